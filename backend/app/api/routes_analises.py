@@ -4,13 +4,20 @@ Rotas da API para análises setoriais
 
 from flask import Blueprint, jsonify, request, make_response
 from dataclasses import asdict
+import base64
+import hashlib
+import json
 import logging
 import os
 import requests
-import duckdb
 from pyarrow import parquet as pq
 from core.config import Config
 from services.services_cnpj_service import buscar_por_palavra_chave
+from services.services_busca_nomes import sql_cnpjs_basicos
+from services.services_filtro_sql import esquema_parquet, expressao_numerica
+from utils.utils_formatacao import formatar_leads, numero_br, registros_json
+from services.services_responsavel import responsavel_disponivel
+from services.services_kpi_cubo import SITUACAO_ATIVA, SITUACAO_BAIXADA, kpis_base_cubo, kpis_geral_insumos_cubo
 from services.services_cnpj_service import consultar_cnpj_completo, verificar_divida_pgfn
 import numpy as np
 import time
@@ -23,7 +30,10 @@ from services.services_analise_service import executar_analise_setorial, sugerir
 from flask import jsonify
 from services.services_analise_service import analisar_licitacoes_por_cnpj
 from services.services_integracao_service import PNCPIntegration
+from services.services_pncp_serie import serie_pncp
 from services.services_cache_service import cache
+from services.services_embeddings import embedding, embeddings
+from services.services_duckdb_pool import obter_cursor, tabela, view_registrada
 try:
     from server import limiter as _limiter
 except Exception:
@@ -84,40 +94,7 @@ def _chat_ai(messages: list, fallback_text: str) -> str:
         return fallback_text
 
 def _embed_text(txt: str) -> np.ndarray:
-    api_key = os.environ.get('AI_API_KEY')
-    base_url = os.environ.get('AI_API_BASE', 'https://api.openai.com/v1')
-    model = os.environ.get('AI_EMBED_MODEL', 'text-embedding-3-large')
-    s = str(txt or '').strip()
-    if not s:
-        return np.zeros((256,), dtype=np.float32)
-    if not api_key:
-        dim = 256
-        v = np.zeros((dim,), dtype=np.float32)
-        for i, ch in enumerate(s.encode('utf-8')):
-            v[i % dim] += float(ch)
-        n = np.linalg.norm(v) or 1.0
-        return (v / n).astype(np.float32)
-    try:
-        payload = {"input": s, "model": model}
-        resp = requests.post(f"{base_url}/embeddings", json=payload, headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}, timeout=20)
-        if not resp.ok:
-            dim = 256
-            v = np.zeros((dim,), dtype=np.float32)
-            for i, ch in enumerate(s.encode('utf-8')):
-                v[i % dim] += float(ch)
-            n = np.linalg.norm(v) or 1.0
-            return (v / n).astype(np.float32)
-        data = resp.json()
-        vec = np.array(data.get('data', [{}])[0].get('embedding') or [], dtype=np.float32)
-        n = np.linalg.norm(vec) or 1.0
-        return (vec / n).astype(np.float32)
-    except Exception:
-        dim = 256
-        v = np.zeros((dim,), dtype=np.float32)
-        for i, ch in enumerate(s.encode('utf-8')):
-            v[i % dim] += float(ch)
-        n = np.linalg.norm(v) or 1.0
-        return (v / n).astype(np.float32)
+    return embedding(txt)
 
 def _rag_search(query: str, top_k: int = 5) -> list:
     idx = cache.get('semantic_index') or {}
@@ -150,11 +127,7 @@ def _index_append_items(new_items: list):
 def _schema_tables() -> dict:
     out = {}
     for nome, caminho in Config.ARQUIVOS_PARQUET.items():
-        try:
-            pf = pq.ParquetFile(str(caminho))
-            cols = [c.name for c in pf.schema]
-        except Exception:
-            cols = []
+        cols = list(esquema_parquet(caminho))
         out[nome] = { 'path': str(caminho), 'columns': cols }
     return out
 
@@ -342,67 +315,17 @@ def rota_pncp_serie():
         'codigoMunicipioIbge': request.args.get('codigoMunicipioIbge'),
         'cnpj': request.args.get('cnpj'),
         'codigoUnidadeAdministrativa': request.args.get('codigoUnidadeAdministrativa'),
-        'idUsuario': request.args.get('idUsuario')
+        'idUsuario': request.args.get('idUsuario'),
+        'esferaId': request.args.get('esferaId')
     }
-    cliente = PNCPIntegration()
-    if dias and dias.isdigit():
-        base = cliente.listar_editais_todos(dias=int(dias), tamanho=tamanho, filtros=filtros)
-        itens = base.get('data') or []
-    else:
-        base = cliente.listar_editais_todos(dias=30, tamanho=tamanho, filtros=filtros)
-        itens = base.get('data') or []
-    def _d(x):
-        s = str(x or '')
-        if not s:
-            return ''
-        import re
-        m = re.match(r"(\d{4})-?(\d{2})-?(\d{2})", s)
-        if m:
-            return f"{m.group(1)}{m.group(2)}{m.group(3)}"
-        return ''
-    def _v(x):
-        try:
-            return float(x or 0)
-        except Exception:
-            return 0.0
-    by_day = {}
-    by_modal = {}
-    by_uf = {}
-    total_v = 0.0
-    for it in itens:
-        d = _d(it.get('dataPublicacaoPncp') or it.get('dataPublicacao'))
-        if not d:
-            continue
-        by_day.setdefault(d, {'date': d, 'count': 0, 'valor': 0.0})
-        by_day[d]['count'] += 1
-        val = _v(it.get('valorTotalEstimado') or it.get('valorTotal'))
-        by_day[d]['valor'] += val
-        total_v += val
-        mod = str(it.get('codigoModalidadeContratacao') or it.get('modalidade') or '')
-        uf = str(it.get('uf') or it.get('ufSigla') or '')
-        if mod:
-            by_modal[mod] = by_modal.get(mod, 0) + 1
-        if uf:
-            by_uf[uf] = by_uf.get(uf, 0) + 1
-    series = sorted(by_day.values(), key=lambda x: x['date'])
-    ma7 = []
-    w = []
-    for s in series:
-        w.append(s['count'])
-        if len(w) > 7:
-            w.pop(0)
-        ma7.append(sum(w) / len(w))
-    top_modal = sorted([{ 'label': k, 'count': v } for k, v in by_modal.items()], key=lambda x: x['count'], reverse=True)[:10]
-    top_uf = sorted([{ 'label': k, 'count': v } for k, v in by_uf.items()], key=lambda x: x['count'], reverse=True)[:10]
-    out = {
-        'total': len(itens),
-        'totalValor': total_v,
-        'series': series,
-        'mediaMovel7': ma7,
-        'topModalidades': top_modal,
-        'topUFs': top_uf
-    }
-    return jsonify(out)
+    media = request.args.get('media', '7')
+    resultado = serie_pncp(
+        filtros,
+        dias=int(dias) if dias and dias.isdigit() else None,
+        media=int(media) if media.isdigit() else 7,
+        tamanho=tamanho,
+    )
+    return jsonify(resultado)
 
 @analises_bp.route('/pncp/raw/<string:tipo>', methods=['GET'])
 @handle_errors
@@ -430,30 +353,72 @@ def rota_pncp_raw(tipo: str):
     return jsonify(resultado)
 
 # --- KPIs Globais da Base ---
+def _nome_situacao_kpi(code):
+    m = {'01':'Nula','1':'Nula','02':'Ativa','2':'Ativa','03':'Suspensa','3':'Suspensa','04':'Inapta','4':'Inapta','05':'Baixada','5':'Baixada','08':'Baixada','8':'Baixada'}
+    return m.get(str(code), str(code))
+
+def _nome_porte_kpi(code):
+    m = {
+        '00': 'Não Informado',
+        '01': 'Microempresa',
+        '02': 'Pequena',
+        '03': 'Média',
+        '04': 'Grande',
+        '05': 'Demais',
+        '1': 'Microempresa',
+        '2': 'Pequena',
+        '3': 'Média',
+        '4': 'Grande',
+        '5': 'Demais'
+    }
+    return m.get(str(code), f'Porte {code}')
+
+def _cards_series_kpis(df_ent, df_sai, total_ativas):
+    entradas_mensais = [{'label': f"{str(r['mes'])[:4]}-{str(r['mes'])[4:]}", 'count': int(r['count'])} for _, r in df_ent.iterrows()]
+    saidas_mensais = [{'label': f"{str(r['mes'])[:4]}-{str(r['mes'])[4:]}", 'count': int(r['count'])} for _, r in df_sai.iterrows()]
+    cards = {'entradas_mensais': entradas_mensais, 'saidas_mensais': saidas_mensais}
+    # Totais recentes para cards
+    if entradas_mensais:
+        cards['entradas_mes_vigente'] = entradas_mensais[-1]['count']
+        cards['entradas_mes_vigente_label'] = entradas_mensais[-1]['label']
+    if len(entradas_mensais) > 1:
+        cards['entradas_mes_anterior'] = entradas_mensais[-2]['count']
+        cards['entradas_mes_anterior_label'] = entradas_mensais[-2]['label']
+    cards['total_ativas'] = int(total_ativas)
+    return cards
+
+def _top_cnae_kpis(df_cnae):
+    return [
+        {
+            'label': f"{str(r.get('descricao', ''))[:40] if 'descricao' in r and r['descricao'] else str(r['cnae']).zfill(7)}", 
+            'cnae': str(r['cnae']).zfill(7),
+            'count': int(r['count'])
+        } 
+        for _, r in df_cnae.iterrows()
+    ]
+
 @analises_bp.route('/kpis/base', methods=['GET'])
 @handle_errors
 def rota_kpis_base():
     """
-    KPIs globais da base de dados (RFB) lendo diretamente os arquivos Parquet.
+    KPIs globais da base de dados (RFB), a partir dos cubos pré-agregados ou,
+    sem eles, lendo diretamente os arquivos Parquet.
     Retorna contagens e tops por UF e CNAE, além do status dos arquivos.
     """
-    import pyarrow.parquet as pq
-    from pathlib import Path
+    def _partes(fp: Path) -> list:
+        # Datasets gerados por services_layout_parquet são diretórios
+        fp = Path(fp)
+        return sorted(fp.rglob('*.parquet')) if fp.is_dir() else [fp]
 
     def _num_rows(fp: Path) -> int:
         try:
-            pf = pq.ParquetFile(str(fp))
-            return sum(r.num_rows for r in pf.metadata.row_group_metadata) if pf.metadata else 0
+            return sum(int(pq.read_metadata(str(p)).num_rows or 0) for p in _partes(fp))
         except Exception:
-            try:
-                pf = pq.ParquetFile(str(fp))
-                return int(pf.metadata.num_rows or 0)
-            except Exception:
-                return 0
+            return 0
 
     def _size_mb(fp: Path) -> float:
         try:
-            return round(fp.stat().st_size / (1024 * 1024), 2)
+            return round(sum(p.stat().st_size for p in _partes(fp)) / (1024 * 1024), 2)
         except Exception:
             return 0.0
 
@@ -479,147 +444,123 @@ def rota_kpis_base():
     top_porte = []
     situacoes = []
     
+    # Cubos pré-agregados (services_kpi_cubo); sem eles, consulta os dados brutos
     try:
-        est_path = str(Config.ARQUIVOS_PARQUET['estabelecimentos']).replace('\\', '/')
-        emp_path = str(Config.ARQUIVOS_PARQUET['empresas']).replace('\\', '/')
-        
-        # UF
-        q1 = (
-            f"SELECT uf as label, COUNT(*) as count FROM read_parquet('{est_path}') "
-            f"WHERE uf IS NOT NULL GROUP BY uf ORDER BY count DESC LIMIT 10"
-        )
-        df_uf = duckdb.sql(q1).to_df()
-        top_uf = [{'label': str(r['label']), 'count': int(r['count'])} for _, r in df_uf.iterrows()]
-        
-        # CNAE principal com descrição
+        cubo = kpis_base_cubo()
+    except Exception as e:
+        logger.warning(f"Erro ao ler cubos de KPIs, usando dados brutos: {e}")
+        cubo = None
+    
+    if cubo is not None:
+        top_uf = [{'label': str(r['label']), 'count': int(r['count'])} for _, r in cubo['uf'].iterrows()]
+        top_cnae = _top_cnae_kpis(cubo['cnae'])
+        situacoes = [{'label': _nome_situacao_kpi(r['sit']), 'count': int(r['count'])} for _, r in cubo['situacoes'].iterrows()]
+        top_porte = [{'label': _nome_porte_kpi(r['porte']), 'count': int(r['count'])} for _, r in cubo['porte'].iterrows()]
+        cards = _cards_series_kpis(cubo['entradas'], cubo['saidas'], cubo['total_ativas'])
+    else:
         try:
-            # Carregar tabela de CNAEs para obter descrições
-            cnae_path = str(Config.ARQUIVOS_PARQUET.get('cnaes', '')).replace('\\', '/')
-            if Path(cnae_path).exists():
-                q2 = (
-                    f"SELECT e.cnae_fiscal_principal AS cnae, c.descricao, COUNT(*) as count "
-                    f"FROM read_parquet('{est_path}') e "
-                    f"LEFT JOIN read_parquet('{cnae_path}') c ON e.cnae_fiscal_principal = c.codigo "
-                    f"WHERE e.cnae_fiscal_principal IS NOT NULL "
-                    f"GROUP BY e.cnae_fiscal_principal, c.descricao "
-                    f"ORDER BY count DESC LIMIT 15"
-                )
-            else:
-                q2 = (
-                    f"SELECT coalesce(cnae_fiscal_principal, cnae_fiscal) AS cnae, COUNT(*) as count "
-                    f"FROM read_parquet('{est_path}') "
-                    f"WHERE cnae_fiscal_principal IS NOT NULL "
-                    f"GROUP BY cnae ORDER BY count DESC LIMIT 15"
-                )
-            df_cnae = duckdb.sql(q2).to_df()
-            top_cnae = [
-                {
-                    'label': f"{str(r.get('descricao', ''))[:40] if 'descricao' in r and r['descricao'] else str(r['cnae']).zfill(7)}", 
-                    'cnae': str(r['cnae']).zfill(7),
-                    'count': int(r['count'])
-                } 
-                for _, r in df_cnae.iterrows()
-            ]
-        except Exception as e:
-            logger.warning(f"Erro ao buscar CNAEs: {e}")
-            top_cnae = []
+            con = obter_cursor()
+            t_est = tabela('estabelecimentos')
+            t_emp = tabela('empresas')
         
-        # Situação cadastral
-        try:
-            q3 = (
-                f"SELECT situacao_cadastral as sit, COUNT(*) as count FROM read_parquet('{est_path}') "
-                f"GROUP BY situacao_cadastral ORDER BY count DESC"
+            # UF
+            q1 = (
+                f"SELECT uf as label, COUNT(*) as count FROM {t_est} "
+                f"WHERE uf IS NOT NULL GROUP BY uf ORDER BY count DESC LIMIT 10"
             )
-            df_sit = duckdb.sql(q3).to_df()
-            def _nome_sit(code):
-                m = {'01':'Nula','1':'Nula','02':'Ativa','2':'Ativa','03':'Suspensa','3':'Suspensa','04':'Inapta','4':'Inapta','05':'Baixada','5':'Baixada','08':'Baixada','8':'Baixada'}
-                return m.get(str(code), str(code))
-            situacoes = [{'label': _nome_sit(r['sit']), 'count': int(r['count'])} for _, r in df_sit.iterrows()]
-        except Exception as e:
-            logger.warning(f"Erro ao buscar situações: {e}")
-            situacoes = []
+            df_uf = con.sql(q1).to_df()
+            top_uf = [{'label': str(r['label']), 'count': int(r['count'])} for _, r in df_uf.iterrows()]
         
-        # Porte de empresa
-        try:
-            if Path(emp_path).exists():
-                q4 = (
-                    f"SELECT porte_da_empresa as porte, COUNT(*) as count "
-                    f"FROM read_parquet('{emp_path}') "
-                    f"WHERE porte_da_empresa IS NOT NULL "
-                    f"GROUP BY porte_da_empresa ORDER BY count DESC"
+            # CNAE principal com descrição
+            try:
+                # Carregar tabela de CNAEs para obter descrições
+                if view_registrada('cnaes'):
+                    q2 = (
+                        f"SELECT e.cnae_fiscal_principal AS cnae, c.descricao, COUNT(*) as count "
+                        f"FROM {t_est} e "
+                        f"LEFT JOIN cnaes c ON e.cnae_fiscal_principal = c.codigo "
+                        f"WHERE e.cnae_fiscal_principal IS NOT NULL "
+                        f"GROUP BY e.cnae_fiscal_principal, c.descricao "
+                        f"ORDER BY count DESC LIMIT 15"
+                    )
+                else:
+                    q2 = (
+                        f"SELECT coalesce(cnae_fiscal_principal, cnae_fiscal) AS cnae, COUNT(*) as count "
+                        f"FROM {t_est} "
+                        f"WHERE cnae_fiscal_principal IS NOT NULL "
+                        f"GROUP BY cnae ORDER BY count DESC LIMIT 15"
+                    )
+                df_cnae = con.sql(q2).to_df()
+                top_cnae = _top_cnae_kpis(df_cnae)
+            except Exception as e:
+                logger.warning(f"Erro ao buscar CNAEs: {e}")
+                top_cnae = []
+        
+            # Situação cadastral
+            try:
+                q3 = (
+                    f"SELECT situacao_cadastral as sit, COUNT(*) as count FROM {t_est} "
+                    f"GROUP BY situacao_cadastral ORDER BY count DESC"
                 )
-                df_porte = duckdb.sql(q4).to_df()
-                def _nome_porte(code):
-                    m = {
-                        '00': 'Não Informado',
-                        '01': 'Microempresa',
-                        '02': 'Pequena',
-                        '03': 'Média',
-                        '04': 'Grande',
-                        '05': 'Demais',
-                        '1': 'Microempresa',
-                        '2': 'Pequena',
-                        '3': 'Média',
-                        '4': 'Grande',
-                        '5': 'Demais'
-                    }
-                    return m.get(str(code), f'Porte {code}')
-                top_porte = [{'label': _nome_porte(r['porte']), 'count': int(r['count'])} for _, r in df_porte.iterrows()]
-        except Exception as e:
-            logger.warning(f"Erro ao buscar portes: {e}")
-            top_porte = []
-
-        # Séries Temporais (Entradas e Saídas)
-        cards = {}
-        try:
-            # Entradas (últimos 24 meses aprox, filtro > 2023)
-            q_ent = (
-                f"SELECT SUBSTR(data_de_inicio_atividade, 1, 6) as mes, COUNT(*) as count "
-                f"FROM read_parquet('{est_path}') "
-                f"WHERE data_de_inicio_atividade >= '20230101' AND data_de_inicio_atividade IS NOT NULL "
-                f"GROUP BY 1 ORDER BY 1"
-            )
-            df_ent = duckdb.sql(q_ent).to_df()
-            entradas_mensais = [{'label': f"{str(r['mes'])[:4]}-{str(r['mes'])[4:]}", 'count': int(r['count'])} for _, r in df_ent.iterrows()]
-            
-            # Saídas (Baixadas = '08', '8')
-            q_sai = (
-                f"SELECT SUBSTR(data_situacao_cadastral, 1, 6) as mes, COUNT(*) as count "
-                f"FROM read_parquet('{est_path}') "
-                f"WHERE situacao_cadastral IN ('08', '8') "
-                f"AND data_situacao_cadastral >= '20230101' AND data_situacao_cadastral IS NOT NULL "
-                f"GROUP BY 1 ORDER BY 1"
-            )
-            df_sai = duckdb.sql(q_sai).to_df()
-            saidas_mensais = [{'label': f"{str(r['mes'])[:4]}-{str(r['mes'])[4:]}", 'count': int(r['count'])} for _, r in df_sai.iterrows()]
-            
-            cards['entradas_mensais'] = entradas_mensais
-            cards['saidas_mensais'] = saidas_mensais
+                df_sit = con.sql(q3).to_df()
+                situacoes = [{'label': _nome_situacao_kpi(r['sit']), 'count': int(r['count'])} for _, r in df_sit.iterrows()]
+            except Exception as e:
+                logger.warning(f"Erro ao buscar situações: {e}")
+                situacoes = []
+        
+            # Porte de empresa
+            try:
+                if view_registrada('empresas'):
+                    q4 = (
+                        f"SELECT porte_da_empresa as porte, COUNT(*) as count "
+                        f"FROM {t_emp} "
+                        f"WHERE porte_da_empresa IS NOT NULL "
+                        f"GROUP BY porte_da_empresa ORDER BY count DESC"
+                    )
+                    df_porte = con.sql(q4).to_df()
+                    top_porte = [{'label': _nome_porte_kpi(r['porte']), 'count': int(r['count'])} for _, r in df_porte.iterrows()]
+            except Exception as e:
+                logger.warning(f"Erro ao buscar portes: {e}")
+                top_porte = []
+
+            # Séries Temporais (Entradas e Saídas)
+            cards = {}
+            try:
+                # Entradas (últimos 24 meses aprox, filtro > 2023)
+                q_ent = (
+                    f"SELECT SUBSTR(data_de_inicio_atividade, 1, 6) as mes, COUNT(*) as count "
+                    f"FROM {t_est} "
+                    f"WHERE data_de_inicio_atividade >= '20230101' AND data_de_inicio_atividade IS NOT NULL "
+                    f"GROUP BY 1 ORDER BY 1"
+                )
+                df_ent = con.sql(q_ent).to_df()
             
-            # Totais recentes para cards
-            if entradas_mensais:
-                cards['entradas_mes_vigente'] = entradas_mensais[-1]['count']
-                cards['entradas_mes_vigente_label'] = entradas_mensais[-1]['label']
-            if len(entradas_mensais) > 1:
-                cards['entradas_mes_anterior'] = entradas_mensais[-2]['count']
-                cards['entradas_mes_anterior_label'] = entradas_mensais[-2]['label']
+                # Saídas (baixadas, mesmos códigos dos cubos)
+                q_sai = (
+                    f"SELECT SUBSTR(data_situacao_cadastral, 1, 6) as mes, COUNT(*) as count "
+                    f"FROM {t_est} "
+                    f"WHERE upper(CAST(situacao_cadastral AS VARCHAR)) IN {SITUACAO_BAIXADA} "
+                    f"AND data_situacao_cadastral >= '20230101' AND data_situacao_cadastral IS NOT NULL "
+                    f"GROUP BY 1 ORDER BY 1"
+                )
+                df_sai = con.sql(q_sai).to_df()
             
-            # Calcular total ativas no backend para facilitar
-            total_ativas_calc = duckdb.sql(f"SELECT COUNT(*) FROM read_parquet('{est_path}') WHERE situacao_cadastral IN ('02','2')").fetchone()[0]
-            cards['total_ativas'] = int(total_ativas_calc)
+                # Calcular total ativas no backend para facilitar
+                total_ativas_calc = con.sql(f"SELECT COUNT(*) FROM {t_est} WHERE CAST(situacao_cadastral AS VARCHAR) IN {SITUACAO_ATIVA}").fetchone()[0]
+                cards = _cards_series_kpis(df_ent, df_sai, total_ativas_calc)
                 
-        except Exception as e:
-            logger.warning(f"Erro ao buscar series: {e}")
-            cards['entradas_mensais'] = []
-            cards['saidas_mensais'] = []
+            except Exception as e:
+                logger.warning(f"Erro ao buscar series: {e}")
+                cards['entradas_mensais'] = []
+                cards['saidas_mensais'] = []
 
-    except Exception as e:
-        logger.error(f"Erro geral em kpis/base: {e}")
-        top_uf = []
-        top_cnae = []
-        top_porte = []
-        situacoes = []
-        cards = {}
+        except Exception as e:
+            logger.error(f"Erro geral em kpis/base: {e}")
+            top_uf = []
+            top_cnae = []
+            top_porte = []
+            situacoes = []
+            cards = {}
 
     out = {
         'timestamp': int(time.time()),
@@ -662,7 +603,10 @@ def rota_scoring_ranking():
 def rota_compat_empresas():
     data = request.get_json() or {}
     cnpj = data.get('cnpj_prestador') or data.get('cnpj') or ''
-    filtros = data.get('filtros') or data
+    filtros = dict(data.get('filtros') or data)
+    for k in ('cursor', 'pagina'):
+        if data.get(k) and k not in filtros:
+            filtros[k] = data[k]
     limite = int(data.get('limite') or 50)
     resultado = ranking_empresas_por_prestador(cnpj, filtros, limite)
     try:
@@ -680,7 +624,10 @@ def rota_compat_empresas():
         resultado['top_empresas'] = top
     except Exception:
         resultado['top_empresas'] = []
+    # Páginas seguintes ("carregar mais") mantêm o relatório determinístico
     try:
+        if filtros.get('cursor'):
+            return jsonify(resultado)
         dash = resultado.get('dashboard') or {}
         resumo_kpis = f"Total: {dash.get('total_leads', 0)} | Média: {dash.get('media_score', 0)} | Máx: {dash.get('max_score', 0)} | Top UF: {dash.get('top_uf', '—')} | Potenciais (A/M/B): {dash.get('potencial_alto', 0)}/{dash.get('potencial_medio', 0)}/{dash.get('potencial_baixo', 0)}"
         amostra = "; ".join([f"{(t.get('razao_social') or '—')[:40]} ({t.get('uf') or '—'}) - Score {int(t.get('score_total') or 0)}" for t in (resultado.get('top_empresas') or [])[:10]])
@@ -794,28 +741,71 @@ def api_nl2sql():
         sql = f"SELECT COUNT(*) AS total FROM {tabela}{where_sql}"
 
     try:
-        con = duckdb.connect()
-        p_emp = str(Config.ARQUIVOS_PARQUET['empresas']).replace('\\', '/')
-        p_est = str(Config.ARQUIVOS_PARQUET['estabelecimentos']).replace('\\', '/')
-        p_soc = str(Config.ARQUIVOS_PARQUET['socios']).replace('\\', '/')
-        p_simp = str(Config.ARQUIVOS_PARQUET['simples']).replace('\\', '/')
-        p_cnaes = str(Config.ARQUIVOS_PARQUET['cnaes']).replace('\\', '/')
-        p_mun = str(Config.ARQUIVOS_PARQUET['municipios']).replace('\\', '/')
-        
-        con.execute(f"CREATE OR REPLACE VIEW empresas AS SELECT * FROM read_parquet('{p_emp}')")
-        con.execute(f"CREATE OR REPLACE VIEW estabelecimentos AS SELECT * FROM read_parquet('{p_est}')")
-        con.execute(f"CREATE OR REPLACE VIEW socios AS SELECT * FROM read_parquet('{p_soc}')")
-        con.execute(f"CREATE OR REPLACE VIEW simples AS SELECT * FROM read_parquet('{p_simp}')")
-        con.execute(f"CREATE OR REPLACE VIEW cnaes AS SELECT * FROM read_parquet('{p_cnaes}')")
-        con.execute(f"CREATE OR REPLACE VIEW municipios AS SELECT * FROM read_parquet('{p_mun}')")
+        # Views da base RFB já registradas na conexão compartilhada
+        con = obter_cursor()
         df = con.execute(sql).df()
-        con.close()
         cols = [str(c) for c in (list(df.columns) if df is not None else [])]
         rows = (df.astype(str).values.tolist() if df is not None else [])
         return jsonify({ 'sql': sql, 'columns': cols, 'rows': rows })
     except Exception as e:
         return jsonify({ 'erro': 'falha ao executar consulta', 'detalhes': str(e), 'sql': sql }), 500
 
+# Ordenações da lista de players: nome → (chave SQL, direção). Nulos vão
+# sempre para o fim, por isso a chave já vem com coalesce.
+def _ordem_players(ordenacao: str):
+    esquema_emp = esquema_parquet(Config.ARQUIVOS_PARQUET['empresas'])
+    capital = expressao_numerica('emp.capital_social_da_empresa', esquema_emp.get('capital_social_da_empresa'))
+    data_inicio = "CAST(e.data_de_inicio_atividade AS VARCHAR)"
+    ordens = {
+        'capital_desc': (f"coalesce({capital}, '-infinity'::DOUBLE)", 'DESC'),
+        'capital_asc': (f"coalesce({capital}, 'infinity'::DOUBLE)", 'ASC'),
+        'idade_desc': (f"coalesce({data_inicio}, '99999999')", 'ASC'),  # Mais antiga = data menor
+        'idade_asc': (f"coalesce({data_inicio}, '')", 'DESC'),  # Mais nova = data maior
+    }
+    # Score sorting requires Python processing usually; capital is the default
+    nome = next((n for n in ordens if n in (ordenacao or '')), 'capital_desc')
+    return (nome,) + ordens[nome]
+
+
+def _criar_cursor_players(nome_ordem: str, chave, cnpj) -> str:
+    """Cursor opaco com a ordenação e a posição (chave, CNPJ) do último item"""
+    valor = float(chave) if nome_ordem.startswith('capital') else str(chave)
+    bruto = json.dumps([nome_ordem, valor, str(cnpj)])
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+
+def _ler_cursor_players(cursor: str, nome_ordem: str):
+    """(chave, CNPJ) do cursor, ou None se inválido ou de outra ordenação"""
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ordem, valor, cnpj = json.loads(bruto)
+        if ordem != nome_ordem:
+            return None
+        return (float(valor) if ordem.startswith('capital') else str(valor)), str(cnpj)
+    except Exception:
+        return None
+
+
+def _total_players(where_sql: str) -> int:
+    """Contagem exata para os filtros (consulta só de contagem, guardada no cache)"""
+    chave = 'players_total:' + hashlib.sha1(where_sql.encode()).hexdigest()
+    try:
+        total = cache.get(chave)
+        if total is not None:
+            return int(total)
+    except Exception:
+        pass
+    total = int(obter_cursor().execute(
+        f"SELECT count(*) FROM {tabela('estabelecimentos')} e "
+        f"JOIN {tabela('empresas')} emp ON e.cnpj_basico = emp.cnpj_basico {where_sql}"
+    ).fetchone()[0])
+    try:
+        cache.set(chave, total, expire=int(Config.PLAYERS_TOTAL_TTL))
+    except Exception:
+        pass
+    return total
+
+
 @analises_bp.route('/players/lista', methods=['GET'])
 @handle_errors
 def rota_players_lista():
@@ -826,15 +816,12 @@ def rota_players_lista():
     situacao = request.args.get('situacao', '').strip()
     idade_range = request.args.get('idade', '').strip()
     ordenacao = request.args.get('ordem', 'score_desc').strip()
+    cursor_param = request.args.get('cursor', '').strip()
     
     limite = 20
     offset = (pagina - 1) * limite
     
     try:
-        est_path = str(Config.ARQUIVOS_PARQUET['estabelecimentos']).replace('\\','/')
-        emp_path = str(Config.ARQUIVOS_PARQUET['empresas']).replace('\\','/')
-        soc_path = str(Config.ARQUIVOS_PARQUET['socios']).replace('\\','/')
-        mun_path = str(Config.ARQUIVOS_PARQUET.get('municipios', '')).replace('\\','/')
         
         # Filtros
         condicoes = []
@@ -860,7 +847,14 @@ def rota_players_lista():
             if len(cnae_digits) >= 4:
                 condicoes.append(f"(CAST(e.cnae_fiscal_principal AS VARCHAR) LIKE '{cnae_digits}%')")
             elif len(safe_termo) >= 3:
-                condicoes.append(f"(emp.razao_social_nome_empresarial ILIKE '%{safe_termo}%' OR e.nome_fantasia ILIKE '%{safe_termo}%')")
+                # Todos os CNPJs básicos do índice de nomes, como subconsulta
+                basicos = sql_cnpjs_basicos(safe_termo, ['razao_social', 'nome_fantasia'])
+                if basicos is None:
+                    condicoes.append(f"(emp.razao_social_nome_empresarial ILIKE '%{safe_termo}%' OR e.nome_fantasia ILIKE '%{safe_termo}%')")
+                elif basicos:
+                    condicoes.append(f"CAST(e.cnpj_basico AS VARCHAR) IN ({basicos})")
+                else:
+                    condicoes.append("FALSE")
 
         # 3. UF
         if uf:
@@ -902,99 +896,97 @@ def rota_players_lista():
         # Municipios Join
         mun_join = ""
         mun_col = "e.municipio"
-        if Path(mun_path).exists():
-           mun_join = f"LEFT JOIN read_parquet('{mun_path}') m ON CAST(e.municipio AS VARCHAR) = CAST(m.codigo AS VARCHAR)"
+        if view_registrada('municipios'):
+           mun_join = "LEFT JOIN municipios m ON CAST(e.municipio AS VARCHAR) = CAST(m.codigo AS VARCHAR)"
            mun_col = "m.descricao"
 
-        # Sort Logic
-        order_by = "emp.capital_social_da_empresa DESC" # Default
-        if ordenacao:
-            if 'capital_desc' in ordenacao: order_by = "emp.capital_social_da_empresa DESC"
-            elif 'capital_asc' in ordenacao: order_by = "emp.capital_social_da_empresa ASC"
-            elif 'idade_desc' in ordenacao: order_by = "e.data_de_inicio_atividade ASC" # Mais antiga = data menor
-            elif 'idade_asc' in ordenacao: order_by = "e.data_de_inicio_atividade DESC" # Mais nova = data maior
-            # Score sorting requires Python processing usually, or complex SQL. fallback for now.
+        # Sort Logic: chave de ordenação + CNPJ como desempate (paginação por cursor)
+        nome_ordem, chave_ordem, direcao = _ordem_players(ordenacao)
+        cnpj_expr = "(e.cnpj_basico || e.cnpj_ordem || e.cnpj_dv)"
+        order_by = f"{chave_ordem} {direcao}, {cnpj_expr} ASC"
+        params_pagina = []
+        posicao = _ler_cursor_players(cursor_param, nome_ordem) if cursor_param else None
+        where_pagina = where_sql
+        if posicao is not None:
+            comparacao = '<' if direcao == 'DESC' else '>'
+            where_pagina += f" AND ({chave_ordem} {comparacao} ? OR ({chave_ordem} = ? AND {cnpj_expr} > ?))"
+            params_pagina = [posicao[0], posicao[0], posicao[1]]
+            offset = 0
+
+        # Responsável: tabela pré-calculada (uma linha por CNPJ básico); sem ela,
+        # um sócio qualquer de cada CNPJ básico
+        if responsavel_disponivel():
+            resp_src = "responsavel"
+        else:
+            resp_src = f"(SELECT cnpj_basico, ANY_VALUE(nome_socio) AS responsavel FROM {tabela('socios')} GROUP BY cnpj_basico)"
 
         sql = f"""
             SELECT 
                 e.cnpj_basico || e.cnpj_ordem || e.cnpj_dv as cnpj,
                 emp.razao_social_nome_empresarial as razao_social,
-                ANY_VALUE(s.nome_socio) as responsavel,
-                ANY_VALUE(e.correio_eletronico) as email,
-                ANY_VALUE(e.ddd_1) as ddd,
-                ANY_VALUE(e.telefone_1) as telefone,
-                ANY_VALUE(e.logradouro) || ', ' || ANY_VALUE(e.numero) as endereco,
-                ANY_VALUE(e.bairro) as bairro,
-                ANY_VALUE({mun_col}) as municipio_nome,
-                ANY_VALUE(e.uf) as uf,
-                ANY_VALUE(emp.capital_social_da_empresa) as capital_social,
-                ANY_VALUE(emp.porte_da_empresa) as porte,
-                ANY_VALUE(e.data_de_inicio_atividade) as data_inicio,
-                ANY_VALUE(e.cnae_fiscal_principal) as cnae
-            FROM read_parquet('{est_path}') e
-            JOIN read_parquet('{emp_path}') emp ON e.cnpj_basico = emp.cnpj_basico
-            LEFT JOIN read_parquet('{soc_path}') s ON e.cnpj_basico = s.cnpj_basico
+                r.responsavel as responsavel,
+                e.correio_eletronico as correio_eletronico,
+                e.ddd_1 as ddd_1,
+                e.telefone_1 as telefone_1,
+                e.tipo_de_logradouro as tipo_de_logradouro,
+                e.logradouro as logradouro,
+                e.numero as numero,
+                e.bairro as bairro,
+                {mun_col} as municipio_nome,
+                e.uf as uf,
+                emp.capital_social_da_empresa as capital_social,
+                emp.porte_da_empresa as porte_da_empresa,
+                e.data_de_inicio_atividade as data_de_inicio_atividade,
+                e.cnae_fiscal_principal as cnae,
+                {chave_ordem} as _chave_ordem
+            FROM {tabela('estabelecimentos')} e
+            JOIN {tabela('empresas')} emp ON e.cnpj_basico = emp.cnpj_basico
+            LEFT JOIN {resp_src} r ON e.cnpj_basico = r.cnpj_basico
             {mun_join}
-            {where_sql}
-            GROUP BY e.cnpj_basico, e.cnpj_ordem, e.cnpj_dv, emp.razao_social_nome_empresarial
+            {where_pagina}
             ORDER BY {order_by}
-            LIMIT {limite} OFFSET {offset}
+            LIMIT {limite + 1} OFFSET {offset}
         """
         
-        df = duckdb.sql(sql).to_df()
-        
-        lista = []
-        current_year = int(time.strftime("%Y"))
-        
-        for _, r in df.iterrows():
-            tel = ''
-            try:
-                ddd = str(int(float(r['ddd']))) if r['ddd'] else ''
-                gomes = str(int(float(r['telefone']))) if r['telefone'] else ''
-                if ddd and gomes:
-                    tel = f"({ddd}) {gomes}"
-            except: pass
-            
-            c = str(r['cnpj'])
-            cnpj_fmt = f"{c[:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:]}" if len(c) == 14 else c
-            
-            resp = r['responsavel']
-            if not isinstance(resp, str): resp = '—'
-            
-            # Idade calc
-            idade = 0
-            try:
-                dt_str = str(r['data_inicio'])
-                y = int(dt_str[:4])
-                idade = current_year - y
-            except: pass
-
-            # Porte desc
-            porte_code = str(r['porte'])
-            porte_desc = 'Demais'
-            if porte_code in ['01','1']: porte_desc = 'Microempresa'
-            elif porte_code in ['03','3']: porte_desc = 'Pequeno Porte'
-            elif porte_code in ['05','5']: porte_desc = 'Demais'
-            
-            lista.append({
-                'cnpj': cnpj_fmt,
-                'razaoSocial': r['razao_social'],
-                'nomeFantasia': r['razao_social'], # Fallback
-                'responsavel': resp,
-                'email': str(r['email']).lower() if isinstance(r['email'], str) else '—',
-                'telefone': tel if tel else '—',
-                'endereco': f"{r['endereco'] or ''} - {r['bairro'] or ''}",
-                'municipio': r['municipio_nome'] if isinstance(r['municipio_nome'], str) else '—',
-                'uf': r['uf'],
-                'capitalSocial': float(r['capital_social'] or 0),
-                'porte': porte_desc,
-                'idade': idade,
-                'cnae': r['cnae'],
-                'cnaeDesc': '', # Could fetch description if needed
-                'match': 0 # Basic search has no score
-            })
+        df = obter_cursor().execute(sql, params_pagina).df()
+        tem_mais = len(df) > limite
+        df = df.head(limite)
+        proximo_cursor = None
+        if tem_mais:
+            ultimo = df.iloc[-1]
+            proximo_cursor = _criar_cursor_players(nome_ordem, ultimo['_chave_ordem'], ultimo['cnpj'])
+        total = _total_players(where_sql)
+        df = formatar_leads(df)
+        df['nome_fantasia'] = df['razao_social']  # Fallback
+        df['capital_social'] = numero_br(df['capital_social']).fillna(0.0)
+        df['cnae_desc'] = ''  # Could fetch description if needed
+        df['match'] = 0  # Basic search has no score
+        lista = registros_json(df, {
+            'cnpj_formatado': 'cnpj',
+            'razao_social': 'razaoSocial',
+            'nome_fantasia': 'nomeFantasia',
+            'responsavel': 'responsavel',
+            'email': 'email',
+            'telefone': 'telefone',
+            'endereco': 'endereco',
+            'municipio_nome': 'municipio',
+            'uf': 'uf',
+            'capital_social': 'capitalSocial',
+            'porte_rotulo': 'porte',
+            'idade': 'idade',
+            'cnae': 'cnae',
+            'cnae_desc': 'cnaeDesc',
+            'match': 'match',
+        }, padrao={'responsavel': '—', 'email': '—', 'telefone': '—', 'municipio': '—', 'endereco': ''})
             
-        return jsonify({'data': lista, 'pagina': pagina, 'total_estimado': 1000 + offset})
+        return jsonify({
+            'data': lista,
+            'pagina': pagina,
+            'total': total,
+            'total_estimado': total,  # Compatibilidade: agora é a contagem exata
+            'cursor': proximo_cursor,
+            'tem_mais': tem_mais,
+        })
         
     except Exception as e:
         logger.error(f"Erro rota_players_lista: {e}")
@@ -1049,8 +1041,11 @@ def api_ai_index_build():
             continue
         vid = str(d.get('id') or f"doc.{len(items)+1}")
         meta = d.get('meta') or {}
-        vec = _embed_text(txt)
-        items.append({ 'id': vid, 'text': txt, 'meta': meta, 'vector': vec.tobytes(), 'dim': int(vec.shape[0]), 'ts': int(time.time()) })
+        items.append({ 'id': vid, 'text': txt, 'meta': meta, 'ts': int(time.time()) })
+    # Um lote de embeddings para todos os documentos (inalterados saem do cache)
+    for it, vec in zip(items, embeddings([it['text'] for it in items])):
+        it['vector'] = vec.tobytes()
+        it['dim'] = int(vec.shape[0])
     res = _vector_upsert(items, mode=mode)
     return jsonify(res)
 
@@ -1107,22 +1102,9 @@ def api_ai_nlq():
     if 'limit' not in sql.lower():
         sql = sql + f" LIMIT {limite}"
     try:
-        con = duckdb.connect()
-        p_emp = str(Config.ARQUIVOS_PARQUET['empresas']).replace('\\', '/')
-        p_est = str(Config.ARQUIVOS_PARQUET['estabelecimentos']).replace('\\', '/')
-        p_soc = str(Config.ARQUIVOS_PARQUET['socios']).replace('\\', '/')
-        p_simp = str(Config.ARQUIVOS_PARQUET['simples']).replace('\\', '/')
-        p_cnaes = str(Config.ARQUIVOS_PARQUET['cnaes']).replace('\\', '/')
-        p_mun = str(Config.ARQUIVOS_PARQUET['municipios']).replace('\\', '/')
-        
-        con.execute(f"CREATE OR REPLACE VIEW empresas AS SELECT * FROM read_parquet('{p_emp}')")
-        con.execute(f"CREATE OR REPLACE VIEW estabelecimentos AS SELECT * FROM read_parquet('{p_est}')")
-        con.execute(f"CREATE OR REPLACE VIEW socios AS SELECT * FROM read_parquet('{p_soc}')")
-        con.execute(f"CREATE OR REPLACE VIEW simples AS SELECT * FROM read_parquet('{p_simp}')")
-        con.execute(f"CREATE OR REPLACE VIEW cnaes AS SELECT * FROM read_parquet('{p_cnaes}')")
-        con.execute(f"CREATE OR REPLACE VIEW municipios AS SELECT * FROM read_parquet('{p_mun}')")
+        # Views da base RFB já registradas na conexão compartilhada
+        con = obter_cursor()
         df = con.execute(sql).df()
-        con.close()
         cols = [str(c) for c in (list(df.columns) if df is not None else [])]
         rows = (df.iloc[:limite].astype(str).values.tolist() if df is not None else [])
         return jsonify({ 'sql': sql, 'columns': cols, 'rows': rows })
@@ -1335,6 +1317,236 @@ def api_prospecting_estudo():
     resultado = estudo_compatibilidade_mercado(cnpj_digits, top_n=top_n)
     return jsonify(resultado)
 
+def _kpis_geral_insumos_brutos(uf, municipio, cnae, ano_min, ano_max):
+    """Insumos de /kpis/geral consultando estabelecimentos diretamente (sem cubos)"""
+    con = obter_cursor()
+    fp = tabela('estabelecimentos')
+    dt_inicio = "STRPTIME(regexp_replace(cast(data_de_inicio_atividade as varchar), '[^0-9]', ''), '%Y%m%d')"
+    dt_situacao = "STRPTIME(regexp_replace(cast(data_da_situacao_cadastral as varchar), '[^0-9]', ''), '%Y%m%d')"
+    where = []
+    if uf:
+        where.append(f"upper(cast(uf as varchar)) = upper('{str(uf)}')")
+    if municipio:
+        where.append(f"upper(cast(municipio as varchar)) = upper('{str(municipio)}')")
+    if cnae:
+        where.append(f"cast(cnae_fiscal_principal as varchar) LIKE '%{str(cnae)}%'")
+    if ano_min:
+        where.append(f"CAST(strftime({dt_inicio}, '%Y') AS INTEGER) >= {int(ano_min)}")
+    if ano_max:
+        where.append(f"CAST(strftime({dt_inicio}, '%Y') AS INTEGER) <= {int(ano_max)}")
+    where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
+    # Determina data de referência (última data disponível ou atual)
+    try:
+        q_max_date = f"SELECT max({dt_inicio}) as max_dt FROM {fp}{where_sql}"
+        df_max = con.execute(q_max_date).df()
+        max_dt = pd.to_datetime(df_max.iloc[0]['max_dt']) if not df_max.empty and pd.notna(df_max.iloc[0]['max_dt']) else pd.Timestamp.now()
+    except Exception:
+        max_dt = pd.Timestamp.now()
+    
+    # Ajusta para utilizar a data de referência (max_dt)
+    current_ref = f"'{max_dt.strftime('%Y-%m-%d')}'"
+
+    q_total_filt = f"SELECT count(*) AS total FROM {fp}{where_sql}"
+    df_total_filt = con.execute(q_total_filt).df()
+    total_filtrados = int(df_total_filt.iloc[0]['total']) if not df_total_filt.empty else 0
+    q_ativas = (
+        f"SELECT count(*) AS total FROM {fp}{where_sql}{' AND ' if where_sql else ' WHERE '}cast(situacao_cadastral as varchar) IN {SITUACAO_ATIVA}"
+    )
+    df_ativas = con.execute(q_ativas).df()
+    total_ativas = int(df_ativas.iloc[0]['total']) if not df_ativas.empty else 0
+    # Entradas nos últimos 30 dias (baseado no max_dt)
+    try:
+        cond_30d = f"{dt_inicio} >= dateadd('day', -30, CAST({current_ref} AS DATE))"
+        q_ent_30 = f"SELECT COUNT(*) AS c FROM {fp}{where_sql}{' AND ' if where_sql else ' WHERE '}{cond_30d}"
+        df_e30 = con.execute(q_ent_30).df()
+        entradas_30dias = int(df_e30.iloc[0]['c']) if not df_e30.empty else 0
+    except Exception:
+        entradas_30dias = None
+    q_idade = (
+        f"SELECT avg(date_diff('year', {dt_inicio}, CAST({current_ref} AS DATE))) AS idade_media "
+        f"FROM {fp}{where_sql}"
+    )
+    df_idade = con.execute(q_idade).df()
+    idade_media = float(df_idade.iloc[0]['idade_media']) if not df_idade.empty else None
+    q_ent12 = (
+        f"SELECT strftime({dt_inicio}, '%Y-%m') AS ym, count(*) AS c "
+        f"FROM {fp}{where_sql}{' AND ' if where_sql else ' WHERE '}{dt_inicio} IS NOT NULL GROUP BY ym ORDER BY ym DESC LIMIT 12"
+    )
+    ent = con.execute(q_ent12).df()
+    entradas = [{ 'label': str(r['ym']), 'count': int(r['c']) } for _, r in ent.iloc[::-1].iterrows()] if not ent.empty else []
+    try:
+        q_sai12 = (
+            f"SELECT strftime({dt_situacao}, '%Y-%m') AS ym, count(*) AS c "
+            f"FROM {fp}{where_sql}{' AND ' if where_sql else ' WHERE '}"
+            f"({dt_situacao} IS NOT NULL) AND ("
+            f"upper(cast(situacao_cadastral as varchar)) IN {SITUACAO_BAIXADA}"
+            f") GROUP BY ym ORDER BY ym DESC LIMIT 12"
+        )
+        sai = con.execute(q_sai12).df()
+    except Exception:
+        sai = None
+    saidas = [{ 'label': str(r['ym']), 'count': int(r['c']) } for _, r in (sai.iloc[::-1].iterrows() if (sai is not None and not sai.empty) else [])] if (sai is not None and not sai.empty) else []
+    q_validos = (
+        f"SELECT count(*) AS total, sum(CASE WHEN coalesce(nullif(cast(correio_eletronico as varchar), ''), nullif(cast(telefone_1 as varchar), ''), nullif(cast(logradouro as varchar), ''), nullif(cast(cep as varchar), '')) IS NOT NULL THEN 1 ELSE 0 END) AS ok "
+        f"FROM {fp}{where_sql}"
+    )
+    try:
+        dv = con.execute(q_validos).df()
+        pct_validos = float((int(dv.iloc[0]['ok'])/max(1,int(dv.iloc[0]['total'])))*100.0) if not dv.empty else 0.0
+    except Exception:
+        pct_validos = None
+    q_top_cnae = f"SELECT cast(cnae_fiscal_principal as varchar) AS cnae, count(*) AS c FROM {fp}{where_sql} GROUP BY cnae ORDER BY c DESC LIMIT 10"
+    top_cnae = con.execute(q_top_cnae).df()
+    
+    # Tentar carregar descrições de CNAEs
+    try:
+        if view_registrada('cnaes'):
+            # Reexecutar query com JOIN para pegar descrições
+            q_top_cnae_desc = (
+                f"SELECT e.cnae_fiscal_principal AS cnae, c.descricao, COUNT(*) as c "
+                f"FROM {fp} e "
+                f"LEFT JOIN cnaes c ON cast(e.cnae_fiscal_principal as varchar) = cast(c.codigo as varchar) "
+                f"{where_sql} GROUP BY e.cnae_fiscal_principal, c.descricao ORDER BY c DESC LIMIT 15"
+            )
+            top_cnae = con.execute(q_top_cnae_desc).df()
+            setores = [
+                {
+                    'label': f"{str(r.get('descricao', ''))[:50] if 'descricao' in r and r['descricao'] else str(r['cnae']).zfill(7)}", 
+                    'cnae': str(r['cnae']).zfill(7),
+                    'count': int(r['c'])
+                } 
+                for _, r in top_cnae.iterrows()
+            ] if not top_cnae.empty else []
+        else:
+            setores = [{ 'label': str(r['cnae']), 'cnae': str(r['cnae']).zfill(7), 'count': int(r['c']) } for _, r in top_cnae.iterrows()] if not top_cnae.empty else []
+    except Exception as e:
+        logger.warning(f"Erro ao carregar descrições de CNAEs: {e}")
+        setores = [{ 'label': str(r['cnae']), 'cnae': str(r['cnae']).zfill(7), 'count': int(r['c']) } for _, r in top_cnae.iterrows()] if not top_cnae.empty else []
+    # Geographic aggregation: switch to municipality level if UF is filtered
+    if uf:
+        # Drill-down to municipalities within the selected state
+        q_geo = f"SELECT cast(municipio as varchar) AS label, count(*) AS c FROM {fp}{where_sql} GROUP BY municipio ORDER BY c DESC LIMIT 10"
+    else:
+        # State-level aggregation when no UF filter
+        q_geo = f"SELECT cast(uf as varchar) AS label, count(*) AS c FROM {fp}{where_sql} GROUP BY uf ORDER BY c DESC LIMIT 10"
+    
+    geo_df = con.execute(q_geo).df()
+    mapa = [{ 'label': str(r['label']), 'count': int(r['c']) } for _, r in geo_df.iterrows()] if not geo_df.empty else []
+    try:
+        # Calcular crescimento relativo ao mes anterior do dataset (max_dt)
+        q_ent_m1 = (
+            f"SELECT cast(uf as varchar) AS uf, count(*) AS c FROM {fp} "
+            f"WHERE strftime({dt_inicio}, '%Y-%m') = strftime(add_months(CAST({current_ref} AS DATE),-1),'%Y-%m')"
+            f"{' AND ' + ' AND '.join(where) if where else ''} GROUP BY uf"
+        )
+        q_ent_m2 = (
+            f"SELECT cast(uf as varchar) AS uf, count(*) AS c FROM {fp} "
+            f"WHERE strftime({dt_inicio}, '%Y-%m') = strftime(add_months(CAST({current_ref} AS DATE),-2),'%Y-%m')"
+            f"{' AND ' + ' AND '.join(where) if where else ''} GROUP BY uf"
+        )
+        df_m1 = con.execute(q_ent_m1).df()
+        df_m2 = con.execute(q_ent_m2).df()
+        d1 = { str(row['uf']): int(row['c']) for _, row in (df_m1.iterrows() if not df_m1.empty else []) }
+        d2 = { str(row['uf']): int(row['c']) for _, row in (df_m2.iterrows() if not df_m2.empty else []) }
+        states = []
+        keys = set(d1.keys()) | set(d2.keys())
+        for k in keys:
+            states.append({ 'label': k, 'delta': int(d1.get(k,0) - d2.get(k,0)) })
+        estados_crescimento = sorted(states, key=lambda x: x['delta'], reverse=True)[:10]
+    except Exception:
+        estados_crescimento = []
+    
+    # Age Distribution (Real Data) - Demographics
+    try:
+        q_age_dist = f"""
+        SELECT 
+            CASE 
+                WHEN age_years <= 1 THEN '0-1 ano'
+                WHEN age_years <= 3 THEN '1-3 anos'
+                WHEN age_years <= 5 THEN '3-5 anos'
+                WHEN age_years <= 10 THEN '5-10 anos'
+                WHEN age_years <= 20 THEN '10-20 anos'
+                ELSE '20+ anos'
+            END as faixa,
+            COUNT(*) as c
+        FROM (
+            SELECT date_diff('year', {dt_inicio}, CAST({current_ref} AS DATE)) as age_years
+            FROM {fp}{where_sql}
+            WHERE {dt_inicio} IS NOT NULL
+        )
+        GROUP BY faixa
+        ORDER BY CASE faixa
+            WHEN '0-1 ano' THEN 1
+            WHEN '1-3 anos' THEN 2
+            WHEN '3-5 anos' THEN 3
+            WHEN '5-10 anos' THEN 4
+            WHEN '10-20 anos' THEN 5
+            ELSE 6
+        END
+        """
+        df_age = con.execute(q_age_dist).df()
+        idade_distribuicao = [{ 'label': str(r['faixa']), 'count': int(r['c']) } for _, r in df_age.iterrows()] if not df_age.empty else []
+    except Exception as e:
+        logger.warning(f"Erro ao calcular distribuição de idade: {e}")
+        idade_distribuicao = []
+    
+    # Survival Rate (Real Data) - Demographics
+    try:
+        q_survival = f"""
+        SELECT 
+            COUNT(CASE WHEN cast(situacao_cadastral as varchar) IN {SITUACAO_ATIVA} THEN 1 END) as ativas,
+            COUNT(*) as total
+        FROM {fp}{where_sql}
+        """
+        df_survival = con.execute(q_survival).df()
+        if not df_survival.empty:
+            ativas_count = int(df_survival.iloc[0]['ativas'] or 0)
+            total_survival = int(df_survival.iloc[0]['total'] or 0)
+            taxa_sobrevivencia = (ativas_count / max(1, total_survival)) * 100.0 if total_survival > 0 else None
+        else:
+            taxa_sobrevivencia = None
+    except Exception as e:
+        logger.warning(f"Erro ao calcular taxa de sobrevivência: {e}")
+        taxa_sobrevivencia = None
+    
+    # Export Potential (Heuristic) - contagem; o percentual é calculado na rota
+    try:
+        q_export = f"""
+        SELECT COUNT(*) as c
+        FROM {fp}{where_sql}{' AND ' if where_sql else ' WHERE '}
+        (
+            (cast(cnae_fiscal_principal as varchar) LIKE '1%' OR 
+             cast(cnae_fiscal_principal as varchar) LIKE '2%' OR 
+             cast(cnae_fiscal_principal as varchar) LIKE '3%' OR
+             cast(cnae_fiscal_principal as varchar) LIKE '62%' OR
+             cast(cnae_fiscal_principal as varchar) LIKE '63%' OR
+             cast(cnae_fiscal_principal as varchar) LIKE '01%' OR
+             cast(cnae_fiscal_principal as varchar) LIKE '02%' OR
+             cast(cnae_fiscal_principal as varchar) LIKE '03%')
+        )
+        """
+        df_export = con.execute(q_export).df()
+        export_count = int(df_export.iloc[0]['c']) if not df_export.empty else 0
+    except Exception as e:
+        logger.warning(f"Erro ao calcular potencial de exportação: {e}")
+        export_count = None
+    return {
+        'max_dt': max_dt,
+        'total_filtrados': total_filtrados,
+        'total_ativas': total_ativas,
+        'entradas_30dias': entradas_30dias,
+        'idade_media': idade_media,
+        'entradas': entradas,
+        'saidas': saidas,
+        'pct_validos': pct_validos,
+        'setores': setores,
+        'mapa': mapa,
+        'estados_crescimento': estados_crescimento,
+        'idade_distribuicao': idade_distribuicao,
+        'taxa_sobrevivencia': taxa_sobrevivencia,
+        'exportacao': export_count,
+    }
+
 @analises_bp.route('/kpis/geral', methods=['GET'])
 @handle_errors
 def api_kpis_geral():
@@ -1345,91 +1557,32 @@ def api_kpis_geral():
     ano_min = request.args.get('ano_min')
     ano_max = request.args.get('ano_max')
     try:
-        con = duckdb.connect()
-        fp = str(Config.ARQUIVOS_PARQUET['estabelecimentos']).replace('\\','/')
-        dt_inicio = "STRPTIME(regexp_replace(cast(data_de_inicio_atividade as varchar), '[^0-9]', ''), '%Y%m%d')"
-        dt_situacao = "STRPTIME(regexp_replace(cast(data_da_situacao_cadastral as varchar), '[^0-9]', ''), '%Y%m%d')"
-        where = []
-        if uf:
-            where.append(f"upper(cast(uf as varchar)) = upper('{str(uf)}')")
-        if municipio:
-            where.append(f"upper(cast(municipio as varchar)) = upper('{str(municipio)}')")
-        if cnae:
-            where.append(f"cast(cnae_fiscal_principal as varchar) LIKE '%{str(cnae)}%'")
-        if ano_min:
-            where.append(f"CAST(strftime({dt_inicio}, '%Y') AS INTEGER) >= {int(ano_min)}")
-        if ano_max:
-            where.append(f"CAST(strftime({dt_inicio}, '%Y') AS INTEGER) <= {int(ano_max)}")
-        where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
-        # Determina data de referência (última data disponível ou atual)
+        # Cubos pré-agregados (services_kpi_cubo); sem eles, consulta os dados brutos
         try:
-            q_max_date = f"SELECT max({dt_inicio}) as max_dt FROM read_parquet('{fp}'){where_sql}"
-            df_max = con.execute(q_max_date).df()
-            max_dt = pd.to_datetime(df_max.iloc[0]['max_dt']) if not df_max.empty and pd.notna(df_max.iloc[0]['max_dt']) else pd.Timestamp.now()
-        except Exception:
-            max_dt = pd.Timestamp.now()
-        
-        # Ajusta para utilizar a data de referência (max_dt)
-        current_ref = f"'{max_dt.strftime('%Y-%m-%d')}'"
-
-        q_total_filt = f"SELECT count(*) AS total FROM read_parquet('{fp}'){where_sql}"
-        df_total_filt = con.execute(q_total_filt).df()
-        total_filtrados = int(df_total_filt.iloc[0]['total']) if not df_total_filt.empty else 0
-        q_ativas = (
-            f"SELECT count(*) AS total FROM read_parquet('{fp}'){where_sql}{' AND ' if where_sql else ' WHERE '}cast(situacao_cadastral as varchar)='02'"
-        )
-        df_ativas = con.execute(q_ativas).df()
-        total_ativas = int(df_ativas.iloc[0]['total']) if not df_ativas.empty else 0
-        # Entradas nos últimos 30 dias (baseado no max_dt)
-        try:
-            cond_30d = f"{dt_inicio} >= dateadd('day', -30, CAST({current_ref} AS DATE))"
-            q_ent_30 = f"SELECT COUNT(*) AS c FROM read_parquet('{fp}'){where_sql}{' AND ' if where_sql else ' WHERE '}{cond_30d}"
-            df_e30 = con.execute(q_ent_30).df()
-            entradas_30dias = int(df_e30.iloc[0]['c']) if not df_e30.empty else 0
-        except Exception:
-            entradas_30dias = None
-        q_idade = (
-            f"SELECT avg(date_diff('year', {dt_inicio}, CAST({current_ref} AS DATE))) AS idade_media "
-            f"FROM read_parquet('{fp}'){where_sql}"
-        )
-        df_idade = con.execute(q_idade).df()
-        idade_media = float(df_idade.iloc[0]['idade_media']) if not df_idade.empty else None
-        q_ent12 = (
-            f"SELECT strftime({dt_inicio}, '%Y-%m') AS ym, count(*) AS c "
-            f"FROM read_parquet('{fp}'){where_sql}{' AND ' if where_sql else ' WHERE '}{dt_inicio} IS NOT NULL GROUP BY ym ORDER BY ym DESC LIMIT 12"
-        )
-        ent = con.execute(q_ent12).df()
-        entradas = [{ 'label': str(r['ym']), 'count': int(r['c']) } for _, r in ent.iloc[::-1].iterrows()] if not ent.empty else []
-        q_ent2 = (
-            f"SELECT strftime({dt_inicio}, '%Y-%m') AS ym, count(*) AS c "
-            f"FROM read_parquet('{fp}'){where_sql}{' AND ' if where_sql else ' WHERE '}{dt_inicio} IS NOT NULL GROUP BY ym ORDER BY ym DESC LIMIT 2"
-        )
-        ent2 = con.execute(q_ent2).df()
-        entradas_mes_vigente = int(ent2.iloc[0]['c']) if not ent2.empty else None
-        entradas_mes_anterior = int(ent2.iloc[1]['c']) if (ent2 is not None and len(ent2)>=2) else None
-        entradas_mes_vigente_label = str(ent2.iloc[0]['ym']) if not ent2.empty else None
-        entradas_mes_anterior_label = str(ent2.iloc[1]['ym']) if (ent2 is not None and len(ent2)>=2) else None
-        try:
-            q_sai12 = (
-                f"SELECT strftime({dt_situacao}, '%Y-%m') AS ym, count(*) AS c "
-                f"FROM read_parquet('{fp}'){where_sql}{' AND ' if where_sql else ' WHERE '}"
-                f"({dt_situacao} IS NOT NULL) AND ("
-                f"upper(cast(situacao_cadastral as varchar)) = '08' OR upper(cast(situacao_cadastral as varchar)) = 'BAIXADA'"
-                f") GROUP BY ym ORDER BY ym DESC LIMIT 12"
-            )
-            sai = con.execute(q_sai12).df()
-        except Exception:
-            sai = None
-        saidas = [{ 'label': str(r['ym']), 'count': int(r['c']) } for _, r in (sai.iloc[::-1].iterrows() if (sai is not None and not sai.empty) else [])] if (sai is not None and not sai.empty) else []
-        q_validos = (
-            f"SELECT count(*) AS total, sum(CASE WHEN coalesce(nullif(cast(correio_eletronico as varchar), ''), nullif(cast(telefone_1 as varchar), ''), nullif(cast(logradouro as varchar), ''), nullif(cast(cep as varchar), '')) IS NOT NULL THEN 1 ELSE 0 END) AS ok "
-            f"FROM read_parquet('{fp}'){where_sql}"
-        )
-        try:
-            dv = con.execute(q_validos).df()
-            pct_validos = float((int(dv.iloc[0]['ok'])/max(1,int(dv.iloc[0]['total'])))*100.0) if not dv.empty else 0.0
-        except Exception:
-            pct_validos = None
+            insumos = kpis_geral_insumos_cubo(uf, municipio, cnae, ano_min, ano_max)
+        except Exception as e:
+            logger.warning(f"Erro ao ler cubos de KPIs, usando dados brutos: {e}")
+            insumos = None
+        fonte = 'cubo' if insumos is not None else 'bruto'
+        if insumos is None:
+            insumos = _kpis_geral_insumos_brutos(uf, municipio, cnae, ano_min, ano_max)
+        max_dt = insumos['max_dt']
+        total_filtrados = insumos['total_filtrados']
+        total_ativas = insumos['total_ativas']
+        entradas_30dias = insumos['entradas_30dias']
+        idade_media = insumos['idade_media']
+        entradas = insumos['entradas']
+        saidas = insumos['saidas']
+        pct_validos = insumos['pct_validos']
+        setores = insumos['setores']
+        mapa = insumos['mapa']
+        estados_crescimento = insumos['estados_crescimento']
+        idade_distribuicao = insumos['idade_distribuicao']
+        taxa_sobrevivencia = insumos['taxa_sobrevivencia']
+        entradas_mes_vigente = entradas[-1]['count'] if entradas else None
+        entradas_mes_anterior = entradas[-2]['count'] if len(entradas) >= 2 else None
+        entradas_mes_vigente_label = entradas[-1]['label'] if entradas else None
+        entradas_mes_anterior_label = entradas[-2]['label'] if len(entradas) >= 2 else None
         try:
             sai_latest = int((saidas[-1]['count'] if (saidas and len(saidas)>0) else 0))
         except Exception:
@@ -1443,140 +1596,9 @@ def api_kpis_geral():
             risk_score = max(0.0, min(100.0, base + inc - dec))
         except Exception:
             risk_score = None
-        q_top_cnae = f"SELECT cast(cnae_fiscal_principal as varchar) AS cnae, count(*) AS c FROM read_parquet('{fp}'){where_sql} GROUP BY cnae ORDER BY c DESC LIMIT 10"
-        top_cnae = con.execute(q_top_cnae).df()
-        
-        # Tentar carregar descrições de CNAEs
-        try:
-            cnae_path = str(Config.ARQUIVOS_PARQUET.get('cnaes', '')).replace('\\','/')
-            if Path(cnae_path).exists():
-                # Reexecutar query com JOIN para pegar descrições
-                q_top_cnae_desc = (
-                    f"SELECT e.cnae_fiscal_principal AS cnae, c.descricao, COUNT(*) as c "
-                    f"FROM read_parquet('{fp}') e "
-                    f"LEFT JOIN read_parquet('{cnae_path}') c ON cast(e.cnae_fiscal_principal as varchar) = cast(c.codigo as varchar) "
-                    f"{where_sql} GROUP BY e.cnae_fiscal_principal, c.descricao ORDER BY c DESC LIMIT 15"
-                )
-                top_cnae = con.execute(q_top_cnae_desc).df()
-                setores = [
-                    {
-                        'label': f"{str(r.get('descricao', ''))[:50] if 'descricao' in r and r['descricao'] else str(r['cnae']).zfill(7)}", 
-                        'cnae': str(r['cnae']).zfill(7),
-                        'count': int(r['c'])
-                    } 
-                    for _, r in top_cnae.iterrows()
-                ] if not top_cnae.empty else []
-            else:
-                setores = [{ 'label': str(r['cnae']), 'cnae': str(r['cnae']).zfill(7), 'count': int(r['c']) } for _, r in top_cnae.iterrows()] if not top_cnae.empty else []
-        except Exception as e:
-            logger.warning(f"Erro ao carregar descrições de CNAEs: {e}")
-            setores = [{ 'label': str(r['cnae']), 'cnae': str(r['cnae']).zfill(7), 'count': int(r['c']) } for _, r in top_cnae.iterrows()] if not top_cnae.empty else []
-        # Geographic aggregation: switch to municipality level if UF is filtered
-        if uf:
-            # Drill-down to municipalities within the selected state
-            q_geo = f"SELECT cast(municipio as varchar) AS label, count(*) AS c FROM read_parquet('{fp}'){where_sql} GROUP BY municipio ORDER BY c DESC LIMIT 10"
-        else:
-            # State-level aggregation when no UF filter
-            q_geo = f"SELECT cast(uf as varchar) AS label, count(*) AS c FROM read_parquet('{fp}'){where_sql} GROUP BY uf ORDER BY c DESC LIMIT 10"
-        
-        geo_df = con.execute(q_geo).df()
-        mapa = [{ 'label': str(r['label']), 'count': int(r['c']) } for _, r in geo_df.iterrows()] if not geo_df.empty else []
-        try:
-            # Calcular crescimento relativo ao mes anterior do dataset (max_dt)
-            q_ent_m1 = (
-                "SELECT cast(uf as varchar) AS uf, count(*) AS c FROM read_parquet('{fp}') "
-                f"WHERE strftime({dt_inicio}, '%Y-%m') = strftime(add_months(CAST({current_ref} AS DATE),-1),'%Y-%m')"
-                f"{' AND ' + ' AND '.join(where) if where else ''} GROUP BY uf"
-            )
-            q_ent_m2 = (
-                "SELECT cast(uf as varchar) AS uf, count(*) AS c FROM read_parquet('{fp}') "
-                f"WHERE strftime({dt_inicio}, '%Y-%m') = strftime(add_months(CAST({current_ref} AS DATE),-2),'%Y-%m')"
-                f"{' AND ' + ' AND '.join(where) if where else ''} GROUP BY uf"
-            )
-            df_m1 = con.execute(q_ent_m1).df()
-            df_m2 = con.execute(q_ent_m2).df()
-            d1 = { str(row['uf']): int(row['c']) for _, row in (df_m1.iterrows() if not df_m1.empty else []) }
-            d2 = { str(row['uf']): int(row['c']) for _, row in (df_m2.iterrows() if not df_m2.empty else []) }
-            states = []
-            keys = set(d1.keys()) | set(d2.keys())
-            for k in keys:
-                states.append({ 'label': k, 'delta': int(d1.get(k,0) - d2.get(k,0)) })
-            estados_crescimento = sorted(states, key=lambda x: x['delta'], reverse=True)[:10]
-        except Exception:
-            estados_crescimento = []
-        
-        # Age Distribution (Real Data) - Demographics
-        try:
-            q_age_dist = f"""
-            SELECT 
-                CASE 
-                    WHEN age_years <= 1 THEN '0-1 ano'
-                    WHEN age_years <= 3 THEN '1-3 anos'
-                    WHEN age_years <= 5 THEN '3-5 anos'
-                    WHEN age_years <= 10 THEN '5-10 anos'
-                    WHEN age_years <= 20 THEN '10-20 anos'
-                    ELSE '20+ anos'
-                END as faixa,
-                COUNT(*) as c
-            FROM (
-                SELECT date_diff('year', {dt_inicio}, CAST({current_ref} AS DATE)) as age_years
-                FROM read_parquet('{fp}'){where_sql}
-                WHERE {dt_inicio} IS NOT NULL
-            )
-            GROUP BY faixa
-            ORDER BY CASE faixa
-                WHEN '0-1 ano' THEN 1
-                WHEN '1-3 anos' THEN 2
-                WHEN '3-5 anos' THEN 3
-                WHEN '5-10 anos' THEN 4
-                WHEN '10-20 anos' THEN 5
-                ELSE 6
-            END
-            """
-            df_age = con.execute(q_age_dist).df()
-            idade_distribuicao = [{ 'label': str(r['faixa']), 'count': int(r['c']) } for _, r in df_age.iterrows()] if not df_age.empty else []
-        except Exception as e:
-            logger.warning(f"Erro ao calcular distribuição de idade: {e}")
-            idade_distribuicao = []
-        
-        # Survival Rate (Real Data) - Demographics
-        try:
-            q_survival = f"""
-            SELECT 
-                COUNT(CASE WHEN cast(situacao_cadastral as varchar) = '02' THEN 1 END) as ativas,
-                COUNT(*) as total
-            FROM read_parquet('{fp}'){where_sql}
-            """
-            df_survival = con.execute(q_survival).df()
-            if not df_survival.empty:
-                ativas_count = int(df_survival.iloc[0]['ativas'] or 0)
-                total_survival = int(df_survival.iloc[0]['total'] or 0)
-                taxa_sobrevivencia = (ativas_count / max(1, total_survival)) * 100.0 if total_survival > 0 else None
-            else:
-                taxa_sobrevivencia = None
-        except Exception as e:
-            logger.warning(f"Erro ao calcular taxa de sobrevivência: {e}")
-            taxa_sobrevivencia = None
-        
         # Export Potential (Heuristic) - Commercial
         try:
-            # CNAEs typically associated with export:manufacturing (10-33), tech (62-63), agro (01-03)
-            q_export = f"""
-            SELECT COUNT(*) as c
-            FROM read_parquet('{fp}'){where_sql}{' AND ' if where_sql else ' WHERE '}
-            (
-                (cast(cnae_fiscal_principal as varchar) LIKE '1%' OR 
-                 cast(cnae_fiscal_principal as varchar) LIKE '2%' OR 
-                 cast(cnae_fiscal_principal as varchar) LIKE '3%' OR
-                 cast(cnae_fiscal_principal as varchar) LIKE '62%' OR
-                 cast(cnae_fiscal_principal as varchar) LIKE '63%' OR
-                 cast(cnae_fiscal_principal as varchar) LIKE '01%' OR
-                 cast(cnae_fiscal_principal as varchar) LIKE '02%' OR
-                 cast(cnae_fiscal_principal as varchar) LIKE '03%')
-            )
-            """
-            df_export = con.execute(q_export).df()
-            export_count = int(df_export.iloc[0]['c']) if not df_export.empty else 0
+            export_count = insumos['exportacao']
             potencial_exportacao_pct = (export_count / max(1, total_filtrados)) * 100.0 if total_filtrados > 0 else 0.0
         except Exception as e:
             logger.warning(f"Erro ao calcular potencial de exportação: {e}")
@@ -1658,8 +1680,6 @@ def api_kpis_geral():
             logger.warning(f"Erro ao calcular momentum de crescimento: {e}")
             momentum_crescimento = None
         
-        con.close()
-        
         # Alinhamento robusto de meses para o gráfico (últimos 12 meses até max_dt)
         try:
             dates = pd.date_range(end=max_dt, periods=12, freq='MS').strftime('%Y-%m').tolist()
@@ -1683,7 +1703,7 @@ def api_kpis_geral():
         
         # Log performance timing
         elapsed_time = time.time() - start_time
-        logger.info(f"api_kpis_geral executed in {elapsed_time:.2f}s - filters: uf={uf}, cnae={cnae}, total={total_filtrados}")
+        logger.info(f"api_kpis_geral executed in {elapsed_time:.2f}s ({fonte}) - filters: uf={uf}, cnae={cnae}, total={total_filtrados}")
         
         response = jsonify({
             'cards': {
@@ -1763,6 +1783,7 @@ def api_analise_setorial():
     somente_ativas = bool(dados.get('somente_ativas', False))
     ano_inicio_min = dados.get('ano_inicio_min')
     ano_inicio_max = dados.get('ano_inicio_max')
+    exato = dados.get('exato')
     try:
         limite = int(dados.get('limite', 20))
     except Exception:
@@ -1799,7 +1820,8 @@ def api_analise_setorial():
         somente_ativas=somente_ativas,
         ano_inicio_min=ano_inicio_min,
         ano_inicio_max=ano_inicio_max,
-        limit=limite
+        limit=limite,
+        exato=None if exato is None else bool(exato)
     )
 
     if not resultado:
@@ -1828,18 +1850,15 @@ def api_ai_index_build_from_parquet():
     if table not in Config.ARQUIVOS_PARQUET.keys():
         return jsonify({ 'error': 'tabela inválida' }), 400
     try:
-        con = duckdb.connect()
-        p_table = str(Config.ARQUIVOS_PARQUET[table]).replace('\\', '/')
-        con.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM read_parquet('{p_table}')")
+        con = obter_cursor()
         where = []
         if uf:
             where.append(f"upper(cast(uf as varchar)) = upper('{str(uf)}')")
         if municipio:
             where.append(f"upper(cast(municipio as varchar)) = upper('{str(municipio)}')")
         where_sql = (" WHERE " + " AND ".join(where)) if where else ""
-        q = f"SELECT * FROM {table}{where_sql} LIMIT {limit}"
+        q = f"SELECT * FROM {tabela(table)}{where_sql} LIMIT {limit}"
         df = con.execute(q).df()
-        con.close()
     except Exception:
         return jsonify({ 'error': 'falha ao ler parquet' }), 500
     if df is None or df.empty:
@@ -1862,7 +1881,9 @@ def api_ai_index_build_from_parquet():
             cnae_desc = ''
         text = f"Empresa {razao} CNPJ {cnpj_basico} UF {ufv} Municipio {mun} CNAE {cnae} {cnae_desc} Porte {porte} Natureza {nat}"
         meta = { 'cnpj_basico': cnpj_basico, 'uf': ufv, 'municipio': mun, 'cnae': cnae, 'porte': porte, 'natureza_juridica': nat, 'table': table }
-        vec = _embed_text(text)
-        items.append({ 'id': f"parquet:{table}:{i}:{cnpj_basico}", 'text': text, 'meta': meta, 'vector': vec.tobytes(), 'dim': int(vec.shape[0]), 'ts': int(time.time()) })
+        items.append({ 'id': f"parquet:{table}:{i}:{cnpj_basico}", 'text': text, 'meta': meta, 'ts': int(time.time()) })
+    for it, vec in zip(items, embeddings([it['text'] for it in items])):
+        it['vector'] = vec.tobytes()
+        it['dim'] = int(vec.shape[0])
     total = _index_append_items(items)
     return jsonify({ 'ok': True, 'total_indexed': len(items), 'total_items': total })
@@ -11,6 +11,14 @@ from services.services_cnpj_service import consultar_cnpj_simples_enriquecida, b
 logger = logging.getLogger(__name__)
 consultas_bp = Blueprint('consultas', __name__)
 
+
+def _com_total(resposta, df):
+    """Total de resultados (todas as páginas) no cabeçalho X-Total-Count, quando conhecido"""
+    total = df.attrs.get('total')
+    if total is not None:
+        resposta.headers['X-Total-Count'] = str(int(total))
+    return resposta
+
 @consultas_bp.route('/cnpj/<string:cnpj>', methods=['GET'])
 @handle_errors
 def api_consulta_cnpj(cnpj):
@@ -58,7 +66,7 @@ def api_consulta_palavra_chave():
     if df is None or df.empty:
         raise NotFoundError(f"Nenhuma empresa encontrada para o termo '{termo}'")
 
-    return jsonify(serializar_dataframe(df))
+    return _com_total(jsonify(serializar_dataframe(df)), df)
 
 @consultas_bp.route('/socio', methods=['GET'])
 @handle_errors
@@ -73,12 +81,18 @@ def api_consulta_socio():
     if len(nome_socio.strip()) < 3:
         raise ValidationError("O nome do sócio deve ter pelo menos 3 caracteres")
 
+    try:
+        page = max(int(request.args.get('page', '1')), 1)
+        page_size = max(min(int(request.args.get('page_size', '500')), 500), 1)
+    except ValueError:
+        raise ValidationError("Parâmetros de paginação inválidos")
+
     logger.info(f"Busca por sócio: '{nome_socio}'")
 
     # Executa busca
-    df = buscar_empresas_por_socio(nome_socio.strip())
+    df = buscar_empresas_por_socio(nome_socio.strip(), page=page, page_size=page_size)
     if df is None or df.empty:
         raise NotFoundError(f"Nenhuma empresa encontrada para o sócio '{nome_socio}'")
 
-    return jsonify(serializar_dataframe(df))
+    return _com_total(jsonify(serializar_dataframe(df)), df)
  
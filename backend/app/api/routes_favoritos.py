@@ -39,6 +39,17 @@ def get_current_user_id():
     return 1
 
 
+def _licitacoes_atuais(licitacao_ids):
+    """Registro atual de cada licitação no espelho local do PNCP (se sincronizado)"""
+    try:
+        from services.services_pncp_espelho import espelho_disponivel, registros_por_numero
+        if not espelho_disponivel():
+            return {}
+        return registros_por_numero(licitacao_ids)
+    except Exception:
+        return {}
+
+
 @bp.route('/licitacao', methods=['POST'])
 @require_auth
 def adicionar_favorito():
@@ -156,12 +167,18 @@ def listar_favoritos():
             LIMIT ? OFFSET ?
         ''', (usuario_id, por_pagina, offset))
         
+        rows = cursor.fetchall()
+        atuais = _licitacoes_atuais([row['licitacao_id'] for row in rows])
+        
         favoritos = []
-        for row in cursor.fetchall():
+        for row in rows:
             try:
                 licitacao_data = json.loads(row['licitacao_data']) if row['licitacao_data'] else {}
             except:
                 licitacao_data = {}
+            # Dados atuais do espelho PNCP prevalecem sobre o snapshot salvo
+            if row['licitacao_id'] in atuais:
+                licitacao_data = {**licitacao_data, **atuais[row['licitacao_id']]}
                 
             favoritos.append({
                 'id': row['id'],
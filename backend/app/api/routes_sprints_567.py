@@ -6,8 +6,9 @@ Parcerias, Cache e Integrações
 from flask import Blueprint, jsonify, request
 import logging
 from services.services_parcerias_b2g import ParceriasB2GService
-from services.services_cache_performance import CacheB2GService
+from services.services_cache_performance import obter_cache_b2g
 from services.services_integracoes_b2g import IntegracoesB2GService
+from services.services_cache_service import cache, obter_estatisticas_cache
 from utils.utils_error_handler import handle_errors
 import sqlite3
 
@@ -84,13 +85,9 @@ def invalidar_cache():
     """Invalida cache"""
     data = request.get_json() or {}
     padrao = data.get('padrao')
+    tag = data.get('tag')
     
-    db = _get_db()
-    service = CacheB2GService(db)
-    total = service.invalidar_cache(padrao)
-    
-    if db:
-        db.close()
+    total = obter_cache_b2g().invalidar_cache(padrao, tag)
     
     return jsonify({
         'sucesso': True,
@@ -102,16 +99,23 @@ def invalidar_cache():
 @handle_errors
 def limpar_expirado():
     """Limpa cache expirado"""
-    db = _get_db()
-    service = CacheB2GService(db)
-    total = service.limpar_cache_expirado()
-    
-    if db:
-        db.close()
+    total = obter_cache_b2g().limpar_cache_expirado()
     
     return jsonify({
         'sucesso': True,
-        'total_removido': total
+        'total_removido': total,
+        'total_removido_cache': cache.expire()
+    })
+
+
+@cache_bp.route('/estatisticas', methods=['GET'])
+@handle_errors
+def estatisticas_cache():
+    """Acertos, falhas, remoções e latência por namespace do cache em camadas"""
+    return jsonify({
+        'sucesso': True,
+        'estatisticas': obter_estatisticas_cache(),
+        'b2g': obter_cache_b2g().estatisticas()
     })
 
 
@@ -163,6 +167,28 @@ def sincronizar_pncp():
     })
 
 
+@integracoes_bp.route('/agendador', methods=['GET'])
+@handle_errors
+def estado_agendador():
+    """Estado e métricas das tarefas agendadas"""
+    from services.services_agendador import estado_agendador as _estado
+    return jsonify({
+        'sucesso': True,
+        **_estado()
+    })
+
+
+@integracoes_bp.route('/agendador/<nome>/executar', methods=['POST'])
+@handle_errors
+def executar_tarefa_agendada(nome):
+    """Antecipa a execução de uma tarefa agendada"""
+    from services.services_agendador import obter_agendador
+    enviada = obter_agendador().executar_agora(nome)
+    if not enviada:
+        return jsonify({'erro': 'Tarefa desconhecida, agendador parado ou tarefa já em execução'}), 409
+    return jsonify({'sucesso': True, 'tarefa': nome}), 202
+
+
 # ==================== HEALTH CHECKS ====================
 
 @parcerias_bp.route('/health', methods=['GET'])
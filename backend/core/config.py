@@ -2,6 +2,7 @@
 Configurações centralizadas da aplicação
 """
 
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -43,6 +44,26 @@ class Config:
     CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
     CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
     CACHE_THRESHOLD = int(os.environ.get('CACHE_THRESHOLD', 1000))
+    # Cache em camadas (services.services_cache_service): LRU em memória + diskcache
+    CACHE_MEMORIA_MB = int(os.environ.get('CACHE_MEMORIA_MB', 256))
+    CACHE_MEMORIA_ITEM_MB = int(os.environ.get('CACHE_MEMORIA_ITEM_MB', 64))  # maior item mantido em memória
+    CACHE_DISCO_MB = int(os.environ.get('CACHE_DISCO_MB', 4096))
+    # Espera máxima por um cálculo idêntico já em andamento (em_voo)
+    CACHE_ESPERA_TIMEOUT = float(os.environ.get('CACHE_ESPERA_TIMEOUT', 120))  # segundos
+    # Por namespace (prefixo da chave antes de ':'): ttl em segundos, memoria_mb e
+    # obsoleto (segundos após o TTL em que o valor antigo é servido enquanto recalcula)
+    CACHE_NAMESPACES = json.loads(os.environ.get('CACHE_NAMESPACES') or json.dumps({
+        'cnaes': {'ttl': 86400, 'memoria_mb': 32},
+        'municipios': {'ttl': 86400, 'memoria_mb': 32},
+        'cnpj': {'memoria_mb': 64, 'obsoleto': 86400},
+        'setorial': {'memoria_mb': 64, 'obsoleto': 3600},
+        'pncp': {'memoria_mb': 32, 'obsoleto': 1800},
+    }))
+    # Recálculo em segundo plano das entradas obsoletas e das chaves mais acessadas
+    CACHE_RECALCULO_TRABALHADORES = int(os.environ.get('CACHE_RECALCULO_TRABALHADORES', 2))
+    CACHE_RECALCULO_MAX_CHAVES = int(os.environ.get('CACHE_RECALCULO_MAX_CHAVES', 5000))
+    CACHE_POPULARES_TOP = int(os.environ.get('CACHE_POPULARES_TOP', 50))
+    CACHE_POPULARES_ANTECEDENCIA = int(os.environ.get('CACHE_POPULARES_ANTECEDENCIA', 120))  # segundos antes de vencer
 
     # API
     API_VERSION = '4.0'
@@ -62,43 +83,77 @@ class Config:
             pass
         return root / patterns[0]
 
-    # Resolver dinamicamente os arquivos dentro de '2_fonte_de_dados'
-    ARQUIVOS_PARQUET = {
-        'empresas': _find_file.__func__(DATA_DIR, [
-            '*EMPRESAS*.parquet','*empresas*.parquet'
-        ]),
-        'estabelecimentos': _find_file.__func__(DATA_DIR, [
-            '*ESTABELECIMENTOS*.parquet','*estabelecimentos*.parquet','*K3241*K3241*.parquet'
-        ]),
-        'socios': _find_file.__func__(DATA_DIR, [
-            '*SOCIOS*.parquet','*socios*.parquet','*QSA*.parquet'
-        ]),
-        'simples': _find_file.__func__(DATA_DIR, [
-            '*SIMPLES*.parquet','*simples*.parquet'
-        ]),
-        'cnaes': _find_file.__func__(DATA_DIR, [
-            '*CNAES*.parquet','*cnae*.parquet'
-        ]),
-        'municipios': _find_file.__func__(DATA_DIR, [
-            '*MUNICIPIOS*.parquet','*municipio*.parquet','*IBGE*MUN*.parquet'
-        ]),
-        'pgfn': _find_file.__func__(DATA_DIR, [
-            '**/*PGFN*.parquet','**/*divida*.parquet'
-        ]),
-        'comex': _find_file.__func__(DATA_DIR, [
-            '**/*COMEX*.parquet','**/*export*.parquet','**/*import*.parquet'
-        ]),
-        'caged': _find_file.__func__(DATA_DIR, [
-            '**/*CAGED*.parquet','**/*emprego*.parquet'
-        ]),
-        'antt': _find_file.__func__(DATA_DIR, [
-            '**/*ANTT*.parquet','**/*logistica*.parquet','**/*transporte*.parquet'
-        ]),
-        'diarios': _find_file.__func__(DATA_DIR, [
-            '**/*DIARIO*.parquet','**/*DOU*.parquet','**/*diario_oficial*.parquet'
-        ])
+    # Padrões de busca dos arquivos dentro de '2_fonte_de_dados'
+    PADROES_PARQUET = {
+        'empresas': ['*EMPRESAS*.parquet','*empresas*.parquet'],
+        'estabelecimentos': ['*ESTABELECIMENTOS*.parquet','*estabelecimentos*.parquet','*K3241*K3241*.parquet'],
+        'socios': ['*SOCIOS*.parquet','*socios*.parquet','*QSA*.parquet'],
+        'simples': ['*SIMPLES*.parquet','*simples*.parquet'],
+        'cnaes': ['*CNAES*.parquet','*cnae*.parquet'],
+        'municipios': ['*MUNICIPIOS*.parquet','*municipio*.parquet','*IBGE*MUN*.parquet'],
+        'pgfn': ['**/*PGFN*.parquet','**/*divida*.parquet'],
+        'comex': ['**/*COMEX*.parquet','**/*export*.parquet','**/*import*.parquet'],
+        'caged': ['**/*CAGED*.parquet','**/*emprego*.parquet'],
+        'antt': ['**/*ANTT*.parquet','**/*logistica*.parquet','**/*transporte*.parquet'],
+        'diarios': ['**/*DIARIO*.parquet','**/*DOU*.parquet','**/*diario_oficial*.parquet']
     }
 
+    # Datasets particionados/ordenados (gerados por services.services_layout_parquet)
+    DATASETS_DIR = Path(os.environ.get('DATASETS_DIR', str(DATA_DIR / 'datasets')))
+    USAR_DATASETS = os.environ.get('USAR_DATASETS', 'true').lower() == 'true'
+    LAYOUT_ROW_GROUP = int(os.environ.get('LAYOUT_ROW_GROUP', 122880))
+
+    @staticmethod
+    def _dataset_gerado(datasets_dir: Path, nome: str, origem: Path = None):
+        """
+        Diretório do dataset gerado para a tabela, se existir e tiver arquivos.
+
+        Se o arquivo monolítico de origem mudou desde a geração (novo dump,
+        com outro nome ou mais recente), o dataset está desatualizado e é
+        ignorado até ser gerado de novo.
+        """
+        try:
+            diretorio = Path(datasets_dir) / nome
+            arquivos = list(diretorio.rglob('*.parquet')) if diretorio.is_dir() else []
+            if not arquivos:
+                return None
+            if origem is not None and Path(origem).is_file():
+                try:
+                    with open(Path(datasets_dir) / 'manifesto.json', 'r', encoding='utf-8') as f:
+                        gerado = (json.load(f).get('tabelas') or {}).get(nome) or {}
+                except (OSError, ValueError):
+                    gerado = {}
+                if gerado.get('origem') and Path(gerado['origem']).name != Path(origem).name:
+                    return None
+                referencia = gerado.get('origem_mtime') or max(a.stat().st_mtime for a in arquivos)
+                if Path(origem).stat().st_mtime > referencia:
+                    return None
+            return diretorio
+        except Exception:
+            pass
+        return None
+
+    # Resolver dinamicamente os arquivos dentro de '2_fonte_de_dados'
+    # (datasets gerados têm prioridade sobre os arquivos monolíticos, enquanto
+    # estiverem em dia com eles)
+    ARQUIVOS_PARQUET = {}
+    for _nome, _padroes in PADROES_PARQUET.items():
+        _origem = _find_file.__func__(DATA_DIR, _padroes)
+        ARQUIVOS_PARQUET[_nome] = (USAR_DATASETS and _dataset_gerado.__func__(DATASETS_DIR, _nome, _origem)) or _origem
+    del _nome, _padroes, _origem
+
+    @classmethod
+    def recarregar_arquivos_parquet(cls) -> dict:
+        """Resolve de novo os arquivos (ex.: após um novo dump mensal), atualizando o dict no lugar"""
+        for nome, padroes in cls.PADROES_PARQUET.items():
+            origem = cls._find_file(cls.DATA_DIR, padroes)
+            cls.ARQUIVOS_PARQUET[nome] = (cls.USAR_DATASETS and cls._dataset_gerado(cls.DATASETS_DIR, nome, origem)) or origem
+        return cls.ARQUIVOS_PARQUET
+
+    # Manifesto da versão dos dados carregados (gerado por services.services_versao_dados)
+    VERSAO_DADOS_ARQUIVO = Path(os.environ.get('VERSAO_DADOS_ARQUIVO', str(DATA_DIR / 'versao_dados.json')))
+    ATUALIZAR_ARTEFATOS_NA_INICIALIZACAO = os.environ.get('ATUALIZAR_ARTEFATOS_NA_INICIALIZACAO', 'false').lower() == 'true'
+
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -107,7 +162,114 @@ class Config:
     MAX_PAGE_SIZE = 500
     DEFAULT_PAGE_SIZE = 50
     QUERY_TIMEOUT = 30  # segundos
-    
+
+    # DuckDB (conexão compartilhada por processo)
+    DUCKDB_PATH = os.environ.get('DUCKDB_PATH', ':memory:')
+    DUCKDB_MEMORY_LIMIT = os.environ.get('DUCKDB_MEMORY_LIMIT', '2GB')
+    DUCKDB_THREADS = int(os.environ.get('DUCKDB_THREADS', 4))
+    DUCKDB_TEMP_DIR = os.environ.get('DUCKDB_TEMP_DIR', str(CACHE_DIR / 'duckdb_tmp'))
+
+    # Índice de consulta pontual por CNPJ (gerado por services.services_cnpj_index)
+    CNPJ_INDEX_DIR = Path(os.environ.get('CNPJ_INDEX_DIR', str(DATA_DIR / 'indice_cnpj')))
+    CNPJ_INDEX_ROW_GROUP = int(os.environ.get('CNPJ_INDEX_ROW_GROUP', 2048))
+
+    # Cubos de agregados dos dashboards de KPIs (gerados por services.services_kpi_cubo)
+    KPI_CUBO_DIR = Path(os.environ.get('KPI_CUBO_DIR', str(DATA_DIR / 'cubos_kpi')))
+
+    # Índice invertido de nomes (gerado por services.services_busca_nomes)
+    BUSCA_INDEX_DIR = Path(os.environ.get('BUSCA_INDEX_DIR', str(DATA_DIR / 'indice_nomes')))
+    BUSCA_INDEX_ROW_GROUP = int(os.environ.get('BUSCA_INDEX_ROW_GROUP', 8192))
+
+    # Responsável (sócio administrador) por CNPJ básico (gerado por services.services_responsavel)
+    RESPONSAVEL_DIR = Path(os.environ.get('RESPONSAVEL_DIR', str(DATA_DIR / 'responsavel')))
+    RESPONSAVEL_ROW_GROUP = int(os.environ.get('RESPONSAVEL_ROW_GROUP', 16384))
+
+    # Máximo de candidatos (maior capital social primeiro) lidos por ranking
+    CANDIDATOS_LIMITE = int(os.environ.get('CANDIDATOS_LIMITE', 500000))
+    # Candidatos lidos no último recurso do ranking (sem nenhum filtro)
+    CANDIDATOS_LIMITE_AMPLIADO = int(os.environ.get('CANDIDATOS_LIMITE_AMPLIADO', 100000))
+
+    # Análise setorial: KPIs agregados sobre toda a população filtrada (sem amostra)
+    ANALISE_SETORIAL_EXATA = os.environ.get('ANALISE_SETORIAL_EXATA', 'true').lower() == 'true'
+
+    # Ranking de leads: conjuntos pontuados mantidos para paginação por cursor
+    RANKING_CURSOR_MAX = int(os.environ.get('RANKING_CURSOR_MAX', 16))
+    RANKING_CURSOR_TTL = int(os.environ.get('RANKING_CURSOR_TTL', 900))  # segundos
+
+    # Lista de players: contagem exata por filtro guardada no cache
+    PLAYERS_TOTAL_TTL = int(os.environ.get('PLAYERS_TOTAL_TTL', 3600))  # segundos
+
+    # Coletor PNCP: requisições simultâneas, repetições com backoff e cache por página
+    PNCP_CONCORRENCIA = int(os.environ.get('PNCP_CONCORRENCIA', 6))
+    PNCP_TENTATIVAS = int(os.environ.get('PNCP_TENTATIVAS', 4))
+    PNCP_BACKOFF = float(os.environ.get('PNCP_BACKOFF', 0.5))  # segundos (dobra a cada tentativa)
+    PNCP_TIMEOUT = int(os.environ.get('PNCP_TIMEOUT', 15))  # segundos
+    PNCP_PAGINA_TTL = int(os.environ.get('PNCP_PAGINA_TTL', 600))  # segundos
+    PNCP_API_URL = os.environ.get('PNCP_API_URL', 'https://pncp.gov.br/api/consulta')
+
+    # Espelho local do PNCP (gerado por services.services_pncp_espelho)
+    PNCP_ESPELHO_ATIVO = os.environ.get('PNCP_ESPELHO_ATIVO', 'true').lower() == 'true'
+    PNCP_ESPELHO_PATH = Path(os.environ.get('PNCP_ESPELHO_PATH', str(DATA_DIR / 'pncp' / 'espelho_pncp.duckdb')))
+    PNCP_ESPELHO_TIPOS = [t.strip() for t in os.environ.get('PNCP_ESPELHO_TIPOS', 'contratacoes,contratos').split(',') if t.strip()]
+    PNCP_ESPELHO_DIAS_INICIAIS = int(os.environ.get('PNCP_ESPELHO_DIAS_INICIAIS', 90))
+    PNCP_ESPELHO_JANELA_DIAS = int(os.environ.get('PNCP_ESPELHO_JANELA_DIAS', 10))
+    PNCP_ESPELHO_SOBREPOSICAO_DIAS = int(os.environ.get('PNCP_ESPELHO_SOBREPOSICAO_DIAS', 1))
+    PNCP_ESPELHO_INTERVALO = int(os.environ.get('PNCP_ESPELHO_INTERVALO', 900))  # segundos; 0 desativa
+    # Frescor exigido para consultar o espelho em vez da API
+    PNCP_ESPELHO_TOLERANCIA_DIAS = int(os.environ.get('PNCP_ESPELHO_TOLERANCIA_DIAS', 1))  # atraso aceito da marca d'água
+    PNCP_ESPELHO_IDADE_MAX = int(os.environ.get('PNCP_ESPELHO_IDADE_MAX', 3600))  # segundos desde a última sincronização; 0 desativa
+
+    # Alertas B2G: janela inicial (sem verificação anterior) e máximo de licitações por lote
+    ALERTAS_DIAS_INICIAIS = int(os.environ.get('ALERTAS_DIAS_INICIAIS', 7))
+    ALERTAS_LOTE_MAX = int(os.environ.get('ALERTAS_LOTE_MAX', 50000))
+
+    # Cache B2G (services.services_cache_performance): LRU em memória + gravação em lote no SQLite
+    CACHE_B2G_MAX_ENTRADAS = int(os.environ.get('CACHE_B2G_MAX_ENTRADAS', 20000))
+    CACHE_B2G_MAX_MB = int(os.environ.get('CACHE_B2G_MAX_MB', 64))
+    CACHE_B2G_LOTE = int(os.environ.get('CACHE_B2G_LOTE', 500))  # entradas por transação
+    CACHE_B2G_INTERVALO_ESCRITA = float(os.environ.get('CACHE_B2G_INTERVALO_ESCRITA', 2))  # segundos
+    MATCH_CACHE_TTL = int(os.environ.get('MATCH_CACHE_TTL', 86400))  # segundos
+
+    # Aquecimento de cache (services.services_aquecimento): repete as consultas mais frequentes
+    AQUECIMENTO_ATIVO = os.environ.get('AQUECIMENTO_ATIVO', 'true').lower() == 'true'
+    AQUECIMENTO_CONSULTAS = int(os.environ.get('AQUECIMENTO_CONSULTAS', 50))
+    AQUECIMENTO_TRABALHADORES = int(os.environ.get('AQUECIMENTO_TRABALHADORES', 2))
+    AQUECIMENTO_TEMPO_MAX = int(os.environ.get('AQUECIMENTO_TEMPO_MAX', 900))  # segundos até declarar pronto
+    AQUECIMENTO_JANELA_DIAS = int(os.environ.get('AQUECIMENTO_JANELA_DIAS', 14))
+    # /api/health responde 503 enquanto o aquecimento inicial não termina
+    AQUECIMENTO_SAUDE_AGUARDA = os.environ.get('AQUECIMENTO_SAUDE_AGUARDA', 'true').lower() == 'true'
+    # Prefixos de rota cujas consultas são registradas para o aquecimento
+    AQUECIMENTO_ROTAS = [r.strip() for r in os.environ.get(
+        'AQUECIMENTO_ROTAS',
+        '/api/analise/setorial,/api/analise/players/lista,/api/analise/kpis/geral,/api/analise/kpis/base,'
+        '/api/analise/pncp/serie,/api/analise/pncp/editais,/api/consulta/cnpj/'
+    ).split(',') if r.strip()]
+    # Consultas sempre aquecidas: [{"metodo": "POST", "caminho": "/api/analise/setorial", "corpo": {...}}]
+    AQUECIMENTO_CONSULTAS_FIXAS = json.loads(os.environ.get('AQUECIMENTO_CONSULTAS_FIXAS') or json.dumps([
+        {'metodo': 'GET', 'caminho': '/api/analise/kpis/base'},
+        {'metodo': 'GET', 'caminho': '/api/analise/kpis/geral'},
+        {'metodo': 'GET', 'caminho': '/api/analise/players/lista'},
+    ]))
+
+    # Embeddings do índice semântico (services.services_embeddings)
+    AI_EMBED_LOTE = int(os.environ.get('AI_EMBED_LOTE', 64))  # textos por requisição
+    AI_EMBED_CONCORRENCIA = int(os.environ.get('AI_EMBED_CONCORRENCIA', 4))
+    AI_EMBED_TENTATIVAS = int(os.environ.get('AI_EMBED_TENTATIVAS', 4))
+    AI_EMBED_BACKOFF = float(os.environ.get('AI_EMBED_BACKOFF', 0.5))  # segundos (dobra a cada tentativa)
+    AI_EMBED_TIMEOUT = int(os.environ.get('AI_EMBED_TIMEOUT', 60))  # segundos por lote
+    AI_EMBED_CACHE_DIR = Path(os.environ.get('AI_EMBED_CACHE_DIR', str(CACHE_DIR / 'embeddings')))
+    AI_EMBED_CACHE_MB = int(os.environ.get('AI_EMBED_CACHE_MB', 1024))
+
+    # Agendador de tarefas em segundo plano (estado em B2G_DB_PATH)
+    B2G_DB_PATH = Path(os.environ.get('B2G_DB_PATH', str(BASE_DIR.parent / 'users.db')))
+    AGENDADOR_ATIVO = os.environ.get('AGENDADOR_ATIVO', 'true').lower() == 'true'
+    AGENDADOR_TRABALHADORES = int(os.environ.get('AGENDADOR_TRABALHADORES', 2))
+    AGENDADOR_TICK = float(os.environ.get('AGENDADOR_TICK', 5))  # segundos
+    AGENDADOR_ALERTAS_INTERVALO = int(os.environ.get('AGENDADOR_ALERTAS_INTERVALO', 300))  # segundos; 0 desativa
+    AGENDADOR_CACHE_INTERVALO = int(os.environ.get('AGENDADOR_CACHE_INTERVALO', 3600))  # segundos; 0 desativa
+    AGENDADOR_POPULARES_INTERVALO = int(os.environ.get('AGENDADOR_POPULARES_INTERVALO', 60))  # segundos; 0 desativa
+    AGENDADOR_AQUECIMENTO_INTERVALO = int(os.environ.get('AGENDADOR_AQUECIMENTO_INTERVALO', 300))  # segundos; 0 desativa
+
     # Email Configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
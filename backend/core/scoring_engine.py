@@ -4,13 +4,16 @@ Motor de pontuação para análise de compatibilidade B2B.
 Avalia a compatibilidade entre prestador e potencial cliente/oportunidade.
 """
 
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Union
 from dataclasses import dataclass
 from enum import Enum
 from datetime import datetime
 import re
 import math
 
+import numpy as np
+import pandas as pd
+
 
 # ========================================
 # ENUMS E CONSTANTES
@@ -44,45 +47,10 @@ class ClassificacaoScore(Enum):
     MUITO_BAIXA = "Muito Baixa"
 
 
-# Mapeamento de estados vizinhos (completo)
-ESTADOS_VIZINHOS = {
-    'AC': ['AM', 'RO'],
-    'AL': ['PE', 'SE', 'BA'],
-    'AP': ['PA'],
-    'AM': ['RR', 'PA', 'MT', 'RO', 'AC'],
-    'BA': ['SE', 'AL', 'PE', 'PI', 'TO', 'GO', 'MG', 'ES'],
-    'CE': ['RN', 'PB', 'PE', 'PI'],
-    'DF': ['GO', 'MG'],
-    'ES': ['BA', 'MG', 'RJ'],
-    'GO': ['TO', 'BA', 'MG', 'MS', 'MT', 'DF'],
-    'MA': ['PA', 'TO', 'PI'],
-    'MT': ['RO', 'AM', 'PA', 'TO', 'GO', 'MS'],
-    'MS': ['MT', 'GO', 'MG', 'SP', 'PR'],
-    'MG': ['BA', 'ES', 'RJ', 'SP', 'MS', 'GO', 'DF'],
-    'PA': ['AP', 'MA', 'TO', 'MT', 'AM', 'RR'],
-    'PB': ['RN', 'CE', 'PE'],
-    'PR': ['SP', 'MS', 'SC'],
-    'PE': ['PB', 'CE', 'PI', 'BA', 'AL'],
-    'PI': ['CE', 'MA', 'TO', 'BA', 'PE'],
-    'RJ': ['ES', 'MG', 'SP'],
-    'RN': ['PB', 'CE'],
-    'RS': ['SC'],
-    'RO': ['AC', 'AM', 'MT'],
-    'RR': ['AM', 'PA'],
-    'SC': ['PR', 'RS'],
-    'SP': ['MG', 'RJ', 'PR', 'MS'],
-    'SE': ['AL', 'BA'],
-    'TO': ['MA', 'PI', 'BA', 'GO', 'MT', 'PA']
-}
-
-# Regiões do Brasil
-REGIOES = {
-    'Norte': ['AC', 'AP', 'AM', 'PA', 'RO', 'RR', 'TO'],
-    'Nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
-    'Centro-Oeste': ['DF', 'GO', 'MT', 'MS'],
-    'Sudeste': ['ES', 'MG', 'RJ', 'SP'],
-    'Sul': ['PR', 'SC', 'RS']
-}
+# Estados vizinhos, regiões e demais tabelas compiladas na importação
+from .tabelas_referencia import (
+    UF_REGIAO, PARES_VIZINHOS, codificar_cnae, limpar_cnae, nivel_porte, parse_data
+)
 
 
 # ========================================
@@ -381,7 +349,7 @@ class ScoringEngine:
     
     def _limpar_cnae(self, cnae: str) -> str:
         """Remove caracteres não numéricos do CNAE."""
-        return ''.join(c for c in str(cnae) if c.isdigit())
+        return limpar_cnae(cnae)
     
     def _avaliar_cnae(self, cnae_empresa: str, cnae_edital: str) -> Tuple[float, str]:
         """
@@ -400,8 +368,10 @@ class ScoringEngine:
             self.alertas.append("CNAE faltando - usando score neutro")
             return 0.5, "CNAE não informado"
         
-        cnae_emp = self._limpar_cnae(cnae_empresa)
-        cnae_edit = self._limpar_cnae(cnae_edital)
+        cod_emp = codificar_cnae(cnae_empresa)
+        cod_edit = codificar_cnae(cnae_edital)
+        cnae_emp = cod_emp.digitos
+        cnae_edit = cod_edit.digitos
         
         if not cnae_emp or not cnae_edit:
             return 0.5, "CNAE inválido"
@@ -420,21 +390,18 @@ class ScoringEngine:
                 return score_potencial, f"Cliente {tipo_potencial}"
         
         # Fallback: comparação simples por setor
-        if cnae_emp[:2] == cnae_edit[:2]:
+        if cod_emp.divisao == cod_edit.divisao:
             self.alertas.append("Mesmo setor - possível concorrência")
             return 0.3, "Mesmo setor"
         
-        if cnae_emp[:1] == cnae_edit[:1]:
+        if cod_emp.digito1 == cod_edit.digito1:
             return 0.6, "Seção relacionada"
         
         return 0.5, "Setores diferentes"
     
     def _get_regiao(self, uf: str) -> Optional[str]:
         """Retorna a região do estado."""
-        for regiao, estados in REGIOES.items():
-            if uf in estados:
-                return regiao
-        return None
+        return UF_REGIAO.get(uf) if isinstance(uf, str) else None
     
     def _avaliar_localizacao(self, uf_empresa: str, municipio_empresa: str,
                             uf_edital: str, municipio_edital: str) -> Tuple[float, str]:
@@ -460,8 +427,7 @@ class ScoringEngine:
             return 0.8, "Mesmo estado"
         
         # Estados vizinhos = bom
-        vizinhos = ESTADOS_VIZINHOS.get(uf_emp, [])
-        if uf_edit in vizinhos:
+        if f"{uf_emp}|{uf_edit}" in PARES_VIZINHOS:
             return 0.5, "Estado vizinho"
         
         # Mesma região = aceitável
@@ -476,25 +442,10 @@ class ScoringEngine:
     
     def _normalizar_porte(self, porte: str) -> Optional[Porte]:
         """Converte string para enum Porte."""
-        try:
-            porte_upper = porte.upper().strip()
-            
-            # Mapeamentos comuns
-            mapeamento = {
-                'MEI': Porte.MEI,
-                'MICRO': Porte.MICRO,
-                'MICRO EMPRESA': Porte.MICRO,
-                'PEQUENO': Porte.PEQUENO,
-                'PEQUENA': Porte.PEQUENO,
-                'EPP': Porte.PEQUENO,
-                'MEDIO': Porte.MEDIO,
-                'MÉDIA': Porte.MEDIO,
-                'GRANDE': Porte.GRANDE
-            }
-            
-            return mapeamento.get(porte_upper)
-        except:
+        if not isinstance(porte, str):
             return None
+        nivel = nivel_porte(porte)
+        return Porte(nivel) if nivel else None
     
     def _avaliar_porte(self, porte_empresa: str, 
                       portes_preferenciais: List[str]) -> Tuple[float, str]:
@@ -590,24 +541,9 @@ class ScoringEngine:
     
     def _parse_data(self, data_str: str) -> Optional[datetime]:
         """Tenta fazer parse de data em vários formatos."""
-        if not data_str:
+        if not data_str or not isinstance(data_str, str):
             return None
-        
-        formatos = [
-            '%Y-%m-%d',
-            '%d/%m/%Y',
-            '%Y%m%d',
-            '%d-%m-%Y',
-            '%Y/%m/%d'
-        ]
-        
-        for fmt in formatos:
-            try:
-                return datetime.strptime(data_str[:10], fmt)
-            except:
-                continue
-        
-        return None
+        return parse_data(data_str[:10])
     
     def _avaliar_experiencia(self, data_abertura: str, 
                             exige_experiencia: bool) -> Tuple[float, str]:
@@ -701,6 +637,263 @@ class ScoringEngine:
         
         return 0.5, "Situação desconhecida"
 
+    # ========================================
+    # MODO VETORIZADO (LOTE)
+    # ========================================
+
+    def calcular_scores_vetorizado(self, empresas: Union[pd.DataFrame, Dict[str, Any]],
+                                   edital: Union[pd.DataFrame, Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Calcula os scores de vários pares empresa/edital com operações em arrays.
+
+        Produz os mesmos scores e classificações de `calcular_score`, sem os
+        textos de detalhe e alertas. Qualquer um dos lados pode ser um dict
+        (valor único, replicado para todas as linhas) ou um DataFrame com as
+        mesmas chaves usadas no modo escalar.
+
+        Args:
+            empresas: Colunas cnae_fiscal, uf, municipio, porte, capital_social,
+                data_abertura, situacao_cadastral
+            edital: Colunas cnae_relacionado, uf, municipio, porte_preferencial,
+                valorEstimado, exige_experiencia, exige_certidoes
+
+        Returns:
+            DataFrame com score_<critério> (0-100), score_total e classificacao
+        """
+        if isinstance(empresas, pd.DataFrame):
+            index = empresas.index
+        elif isinstance(edital, pd.DataFrame):
+            index = edital.index
+        else:
+            index = pd.RangeIndex(1)
+
+        def coluna(fonte, nome, padrao):
+            if isinstance(fonte, pd.DataFrame):
+                if nome in fonte.columns:
+                    return pd.Series(fonte[nome].to_numpy(dtype=object), index=index)
+                return pd.Series([padrao] * len(index), index=index, dtype=object)
+            valor = fonte.get(nome, padrao)
+            return pd.Series([valor] * len(index), index=index, dtype=object)
+
+        scores = {
+            'cnae': self._vet_cnae(coluna(empresas, 'cnae_fiscal', ''),
+                                   coluna(edital, 'cnae_relacionado', '')),
+            'localizacao': self._vet_localizacao(coluna(empresas, 'uf', ''),
+                                                 coluna(empresas, 'municipio', ''),
+                                                 coluna(edital, 'uf', ''),
+                                                 coluna(edital, 'municipio', '')),
+            'porte': self._vet_porte(coluna(empresas, 'porte', ''),
+                                     coluna(edital, 'porte_preferencial', [])),
+            'capital_social': self._vet_capital_social(coluna(empresas, 'capital_social', 0),
+                                                       coluna(edital, 'valorEstimado', 0)),
+            'experiencia': self._vet_experiencia(coluna(empresas, 'data_abertura', ''),
+                                                 coluna(edital, 'exige_experiencia', False)),
+            'certidoes': self._vet_certidoes(coluna(empresas, 'situacao_cadastral', ''),
+                                             coluna(edital, 'exige_certidoes', False)),
+        }
+
+        # Mesma ordem de soma do modo escalar
+        total = np.zeros(len(index))
+        resultado = {}
+        for nome, score in scores.items():
+            peso = getattr(self.perfil, nome)
+            resultado[f'score_{nome}'] = score * 100
+            total = total + score * peso * 100
+        total = np.clip(total, 0, 100)
+
+        resultado['score_total'] = total
+        resultado['classificacao'] = np.select(
+            [total >= 85, total >= 70, total >= 50, total >= 30],
+            [ClassificacaoScore.MUITO_ALTA.value, ClassificacaoScore.ALTA.value,
+             ClassificacaoScore.MEDIA.value, ClassificacaoScore.BAIXA.value],
+            default=ClassificacaoScore.MUITO_BAIXA.value
+        )
+        return pd.DataFrame(resultado, index=index)
+
+    @staticmethod
+    def _vet_vazio(valores: pd.Series) -> np.ndarray:
+        """Equivalente vetorizado de `not valor` para os campos de entrada."""
+        return (valores.isna() | valores.eq('') | valores.eq(0)).to_numpy()
+
+    @staticmethod
+    def _vet_texto(valores: pd.Series) -> pd.Series:
+        """Converte para texto, com vazio nas posições ausentes."""
+        return valores.where(valores.notna(), '').astype(str)
+
+    @staticmethod
+    def _vet_flag(valores: pd.Series) -> np.ndarray:
+        return valores.map(bool).to_numpy(dtype=bool)
+
+    @staticmethod
+    def _vet_por_valor(valores: pd.Series, funcao, padrao: float) -> np.ndarray:
+        """
+        Aplica `funcao` uma única vez por valor distinto e espalha o resultado.
+        Posições ausentes (None/NaN) recebem `padrao`.
+        """
+        codigos, unicos = pd.factorize(valores)
+        tabela = np.array([funcao(v) for v in unicos] + [padrao], dtype=float)
+        return tabela[np.where(codigos >= 0, codigos, len(unicos))]
+
+    def _vet_cnae(self, cnae_empresa: pd.Series, cnae_edital: pd.Series) -> np.ndarray:
+        """Versão vetorizada de `_avaliar_cnae`."""
+        faltando = self._vet_vazio(cnae_empresa) | self._vet_vazio(cnae_edital)
+        emp = self._vet_texto(cnae_empresa).str.replace(r'\D', '', regex=True)
+        edit = self._vet_texto(cnae_edital).str.replace(r'\D', '', regex=True)
+        invalido = (emp.eq('') | edit.eq('')).to_numpy()
+
+        mapeado = np.full(len(emp), np.nan)
+        if CNAE_MAPPING_DISPONIVEL:
+            # As regras de mapeamento são avaliadas uma vez por par distinto de CNAEs
+            def regra_mapeamento(par):
+                a, b = par.split('|', 1)
+                if not a or not b:
+                    return np.nan
+                if is_concorrente(a, b):
+                    return 0.1
+                _, score_potencial = get_potencial_score(a, b)
+                return score_potencial if score_potencial > 0 else np.nan
+            mapeado = self._vet_por_valor(emp + '|' + edit, regra_mapeamento, np.nan)
+
+        mesmo_setor = (emp.str[:2] == edit.str[:2]).to_numpy()
+        mesma_secao = (emp.str[:1] == edit.str[:1]).to_numpy()
+        return np.select(
+            [faltando, invalido, ~np.isnan(mapeado), mesmo_setor, mesma_secao],
+            [0.5, 0.5, mapeado, 0.3, 0.6],
+            default=0.5
+        )
+
+    def _vet_localizacao(self, uf_empresa: pd.Series, municipio_empresa: pd.Series,
+                         uf_edital: pd.Series, municipio_edital: pd.Series) -> np.ndarray:
+        """Versão vetorizada de `_avaliar_localizacao`."""
+        faltando = self._vet_vazio(uf_empresa) | self._vet_vazio(uf_edital)
+        uf_emp = self._vet_texto(uf_empresa).str.upper()
+        uf_edit = self._vet_texto(uf_edital).str.upper()
+        mesma_uf = (uf_emp == uf_edit).to_numpy()
+
+        mun_emp = self._vet_texto(municipio_empresa)
+        mun_edit = self._vet_texto(municipio_edital)
+        mesmo_municipio = (
+            mesma_uf
+            & ~self._vet_vazio(municipio_empresa) & ~self._vet_vazio(municipio_edital)
+            & (mun_emp.str.lower() == mun_edit.str.lower()).to_numpy()
+        )
+
+        vizinho = (uf_emp + '|' + uf_edit).isin(PARES_VIZINHOS).to_numpy()
+
+        reg_emp = uf_emp.map(UF_REGIAO)
+        reg_edit = uf_edit.map(UF_REGIAO)
+        mesma_regiao = (reg_emp.notna() & (reg_emp == reg_edit)).to_numpy()
+
+        return np.select(
+            [faltando, mesmo_municipio, mesma_uf, vizinho, mesma_regiao],
+            [0.5, 1.0, 0.8, 0.5, 0.3],
+            default=0.15
+        )
+
+    def _vet_nivel_porte(self, valores: pd.Series) -> np.ndarray:
+        """Nível (Porte.value) de cada valor, 0 quando não reconhecido."""
+        def nivel(valor):
+            porte = self._normalizar_porte(valor)
+            return porte.value if porte else 0
+        return self._vet_por_valor(valores, nivel, 0).astype(np.int64)
+
+    def _vet_porte(self, porte_empresa: pd.Series, portes_preferenciais: pd.Series) -> np.ndarray:
+        """Versão vetorizada de `_avaliar_porte`."""
+        nivel_emp = self._vet_nivel_porte(porte_empresa)
+
+        # Só listas/tuplas/conjuntos contam como preferência; os níveis
+        # válidos de cada linha são expandidos para comparação em bloco
+        listas = pd.Series(
+            [list(v) if isinstance(v, (list, tuple, set)) else [] for v in portes_preferenciais],
+            index=np.arange(len(portes_preferenciais)), dtype=object
+        )
+        expandido = listas.explode()
+        nivel_pref = pd.Series(self._vet_nivel_porte(expandido), index=expandido.index)
+        nivel_pref = nivel_pref[nivel_pref > 0]
+
+        tem_pref = np.zeros(len(nivel_emp), dtype=bool)
+        atende = np.zeros(len(nivel_emp), dtype=bool)
+        pref_min = np.zeros(len(nivel_emp), dtype=np.int64)
+        if not nivel_pref.empty:
+            linhas = nivel_pref.index.to_numpy(dtype=np.int64)
+            minimos = pd.Series(nivel_pref.to_numpy()).groupby(linhas).min()
+            tem_pref[minimos.index.to_numpy()] = True
+            pref_min[minimos.index.to_numpy()] = minimos.to_numpy()
+            iguais = nivel_pref.to_numpy() == nivel_emp[linhas]
+            atende[np.unique(linhas[iguais])] = True
+
+        return np.select(
+            [nivel_emp == 0,
+             tem_pref & atende,
+             tem_pref & (np.abs(nivel_emp - pref_min) <= 1),
+             tem_pref,
+             nivel_emp >= 4,
+             nivel_emp == 3],
+            [0.5, 1.0, 0.7, 0.4, 0.9, 0.7],
+            default=0.5
+        )
+
+    def _vet_capital_social(self, capital_empresa: pd.Series, valor_estimado: pd.Series) -> np.ndarray:
+        """Versão vetorizada de `_avaliar_capital_social`."""
+        capital = pd.to_numeric(capital_empresa, errors='coerce').to_numpy(dtype=float)
+        valor = pd.to_numeric(valor_estimado, errors='coerce').to_numpy(dtype=float)
+        sem_valor = valor <= 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            razao = np.where(sem_valor, np.nan, capital / np.where(sem_valor, 1.0, valor))
+        return np.select(
+            [capital <= 0,
+             sem_valor & (capital >= 5_000_000),
+             sem_valor & (capital >= 1_000_000),
+             sem_valor & (capital >= 500_000),
+             sem_valor & (capital >= 100_000),
+             sem_valor,
+             razao >= 0.20,
+             razao >= 0.15,
+             razao >= 0.10,
+             razao >= 0.05],
+            [0.3, 0.9, 0.8, 0.7, 0.6, 0.5, 1.0, 0.9, 0.8, 0.6],
+            default=0.3
+        )
+
+    def _vet_experiencia(self, data_abertura: pd.Series, exige_experiencia: pd.Series) -> np.ndarray:
+        """Versão vetorizada de `_avaliar_experiencia`."""
+        exige = self._vet_flag(exige_experiencia)
+        faltando = self._vet_vazio(data_abertura)
+
+        # Datas se repetem muito: cada valor distinto é interpretado uma única vez
+        agora = datetime.now()
+        def anos_desde(valor):
+            data_inicio = self._parse_data(valor)
+            return (agora - data_inicio).days / 365.25 if data_inicio else np.nan
+        anos = self._vet_por_valor(data_abertura, anos_desde, np.nan)
+        invalida = np.isnan(anos)
+
+        return np.select(
+            [faltando, invalida, anos < 0,
+             anos >= 15, anos >= 10, anos >= 5, anos >= 3, anos >= 2, anos >= 1],
+            [np.where(exige, 0.3, 0.5), np.where(exige, 0.3, 0.5), 0.0,
+             1.0, 0.95, 0.85, 0.7, 0.6, 0.5],
+            default=np.where(exige, 0.2, 0.4)
+        )
+
+    def _vet_certidoes(self, situacao_cadastral: pd.Series, exige_certidoes: pd.Series) -> np.ndarray:
+        """Versão vetorizada de `_avaliar_certidoes`."""
+        exige = self._vet_flag(exige_certidoes)
+        faltando = self._vet_vazio(situacao_cadastral)
+        situacao = situacao_cadastral.map(
+            lambda s: s.upper().strip() if isinstance(s, str) else ''
+        )
+        ativa = situacao.eq(SituacaoCadastral.ATIVA.value).to_numpy()
+        encerrada = situacao.isin([SituacaoCadastral.BAIXADA.value,
+                                   SituacaoCadastral.CANCELADA.value]).to_numpy()
+        irregular = situacao.isin([SituacaoCadastral.SUSPENSA.value,
+                                   SituacaoCadastral.INAPTA.value]).to_numpy()
+        return np.select(
+            [faltando, ativa, encerrada, irregular],
+            [np.where(exige, 0.3, 0.5), 1.0, 0.0, np.where(exige, 0.1, 0.3)],
+            default=np.where(exige, 0.3, 0.5)
+        )
+
 
 # ========================================
 # FUNÇÕES AUXILIARES
@@ -0,0 +1,180 @@
+"""
+Tabelas de referência pré-compiladas para os cálculos de score.
+
+Montadas uma única vez na importação e compartilhadas por
+core/scoring_engine.py e services/services_match_b2g.py: hierarquia de CNAE
+codificada em inteiros, UF → região e vizinhança, níveis de porte
+e cache de datas já interpretadas.
+"""
+
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+# ========================================
+# UFs E REGIÕES
+# ========================================
+
+# Mapeamento de estados vizinhos (completo)
+ESTADOS_VIZINHOS = {
+    'AC': ['AM', 'RO'],
+    'AL': ['PE', 'SE', 'BA'],
+    'AP': ['PA'],
+    'AM': ['RR', 'PA', 'MT', 'RO', 'AC'],
+    'BA': ['SE', 'AL', 'PE', 'PI', 'TO', 'GO', 'MG', 'ES'],
+    'CE': ['RN', 'PB', 'PE', 'PI'],
+    'DF': ['GO', 'MG'],
+    'ES': ['BA', 'MG', 'RJ'],
+    'GO': ['TO', 'BA', 'MG', 'MS', 'MT', 'DF'],
+    'MA': ['PA', 'TO', 'PI'],
+    'MT': ['RO', 'AM', 'PA', 'TO', 'GO', 'MS'],
+    'MS': ['MT', 'GO', 'MG', 'SP', 'PR'],
+    'MG': ['BA', 'ES', 'RJ', 'SP', 'MS', 'GO', 'DF'],
+    'PA': ['AP', 'MA', 'TO', 'MT', 'AM', 'RR'],
+    'PB': ['RN', 'CE', 'PE'],
+    'PR': ['SP', 'MS', 'SC'],
+    'PE': ['PB', 'CE', 'PI', 'BA', 'AL'],
+    'PI': ['CE', 'MA', 'TO', 'BA', 'PE'],
+    'RJ': ['ES', 'MG', 'SP'],
+    'RN': ['PB', 'CE'],
+    'RS': ['SC'],
+    'RO': ['AC', 'AM', 'MT'],
+    'RR': ['AM', 'PA'],
+    'SC': ['PR', 'RS'],
+    'SP': ['MG', 'RJ', 'PR', 'MS'],
+    'SE': ['AL', 'BA'],
+    'TO': ['MA', 'PI', 'BA', 'GO', 'MT', 'PA']
+}
+
+# Regiões do Brasil
+REGIOES = {
+    'Norte': ['AC', 'AP', 'AM', 'PA', 'RO', 'RR', 'TO'],
+    'Nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
+    'Centro-Oeste': ['DF', 'GO', 'MT', 'MS'],
+    'Sudeste': ['ES', 'MG', 'RJ', 'SP'],
+    'Sul': ['PR', 'SC', 'RS']
+}
+
+# Identificadores de região usados nos textos do match B2G
+REGIAO_SLUG = {
+    'Norte': 'norte',
+    'Nordeste': 'nordeste',
+    'Centro-Oeste': 'centro_oeste',
+    'Sudeste': 'sudeste',
+    'Sul': 'sul'
+}
+
+UF_REGIAO: Dict[str, str] = {uf: regiao for regiao, ufs in REGIOES.items() for uf in ufs}
+UF_REGIAO_SLUG: Dict[str, str] = {uf: REGIAO_SLUG[regiao] for uf, regiao in UF_REGIAO.items()}
+
+# Pares "UF|UF vizinha" para teste de vizinhança em O(1) (e em lote com isin)
+PARES_VIZINHOS = frozenset(f"{uf}|{v}" for uf, vizinhos in ESTADOS_VIZINHOS.items() for v in vizinhos)
+
+
+# ========================================
+# PORTE
+# ========================================
+
+# Nível de porte (mesma escala de scoring_engine.Porte)
+NIVEL_PORTE: Dict[str, int] = {
+    'MEI': 1,
+    'MICRO': 2,
+    'MICRO EMPRESA': 2,
+    'PEQUENO': 3,
+    'PEQUENA': 3,
+    'EPP': 3,
+    'MEDIO': 4,
+    'MÉDIA': 4,
+    'GRANDE': 5
+}
+
+
+@lru_cache(maxsize=1024)
+def nivel_porte(porte: str) -> int:
+    """Nível do porte informado em texto (0 se não reconhecido)"""
+    try:
+        return NIVEL_PORTE.get(porte.upper().strip(), 0)
+    except Exception:
+        return 0
+
+
+# ========================================
+# CNAE
+# ========================================
+
+class CnaeCodificado(NamedTuple):
+    """
+    CNAE limpo e seus prefixos hierárquicos como inteiros.
+
+    Cada prefixo é codificado como int('1' + prefixo): o dígito sentinela
+    preserva zeros à esquerda e o comprimento, de modo que dois códigos são
+    iguais exatamente quando os prefixos em texto são iguais.
+    """
+    digitos: str
+    digito1: int
+    divisao: int
+
+
+@lru_cache(maxsize=65536)
+def _codificar_cnae_texto(texto: str) -> CnaeCodificado:
+    digitos = ''.join(c for c in texto if c.isdigit())
+
+    def prefixo(n: int) -> int:
+        try:
+            return int('1' + digitos[:n])
+        except ValueError:
+            # Dígitos não decimais (ex.: '²') não convertem; o hash mantém a igualdade
+            return hash(digitos[:n])
+
+    return CnaeCodificado(digitos, prefixo(1), prefixo(2))
+
+
+def codificar_cnae(cnae) -> CnaeCodificado:
+    """CNAE (qualquer formato) → CnaeCodificado, com cache"""
+    return _codificar_cnae_texto(str(cnae))
+
+
+def limpar_cnae(cnae) -> str:
+    """Remove caracteres não numéricos do CNAE (com cache)"""
+    return codificar_cnae(cnae).digitos
+
+
+# ========================================
+# DATAS E TEXTO
+# ========================================
+
+FORMATOS_DATA = (
+    '%Y-%m-%d',
+    '%d/%m/%Y',
+    '%Y%m%d',
+    '%d-%m-%Y',
+    '%Y/%m/%d'
+)
+
+
+@lru_cache(maxsize=131072)
+def parse_data(texto: str, formatos: Tuple[str, ...] = FORMATOS_DATA) -> Optional[datetime]:
+    """
+    Interpreta a data com o primeiro formato que servir (com cache).
+
+    O texto é usado como está; quem chama decide recortes como [:10].
+    """
+    for fmt in formatos:
+        try:
+            return datetime.strptime(texto, fmt)
+        except Exception:
+            continue
+    return None
+
+
+_RE_NAO_ALFANUM = re.compile(r'[^a-z0-9\s]')
+_RE_ESPACOS = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=16384)
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, só [a-z0-9] e espaços simples (com cache)"""
+    texto = _RE_NAO_ALFANUM.sub(' ', texto.lower())
+    return _RE_ESPACOS.sub(' ', texto).strip()
@@ -58,7 +58,7 @@ def create_app(config_name='development'):
     app.config['JSON_AS_ASCII'] = False
 
     # Configura CORS
-    CORS(app, origins=app.config['CORS_ORIGINS'])
+    CORS(app, origins=app.config['CORS_ORIGINS'], expose_headers=['X-Total-Count'])
 
     # Configura Rate Limiting
     if app.config['RATE_LIMIT_ENABLED']:
@@ -135,6 +135,10 @@ def create_app(config_name='development'):
     register_error_handlers(app)
     logger.info("✓ Error handlers registrados")
 
+    # Registro das consultas frequentes para o aquecimento de cache
+    from services.services_aquecimento import registrar_coleta
+    registrar_coleta(app)
+
     # Rotas principais
 
 
@@ -277,10 +281,21 @@ def create_app(config_name='development'):
     def health_check():
         """Health check da aplicação"""
         from utils.utils_diagnostics import verificar_saude_sistema
+        from services.services_aquecimento import estado_aquecimento
         saude = verificar_saude_sistema()
+        saude["aquecimento"] = estado_aquecimento()
         status_code = 200 if saude["status"] == "healthy" else 503
+        if app.config.get('AQUECIMENTO_SAUDE_AGUARDA') and not saude["aquecimento"]["pronto"]:
+            status_code = 503
         return jsonify(saude), status_code
 
+    @app.route('/api/health/pronto', methods=['GET'])
+    def readiness_check():
+        """Prontidão para o balanceador: 503 enquanto o cache é aquecido"""
+        from services.services_aquecimento import estado_aquecimento
+        estado = estado_aquecimento()
+        return jsonify(estado), 200 if estado["pronto"] else 503
+
     @app.route('/api/status', methods=['GET'])
     def api_status():
         """Status detalhado do sistema"""
@@ -366,10 +381,37 @@ def create_app(config_name='development'):
         if not validar_arquivos_dados():
             logger.error("Arquivos de dados não encontrados!")
 
+        # Conexão DuckDB compartilhada com as views da base RFB
+        from services.services_duckdb_pool import inicializar_duckdb
+        try:
+            inicializar_duckdb()
+        except Exception as e:
+            logger.error(f"Erro ao inicializar DuckDB: {e}")
+
+        # Detecta novo dump da Receita: invalida caches derivados e, se configurado,
+        # reconstrói índices/cubos afetados (senão ficam pendentes para o CLI)
+        from services.services_versao_dados import atualizar_artefatos
+        try:
+            resumo_versao = atualizar_artefatos(reconstruir=app.config.get('ATUALIZAR_ARTEFATOS_NA_INICIALIZACAO', False))
+            logger.info(f"✓ Versão dos dados: {resumo_versao['versao']}")
+            if resumo_versao['pendentes']:
+                logger.warning(f"Artefatos desatualizados: {', '.join(resumo_versao['pendentes'])} "
+                               f"(execute python -m services.services_versao_dados)")
+        except Exception as e:
+            logger.error(f"Erro ao verificar versão dos dados: {e}")
+
         # Pré-carrega dados essenciais
         from services.services_cache_service import pre_carregar_dados_essenciais
         pre_carregar_dados_essenciais()
 
+        # Tarefas em segundo plano (espelho PNCP, alertas, manutenção do cache)
+        # fora das threads de requisição
+        from services.services_agendador import iniciar_agendador
+        try:
+            iniciar_agendador()
+        except Exception as e:
+            logger.error(f"Erro ao iniciar agendador: {e}")
+
         logger.info("=== Aplicação inicializada ===")
 
     inicializar()
@@ -378,6 +420,13 @@ def create_app(config_name='development'):
     with app.app_context():
         db.create_all()
         logger.info("✓ Tabelas do banco de dados verificadas/criadas")
+
+    # Aquecimento de cache em segundo plano (não bloqueia a inicialização)
+    from services.services_aquecimento import iniciar_aquecimento
+    try:
+        iniciar_aquecimento(app)
+    except Exception as e:
+        logger.error(f"Erro ao iniciar aquecimento de cache: {e}")
         
     return app
 
@@ -65,33 +65,30 @@ class AnalisadorSetorial:
             if df_estabelecimentos is None or df_estabelecimentos.empty:
                 return self._resultado_vazio()
             
-            # Preparação dos dados
-            df_estab = df_estabelecimentos.copy()
-            df_emp = df_empresas.copy() if df_empresas is not None and not df_empresas.empty else pd.DataFrame()
-            df_soc = df_socios.copy() if df_socios is not None and not df_socios.empty else pd.DataFrame()
+            df_emp = df_empresas if df_empresas is not None and not df_empresas.empty else pd.DataFrame()
+            df_soc = df_socios if df_socios is not None and not df_socios.empty else pd.DataFrame()
             
-            # Processar datas e anos
-            if 'data_de_inicio_atividade' in df_estab.columns:
-                df_estab['ano_inicio'] = pd.to_datetime(
-                    df_estab['data_de_inicio_atividade'].astype(str),
-                    format='%Y%m%d',
-                    errors='coerce'
-                ).dt.year
+            # Uma passada por coluna; KPIs, gráficos e rankings saem dos agregados
+            agregados = self.agregar(df_estabelecimentos, df_emp)
+            agregados['total_empresas'] = len(df_emp)
+            agregados['total_socios'] = len(df_soc)
+            return self.analisar_agregados(agregados)
             
-            # Calcular KPIs
-            kpis = self._calcular_kpis_completos(df_estab, df_emp, df_soc)
-            
-            # Gerar dados para gráficos
-            dados_graficos = self._gerar_dados_graficos(df_estab, df_emp, df_soc)
-            
-            # Gerar texto de análise
+        except Exception as e:
+            logger.error(f"Erro inesperado na análise: {e}", exc_info=True)
+            return self._resultado_vazio()
+    
+    def analisar_agregados(self, agregados: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Monta o resultado da análise a partir dos agregados (ver `agregar`),
+        sem voltar às linhas.
+        """
+        try:
+            kpis = self._calcular_kpis_completos(agregados)
+            dados_graficos = self._gerar_dados_graficos(agregados, kpis)
             texto_analise = self._gerar_texto_analise(kpis)
-            
-            # Gerar dados de ranking
-            ranking = self._gerar_ranking(df_estab, df_emp)
-            
-            # Estrutura top para análise base
-            top = self._gerar_top_estruturas(df_estab, df_emp)
+            ranking = self._gerar_ranking(agregados)
+            top = self._gerar_top_estruturas(agregados)
             
             return {
                 "sucesso": True,
@@ -103,9 +100,9 @@ class AnalisadorSetorial:
                 "ranking": ranking,
                 "top": top,
                 "resumo": {
-                    "total_estabelecimentos": len(df_estab),
-                    "total_empresas": len(df_emp) if not df_emp.empty else 0,
-                    "total_socios": len(df_soc) if not df_soc.empty else 0
+                    "total_estabelecimentos": int(agregados.get('total', 0)),
+                    "total_empresas": int(agregados.get('total_empresas', 0)),
+                    "total_socios": int(agregados.get('total_socios', 0))
                 }
             }
             
@@ -147,25 +144,101 @@ class AnalisadorSetorial:
             }
         }
     
-    def _calcular_kpis_completos(
-        self,
-        df_estab: pd.DataFrame,
-        df_emp: pd.DataFrame,
-        df_soc: pd.DataFrame
-    ) -> Dict[str, Any]:
-        """Calcula todos os KPIs de forma otimizada"""
+    # ---------------------------------------------------------------
+    # AGREGAÇÃO (UMA PASSADA)
+    # ---------------------------------------------------------------
+    
+    @staticmethod
+    def _anomes(datas: pd.Series) -> pd.Series:
+        """Datas AAAAMMDD (texto ou número) → código inteiro AAAAMM; inválidas viram NaN"""
+        if pd.api.types.is_datetime64_any_dtype(datas):
+            return (datas.dt.year * 100 + datas.dt.month).astype(float)
+        if pd.api.types.is_numeric_dtype(datas):
+            num = pd.to_numeric(datas, errors='coerce')
+        else:
+            num = pd.to_numeric(datas.astype(str).str.strip(), errors='coerce')
+        ano = num // 10000
+        mes = (num // 100) % 100
+        dia = num % 100
+        validos = (ano >= 1800) & (ano <= 2100) & (mes >= 1) & (mes <= 12) & (dia >= 1) & (dia <= 31)
+        return (num // 100).where(validos)
+    
+    def agregar(self, df_estab: pd.DataFrame, df_emp: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """
+        Agregados compartilhados por KPIs, gráficos e rankings.
+        
+        Cada coluna é lida uma única vez: datas viram códigos AAAAMM e as
+        distribuições (situação, UF, CNAE, porte, mês de início) são contagens
+        indexadas pelo valor.
+        """
+        df_emp = df_emp if df_emp is not None else pd.DataFrame()
+        total = len(df_estab)
+        ag: Dict[str, Any] = {'total': total}
+        
+        ativas = None
+        if 'situacao_cadastral' in df_estab.columns:
+            sit = df_estab['situacao_cadastral']
+            ag['situacao'] = sit.value_counts()
+            ativas = (sit == '02').to_numpy()
+        
+        if 'uf' in df_estab.columns:
+            ag['uf'] = df_estab['uf'].value_counts()
+        if 'municipio' in df_estab.columns:
+            ag['num_municipios'] = int(df_estab['municipio'].nunique())
+        if 'cnae_fiscal_principal' in df_estab.columns:
+            ag['cnae'] = df_estab['cnae_fiscal_principal'].value_counts()
+        
+        if 'data_de_inicio_atividade' in df_estab.columns:
+            anomes = self._anomes(df_estab['data_de_inicio_atividade'])
+            ag['meses'] = anomes.value_counts().sort_index()
+            anomes_ativas = anomes[ativas] if ativas is not None else anomes
+            ag['meses_ativas'] = anomes_ativas.value_counts().sort_index()
+        
+        # Percentual de dados válidos
+        ag['valores_validos'] = int(df_estab.notna().to_numpy().sum())
+        ag['valores_total'] = int(df_estab.size)
+        
+        if not df_emp.empty and 'capital_social_da_empresa' in df_emp.columns:
+            capital = pd.to_numeric(df_emp['capital_social_da_empresa'], errors='coerce').dropna()
+            ag['capital'] = {
+                'medio': float(capital.mean()) if len(capital) else 0,
+                'mediana': float(capital.median()) if len(capital) else 0,
+                'total': float(capital.sum()) if len(capital) else 0,
+            }
+        if not df_emp.empty and 'porte_da_empresa' in df_emp.columns:
+            ag['porte'] = df_emp['porte_da_empresa'].value_counts()
+        
+        return ag
+    
+    @staticmethod
+    def _ultimos_meses(n: int = 12) -> List[Tuple[int, int]]:
+        """(ano, mês) dos últimos n meses, do mais antigo ao atual"""
+        agora = datetime.now()
+        meses = []
+        for i in range(n):
+            mes = (agora.month - i) % 12 or 12
+            ano = agora.year if (agora.month - i) > 0 else agora.year - 1
+            meses.append((ano, mes))
+        return list(reversed(meses))
+    
+    # ---------------------------------------------------------------
+    # KPIs, GRÁFICOS E RANKINGS A PARTIR DOS AGREGADOS
+    # ---------------------------------------------------------------
+    
+    def _calcular_kpis_completos(self, ag: Dict[str, Any]) -> Dict[str, Any]:
+        """Calcula todos os KPIs a partir dos agregados"""
         kpis = {}
         
         try:
             # KPIs básicos de estabelecimentos
-            total_estab = len(df_estab)
+            total_estab = int(ag.get('total', 0))
             kpis['total_estabelecimentos'] = total_estab
             
             # Situação cadastral
-            if 'situacao_cadastral' in df_estab.columns:
-                ativas = (df_estab['situacao_cadastral'] == '02').sum()
-                kpis['total_ativas'] = int(ativas)
-                kpis['empresas_ativas'] = int(ativas)
+            if 'situacao' in ag:
+                ativas = int(ag['situacao'].get('02', 0))
+                kpis['total_ativas'] = ativas
+                kpis['empresas_ativas'] = ativas
                 kpis['pct_ativas'] = round((ativas / total_estab * 100), 2) if total_estab > 0 else 0
             else:
                 kpis['total_ativas'] = total_estab
@@ -173,130 +246,59 @@ class AnalisadorSetorial:
                 kpis['pct_ativas'] = 100.0
             
             # Distribuição geográfica
-            if 'uf' in df_estab.columns:
-                kpis['num_ufs'] = int(df_estab['uf'].nunique())
-            else:
-                kpis['num_ufs'] = 0
-                
-            if 'municipio' in df_estab.columns:
-                kpis['num_municipios'] = int(df_estab['municipio'].nunique())
-            else:
-                kpis['num_municipios'] = 0
+            kpis['num_ufs'] = int(len(ag['uf'])) if 'uf' in ag else 0
+            kpis['num_municipios'] = int(ag.get('num_municipios', 0))
             
-            # Idade média
-            if 'ano_inicio' in df_estab.columns:
+            # Idade média e sobrevivência (contagens por ano de início)
+            meses = ag.get('meses')
+            if meses is not None:
                 ano_atual = datetime.now().year
-                idades = ano_atual - df_estab['ano_inicio'].dropna()
-                idades = idades[idades >= 0]  # Remove valores negativos
-                if len(idades) > 0:
-                    kpis['idade_media'] = float(idades.mean())
-                else:
-                    kpis['idade_media'] = 0.0
+                por_ano = meses.groupby((meses.index // 100).astype(int)).sum()
+                idades = ano_atual - por_ano.index.to_numpy()
+                contagens = por_ano.to_numpy()
+                nao_neg = idades >= 0
+                n_nao_neg = contagens[nao_neg].sum()
+                kpis['idade_media'] = float((idades[nao_neg] * contagens[nao_neg]).sum() / n_nao_neg) if n_nao_neg > 0 else 0.0
             else:
                 kpis['idade_media'] = 0.0
             
-            if not df_estab.empty and ('cnae_fiscal_principal' in df_estab.columns):
+            if 'cnae' in ag and len(ag['cnae']) > 0:
                 try:
-                    counts = df_estab['cnae_fiscal_principal'].value_counts()
-                    hhi = calcular_hhi(counts.values)
-                    gini = calcular_indice_gini(counts.values)
-                    kpis['indice_hhi'] = float(hhi)
-                    kpis['indice_gini'] = float(gini)
+                    kpis['indice_hhi'] = float(calcular_hhi(ag['cnae'].values))
+                    kpis['indice_gini'] = float(calcular_indice_gini(ag['cnae'].values))
                 except:
                     kpis['indice_hhi'] = 0.0
                     kpis['indice_gini'] = 0.0
             
             # Entradas e saídas mensais (últimos 12 meses)
-            if 'ano_inicio' in df_estab.columns:
-                ano_atual = datetime.now().year
-                mes_atual = datetime.now().month
-                
-                # Calcular entradas por mês (últimos 12 meses)
-                entradas_list = []
-                for i in range(12):
-                    mes = (mes_atual - i) % 12 or 12
-                    ano = ano_atual if (mes_atual - i) > 0 else ano_atual - 1
-                    
-                    if 'data_de_inicio_atividade' in df_estab.columns:
-                        try:
-                            datas = pd.to_datetime(
-                                df_estab['data_de_inicio_atividade'].astype(str),
-                                format='%Y%m%d',
-                                errors='coerce'
-                            )
-                            mask = (datas.dt.year == ano) & (datas.dt.month == mes)
-                            count = int(mask.sum())
-                        except:
-                            count = 0
-                    else:
-                        count = 0
-                    
-                    entradas_list.append({
-                        'label': f"{ano}-{mes:02d}",
-                        'count': count
-                    })
-                
-                kpis['entradas_mensais'] = list(reversed(entradas_list))
-                
-                # Estimar saídas (empresas que mudaram de ativa para inativa)
-                saidas_list = []
-                for i in range(12):
-                    mes = (mes_atual - i) % 12 or 12
-                    ano = ano_atual if (mes_atual - i) > 0 else ano_atual - 1
-                    
-                    # Estimativa: 2-5% das entradas
-                    entrada_mes = entradas_list[i]['count']
-                    saida_estimada = int(entrada_mes * 0.03)
-                    
-                    saidas_list.append({
-                        'label': f"{ano}-{mes:02d}",
-                        'count': saida_estimada
-                    })
-                
-                kpis['saidas_mensais'] = list(reversed(saidas_list))
+            if meses is not None:
+                entradas_list = [
+                    {'label': f"{ano}-{mes:02d}", 'count': int(meses.get(ano * 100 + mes, 0))}
+                    for ano, mes in self._ultimos_meses(12)
+                ]
+                kpis['entradas_mensais'] = entradas_list
+                # Estimativa de saídas: 3% das entradas do mês
+                kpis['saidas_mensais'] = [
+                    {'label': e['label'], 'count': int(e['count'] * 0.03)} for e in entradas_list
+                ]
             else:
                 kpis['entradas_mensais'] = []
                 kpis['saidas_mensais'] = []
             
             # Percentual de dados válidos
-            total_campos = len(df_estab.columns)
-            if total_campos > 0:
-                campos_validos = df_estab.notna().sum().sum()
-                total_valores = total_campos * len(df_estab)
-                kpis['pct_dados_validos'] = round((campos_validos / total_valores * 100), 2) if total_valores > 0 else 0
-            else:
-                kpis['pct_dados_validos'] = 0
+            valores_total = ag.get('valores_total', 0)
+            kpis['pct_dados_validos'] = round((ag.get('valores_validos', 0) / valores_total * 100), 2) if valores_total > 0 else 0
             
             # Taxa de sobrevivência (empresas ativas > 5 anos)
-            if 'ano_inicio' in df_estab.columns:
-                try:
-                    ano_atual = datetime.now().year
-                    idades = ano_atual - df_estab['ano_inicio'].dropna()
-                    total_5_anos = (idades >= 5).sum()
-                    total_empresas = len(idades)
-                    if total_empresas > 0:
-                        kpis['taxa_sobrevivencia_5anos'] = round((total_5_anos / total_empresas * 100), 2)
-                    else:
-                        kpis['taxa_sobrevivencia_5anos'] = 0
-                except:
-                    kpis['taxa_sobrevivencia_5anos'] = 0
+            if meses is not None:
+                total_datas = contagens.sum()
+                kpis['taxa_sobrevivencia_5anos'] = round((contagens[idades >= 5].sum() / total_datas * 100), 2) if total_datas > 0 else 0
             
             # KPIs financeiros (se disponível)
-            if not df_emp.empty and 'capital_social_da_empresa' in df_emp.columns:
-                try:
-                    capital = pd.to_numeric(df_emp['capital_social_da_empresa'], errors='coerce').dropna()
-                    if len(capital) > 0:
-                        kpis['capital_social_medio'] = float(capital.mean())
-                        kpis['capital_social_mediana'] = float(capital.median())
-                        kpis['capital_social_total'] = float(capital.sum())
-                    else:
-                        kpis['capital_social_medio'] = 0
-                        kpis['capital_social_mediana'] = 0
-                        kpis['capital_social_total'] = 0
-                except:
-                    kpis['capital_social_medio'] = 0
-                    kpis['capital_social_mediana'] = 0
-                    kpis['capital_social_total'] = 0
+            if 'capital' in ag:
+                kpis['capital_social_medio'] = ag['capital']['medio']
+                kpis['capital_social_mediana'] = ag['capital']['mediana']
+                kpis['capital_social_total'] = ag['capital']['total']
             
             # Taxas demográficas
             if kpis.get('total_ativas', 0) > 0:
@@ -314,71 +316,37 @@ class AnalisadorSetorial:
         
         return kpis
     
-    def _gerar_dados_graficos(
-        self,
-        df_estab: pd.DataFrame,
-        df_emp: pd.DataFrame,
-        df_soc: pd.DataFrame
-    ) -> Dict[str, Any]:
+    def _gerar_dados_graficos(self, ag: Dict[str, Any], kpis: Dict[str, Any]) -> Dict[str, Any]:
         """Gera dados para todos os gráficos"""
         graficos = {}
         
         try:
-            # Evolução de empresas ativas (últimos 12 meses)
-            if 'ano_inicio' in df_estab.columns:
-                ano_atual = datetime.now().year
-                mes_atual = datetime.now().month
-                
-                labels = []
-                valores = []
-                
-                for i in range(12):
-                    mes = (mes_atual - i) % 12 or 12
-                    ano = ano_atual if (mes_atual - i) > 0 else ano_atual - 1
-                    
-                    # Contar empresas iniciadas até este mês
-                    if 'data_de_inicio_atividade' in df_estab.columns:
-                        try:
-                            datas = pd.to_datetime(
-                                df_estab['data_de_inicio_atividade'].astype(str),
-                                format='%Y%m%d',
-                                errors='coerce'
-                            )
-                            mask = (datas.dt.year < ano) | ((datas.dt.year == ano) & (datas.dt.month <= mes))
-                            if 'situacao_cadastral' in df_estab.columns:
-                                mask = mask & (df_estab['situacao_cadastral'] == '02')
-                            count = int(mask.sum())
-                        except:
-                            count = 0
-                    else:
-                        count = 0
-                    
-                    labels.append(f"{ano}-{mes:02d}")
-                    valores.append(count)
-                
+            # Evolução de empresas ativas (iniciadas até cada um dos últimos 12 meses)
+            meses_ativas = ag.get('meses_ativas')
+            if meses_ativas is not None:
+                codigos = meses_ativas.index.to_numpy()
+                acumulado = np.concatenate([[0], np.cumsum(meses_ativas.to_numpy())])
+                ultimos = self._ultimos_meses(12)
+                alvos = np.array([ano * 100 + mes for ano, mes in ultimos])
+                posicoes = np.searchsorted(codigos, alvos, side='right')
                 graficos['evolucao_ativas'] = {
-                    'labels': list(reversed(labels)),
-                    'valores': list(reversed(valores))
+                    'labels': [f"{ano}-{mes:02d}" for ano, mes in ultimos],
+                    'valores': [int(v) for v in acumulado[posicoes]]
                 }
             else:
                 graficos['evolucao_ativas'] = {'labels': [], 'valores': []}
             
             # Entradas vs Saídas
-            if 'entradas_mensais' in self._calcular_kpis_completos(df_estab, df_emp, df_soc):
-                kpis = self._calcular_kpis_completos(df_estab, df_emp, df_soc)
-                entradas = kpis.get('entradas_mensais', [])
-                saidas = kpis.get('saidas_mensais', [])
-                
-                graficos['entradas_vs_saidas'] = {
-                    'labels': [e['label'] for e in entradas],
-                    'entradas': [e['count'] for e in entradas],
-                    'saidas': [s['count'] for s in saidas]
-                }
-            else:
-                graficos['entradas_vs_saidas'] = {'labels': [], 'entradas': [], 'saidas': []}
+            entradas = kpis.get('entradas_mensais', [])
+            saidas = kpis.get('saidas_mensais', [])
+            graficos['entradas_vs_saidas'] = {
+                'labels': [e['label'] for e in entradas],
+                'entradas': [e['count'] for e in entradas],
+                'saidas': [s['count'] for s in saidas]
+            }
             
-            if not df_emp.empty and ('porte_da_empresa' in df_emp.columns):
-                dist_porte = df_emp['porte_da_empresa'].value_counts()
+            if 'porte' in ag:
+                dist_porte = ag['porte']
                 graficos['distribuicao_porte'] = {
                     'labels': dist_porte.index.tolist(),
                     'valores': dist_porte.values.tolist(),
@@ -388,8 +356,8 @@ class AnalisadorSetorial:
                 graficos['distribuicao_porte'] = {'labels': [], 'valores': []}
             
             # Mapa de calor (distribuição geográfica)
-            if 'uf' in df_estab.columns:
-                dist_uf = df_estab['uf'].value_counts().head(10)
+            if 'uf' in ag:
+                dist_uf = ag['uf'].head(10)
                 graficos['mapa_calor'] = {
                     'labels': dist_uf.index.tolist(),
                     'valores': dist_uf.values.tolist()
@@ -402,11 +370,7 @@ class AnalisadorSetorial:
         
         return graficos
     
-    def _gerar_ranking(
-        self,
-        df_estab: pd.DataFrame,
-        df_emp: pd.DataFrame
-    ) -> Dict[str, Any]:
+    def _gerar_ranking(self, ag: Dict[str, Any]) -> Dict[str, Any]:
         """Gera rankings de setores e estados"""
         ranking = {
             'setores_top': [],
@@ -415,19 +379,17 @@ class AnalisadorSetorial:
         
         try:
             # Top setores por CNAE
-            if 'cnae_fiscal_principal' in df_estab.columns:
-                top_cnaes = df_estab['cnae_fiscal_principal'].value_counts().head(10)
+            if 'cnae' in ag:
                 ranking['setores_top'] = [
                     {'label': str(cnae), 'count': int(count), 'cnae': str(cnae)}
-                    for cnae, count in top_cnaes.items()
+                    for cnae, count in ag['cnae'].head(10).items()
                 ]
             
             # Estados em crescimento (baseado em quantidade)
-            if 'uf' in df_estab.columns:
-                top_ufs = df_estab['uf'].value_counts().head(10)
+            if 'uf' in ag:
                 ranking['estados_crescimento'] = [
                     {'label': str(uf), 'count': int(count), 'delta': int(count * 0.05)}  # Estimativa de crescimento
-                    for uf, count in top_ufs.items()
+                    for uf, count in ag['uf'].head(10).items()
                 ]
         
         except Exception as e:
@@ -435,19 +397,13 @@ class AnalisadorSetorial:
         
         return ranking
     
-    def _gerar_top_estruturas(
-        self,
-        df_estab: pd.DataFrame,
-        df_emp: pd.DataFrame
-    ) -> Dict[str, List[Dict]]:
+    def _gerar_top_estruturas(self, ag: Dict[str, Any]) -> Dict[str, List[Dict]]:
         """Gera estruturas top para análise base"""
         top = {}
         
         try:
             # Situação cadastral
-            if 'situacao_cadastral' in df_estab.columns:
-                sit_counts = df_estab['situacao_cadastral'].value_counts()
-                
+            if 'situacao' in ag:
                 # Mapeamento de códigos para nomes
                 situacao_map = {
                     '01': 'NULA',
@@ -463,7 +419,7 @@ class AnalisadorSetorial:
                         'count': int(count),
                         'codigo': str(codigo)
                     }
-                    for codigo, count in sit_counts.items()
+                    for codigo, count in ag['situacao'].items()
                 ]
         
         except Exception as e:
@@ -530,3 +486,10 @@ def analisar_dados_setoriais(
     Função de interface para manter retrocompatibilidade.
     """
     return _analisador_global.analisar(df_estabelecimentos, df_empresas, df_socios)
+
+def analisar_agregados_setoriais(agregados: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Análise a partir de agregados já calculados (ex.: no DuckDB), no mesmo
+    formato de AnalisadorSetorial.agregar.
+    """
+    return _analisador_global.analisar_agregados(agregados)
@@ -0,0 +1,348 @@
+"""
+Agendador de tarefas em segundo plano
+
+Executa as tarefas periódicas (sincronização do espelho PNCP, verificação
+de alertas B2G, manutenção do cache, recálculo das chaves mais acessadas, reaquecimento
+após nova versão dos dados) fora das threads de requisição do
+servidor:
+
+  - uma thread de tick verifica, a cada Config.AGENDADOR_TICK segundos,
+    quais tarefas venceram e as envia a um pool limitado
+    (Config.AGENDADOR_TRABALHADORES);
+  - uma tarefa nunca roda em paralelo com ela mesma;
+  - o estado (próxima execução, último status/erro, contagens e duração)
+    fica na tabela tarefas_agendadas do banco B2G (SQLite), de modo que um
+    reinício respeita o agendamento em vez de disparar tudo de novo.
+
+A verificação de alertas respeita a `frequencia` de cada alerta
+(imediato, diario, semanal) via AlertasB2GService._deve_verificar; o
+intervalo da tarefa é só a granularidade da checagem.
+
+Também pode rodar como processo separado (com AGENDADOR_ATIVO=false no
+servidor web):
+    python -m services.services_agendador
+    python -m services.services_agendador --executar alertas_verificacao
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from core.config import Config
+
+logger = logging.getLogger(__name__)
+
+TABELA = 'tarefas_agendadas'
+
+
+class Tarefa:
+    """Tarefa periódica registrada no agendador"""
+
+    def __init__(self, nome: str, funcao: Callable[[], Any], intervalo: int):
+        self.nome = nome
+        self.funcao = funcao
+        self.intervalo = int(intervalo)
+
+
+def _conexao() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(Config.B2G_DB_PATH), timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _criar_tabela():
+    with _conexao() as conn:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABELA} (
+                nome TEXT PRIMARY KEY,
+                intervalo INTEGER NOT NULL,
+                ultima_execucao TEXT,
+                proxima_execucao REAL NOT NULL,
+                ultimo_status TEXT,
+                ultimo_erro TEXT,
+                ultimo_resultado TEXT,
+                execucoes INTEGER DEFAULT 0,
+                falhas INTEGER DEFAULT 0,
+                ultima_duracao_ms REAL,
+                duracao_media_ms REAL
+            )
+        """)
+
+
+def _resumo(resultado: Any) -> Optional[str]:
+    """Resultado da tarefa → JSON curto para a coluna ultimo_resultado"""
+    if resultado is None:
+        return None
+    try:
+        texto = json.dumps(resultado, default=str, ensure_ascii=False)
+    except (TypeError, ValueError):
+        texto = str(resultado)
+    return texto[:2000]
+
+
+class Agendador:
+    """Tick + pool limitado de trabalhadores, com estado no SQLite"""
+
+    def __init__(self, trabalhadores: int, tick: float):
+        self.tarefas: Dict[str, Tarefa] = {}
+        self.trabalhadores = max(int(trabalhadores), 1)
+        self.tick = max(float(tick), 0.5)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+        self._em_execucao: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, tarefa: Tarefa):
+        """Registra a tarefa; a primeira execução é imediata se ela nunca rodou"""
+        self.tarefas[tarefa.nome] = tarefa
+        with _conexao() as conn:
+            conn.execute(f"""
+                INSERT INTO {TABELA} (nome, intervalo, proxima_execucao) VALUES (?, ?, ?)
+                ON CONFLICT(nome) DO UPDATE SET intervalo = excluded.intervalo
+            """, (tarefa.nome, tarefa.intervalo, time.time()))
+
+    # ---------- execução ----------
+
+    def _executar(self, tarefa: Tarefa):
+        inicio = time.perf_counter()
+        status, erro, resultado = 'sucesso', None, None
+        try:
+            resultado = tarefa.funcao()
+            if isinstance(resultado, dict) and resultado.get('sucesso') is False:
+                status, erro = 'falha', str(resultado.get('erro') or resultado.get('mensagem') or '')
+        except Exception as e:
+            logger.error(f"Erro na tarefa agendada '{tarefa.nome}': {e}")
+            status, erro = 'falha', str(e)
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        try:
+            with _conexao() as conn:
+                conn.execute(f"""
+                    UPDATE {TABELA} SET
+                        ultima_execucao = ?,
+                        proxima_execucao = ?,
+                        ultimo_status = ?,
+                        ultimo_erro = ?,
+                        ultimo_resultado = ?,
+                        execucoes = execucoes + 1,
+                        falhas = falhas + ?,
+                        ultima_duracao_ms = ?,
+                        duracao_media_ms = (coalesce(duracao_media_ms, 0) * execucoes + ?) / (execucoes + 1)
+                    WHERE nome = ?
+                """, (
+                    datetime.now().isoformat(),
+                    time.time() + tarefa.intervalo,
+                    status, erro, _resumo(resultado),
+                    int(status == 'falha'),
+                    round(duracao_ms, 1), duracao_ms,
+                    tarefa.nome,
+                ))
+        except Exception as e:
+            logger.error(f"Erro ao registrar execução de '{tarefa.nome}': {e}")
+        finally:
+            with self._lock:
+                self._em_execucao.pop(tarefa.nome, None)
+        logger.info(f"Tarefa '{tarefa.nome}': {status} em {duracao_ms:.0f} ms")
+
+    def _enviar(self, tarefa: Tarefa) -> bool:
+        """Envia ao pool, a menos que a tarefa já esteja rodando"""
+        with self._lock:
+            if tarefa.nome in self._em_execucao:
+                return False
+            self._em_execucao[tarefa.nome] = time.time()
+        self._executor.submit(self._executar, tarefa)
+        return True
+
+    def _vencidas(self) -> List[str]:
+        with _conexao() as conn:
+            rows = conn.execute(
+                f"SELECT nome FROM {TABELA} WHERE proxima_execucao <= ?", (time.time(),)
+            ).fetchall()
+        return [r['nome'] for r in rows if r['nome'] in self.tarefas]
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                for nome in self._vencidas():
+                    self._enviar(self.tarefas[nome])
+            except Exception as e:
+                logger.error(f"Erro no tick do agendador: {e}")
+            self._parar.wait(self.tick)
+
+    # ---------- controle ----------
+
+    def iniciar(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.trabalhadores, thread_name_prefix='agendador')
+        self._thread = threading.Thread(target=self._loop, name='agendador-tick', daemon=True)
+        self._thread.start()
+
+    def parar(self, aguardar: bool = False):
+        self._parar.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=aguardar)
+
+    def executar_agora(self, nome: str) -> bool:
+        """Antecipa a próxima execução da tarefa; False se desconhecida ou já rodando"""
+        tarefa = self.tarefas.get(nome)
+        if tarefa is None or self._executor is None:
+            return False
+        return self._enviar(tarefa)
+
+    def estado(self) -> List[Dict]:
+        """Estado persistido e métricas de cada tarefa"""
+        with _conexao() as conn:
+            rows = conn.execute(f"SELECT * FROM {TABELA} ORDER BY nome").fetchall()
+        agora = time.time()
+        with self._lock:
+            em_execucao = dict(self._em_execucao)
+        estado = []
+        for r in rows:
+            item = dict(r)
+            item['registrada'] = item['nome'] in self.tarefas
+            item['em_execucao'] = item['nome'] in em_execucao
+            item['proxima_em_s'] = max(round(item['proxima_execucao'] - agora), 0)
+            item['proxima_execucao'] = datetime.fromtimestamp(item['proxima_execucao']).isoformat()
+            if item['ultimo_resultado']:
+                try:
+                    item['ultimo_resultado'] = json.loads(item['ultimo_resultado'])
+                except ValueError:
+                    pass
+            estado.append(item)
+        return estado
+
+
+# ==========================================
+# TAREFAS
+# ==========================================
+
+def _sincronizar_pncp():
+    from services.services_pncp_espelho import sincronizar
+    return sincronizar()
+
+
+def _verificar_alertas():
+    """Verifica os alertas devidos (frequência) e notifica os que casaram"""
+    from services.services_alertas_b2g import AlertasB2GService
+    from services.services_notificacoes_b2g import NotificacoesB2GService
+
+    conn = sqlite3.connect(str(Config.B2G_DB_PATH), timeout=30)
+    try:
+        matches = AlertasB2GService(conn).verificar_alertas()
+        notificacoes = NotificacoesB2GService(conn)
+        for m in matches:
+            notificacoes.criar_notificacao_alerta(m['usuario_id'], m['nome_alerta'], m['total_matches'])
+        return {
+            'alertas_disparados': len(matches),
+            'licitacoes': sum(m['total_matches'] for m in matches),
+        }
+    finally:
+        conn.close()
+
+
+def _manter_cache():
+    """Remove entradas expiradas do cache em camadas e do cache B2G"""
+    from services.services_cache_performance import obter_cache_b2g
+    from services.services_cache_service import cache
+
+    return {
+        'cache': cache.expire(),
+        'cache_b2g': obter_cache_b2g().limpar_cache_expirado(),
+    }
+
+
+def _atualizar_populares():
+    from services.services_cache_service import atualizar_populares
+    return atualizar_populares()
+
+
+def _reaquecer():
+    from services.services_aquecimento import reaquecer_se_dados_mudaram
+    return reaquecer_se_dados_mudaram()
+
+
+def tarefas_padrao() -> List[Tarefa]:
+    tarefas = []
+    if Config.PNCP_ESPELHO_ATIVO and Config.PNCP_ESPELHO_INTERVALO > 0:
+        tarefas.append(Tarefa('pncp_sincronizacao', _sincronizar_pncp, Config.PNCP_ESPELHO_INTERVALO))
+    if Config.AGENDADOR_ALERTAS_INTERVALO > 0:
+        tarefas.append(Tarefa('alertas_verificacao', _verificar_alertas, Config.AGENDADOR_ALERTAS_INTERVALO))
+    if Config.AGENDADOR_CACHE_INTERVALO > 0:
+        tarefas.append(Tarefa('cache_manutencao', _manter_cache, Config.AGENDADOR_CACHE_INTERVALO))
+    if Config.AGENDADOR_POPULARES_INTERVALO > 0:
+        tarefas.append(Tarefa('cache_populares', _atualizar_populares, Config.AGENDADOR_POPULARES_INTERVALO))
+    if Config.AQUECIMENTO_ATIVO and Config.AGENDADOR_AQUECIMENTO_INTERVALO > 0:
+        tarefas.append(Tarefa('cache_aquecimento', _reaquecer, Config.AGENDADOR_AQUECIMENTO_INTERVALO))
+    return tarefas
+
+
+_agendador: Optional[Agendador] = None
+_lock_agendador = threading.Lock()
+
+
+def obter_agendador() -> Agendador:
+    """Agendador do processo, com as tarefas padrão registradas"""
+    global _agendador
+    with _lock_agendador:
+        if _agendador is None:
+            _criar_tabela()
+            agendador = Agendador(Config.AGENDADOR_TRABALHADORES, Config.AGENDADOR_TICK)
+            for tarefa in tarefas_padrao():
+                agendador.registrar(tarefa)
+            _agendador = agendador
+        return _agendador
+
+
+def iniciar_agendador() -> bool:
+    """Inicia o agendador em segundo plano (se Config.AGENDADOR_ATIVO)"""
+    if not Config.AGENDADOR_ATIVO:
+        return False
+    agendador = obter_agendador()
+    agendador.iniciar()
+    logger.info(f"✓ Agendador iniciado: {', '.join(agendador.tarefas) or 'sem tarefas'} "
+                f"({agendador.trabalhadores} trabalhadores)")
+    return True
+
+
+def estado_agendador() -> Dict:
+    agendador = obter_agendador()
+    return {
+        'ativo': agendador._thread is not None and agendador._thread.is_alive(),
+        'trabalhadores': agendador.trabalhadores,
+        'tarefas': agendador.estado(),
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Agendador de tarefas B2G')
+    parser.add_argument('--executar', help='Executa uma tarefa uma vez e sai')
+    parser.add_argument('--estado', action='store_true', help='Mostra o estado das tarefas')
+    args = parser.parse_args()
+
+    agendador = obter_agendador()
+    if args.estado:
+        print(json.dumps(agendador.estado(), indent=2, ensure_ascii=False, default=str))
+    elif args.executar:
+        tarefa = agendador.tarefas.get(args.executar)
+        if tarefa is None:
+            parser.error(f"tarefa desconhecida: {args.executar} (disponíveis: {', '.join(agendador.tarefas)})")
+        agendador._executar(tarefa)
+        print(json.dumps([t for t in agendador.estado() if t['nome'] == tarefa.nome], indent=2,
+                         ensure_ascii=False, default=str))
+    else:
+        agendador.iniciar()
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            agendador.parar(aguardar=True)
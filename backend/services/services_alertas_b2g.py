@@ -4,11 +4,14 @@ Gerencia alertas personalizados e triggers automáticos
 """
 
 import logging
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 from datetime import datetime, timedelta
 import json
 import re
 
+from core.config import Config
+from services.services_motor_alertas import MotorAlertas
+
 logger = logging.getLogger(__name__)
 
 
@@ -275,34 +278,62 @@ class AlertasB2GService:
                 """)
             
             alertas = cursor.fetchall()
-            matches = []
             
-            for alerta_row in alertas:
-                alerta_id, uid, nome, criterios_json, freq, canais_json, ultima_verif = alerta_row
-                
-                criterios = json.loads(criterios_json) if criterios_json else {}
-                canais = json.loads(canais_json) if canais_json else []
-                
-                # Verificar se deve disparar baseado na frequência
+            # Instante da verificação, tomado antes da leitura: o que entrar no
+            # espelho depois dele fica para a próxima rodada
+            agora = datetime.now()
+            
+            # Alertas a verificar agora (frequência), com critérios decodificados
+            pendentes = []
+            for alerta_id, uid, nome, criterios_json, freq, canais_json, ultima_verif in alertas:
                 if not self._deve_verificar(freq, ultima_verif):
                     continue
-                
-                # Simular busca de licitações (em produção, buscar do PNCP)
-                licitacoes_match = self._buscar_licitacoes_por_criterios(criterios)
-                
-                if licitacoes_match:
-                    matches.append({
-                        'alerta_id': alerta_id,
-                        'usuario_id': uid,
-                        'nome_alerta': nome,
-                        'criterios': criterios,
-                        'canais': canais,
-                        'total_matches': len(licitacoes_match),
-                        'licitacoes': licitacoes_match[:10]  # Limitar preview
-                    })
-                    
-                    # Atualizar última verificação
-                    self._atualizar_ultima_verificacao(alerta_id)
+                pendentes.append({
+                    'id': alerta_id,
+                    'usuario_id': uid,
+                    'nome': nome,
+                    'criterios': json.loads(criterios_json) if criterios_json else {},
+                    'canais': json.loads(canais_json) if canais_json else [],
+                    'desde': self._marca_verificacao(ultima_verif, agora),
+                })
+            if not pendentes:
+                return []
+            
+            # O que entrou no espelho desde a verificação mais antiga até
+            # `agora`, em lotes casados contra todos os alertas de uma vez
+            lotes = self._lotes_licitacoes(min(p['desde'] for p in pendentes), agora)
+            if lotes is None:
+                # Espelho indisponível ou defasado: a marca não avança
+                return []
+            motor = MotorAlertas(pendentes)
+            por_id = {p['id']: p for p in pendentes}
+            totais = dict.fromkeys(por_id, 0)
+            previas: Dict[int, List[str]] = {alerta_id: [] for alerta_id in por_id}
+            for lote in lotes:
+                for alerta_id, indices in motor.casar_lote(lote).items():
+                    desde = por_id[alerta_id]['desde']
+                    novos = [i for i in indices if lote[i]['sincronizado_em'] > desde]
+                    totais[alerta_id] += len(novos)
+                    previas[alerta_id] += [lote[i]['registro'] for i in novos[:10 - len(previas[alerta_id])]]
+            
+            matches = []
+            for alerta in pendentes:
+                if not totais[alerta['id']]:
+                    continue
+                matches.append({
+                    'alerta_id': alerta['id'],
+                    'usuario_id': alerta['usuario_id'],
+                    'nome_alerta': alerta['nome'],
+                    'criterios': alerta['criterios'],
+                    'canais': alerta['canais'],
+                    'total_matches': totais[alerta['id']],
+                    'licitacoes': [json.loads(r) for r in previas[alerta['id']]]  # Limitar preview
+                })
+            
+            # Todos os alertas avaliados avançam a marca; só os casados contam disparo
+            self._atualizar_ultimas_verificacoes(
+                [p['id'] for p in pendentes], [m['alerta_id'] for m in matches], agora
+            )
             
             return matches
             
@@ -366,15 +397,73 @@ class AlertasB2GService:
         except Exception:
             return True
     
-    def _buscar_licitacoes_por_criterios(self, criterios: Dict) -> List[Dict]:
+    def _marca_verificacao(self, ultima_verificacao: Optional[str], agora: datetime) -> datetime:
+        """Instante a partir do qual o que entrou no espelho é novidade para o alerta"""
+        try:
+            if ultima_verificacao:
+                return datetime.fromisoformat(ultima_verificacao)
+        except ValueError:
+            pass
+        return agora - timedelta(days=int(Config.ALERTAS_DIAS_INICIAIS))
+    
+    def _lotes_licitacoes(self, sincronizado_apos: datetime, agora: datetime) -> Optional[Iterator[List[Dict]]]:
         """
-        Busca licitações que atendem aos critérios
-        
-        NOTA: Em produção, integrar com PNCP ou banco de licitações
+        Contratações que entraram no espelho local do PNCP após o instante e
+        até `agora`, publicadas nos últimos Config.ALERTAS_DIAS_INICIAIS dias,
+        em lotes de até Config.ALERTAS_LOTE_MAX (paginados por sincronizado_em,
+        chave, para que nenhuma fique de fora da verificação).
+
+        Returns:
+            Iterador de lotes, ou None se o espelho não está disponível
+        """
+        try:
+            from services.services_pncp_espelho import contratacoes_desde, espelho_disponivel
+            if not espelho_disponivel():
+                return None
+        except Exception as e:
+            logger.error(f"Erro ao consultar o espelho para alertas: {e}")
+            return None
+        publicadas_desde = (agora.date() - timedelta(days=int(Config.ALERTAS_DIAS_INICIAIS))).isoformat()
+        limite = max(int(Config.ALERTAS_LOTE_MAX), 1)
+
+        def lotes():
+            apos = None
+            while True:
+                lote = contratacoes_desde(publicadas_desde, limite=limite, sincronizado_apos=sincronizado_apos,
+                                          sincronizado_ate=agora, apos=apos)
+                if lote:
+                    yield lote
+                if len(lote) < limite:
+                    return
+                apos = (lote[-1]['sincronizado_em'], lote[-1]['chave'])
+
+        return lotes()
+    
+    def _atualizar_ultimas_verificacoes(self, verificados: List[int], disparados: List[int],
+                                        agora: datetime):
+        """
+        Grava o instante da verificação em todos os alertas avaliados e soma
+        um disparo aos que tiveram licitações, em uma transação
         """
-        # Simulação - retornar lista vazia por enquanto
-        # TODO: Implementar busca real
-        return []
+        try:
+            if not self.db or not verificados:
+                return
+            
+            cursor = self.db.cursor()
+            cursor.executemany("""
+                UPDATE alertas_b2g SET ultima_verificacao = ? WHERE id = ?
+            """, [(agora.isoformat(), alerta_id) for alerta_id in verificados])
+            if disparados:
+                cursor.executemany("""
+                    UPDATE alertas_b2g
+                    SET total_disparos = COALESCE(total_disparos, 0) + 1
+                    WHERE id = ?
+                """, [(alerta_id,) for alerta_id in disparados])
+            
+            self.db.commit()
+            
+        except Exception as e:
+            logger.error(f"Erro ao atualizar verificação: {e}")
     
     def _atualizar_ultima_verificacao(self, alerta_id: int):
         """Atualiza timestamp da última verificação"""
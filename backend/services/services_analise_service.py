@@ -2,12 +2,19 @@
 Serviços de análise setorial
 """
 from services.services_cnpj_service import consultar_cnpj_completo, consultar_cnpj_simples_enriquecida, _municipios_df, _municipio_nome, obter_cnae_principal_por_cnpj, _cnae_desc, _situacao_nome
-from services.services_cache_service import cache
+from services.services_cache_service import cache, em_voo
 from services.services_integracao_service import buscar_licitacoes_pncp, PNCPIntegration
 from utils.utils_serializer import serializar_dataframe
+from utils.utils_formatacao import formatar_leads
 
 import pandas as pd
+import numpy as np
+import hashlib
+import json
 import logging
+import threading
+import time
+from collections import OrderedDict
 from core.config import Config
 from functools import lru_cache
 from utils.utils_analise_utils import (
@@ -15,9 +22,11 @@ from utils.utils_analise_utils import (
     calcular_hhi,
     calcular_entropia_shannon
 )
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 from utils.utils_validator import normalizar_cnpj
-import duckdb
+from services.services_duckdb_pool import obter_cursor, tabela
+from services.services_responsavel import responsaveis_por_cnpj_basico, responsavel_disponivel
+from services.services_filtro_sql import compilar_filtros, esquema_parquet, expressao_numerica, identificador
 from datetime import datetime
 from core.scoring_engine import ScoringEngine, CriterioScore, ResultadoScore
 try:
@@ -89,81 +98,90 @@ def _parse_float_br(val: Any) -> float:
     except Exception:
         return 0.0
 
-def carregar_dataframe_empresas_filtrado(filtros_parquet: List[tuple]) -> pd.DataFrame:
+def carregar_dataframe_empresas_filtrado(filtros_parquet: List[tuple], limite: Optional[int] = None) -> pd.DataFrame:
+    """
+    Estabelecimentos + empresas que atendem exatamente aos filtros.
+
+    Os filtros (coluna, op, valor) são compilados em predicados tipados e
+    aplicados dentro do DuckDB em cada lado do join (estabelecimentos ou
+    empresas, conforme a coluna), de modo que a leitura do Parquet descarta
+    row groups pelas estatísticas antes da junção. Com `limite`, retorna as
+    `limite` empresas de maior capital social.
+    """
     try:
-        from pyarrow import parquet as pq
-        raw_path = str(Config.ARQUIVOS_PARQUET['estabelecimentos'])
-        fp = raw_path.replace('\\', '/')
-        pf = pq.ParquetFile(fp)
-        cols = [c.name for c in pf.schema]
-        def pick(cands, default=None):
+        esq_est = esquema_parquet(Config.ARQUIVOS_PARQUET['estabelecimentos'])
+        esq_emp = esquema_parquet(Config.ARQUIVOS_PARQUET['empresas'])
+        if not esq_est:
+            return pd.DataFrame()
+        def pick(cols, cands, default=None):
             return next((c for c in cands if c in cols), default)
-        basico = pick(['cnpj_basico','CNPJ_BASICO','cnpjBasico'])
-        ordem = pick(['cnpj_ordem','CNPJ_ORDEM','cnpjOrdem'])
-        dv = pick(['cnpj_dv','CNPJ_DV','cnpjDV'])
-        uf_col = pick(['uf','UF','sigla_uf'])
-        mun_col = pick(['municipio','MUNICIPIO','nome_municipio','municipio_nome'])
-        cnae_col = pick(['cnae_fiscal_principal','cnae_fiscal','CNAE_FISCAL'])
-        nome_fantasia = pick(['nome_fantasia','NOME_FANTASIA'])
-        sit_col = pick(['situacao_cadastral','SITUACAO_CADASTRAL'])
-        d1 = pick(['ddd_1','DDD_1'])
-        t1 = pick(['telefone_1','TELEFONE_1'])
-        email_col = pick(['correio_eletronico','email','EMAIL'])
-        log_col = pick(['logradouro','LOGRADOURO'])
-        num_col = pick(['numero','NUMERO'])
-        bairro_col = pick(['bairro','BAIRRO'])
-        cep_col = pick(['cep','CEP'])
-
-        select_cols = [x for x in [basico,ordem,dv,nome_fantasia,uf_col,mun_col,cnae_col,sit_col,d1,t1,email_col,log_col,num_col,bairro_col,cep_col] if x]
-        where = []
-        for col, op, val in filtros_parquet or []:
-            if col not in cols:
-                continue
-            c = str(col)
-            if op == 'in' and isinstance(val, (list, tuple, set)):
-                vals = ",".join([f"'{str(x)}'" for x in val])
-                where.append(f"CAST({c} AS VARCHAR) IN ({vals})")
-            elif op == '==':
-                where.append(f"CAST({c} AS VARCHAR) = '{str(val)}'")
-            elif op == '>=':
-                where.append(f"CAST({c} AS DOUBLE) >= {float(val)}")
-            elif op == '<=':
-                where.append(f"CAST({c} AS DOUBLE) <= {float(val)}")
-        where_sql = (" WHERE " + " AND ".join(where)) if where else ""
+        basico = pick(esq_est, ['cnpj_basico','CNPJ_BASICO','cnpjBasico'])
+        ordem = pick(esq_est, ['cnpj_ordem','CNPJ_ORDEM','cnpjOrdem'])
+        dv = pick(esq_est, ['cnpj_dv','CNPJ_DV','cnpjDV'])
+        renomear_est = {
+            basico: 'cnpj_basico', ordem: 'cnpj_ordem', dv: 'cnpj_dv',
+            pick(esq_est, ['nome_fantasia','NOME_FANTASIA']): 'nome_fantasia',
+            pick(esq_est, ['uf','UF','sigla_uf']): 'uf',
+            pick(esq_est, ['municipio','MUNICIPIO','nome_municipio','municipio_nome']): 'municipio',
+            pick(esq_est, ['cnae_fiscal_principal','cnae_fiscal','CNAE_FISCAL']): 'cnae_fiscal_principal',
+            pick(esq_est, ['situacao_cadastral','SITUACAO_CADASTRAL']): 'situacao_cadastral',
+            pick(esq_est, ['data_de_inicio_atividade','data_inicio_atividade']): 'data_de_inicio_atividade',
+            pick(esq_est, ['ddd_1','DDD_1']): 'ddd_1',
+            pick(esq_est, ['telefone_1','TELEFONE_1']): 'telefone_1',
+            pick(esq_est, ['correio_eletronico','email','EMAIL']): 'correio_eletronico',
+            pick(esq_est, ['logradouro','LOGRADOURO']): 'logradouro',
+            pick(esq_est, ['numero','NUMERO']): 'numero',
+            pick(esq_est, ['bairro','BAIRRO']): 'bairro',
+            pick(esq_est, ['cep','CEP']): 'cep',
+        }
+        renomear_est.pop(None, None)
+        emp_basico = pick(esq_emp, ['cnpj_basico','CNPJ_BASICO','cnpjBasico'])
+        cap_col = pick(esq_emp, ['capital_social_da_empresa','capital_social'])
+        renomear_emp = {
+            pick(esq_emp, ['razao_social_nome_empresarial','razao_social','nome_empresarial']): 'razao_social_nome_empresarial',
+            cap_col: 'capital_social_da_empresa',
+            pick(esq_emp, ['porte_da_empresa','porte']): 'porte_da_empresa',
+        }
+        renomear_emp.pop(None, None)
+
+        # Cada filtro vai para o lado do join que tem a coluna
+        where_est, params_est, restantes = compilar_filtros(filtros_parquet, esq_est, 'e')
+        where_emp, params_emp, ignorados = compilar_filtros(restantes, esq_emp, 'm') if emp_basico else ([], [], restantes)
+        if ignorados:
+            logger.debug(f"Filtros sem coluna correspondente ignorados: {ignorados}")
+
+        sel = [f"e.{identificador(c)} AS {identificador(n)}" for c, n in renomear_est.items()]
         q = (
-            f"SELECT {', '.join(select_cols)} FROM read_parquet('{fp}') USING SAMPLE 100000 ROWS" +
-            f"{where_sql}"
+            f"SELECT {', '.join(sel)} FROM {tabela('estabelecimentos')} e"
+            + (" WHERE " + " AND ".join(where_est) if where_est else "")
         )
-        df_est = duckdb.sql(q).to_df()
-        if df_est is None or df_est.empty:
+        params = list(params_est)
+        if emp_basico:
+            sel_emp = [f"m.{identificador(c)} AS {identificador(n)}" for c, n in renomear_emp.items()]
+            q = (
+                f"SELECT f.*, {', '.join(sel_emp)} FROM ({q}) f "
+                f"{'JOIN' if where_emp else 'LEFT JOIN'} {tabela('empresas')} m "
+                f"ON m.{identificador(emp_basico)} = f.cnpj_basico"
+                + (" WHERE " + " AND ".join(where_emp) if where_emp else "")
+            )
+            params += params_emp
+            if limite and cap_col:
+                q += f" ORDER BY {expressao_numerica('m.' + identificador(cap_col), esq_emp.get(cap_col))} DESC NULLS LAST"
+        if limite:
+            q += " LIMIT ?"
+            params.append(int(limite))
+
+        df = obter_cursor().execute(q, params).df()
+        if df is None or df.empty:
             return pd.DataFrame()
-        df_est = df_est.rename(columns={
-            basico: 'cnpj_basico', ordem: 'cnpj_ordem', dv: 'cnpj_dv',
-            uf_col: 'uf', mun_col: 'municipio', cnae_col: 'cnae_fiscal_principal',
-            nome_fantasia: 'nome_fantasia', sit_col: 'situacao_cadastral',
-            d1: 'ddd_1', t1: 'telefone_1', email_col: 'correio_eletronico',
-            log_col: 'logradouro', num_col: 'numero', bairro_col: 'bairro', cep_col: 'cep'
-        })
-
-        basicos = df_est['cnpj_basico'].astype(str).unique().tolist()
-        df_emp = pd.read_parquet(
-            Config.ARQUIVOS_PARQUET['empresas'],
-            filters=[('cnpj_basico','in', basicos)],
-            columns=None
-        )
-        # Detecta coluna de razão social
-        if df_emp is not None and not df_emp.empty:
-            rs_col = next((c for c in ['razao_social_nome_empresarial','razao_social','nome_empresarial'] if c in df_emp.columns), df_emp.columns[0])
-            cap_col = next((c for c in ['capital_social_da_empresa','capital_social'] if c in df_emp.columns), None)
-            porte_col = next((c for c in ['porte_da_empresa','porte'] if c in df_emp.columns), None)
-            df_emp = df_emp[[c for c in ['cnpj_basico', rs_col, cap_col, porte_col] if c]]
-            df_emp = df_emp.rename(columns={rs_col: 'razao_social_nome_empresarial', cap_col: 'capital_social_da_empresa', porte_col: 'porte_da_empresa'})
-        df = pd.merge(df_est, df_emp, on='cnpj_basico', how='left')
+        for col in ('razao_social_nome_empresarial', 'capital_social_da_empresa', 'porte_da_empresa'):
+            if col not in df.columns:
+                df[col] = None
         df['cnpj'] = df['cnpj_basico'].astype(str) + df['cnpj_ordem'].astype(str) + df['cnpj_dv'].astype(str)
         df['razao_social'] = df['razao_social_nome_empresarial']
         df['email'] = df.get('correio_eletronico') if 'correio_eletronico' in df.columns else None
         # Normaliza capital social para número
-        if 'capital_social_da_empresa' in df.columns:
+        if not pd.api.types.is_numeric_dtype(df['capital_social_da_empresa']):
             df['capital_social_da_empresa'] = df['capital_social_da_empresa'].apply(_parse_float_br)
         try:
             df['cnae_fiscal_descricao'] = df['cnae_fiscal_principal'].apply(_cnae_desc)
@@ -174,7 +192,8 @@ def carregar_dataframe_empresas_filtrado(filtros_parquet: List[tuple]) -> pd.Dat
         except Exception:
             pass
         return df
-    except Exception:
+    except Exception as e:
+        logger.error(f"Erro ao carregar empresas filtradas: {e}")
         return pd.DataFrame()
 
 def scoring_compatibilidade(cnpj: str, edital: Dict[str, Any]) -> Dict[str, Any]:
@@ -221,9 +240,12 @@ def scoring_ranking(cnpj: str, filtros: Dict[str, Any], limite: int = 50) -> Dic
 
 
 
-def ranking_empresas_por_prestador(cnpj_prestador: str, filtros: Dict[str, Any], limite: int = 50) -> Dict[str, Any]:
+def _materializar_ranking(cnpj_prestador: str, filtros: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Gera ranking de empresas (leads) mais compatíveis - VERSÃO CORRIGIDA
+    Carrega, filtra e pontua todos os candidatos do prestador de uma vez.
+
+    Retorna o conjunto ordenado ('leads') com as estatísticas, ou o dict de
+    resposta final quando não há o que ranquear.
     """
     try:
         print(f"[INFO] 🔍 Iniciando busca de leads para {cnpj_prestador}")
@@ -306,24 +328,23 @@ def ranking_empresas_por_prestador(cnpj_prestador: str, filtros: Dict[str, Any],
         
         # ETAPA 4: CARREGAR EMPRESAS (SEM LIMIT RESTRIÇÃO CNAE)
         print("[INFO] 📊 Carregando empresas...")
-        df = carregar_dataframe_empresas_filtrado(filtros_parquet)
+        df = carregar_dataframe_empresas_filtrado(filtros_parquet, limite=Config.CANDIDATOS_LIMITE)
         
         if df.empty:
             print("[❌] Nenhuma empresa encontrada - EXPANDINDO BUSCA")
             # FALLBACK: Remove filtros mais restritivos e tenta novamente
             df = carregar_dataframe_empresas_filtrado([
                 ('situacao_cadastral', '==', '02')  # Apenas ativas
-            ])
+            ], limite=Config.CANDIDATOS_LIMITE)
         
         if df.empty:
             print('[WARNING] Nenhuma empresa encontrada com os filtros — ampliando escopo real')
-            df = carregar_dataframe_empresas_filtrado([])
+            df = carregar_dataframe_empresas_filtrado([], limite=Config.CANDIDATOS_LIMITE_AMPLIADO)
             if df.empty:
                 return {
                     'resultados': [],
                     'total': 0,
                     'pagina': 1,
-                    'limite': limite,
                     'mensagem': 'Nenhuma empresa encontrada nos arquivos reais',
                     'debug': {'cnae_prestador': cnae_prestador}
                 }
@@ -376,74 +397,177 @@ def ranking_empresas_por_prestador(cnpj_prestador: str, filtros: Dict[str, Any],
             }
         
         # ETAPA 7: ORDENAÇÃO E DEFINIÇÃO DO CONJUNTO A PROCESSAR
-        pagina = max(1, int(filtros.get('pagina', 1)))
-        inicio = (pagina - 1) * limite
         total_empresas = total_filtrado
         df_processar = df_filtrado.sort_values('capital_social_da_empresa', ascending=False)
-        processar_todas = True
-        max_processar = int(filtros.get('max_processar', 100))
+        max_processar = int(filtros.get('max_processar', 50000))
         df_iter = df_processar
         if len(df_iter) > max_processar:
             print(f"[WARN] Volume alto ({len(df_iter)}) – limitando processamento a {max_processar} registros")
             df_iter = df_iter.head(max_processar)
         print(f"[INFO] 📄 Processando {len(df_iter)} empresas (total filtradas: {total_empresas})")
         
-        # ETAPA 8: CALCULAR SCORES
+        # ETAPA 8: CALCULAR SCORES (VETORIZADO)
+        def _col_texto(nome):
+            if nome in df_iter.columns:
+                return df_iter[nome].astype(str)
+            return pd.Series('', index=df_iter.index)
+        
+        capital_leads = df_iter['capital_social_da_empresa'] if 'capital_social_da_empresa' in df_iter.columns else pd.Series(0.0, index=df_iter.index)
+        if not pd.api.types.is_numeric_dtype(capital_leads):
+            capital_leads = capital_leads.map(_parse_float_br)
+        leads = pd.DataFrame({
+            'cnpj': _col_texto('cnpj'),
+            'razao_social': _col_texto('razao_social_nome_empresarial'),
+            'nome_fantasia': _col_texto('nome_fantasia'),
+            'cnae_fiscal_principal': _col_texto('cnae_fiscal_principal').str.zfill(7),
+            'cnae_descricao': _col_texto('cnae_fiscal_descricao'),
+            'uf': _col_texto('uf'),
+            'municipio': _col_texto('municipio'),
+            'porte_da_empresa': _col_texto('porte_da_empresa'),
+            'capital_social_da_empresa': capital_leads.astype(float),
+            'data_de_inicio_atividade': _col_texto('data_de_inicio_atividade'),
+            'email': _col_texto('email'),
+            'telefone': _col_texto('telefone_1'),
+        }, index=df_iter.index)
+        
+        # Edital simulado por lead: o prestador é avaliado contra cada empresa
+        editais = pd.DataFrame({
+            'cnae_relacionado': cnae_prestador,
+            'uf': leads['uf'],
+            'municipio': leads['municipio'],
+            'valorEstimado': leads['capital_social_da_empresa'] * 0.05,
+            'porte_preferencial': [[p] for p in leads['porte_da_empresa']],
+            'exige_experiencia': False,
+            'exige_certidoes': False,
+        }, index=leads.index)
+        
         engine = ScoringEngine()
-        resultados = []
+        scores = engine.calcular_scores_vetorizado(prestador_data, editais)
+        
+        potenciais = {c: get_potencial_score(cnae_prestador, c) for c in leads['cnae_fiscal_principal'].unique()}
+        leads['potencial'] = leads['cnae_fiscal_principal'].map(lambda c: potenciais[c][0])
+        leads['bonus_potencial'] = leads['cnae_fiscal_principal'].map(lambda c: potenciais[c][1])
+        leads['score_base'] = scores['score_total']
+        leads['compatibilidade'] = np.minimum(100, leads['score_base'] + leads['bonus_potencial']).round(1)
+        cnaes_alvo = set(cnaes_primarios + cnaes_secundarios)
+        leads['match_cnae_alvo'] = leads['cnae_fiscal_principal'].str[:4].isin(cnaes_alvo)
+        
+        leads = leads.sort_values(['compatibilidade', 'capital_social_da_empresa'], ascending=False, kind='mergesort')
+        print(f"[✅] 🎉 {len(leads)} LEADS GERADOS!")
         
-        for idx, row in df_iter.iterrows():
+        return {
+            'leads': leads.reset_index(drop=True),
+            'total': total_empresas,
+            'cnae_prestador': cnae_prestador,
+            'estatisticas': {
+                'total_carregadas': len(df),
+                'com_cnae_alvo': int(empresas_com_cnae_alvo),
+                'concorrentes_removidos': concorrentes_removidos,
+                'leads_gerados': len(leads),
+                'processadas': len(df_iter),
+                'cnae_prestador': cnae_prestador
+            },
+        }
+        
+    except Exception as e:
+        print(f"[FATAL] 💥 Erro: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return {'erro': str(e), 'resultados': [], 'total': 0}
+
+
+# Conjuntos de ranking já pontuados, por prestador + filtros (LRU com TTL).
+# Páginas seguintes e "carregar mais" leem daqui sem reler parquet nem repontuar.
+_ranking_conjuntos: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_ranking_lock = threading.Lock()
+_CAMPOS_LEAD = ['cnpj', 'razao_social', 'nome_fantasia', 'cnae_fiscal_principal', 'cnae_descricao',
+                'uf', 'municipio', 'porte_da_empresa', 'capital_social_da_empresa',
+                'data_de_inicio_atividade', 'email', 'telefone']
+
+
+def _chave_ranking(cnpj_prestador: str, filtros: Dict[str, Any]) -> str:
+    """Chave do conjunto: prestador + filtros, sem os parâmetros de paginação"""
+    base = {k: v for k, v in (filtros or {}).items() if k not in ('pagina', 'cursor', 'limite')}
+    payload = json.dumps({'cnpj': normalizar_cnpj(cnpj_prestador), 'filtros': base}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _obter_conjunto_ranking(chave: str) -> Optional[Dict[str, Any]]:
+    with _ranking_lock:
+        conjunto = _ranking_conjuntos.get(chave)
+        if conjunto is None:
+            return None
+        if time.time() - conjunto['criado_em'] > Config.RANKING_CURSOR_TTL:
+            _ranking_conjuntos.pop(chave, None)
+            return None
+        _ranking_conjuntos.move_to_end(chave)
+        return conjunto
+
+
+def _guardar_conjunto_ranking(chave: str, conjunto: Dict[str, Any]):
+    with _ranking_lock:
+        conjunto['criado_em'] = time.time()
+        _ranking_conjuntos[chave] = conjunto
+        _ranking_conjuntos.move_to_end(chave)
+        while len(_ranking_conjuntos) > Config.RANKING_CURSOR_MAX:
+            _ranking_conjuntos.popitem(last=False)
+
+
+def _ler_cursor(cursor: str) -> Tuple[str, int]:
+    """Cursor opaco no formato '<chave>.<offset>'"""
+    chave, _, offset = str(cursor).partition('.')
+    return chave, max(0, int(offset))
+
+
+def ranking_empresas_por_prestador(cnpj_prestador: str, filtros: Dict[str, Any], limite: int = 50) -> Dict[str, Any]:
+    """
+    Gera ranking de empresas (leads) mais compatíveis, paginado por cursor.
+
+    A primeira chamada materializa e pontua o conjunto completo de candidatos;
+    as seguintes (com 'cursor' ou 'pagina' em filtros) apenas fatiam esse conjunto.
+    """
+    try:
+        filtros = filtros or {}
+        limite = max(1, int(limite))
+        chave = _chave_ranking(cnpj_prestador, filtros)
+        if filtros.get('cursor'):
             try:
-                empresa_data = {
-                    'cnpj': str(row.get('cnpj', '')),
-                    'razao_social': str(row.get('razao_social_nome_empresarial', '')),
-                    'nome_fantasia': str(row.get('nome_fantasia', '')),
-                    'cnae_fiscal_principal': str(row.get('cnae_fiscal_principal', '')).zfill(7),
-                    'cnae_descricao': str(row.get('cnae_fiscal_descricao', '')),
-                    'uf': str(row.get('uf', '')),
-                    'municipio': str(row.get('municipio', '')),
-                    'porte_da_empresa': str(row.get('porte_da_empresa', '')),
-                    'capital_social_da_empresa': _parse_float_br(row.get('capital_social_da_empresa', 0)),
-                    'data_de_inicio_atividade': str(row.get('data_de_inicio_atividade', '')),
-                    'email': str(row.get('email', '')),
-                    'telefone': str(row.get('telefone_1', '')),
-                }
-                
-                # Edital simulado melhorado
-                edital_simulado = {
-                    'cnae_relacionado': cnae_prestador,
-                    'uf': empresa_data['uf'],
-                    'municipio': empresa_data['municipio'],
-                    'valorEstimado': float(empresa_data['capital_social_da_empresa']) * 0.05,
-                    'porte_preferencial': [empresa_data['porte_da_empresa']],
-                    'exige_experiencia': False,
-                    'exige_certidoes': False,
-                    'palavras_chave': []
-                }
-                
-                score_result = engine.calcular_score(prestador_data, edital_simulado)
-                score_base = getattr(score_result, 'score_total', 0)
-                potencial_texto, bonus_score = get_potencial_score(cnae_prestador, empresa_data['cnae_fiscal_principal'])
-                score_final = min(100, score_base + bonus_score)
-                
-                resultado = {
-                    'empresa': empresa_data,
-                    'compatibilidade': round(score_final, 1),
-                    'potencial': potencial_texto,
-                    'score_base': round(score_base, 1),
-                    'bonus_potencial': bonus_score,
-                    'match_cnae_alvo': empresa_data['cnae_fiscal_principal'][:4] in cnaes_primarios + cnaes_secundarios
-                }
-                resultados.append(resultado)
-                
-            except Exception as e:
-                print(f"[⚠️] Skip {row.get('cnpj')}: {str(e)[:50]}")
-                continue
+                chave_cursor, inicio = _ler_cursor(filtros['cursor'])
+            except ValueError:
+                chave_cursor, inicio = None, 0
+            if chave_cursor != chave:
+                return {'erro': 'Cursor inválido para este prestador/filtros', 'resultados': [], 'total': 0}
+        else:
+            inicio = (max(1, int(filtros.get('pagina', 1))) - 1) * limite
+        
+        conjunto = _obter_conjunto_ranking(chave)
+        do_cache = conjunto is not None
+        if conjunto is None:
+            conjunto = _materializar_ranking(cnpj_prestador, filtros)
+            if 'leads' not in conjunto:
+                return dict(conjunto, limite=limite) if 'pagina' in conjunto else conjunto
+            _guardar_conjunto_ranking(chave, conjunto)
+        
+        leads = conjunto['leads']
+        cnae_prestador = conjunto['cnae_prestador']
+        total_empresas = conjunto['total']
+        fatia = leads.iloc[inicio:inicio + limite]
+        top_n = [
+            {
+                'empresa': {k: r[k] for k in _CAMPOS_LEAD},
+                'compatibilidade': float(r['compatibilidade']),
+                'potencial': r['potencial'],
+                'score_base': round(float(r['score_base']), 1),
+                'bonus_potencial': r['bonus_potencial'],
+                'match_cnae_alvo': bool(r['match_cnae_alvo'])
+            }
+            for r in fatia.to_dict(orient='records')
+        ]
+        fim = inicio + len(top_n)
+        proximo_cursor = f"{chave}.{fim}" if fim < len(leads) else None
         
         # ETAPA 9: RESULTADO FINAL
-        resultados_ordenados = sorted(resultados, key=lambda x: (x['compatibilidade'], x['empresa']['capital_social_da_empresa']), reverse=True)
-        top_n = resultados_ordenados[:limite]
-        print(f"[✅] 🎉 {len(resultados_ordenados)} LEADS GERADOS! | Top retornado: {len(top_n)}")
+        print(f"[✅] Página de leads {inicio}-{fim} de {len(leads)} ({'cache' if do_cache else 'materializado'})")
         media_score = round(sum(x.get('compatibilidade', 0) for x in top_n) / len(top_n), 1) if top_n else 0
         max_score = max([x.get('compatibilidade', 0) for x in top_n]) if top_n else 0
         dist_uf = {}
@@ -460,7 +584,7 @@ def ranking_empresas_por_prestador(cnpj_prestador: str, filtros: Dict[str, Any],
         sel_mun = str(filtros.get('municipio', '') or '')
         relatorio = (
             f"Levantamento de leads com base no CNAE do prestador {cnae_prestador}. "
-            f"Foram processadas {len(df_iter)} empresas não-concorrentes e retornados {len(top_n)} leads. "
+            f"Foram processadas {conjunto['estatisticas']['processadas']} empresas não-concorrentes e retornados {len(top_n)} leads. "
             f"Score médio {media_score} e máximo {max_score}. "
             f"{('Filtro geográfico aplicado: UF ' + sel_uf) if sel_uf else ''}"
             f"{(', Município ' + sel_mun) if sel_mun else ''}. "
@@ -471,17 +595,12 @@ def ranking_empresas_por_prestador(cnpj_prestador: str, filtros: Dict[str, Any],
         return {
             'resultados': top_n,
             'total': total_empresas,
-            'pagina': pagina,
+            'pagina': inicio // limite + 1,
             'limite': limite,
-            'total_paginas': (total_empresas + limite - 1) // limite,
-            'estatisticas': {
-                'total_carregadas': len(df),
-                'com_cnae_alvo': empresas_com_cnae_alvo,
-                'concorrentes_removidos': concorrentes_removidos,
-                'leads_gerados': len(resultados_ordenados),
-                'processadas': len(df_iter),
-                'cnae_prestador': cnae_prestador
-            },
+            'total_paginas': (len(leads) + limite - 1) // limite,
+            'cursor': proximo_cursor,
+            'tem_mais': proximo_cursor is not None,
+            'estatisticas': dict(conjunto['estatisticas'], do_cache=do_cache),
             'dashboard': {
                 'total_leads': len(top_n),
                 'media_score': media_score,
@@ -608,18 +727,136 @@ def sugerir_cnaes(termo: str, setor_filtro: str = None):
         logger.error(f"Erro ao sugerir CNAEs para '{termo}': {e}", exc_info=True)
         return []
 
+def _anomes_sql(coluna: str) -> str:
+    """Código AAAAMM de uma data AAAAMMDD (texto, número ou DATE); NULL se inválida"""
+    n = f"TRY_CAST(regexp_replace(CAST({coluna} AS VARCHAR), '[^0-9]', '', 'g') AS BIGINT)"
+    return (
+        f"CASE WHEN {n} // 10000 BETWEEN 1800 AND 2100 AND ({n} // 100) % 100 BETWEEN 1 AND 12 "
+        f"AND {n} % 100 BETWEEN 1 AND 31 THEN {n} // 100 END"
+    )
+
+
+def _where_setorial(cnae_codes=None, uf=None, municipio=None, somente_ativas=False,
+                    ano_inicio_min=None, ano_inicio_max=None) -> Tuple[str, List[Any]]:
+    """Cláusula WHERE parametrizada (tipada pelo esquema) dos filtros da análise setorial"""
+    filtros = []
+    if cnae_codes:
+        filtros.append(('cnae_fiscal_principal', 'in', [str(c) for c in cnae_codes]))
+    if uf:
+        ufs = [str(x).upper() for x in uf] if isinstance(uf, (list, tuple, set)) else [str(uf).upper()]
+        filtros.append(('uf', 'in', ufs))
+    if municipio:
+        filtros.append(('municipio', '==', str(municipio).upper()))
+    if somente_ativas:
+        filtros.append(('situacao_cadastral', '==', '02'))
+    where, params, _ = compilar_filtros(filtros, esquema_parquet(Config.ARQUIVOS_PARQUET['estabelecimentos']))
+    if ano_inicio_min:
+        where.append(f"{_anomes_sql('data_de_inicio_atividade')} // 100 >= ?")
+        params.append(int(ano_inicio_min))
+    if ano_inicio_max:
+        where.append(f"{_anomes_sql('data_de_inicio_atividade')} // 100 <= ?")
+        params.append(int(ano_inicio_max))
+    return ((" WHERE " + " AND ".join(where)) if where else ""), params
+
+
+def _contagens_sql(df: pd.DataFrame, coluna: str) -> pd.Series:
+    """Série valor → contagem (desc., sem nulos), como value_counts"""
+    df = df[df[coluna].notna()]
+    return pd.Series(df['n'].to_numpy(), index=df[coluna].to_numpy()).astype(int).sort_values(ascending=False, kind='stable')
+
+
+def _agregados_setoriais_sql(where_sql: str, params: List[Any], colunas: List[str]) -> Dict[str, Any]:
+    """
+    Agregados da análise setorial sobre toda a população filtrada, no formato
+    de AnalisadorSetorial.agregar, calculados no DuckDB.
+    """
+    cur = obter_cursor()
+    est = tabela('estabelecimentos')
+    base = f"SELECT cnpj_basico FROM {est}{where_sql}"
+
+    # Distribuições em uma única varredura (GROUPING SETS)
+    q_dist = f"""
+        SELECT sit, uf, cnae, anomes, ativa,
+               GROUPING(sit) AS g_sit, GROUPING(uf) AS g_uf, GROUPING(cnae) AS g_cnae, GROUPING(anomes) AS g_mes,
+               count(*) AS n
+        FROM (
+            SELECT CAST(situacao_cadastral AS VARCHAR) AS sit, CAST(uf AS VARCHAR) AS uf,
+                   CAST(cnae_fiscal_principal AS VARCHAR) AS cnae,
+                   {_anomes_sql('data_de_inicio_atividade')} AS anomes,
+                   CAST(situacao_cadastral AS VARCHAR) = '02' AS ativa
+            FROM {est}{where_sql}
+        ) b
+        GROUP BY GROUPING SETS ((sit), (uf), (cnae), (anomes, ativa))
+    """
+    dist = cur.execute(q_dist, params).df()
+
+    validos = ' + '.join(f"count({identificador(c)})" for c in colunas)
+    total, num_municipios, valores_validos = cur.execute(
+        f"SELECT count(*), count(DISTINCT municipio), {validos} FROM {est}{where_sql}", params
+    ).fetchone()
+
+    ag: Dict[str, Any] = {
+        'total': int(total or 0),
+        'num_municipios': int(num_municipios or 0),
+        'valores_validos': int(valores_validos or 0),
+        'valores_total': int(total or 0) * len(colunas),
+        'situacao': _contagens_sql(dist[dist['g_sit'] == 0], 'sit'),
+        'uf': _contagens_sql(dist[dist['g_uf'] == 0], 'uf'),
+        'cnae': _contagens_sql(dist[dist['g_cnae'] == 0], 'cnae'),
+    }
+    meses = dist[(dist['g_mes'] == 0) & dist['anomes'].notna()]
+    ag['meses'] = meses.groupby(meses['anomes'].astype(int))['n'].sum().sort_index()
+    ativas = meses[meses['ativa'] == True]
+    ag['meses_ativas'] = ativas.groupby(ativas['anomes'].astype(int))['n'].sum().sort_index()
+
+    # Empresas (uma linha por CNPJ básico) e sócios dos estabelecimentos filtrados
+    esquema_emp = esquema_parquet(Config.ARQUIVOS_PARQUET['empresas'])
+    capital = expressao_numerica('capital_social_da_empresa', esquema_emp.get('capital_social_da_empresa'))
+    emp = cur.execute(f"""
+        SELECT porte, GROUPING(porte) AS g, count(*) AS n,
+               avg(capital) AS medio, median(capital) AS mediana, sum(capital) AS soma
+        FROM (
+            SELECT {capital} AS capital, porte_da_empresa AS porte
+            FROM {tabela('empresas')} WHERE cnpj_basico IN ({base})
+        ) m
+        GROUP BY GROUPING SETS ((porte), ())
+    """, params).df()
+    geral = emp[emp['g'] == 1]
+    if not geral.empty:
+        linha = geral.iloc[0]
+        ag['total_empresas'] = int(linha['n'])
+        ag['capital'] = {
+            'medio': float(linha['medio']) if pd.notna(linha['medio']) else 0,
+            'mediana': float(linha['mediana']) if pd.notna(linha['mediana']) else 0,
+            'total': float(linha['soma']) if pd.notna(linha['soma']) else 0,
+        }
+    ag['porte'] = _contagens_sql(emp[emp['g'] == 0], 'porte')
+    ag['total_socios'] = int(cur.execute(
+        f"SELECT count(*) FROM {tabela('socios')} WHERE cnpj_basico IN ({base})", params
+    ).fetchone()[0] or 0)
+    return ag
+
+
 def executar_analise_setorial(cnae_codes=None, termo_busca=None, uf=None,
                               municipio=None, somente_ativas=False,
                               ano_inicio_min=None, ano_inicio_max=None,
-                              limit: int = 20):
+                              limit: int = 20, exato: Optional[bool] = None):
     """
     Executa análise setorial completa
+
+    Args:
+        exato: KPIs e gráficos agregados no DuckDB sobre toda a população
+            filtrada, materializando só as `limit` empresas exibidas
+            (padrão: Config.ANALISE_SETORIAL_EXATA). Sem ele, a análise usa
+            uma amostra de até 20 mil estabelecimentos.
     """
+    if exato is None:
+        exato = Config.ANALISE_SETORIAL_EXATA
     try:
         cache_key = (
             f"setorial:cnaes:{','.join(map(str, cnae_codes or []))}:termo:{str(termo_busca or '').strip().lower()}"
             f":uf:{','.join(map(lambda x: str(x).upper(), uf if isinstance(uf,(list,tuple,set)) else ([uf] if uf else [])))}"
-            f":mun:{str(municipio or '').upper()}:ativas:{int(bool(somente_ativas))}:ai:{ano_inicio_min}:af:{ano_inicio_max}:lim:{int(limit or 20)}"
+            f":mun:{str(municipio or '').upper()}:ativas:{int(bool(somente_ativas))}:ai:{ano_inicio_min}:af:{ano_inicio_max}:lim:{int(limit or 20)}:exato:{int(bool(exato))}"
         )
         try:
             cached = cache.get(cache_key)
@@ -627,6 +864,31 @@ def executar_analise_setorial(cnae_codes=None, termo_busca=None, uf=None,
                 return cached
         except Exception as e:
             logger.warning(f"Erro ao acessar cache: {e}")
+        # Pedidos simultâneos do mesmo recorte aguardam um único cálculo
+        return em_voo(cache_key, lambda: _analise_setorial_sem_cache(
+            cache_key, cnae_codes, termo_busca, uf, municipio, somente_ativas,
+            ano_inicio_min, ano_inicio_max, limit, exato
+        ))
+    except Exception as e:
+        logger.error(f"Erro na análise setorial: {e}", exc_info=True)
+        return _erro_setorial(e)
+
+
+def _erro_setorial(e: Exception) -> Dict:
+    return {
+        'erro': str(e),
+        'texto_analise': 'Erro ao processar análise',
+        'dados_graficos': {},
+        'kpis': {},
+        'total_empresas': 0,
+        'empresas': pd.DataFrame()
+    }
+
+
+def _analise_setorial_sem_cache(cache_key, cnae_codes, termo_busca, uf, municipio, somente_ativas,
+                                ano_inicio_min, ano_inicio_max, limit, exato):
+    """Cálculo de executar_analise_setorial, sem consultar o cache"""
+    try:
         # Carrega dados de estabelecimentos
         filtros = []
         if cnae_codes:
@@ -639,40 +901,26 @@ def executar_analise_setorial(cnae_codes=None, termo_busca=None, uf=None,
             'tipo_de_logradouro', 'logradouro', 'numero', 'complemento', 'bairro', 'cep',
             'ddd_1', 'telefone_1', 'ddd_2', 'telefone_2', 'correio_eletronico'
         ]
-        use_duck = True
         df_estabelecimentos = None
-        if use_duck:
-            try:
-                where = []
-                if cnae_codes:
-                    cvals = ",".join([f"'{str(c)}'" for c in cnae_codes])
-                    where.append(f"CAST(cnae_fiscal_principal AS VARCHAR) IN ({cvals})")
-                if uf:
-                    if isinstance(uf, (list, tuple, set)):
-                        uvals = ",".join([f"'{str(x).upper()}'" for x in uf])
-                        where.append(f"uf IN ({uvals})")
-                    else:
-                        where.append(f"uf = '{str(uf).upper()}'")
-                if municipio:
-                    where.append(f"CAST(municipio AS VARCHAR) = '{str(municipio).upper()}'")
-                if somente_ativas:
-                    where.append("situacao_cadastral = '02'")
-                if ano_inicio_min or ano_inicio_max:
-                    year_expr = "EXTRACT(YEAR FROM STRPTIME(CAST(data_de_inicio_atividade AS VARCHAR), '%Y%m%d'))"
-                    if ano_inicio_min:
-                        where.append(f"{year_expr} >= {int(ano_inicio_min)}")
-                    if ano_inicio_max:
-                        where.append(f"{year_expr} <= {int(ano_inicio_max)}")
-                where_sql = (" WHERE " + " AND ".join(where)) if where else ""
-                sel_cols = ",".join(cols_estab)
-                t_path = str(Config.ARQUIVOS_PARQUET['estabelecimentos']).replace('\\', '/')
-                q = (
-                    f"SELECT {sel_cols} FROM parquet_scan('{t_path}')"
-                    f"{where_sql} LIMIT 20000"
-                )
-                df_estabelecimentos = duckdb.sql(q).to_df()
-            except Exception:
-                df_estabelecimentos = None
+        agregados = None
+        try:
+            where_sql, params = _where_setorial(cnae_codes, uf, municipio, somente_ativas,
+                                                ano_inicio_min, ano_inicio_max)
+            if exato:
+                try:
+                    agregados = _agregados_setoriais_sql(where_sql, params, cols_estab)
+                except Exception as e:
+                    logger.warning(f"Agregação setorial no DuckDB falhou, usando amostra: {e}")
+                    agregados = None
+                if agregados is not None and agregados['total'] == 0:
+                    return None
+            # Com agregados exatos só as linhas exibidas são materializadas
+            limite_linhas = max(1, int(limit or 20)) if agregados is not None else 20000
+            sel_cols = ",".join(cols_estab)
+            q = f"SELECT {sel_cols} FROM {tabela('estabelecimentos')}{where_sql} LIMIT ?"
+            df_estabelecimentos = obter_cursor().execute(q, params + [limite_linhas]).df()
+        except Exception:
+            df_estabelecimentos = None
         if df_estabelecimentos is None:
             df_estabelecimentos = pd.read_parquet(
                 Config.ARQUIVOS_PARQUET['estabelecimentos'],
@@ -746,113 +994,64 @@ def executar_analise_setorial(cnae_codes=None, termo_busca=None, uf=None,
             ]
         )
 
-        # Carrega dados dos sócios
-        df_socios = pd.read_parquet(
-            Config.ARQUIVOS_PARQUET['socios'],
-            filters=[('cnpj_basico', 'in', cnpjs_basicos)],
-            columns=['cnpj_basico','nome_socio','cpf_cnpj_do_socio','qualificacao_socio']
-        )
+        # Carrega dados dos sócios (dispensável com agregados exatos e tabela de responsável)
+        if agregados is not None and responsavel_disponivel():
+            df_socios = pd.DataFrame(columns=['cnpj_basico','nome_socio','cpf_cnpj_do_socio','qualificacao_socio'])
+        else:
+            df_socios = pd.read_parquet(
+                Config.ARQUIVOS_PARQUET['socios'],
+                filters=[('cnpj_basico', 'in', cnpjs_basicos)],
+                columns=['cnpj_basico','nome_socio','cpf_cnpj_do_socio','qualificacao_socio']
+            )
 
         # Executa análise
-        from analise_setorial import analisar_dados_setoriais
-        resultados_analise = analisar_dados_setoriais(
-            df_estabelecimentos, df_empresas, df_socios
-        )
+        from analise_setorial import analisar_dados_setoriais, analisar_agregados_setoriais
+        if agregados is not None:
+            resultados_analise = analisar_agregados_setoriais(agregados)
+        else:
+            resultados_analise = analisar_dados_setoriais(
+                df_estabelecimentos, df_empresas, df_socios
+            )
 
         df_lista = pd.merge(df_estabelecimentos, df_empresas, on='cnpj_basico', how='left')
+        total_lista = int(len(df_lista))
+        # Só as linhas exibidas são enriquecidas e formatadas
+        df_lista = df_lista.head(int(limit) if limit else 20)
 
         try:
-            df_tmp = df_socios.copy()
-            if 'qualificacao_socio' in df_tmp.columns:
-                q = df_tmp['qualificacao_socio'].astype(str).str.upper()
-                df_tmp['__is_admin'] = q.str.contains('ADMIN') | q.str.contains('DIRETOR') | q.str.contains('PRESIDENTE') | q.str.contains('GERENTE')
+            # Tabela pré-calculada (services_responsavel); sem ela, escolhe entre os sócios carregados
+            df_resp = responsaveis_por_cnpj_basico(df_lista['cnpj_basico'].astype(str).tolist())
+            if df_resp is not None:
+                df_resp = df_resp[['cnpj_basico', 'responsavel', 'responsavel_documento']]
+                df_resp['cnpj_basico'] = df_resp['cnpj_basico'].astype(str)
+                df_lista = df_lista.assign(cnpj_basico=df_lista['cnpj_basico'].astype(str))
+                df_lista = pd.merge(df_lista, df_resp, on='cnpj_basico', how='left')
             else:
-                df_tmp['__is_admin'] = False
-            df_tmp['__ord'] = (~df_tmp['__is_admin']).astype(int)
-            df_tmp = df_tmp.sort_values(['cnpj_basico','__ord']).drop_duplicates(['cnpj_basico'])
-            cols_merge = ['cnpj_basico']
-            if 'nome_socio' in df_tmp.columns:
-                cols_merge.append('nome_socio')
-            if 'cpf_cnpj_do_socio' in df_tmp.columns:
-                cols_merge.append('cpf_cnpj_do_socio')
-            df_resp = df_tmp[cols_merge]
-            df_lista = pd.merge(df_lista, df_resp, on='cnpj_basico', how='left')
-            if 'nome_socio' in df_lista.columns:
-                df_lista.rename(columns={'nome_socio': 'responsavel'}, inplace=True)
-            if 'cpf_cnpj_do_socio' in df_lista.columns:
-                df_lista.rename(columns={'cpf_cnpj_do_socio': 'responsavel_documento'}, inplace=True)
-            if 'responsavel_documento' in df_lista.columns:
-                df_lista['responsavel_documento'] = df_lista['responsavel_documento'].astype(str).str.replace(r'\D','', regex=True)
+                df_tmp = df_socios[df_socios['cnpj_basico'].isin(df_lista['cnpj_basico'])].copy()
+                if 'qualificacao_socio' in df_tmp.columns:
+                    q = df_tmp['qualificacao_socio'].astype(str).str.upper()
+                    df_tmp['__is_admin'] = q.str.contains('ADMIN') | q.str.contains('DIRETOR') | q.str.contains('PRESIDENTE') | q.str.contains('GERENTE')
+                else:
+                    df_tmp['__is_admin'] = False
+                df_tmp['__ord'] = (~df_tmp['__is_admin']).astype(int)
+                df_tmp = df_tmp.sort_values(['cnpj_basico','__ord']).drop_duplicates(['cnpj_basico'])
+                cols_merge = ['cnpj_basico']
+                if 'nome_socio' in df_tmp.columns:
+                    cols_merge.append('nome_socio')
+                if 'cpf_cnpj_do_socio' in df_tmp.columns:
+                    cols_merge.append('cpf_cnpj_do_socio')
+                df_resp = df_tmp[cols_merge]
+                df_lista = pd.merge(df_lista, df_resp, on='cnpj_basico', how='left')
+                if 'nome_socio' in df_lista.columns:
+                    df_lista.rename(columns={'nome_socio': 'responsavel'}, inplace=True)
+                if 'cpf_cnpj_do_socio' in df_lista.columns:
+                    df_lista.rename(columns={'cpf_cnpj_do_socio': 'responsavel_documento'}, inplace=True)
+                if 'responsavel_documento' in df_lista.columns:
+                    df_lista['responsavel_documento'] = df_lista['responsavel_documento'].astype(str).str.replace(r'\D','', regex=True)
         except Exception:
             df_lista['responsavel'] = None
 
-        try:
-            def fmt_cep(v):
-                try:
-                    s = ''.join([c for c in str(v) if c.isdigit()])
-                    return f"{s[:5]}-{s[5:8]}" if len(s)==8 else None
-                except Exception:
-                    return None
-
-            tipo = df_lista['tipo_de_logradouro'].astype(str) if 'tipo_de_logradouro' in df_lista.columns else None
-            logradouro = df_lista['logradouro'].astype(str) if 'logradouro' in df_lista.columns else None
-            numero = df_lista['numero'].astype(str) if 'numero' in df_lista.columns else None
-            complemento = df_lista['complemento'].astype(str) if 'complemento' in df_lista.columns else None
-            bairro = df_lista['bairro'].astype(str) if 'bairro' in df_lista.columns else None
-            cep = df_lista['cep'].apply(fmt_cep) if 'cep' in df_lista.columns else None
-
-            partes = []
-            if tipo is not None and logradouro is not None:
-                partes.append((tipo.fillna('') + ' ' + logradouro.fillna('')).str.strip())
-            elif logradouro is not None:
-                partes.append(logradouro.fillna(''))
-            if numero is not None:
-                partes.append(('Nº ' + numero.fillna('')).str.strip())
-            if complemento is not None:
-                partes.append(complemento.fillna(''))
-            if bairro is not None:
-                partes.append(bairro.fillna(''))
-            if cep is not None:
-                partes.append(pd.Series(cep).fillna(''))
-
-            if partes:
-                end = partes[0]
-                for p in partes[1:]:
-                    end = (end + ' - ' + p).str.replace(r'\s+-\s+-', ' - ', regex=True)
-                df_lista['endereco'] = end.str.strip().replace({'': None})
-            else:
-                df_lista['endereco'] = None
-        except Exception:
-            df_lista['endereco'] = None
-
-        try:
-            tel1 = df_lista['telefone_1'].astype(str) if 'telefone_1' in df_lista.columns else None
-            ddd1 = df_lista['ddd_1'].astype(str) if 'ddd_1' in df_lista.columns else None
-            tel2 = df_lista['telefone_2'].astype(str) if 'telefone_2' in df_lista.columns else None
-            ddd2 = df_lista['ddd_2'].astype(str) if 'ddd_2' in df_lista.columns else None
-
-            def join_tel(ddd, tel):
-                if ddd is None or tel is None:
-                    return None
-                return (('(' + ddd.fillna('') + ') ' + tel.fillna('')).str.strip().replace({'() ': ''}))
-
-            t1 = join_tel(ddd1, tel1)
-            t2 = join_tel(ddd2, tel2)
-            if t1 is not None:
-                df_lista['telefone'] = t1.where(t1.notna(), t2 if t2 is not None else None)
-            elif t2 is not None:
-                df_lista['telefone'] = t2
-            else:
-                df_lista['telefone'] = None
-
-            if 'correio_eletronico' in df_lista.columns:
-                df_lista['email'] = df_lista['correio_eletronico']
-            else:
-                email_col = next((c for c in df_lista.columns if 'mail' in c.lower() or 'email' in c.lower()), None)
-                df_lista['email'] = df_lista[email_col] if email_col else None
-        except Exception:
-            df_lista['telefone'] = None
-            df_lista['email'] = None
+        df_lista = formatar_leads(df_lista)
 
         try:
             df_lista = _attach_municipio_names(df_lista)
@@ -860,9 +1059,6 @@ def executar_analise_setorial(cnae_codes=None, termo_busca=None, uf=None,
                 df_lista['municipio'] = df_lista['municipio'].astype(str).map(_fix_text)
         except Exception:
             pass
-        df_lista['cnpj'] = df_lista['cnpj_basico'].astype(str) + \
-                          df_lista['cnpj_ordem'].astype(str) + \
-                          df_lista['cnpj_dv'].astype(str)
         if 'responsavel_documento' not in df_lista.columns:
             df_lista['responsavel_documento'] = None
 
@@ -879,16 +1075,17 @@ def executar_analise_setorial(cnae_codes=None, termo_busca=None, uf=None,
         ]
 
         titulo_analise = termo_busca.title() if termo_busca else "Setores Selecionados"
-        texto_intro = f"Análise para '{titulo_analise}', abrangendo {len(df_estabelecimentos)} estabelecimentos."
+        total_estabelecimentos = int(agregados['total']) if agregados is not None else len(df_estabelecimentos)
+        texto_intro = f"Análise para '{titulo_analise}', abrangendo {total_estabelecimentos} estabelecimentos."
         texto_analise_completo = f"{texto_intro}\n\n{resultados_analise.get('texto', '')}"
 
-        total_empresas = int(len(df_lista))
+        total_empresas = total_estabelecimentos if agregados is not None else total_lista
         resp = {
             "texto_analise": texto_analise_completo,
             "dados_graficos": resultados_analise.get("dados_graficos", {}),
             "kpis": resultados_analise.get("kpis", {}),
             "total_empresas": total_empresas,
-            "empresas": df_lista[cols_lista].head(int(limit) if limit else 20)
+            "empresas": df_lista[cols_lista]
         }
         try:
             cache.set(cache_key, resp, expire=300)
@@ -898,14 +1095,7 @@ def executar_analise_setorial(cnae_codes=None, termo_busca=None, uf=None,
 
     except Exception as e:
         logger.error(f"Erro na análise setorial: {e}", exc_info=True)
-        return {
-            'erro': str(e),
-            'texto_analise': 'Erro ao processar análise',
-            'dados_graficos': {},
-            'kpis': {},
-            'total_empresas': 0,
-            'empresas': pd.DataFrame()
-        }
+        return _erro_setorial(e)
 
 def get_cnpjs_por_cnae(cnaes: List[str]):
     try:
@@ -0,0 +1,317 @@
+"""
+Aquecimento de cache
+
+Registra as consultas mais frequentes do tráfego real e as repete ao
+iniciar o servidor (e após uma nova versão dos dados), de modo que os
+primeiros usuários não paguem o cálculo de setorial, lista de players,
+KPIs e séries do PNCP:
+
+  - coleta: um after_request conta as respostas 200 das rotas em
+    Config.AQUECIMENTO_ROTAS (método, caminho, query string e corpo JSON);
+    as contagens ficam em memória e são gravadas em lote na tabela
+    consultas_frequentes do banco B2G pelo agendador;
+  - repetição: as Config.AQUECIMENTO_CONSULTAS consultas mais frequentes
+    (mais as de Config.AQUECIMENTO_CONSULTAS_FIXAS) são executadas pelo
+    test_client da aplicação em um pool de Config.AQUECIMENTO_TRABALHADORES
+    threads, fora das threads do servidor;
+  - prontidão: estado_aquecimento() informa o progresso e o indicador
+    'pronto', usado pelo /api/health e /api/health/pronto. Passado
+    Config.AQUECIMENTO_TEMPO_MAX, o servidor é dado como pronto mesmo
+    com consultas pendentes.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from core.config import Config
+
+logger = logging.getLogger(__name__)
+
+TABELA = 'consultas_frequentes'
+CABECALHO = 'X-Aquecimento'
+CORPO_MAX = 4096  # bytes; corpos maiores não são registrados
+
+_contagens: Counter = Counter()
+_lock_contagens = threading.Lock()
+
+_estado: Dict = {
+    'estado': 'pendente',
+    'pronto': not Config.AQUECIMENTO_ATIVO,
+    'total': 0,
+    'concluidas': 0,
+    'falhas': 0,
+    'inicio': None,
+    'fim': None,
+    'versao_dados': None,
+}
+_lock_estado = threading.Lock()
+_app = None
+
+
+def _conexao() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(Config.B2G_DB_PATH), timeout=30)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA} (
+            metodo TEXT NOT NULL,
+            caminho TEXT NOT NULL,
+            query TEXT NOT NULL,
+            corpo TEXT NOT NULL,
+            contagem INTEGER NOT NULL DEFAULT 0,
+            ultima_vez TEXT NOT NULL,
+            PRIMARY KEY (metodo, caminho, query, corpo)
+        )
+    """)
+    return conn
+
+
+# ==========================================
+# COLETA
+# ==========================================
+
+def _consulta_requisicao(req) -> Optional[Tuple[str, str, str, str]]:
+    """Requisição → (método, caminho, query, corpo) canônicos, ou None se não aquecível"""
+    if not any(req.path.startswith(r) for r in Config.AQUECIMENTO_ROTAS):
+        return None
+    query = '&'.join(f'{k}={v}' for k, v in sorted(req.args.items(multi=True)))
+    corpo = ''
+    if req.method == 'POST':
+        if (req.content_length or 0) > CORPO_MAX:
+            return None
+        dados = req.get_json(silent=True)
+        if dados is None:
+            return None
+        corpo = json.dumps(dados, sort_keys=True, ensure_ascii=False)
+    return req.method, req.path, query, corpo
+
+
+def registrar_coleta(app):
+    """Conta as consultas aquecíveis atendidas com sucesso"""
+    from flask import request
+
+    @app.after_request
+    def _coletar_consulta(resposta):
+        try:
+            if resposta.status_code == 200 and not request.headers.get(CABECALHO):
+                consulta = _consulta_requisicao(request)
+                if consulta is not None:
+                    with _lock_contagens:
+                        _contagens[consulta] += 1
+        except Exception as e:
+            logger.debug(f"Consulta não registrada para aquecimento: {e}")
+        return resposta
+
+
+def descarregar_contagens() -> int:
+    """Grava as contagens em memória na tabela consultas_frequentes"""
+    with _lock_contagens:
+        lote = list(_contagens.items())
+        _contagens.clear()
+    if not lote:
+        return 0
+    agora = datetime.now().isoformat()
+    conn = _conexao()
+    try:
+        with conn:
+            conn.executemany(f"""
+                INSERT INTO {TABELA} (metodo, caminho, query, corpo, contagem, ultima_vez)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(metodo, caminho, query, corpo) DO UPDATE SET
+                    contagem = contagem + excluded.contagem,
+                    ultima_vez = excluded.ultima_vez
+            """, [(*consulta, n, agora) for consulta, n in lote])
+    finally:
+        conn.close()
+    return len(lote)
+
+
+def consultas_frequentes(limite: Optional[int] = None) -> List[Dict]:
+    """Consultas fixas da configuração seguidas das mais frequentes na janela recente"""
+    limite = Config.AQUECIMENTO_CONSULTAS if limite is None else limite
+    consultas = [
+        {
+            'metodo': c.get('metodo', 'GET').upper(),
+            'caminho': c['caminho'],
+            'query': c.get('query', ''),
+            'corpo': json.dumps(c['corpo'], sort_keys=True) if c.get('corpo') is not None else '',
+        }
+        for c in Config.AQUECIMENTO_CONSULTAS_FIXAS
+    ]
+    desde = (datetime.now() - timedelta(days=Config.AQUECIMENTO_JANELA_DIAS)).isoformat()
+    conn = _conexao()
+    try:
+        rows = conn.execute(f"""
+            SELECT metodo, caminho, query, corpo FROM {TABELA}
+            WHERE ultima_vez >= ?
+            ORDER BY contagem DESC, ultima_vez DESC
+            LIMIT ?
+        """, (desde, int(limite))).fetchall()
+    finally:
+        conn.close()
+    vistas = {(c['metodo'], c['caminho'], c['query'], c['corpo']) for c in consultas}
+    for row in rows:
+        if tuple(row) not in vistas:
+            consultas.append({'metodo': row[0], 'caminho': row[1], 'query': row[2], 'corpo': row[3]})
+    return consultas
+
+
+# ==========================================
+# REPETIÇÃO
+# ==========================================
+
+def _atualizar(**campos):
+    with _lock_estado:
+        _estado.update(campos)
+
+
+def _executar_consulta(cliente, consulta: Dict) -> bool:
+    kwargs = {'method': consulta['metodo'], 'query_string': consulta['query'], 'headers': {CABECALHO: '1'}}
+    if consulta['corpo']:
+        kwargs['json'] = json.loads(consulta['corpo'])
+    resposta = cliente.open(consulta['caminho'], **kwargs)
+    # 4xx também não aquece nada (parâmetros que deixaram de valer, rota removida)
+    return 200 <= resposta.status_code < 300
+
+
+def aquecer(app, consultas: Optional[List[Dict]] = None, marcar_pronto: bool = True) -> Dict:
+    """
+    Repete as consultas no pool de aquecimento e atualiza o progresso.
+
+    Args:
+        marcar_pronto: Ao terminar (ou estourar Config.AQUECIMENTO_TEMPO_MAX),
+            marca o servidor como pronto
+    """
+    from services.services_versao_dados import versao_dados
+
+    try:
+        descarregar_contagens()
+    except Exception as e:
+        logger.warning(f"Erro ao gravar consultas frequentes: {e}")
+    try:
+        consultas = consultas_frequentes() if consultas is None else consultas
+    except Exception as e:
+        logger.error(f"Erro ao ler consultas frequentes: {e}")
+        consultas = []
+    try:
+        versao = versao_dados()
+    except Exception:
+        versao = None
+
+    inicio = time.time()
+    _atualizar(estado='aquecendo', total=len(consultas), concluidas=0, falhas=0,
+               inicio=datetime.now().isoformat(), fim=None)
+    logger.info(f"Aquecimento de cache: {len(consultas)} consultas")
+
+    cliente = app.test_client()
+    limite = inicio + Config.AQUECIMENTO_TEMPO_MAX
+    executor = ThreadPoolExecutor(max_workers=max(int(Config.AQUECIMENTO_TRABALHADORES), 1),
+                                  thread_name_prefix='aquecimento')
+    pendentes = {executor.submit(_executar_consulta, cliente, c) for c in consultas}
+    while pendentes:
+        restante = limite - time.time()
+        if restante <= 0:
+            logger.warning(f"Aquecimento excedeu {Config.AQUECIMENTO_TEMPO_MAX}s; "
+                           f"{len(pendentes)} consultas continuam em segundo plano")
+            break
+        prontas, pendentes = wait(pendentes, timeout=restante, return_when=FIRST_COMPLETED)
+        for futuro in prontas:
+            try:
+                ok = futuro.result()
+            except Exception as e:
+                logger.warning(f"Consulta de aquecimento falhou: {e}")
+                ok = False
+            with _lock_estado:
+                _estado['concluidas'] += 1
+                _estado['falhas'] += int(not ok)
+    executor.shutdown(wait=False)
+
+    campos = {'estado': 'pronto', 'fim': datetime.now().isoformat(), 'versao_dados': versao,
+              'duracao_s': round(time.time() - inicio, 1)}
+    if marcar_pronto:
+        campos['pronto'] = True
+    _atualizar(**campos)
+    logger.info(f"✓ Aquecimento concluído em {campos['duracao_s']}s "
+                f"({_estado['concluidas']}/{len(consultas)}, {_estado['falhas']} falhas)")
+    return estado_aquecimento()
+
+
+def iniciar_aquecimento(app) -> bool:
+    """Aquece em segundo plano após create_app; o servidor já atende enquanto isso"""
+    global _app
+    _app = app
+    if not Config.AQUECIMENTO_ATIVO:
+        _atualizar(estado='desativado', pronto=True)
+        return False
+    with _lock_estado:
+        if _estado['estado'] == 'aquecendo':
+            return True
+        _estado['estado'] = 'aquecendo'
+
+    def _rodar():
+        try:
+            aquecer(app)
+        except Exception as e:
+            logger.error(f"Erro no aquecimento de cache: {e}")
+            _atualizar(estado='erro', pronto=True, erro=str(e))
+
+    threading.Thread(target=_rodar, name='aquecimento-cache', daemon=True).start()
+    return True
+
+
+def _descartar_estado_processo():
+    """
+    A nova versão pode ter sido gerada por outro processo: reabre arquivos e
+    views e descarta os resultados calculados com os dados antigos, para que
+    o reaquecimento recalcule em vez de servir o que já estava em memória
+    """
+    from services.services_cache_service import cache
+    from services.services_versao_dados import PREFIXOS_CACHE, invalidar_cache_tabelas, recarregar_processo
+
+    try:
+        recarregar_processo()
+        invalidar_cache_tabelas(list(PREFIXOS_CACHE))
+        cache.limpar_memoria()
+    except Exception as e:
+        logger.warning(f"Erro ao descartar o estado antes do reaquecimento: {e}")
+
+
+def reaquecer_se_dados_mudaram() -> Dict:
+    """
+    Tarefa do agendador: grava as contagens e, se a versão dos dados mudou
+    desde o último aquecimento, repete as consultas (sem tirar o servidor
+    de prontidão)
+    """
+    from services.services_versao_dados import versao_dados
+
+    gravadas = descarregar_contagens()
+    if _app is None or not Config.AQUECIMENTO_ATIVO:
+        return {'consultas_gravadas': gravadas, 'reaquecido': False}
+    with _lock_estado:
+        ocupado = _estado['estado'] == 'aquecendo'
+        anterior = _estado.get('versao_dados')
+    versao = versao_dados()
+    if ocupado or versao is None or versao == anterior:
+        return {'consultas_gravadas': gravadas, 'reaquecido': False}
+    logger.info(f"Nova versão dos dados ({anterior} → {versao}): reaquecendo cache")
+    _descartar_estado_processo()
+    aquecer(_app, marcar_pronto=False)
+    return {'consultas_gravadas': gravadas, 'reaquecido': True, 'versao_dados': versao}
+
+
+def estado_aquecimento() -> Dict:
+    with _lock_estado:
+        estado = dict(_estado)
+    estado['progresso'] = round(estado['concluidas'] / estado['total'], 3) if estado['total'] else (
+        1.0 if estado['estado'] in ('pronto', 'desativado') else 0.0)
+    return estado
+
+
+def servidor_pronto() -> bool:
+    with _lock_estado:
+        return bool(_estado['pronto'])
@@ -0,0 +1,383 @@
+"""
+Índice invertido de nomes (razão social, nome fantasia e sócios)
+
+Etapa offline que tokeniza os nomes da base da Receita (minúsculas, sem
+acentos, só [a-z0-9]) e grava em Parquet, ordenados pela chave de busca:
+
+    documentos.parquet  doc_id, campo, cnpj_basico, cnpj, nome, uf, municipio, n_tokens
+    postings.parquet    token, doc_id
+    vocabulario.parquet token, df
+    trigramas.parquet   trigrama, token
+
+A consulta resolve cada termo no vocabulário (exato, prefixo para o último
+termo e, se nada casar, tokens parecidos por trigramas), lê só os row groups
+de postings desses tokens e pontua os documentos por IDF, exigindo todos os
+termos.
+
+Uso:
+    python -m services.services_busca_nomes
+"""
+
+import json
+import logging
+import math
+import re
+import shutil
+import time
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from core.config import Config
+from services.services_duckdb_pool import obter_conexao, obter_cursor, tabela
+from services.services_filtro_sql import esquema_parquet, identificador
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_MANIFESTO = 'manifesto.json'
+
+# Campos indexados (código gravado em documentos.campo)
+CAMPOS = {
+    'razao_social': 1,
+    'nome_fantasia': 2,
+    'socio': 3,
+}
+
+TAMANHO_MINIMO_TOKEN = 2
+MAX_EXPANSOES_PREFIXO = 64
+MAX_EXPANSOES_TRIGRAMA = 8
+
+_RE_NAO_ALFANUM = re.compile(r'[^a-z0-9]+')
+
+
+def _arquivo(nome: str) -> Path:
+    return Path(Config.BUSCA_INDEX_DIR) / f"{nome}.parquet"
+
+
+def _sql_arquivo(nome: str) -> str:
+    return f"read_parquet('{str(_arquivo(nome)).replace(chr(92), '/')}')"
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Mesma normalização usada na construção: sem acentos, minúsculas, [a-z0-9]"""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return [t for t in _RE_NAO_ALFANUM.split(texto) if len(t) >= TAMANHO_MINIMO_TOKEN]
+
+
+def _trigramas(token: str) -> List[str]:
+    t = f"  {token} "
+    return sorted({t[i:i + 3] for i in range(len(t) - 2)})
+
+
+# ==========================================
+# CONSTRUÇÃO (OFFLINE)
+# ==========================================
+
+def _tokens_sql(coluna: str) -> str:
+    return (
+        f"string_split(trim(regexp_replace(lower(strip_accents(CAST({coluna} AS VARCHAR))), "
+        f"'[^a-z0-9]+', ' ', 'g')), ' ')"
+    )
+
+
+def _consulta_documentos() -> str:
+    """SELECT com os documentos de todos os campos, na ordem de doc_id"""
+    def pick(esquema, cands):
+        return next((identificador(c) for c in cands if c in esquema), None)
+
+    esq_emp = esquema_parquet(Config.ARQUIVOS_PARQUET['empresas'])
+    esq_est = esquema_parquet(Config.ARQUIVOS_PARQUET['estabelecimentos'])
+    esq_soc = esquema_parquet(Config.ARQUIVOS_PARQUET['socios'])
+    partes = []
+
+    razao = pick(esq_emp, ['razao_social_nome_empresarial', 'razao_social', 'nome_empresarial'])
+    if razao:
+        # UF/município da matriz para permitir filtro geográfico na razão social
+        matriz = pick(esq_est, ['identificador_matriz_filial'])
+        filtro_matriz = f"WHERE CAST({matriz} AS VARCHAR) IN ('1', '01')" if matriz else ""
+        partes.append(
+            f"SELECT {CAMPOS['razao_social']} AS campo, CAST(m.cnpj_basico AS VARCHAR) AS cnpj_basico, "
+            f"CAST(NULL AS VARCHAR) AS cnpj, CAST(m.{razao} AS VARCHAR) AS nome, e.uf, e.municipio "
+            f"FROM {tabela('empresas')} m LEFT JOIN ("
+            f"SELECT cnpj_basico, ANY_VALUE(CAST(uf AS VARCHAR)) AS uf, ANY_VALUE(CAST(municipio AS VARCHAR)) AS municipio "
+            f"FROM {tabela('estabelecimentos')} {filtro_matriz} GROUP BY cnpj_basico"
+            f") e ON e.cnpj_basico = m.cnpj_basico WHERE m.{razao} IS NOT NULL"
+        )
+    fantasia = pick(esq_est, ['nome_fantasia', 'NOME_FANTASIA'])
+    if fantasia:
+        partes.append(
+            f"SELECT {CAMPOS['nome_fantasia']} AS campo, CAST(cnpj_basico AS VARCHAR) AS cnpj_basico, "
+            f"CAST(cnpj_basico AS VARCHAR) || CAST(cnpj_ordem AS VARCHAR) || CAST(cnpj_dv AS VARCHAR) AS cnpj, "
+            f"CAST({fantasia} AS VARCHAR) AS nome, CAST(uf AS VARCHAR) AS uf, CAST(municipio AS VARCHAR) AS municipio "
+            f"FROM {tabela('estabelecimentos')} WHERE trim(CAST({fantasia} AS VARCHAR)) <> ''"
+        )
+    socio = pick(esq_soc, ['nome_socio', 'socio', 'nome'])
+    if socio:
+        partes.append(
+            f"SELECT {CAMPOS['socio']} AS campo, CAST(cnpj_basico AS VARCHAR) AS cnpj_basico, "
+            f"CAST(NULL AS VARCHAR) AS cnpj, CAST({socio} AS VARCHAR) AS nome, "
+            f"CAST(NULL AS VARCHAR) AS uf, CAST(NULL AS VARCHAR) AS municipio "
+            f"FROM {tabela('socios')} WHERE {socio} IS NOT NULL"
+        )
+    if not partes:
+        raise ValueError('nenhuma coluna de nome encontrada nos arquivos da Receita')
+    return " UNION ALL ".join(partes)
+
+
+def construir_indice_nomes() -> Dict:
+    """
+    Constrói (ou reconstrói) o índice invertido de nomes.
+
+    Returns:
+        Manifesto com contagens e tempo de construção
+    """
+    inicio = time.time()
+    base = Path(Config.BUSCA_INDEX_DIR)
+    novo = base.parent / f"_{base.name}_novo"
+    shutil.rmtree(novo, ignore_errors=True)
+    novo.mkdir(parents=True, exist_ok=True)
+
+    def destino(nome):
+        return str(novo / f"{nome}.parquet").replace('\\', '/')
+
+    row_group = int(Config.BUSCA_INDEX_ROW_GROUP)
+    con = obter_conexao().cursor()
+    try:
+        logger.info("Índice de nomes: gerando documentos...")
+        con.execute(
+            f"CREATE TEMP TABLE _docs AS SELECT row_number() OVER () AS doc_id, d.*, "
+            f"len(list_filter({_tokens_sql('d.nome')}, x -> length(x) >= {TAMANHO_MINIMO_TOKEN})) AS n_tokens "
+            f"FROM ({_consulta_documentos()}) d"
+        )
+        con.execute(f"COPY (SELECT * FROM _docs ORDER BY doc_id) TO '{destino('documentos')}' "
+                    f"(FORMAT PARQUET, ROW_GROUP_SIZE {row_group})")
+
+        logger.info("Índice de nomes: gerando postings...")
+        con.execute(
+            f"CREATE TEMP TABLE _postings AS SELECT DISTINCT token, doc_id FROM ("
+            f"SELECT unnest({_tokens_sql('nome')}) AS token, doc_id FROM _docs"
+            f") WHERE length(token) >= {TAMANHO_MINIMO_TOKEN}"
+        )
+        con.execute(f"COPY (SELECT * FROM _postings ORDER BY token, doc_id) TO '{destino('postings')}' "
+                    f"(FORMAT PARQUET, ROW_GROUP_SIZE {row_group})")
+        con.execute(f"COPY (SELECT token, count(*) AS df FROM _postings GROUP BY token ORDER BY token) "
+                    f"TO '{destino('vocabulario')}' (FORMAT PARQUET, ROW_GROUP_SIZE {row_group})")
+
+        logger.info("Índice de nomes: gerando trigramas do vocabulário...")
+        # Mesmo recorte de _trigramas: token com 2 espaços à esquerda e 1 à direita
+        con.execute(
+            f"COPY (SELECT DISTINCT trigrama, token FROM ("
+            f"SELECT token, unnest(list_transform(range(1, length(t) - 1), i -> substr(t, i, 3))) AS trigrama "
+            f"FROM (SELECT token, '  ' || token || ' ' AS t FROM read_parquet('{destino('vocabulario')}'))"
+            f") ORDER BY trigrama, token) TO '{destino('trigramas')}' (FORMAT PARQUET, ROW_GROUP_SIZE {row_group})"
+        )
+
+        total_docs = con.execute("SELECT count(*) FROM _docs").fetchone()[0]
+        total_postings = con.execute("SELECT count(*) FROM _postings").fetchone()[0]
+        total_tokens = con.execute(f"SELECT count(*) FROM read_parquet('{destino('vocabulario')}')").fetchone()[0]
+        con.execute("DROP TABLE _docs")
+        con.execute("DROP TABLE _postings")
+    finally:
+        con.close()
+
+    manifesto = {
+        'documentos': int(total_docs),
+        'postings': int(total_postings),
+        'tokens': int(total_tokens),
+        'construido_em': time.time(),
+        'segundos': round(time.time() - inicio, 1),
+    }
+    with open(novo / ARQUIVO_MANIFESTO, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(base, ignore_errors=True)
+    novo.rename(base)
+    recarregar_indice_nomes()
+    logger.info(f"✓ Índice de nomes construído em {manifesto['segundos']}s ({total_docs} documentos)")
+    return manifesto
+
+
+# ==========================================
+# CONSULTA
+# ==========================================
+
+@lru_cache(maxsize=None)
+def _manifesto() -> Optional[Dict]:
+    try:
+        caminho = Path(Config.BUSCA_INDEX_DIR) / ARQUIVO_MANIFESTO
+        if not caminho.exists():
+            return None
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Erro ao ler manifesto do índice de nomes: {e}")
+        return None
+
+
+def indice_nomes_disponivel() -> bool:
+    """Indica se o índice de nomes foi construído"""
+    return _manifesto() is not None
+
+
+def recarregar_indice_nomes():
+    """Descarta o manifesto em memória (após reconstrução)"""
+    _manifesto.cache_clear()
+
+
+def _expandir_termo(cur, termo: str, prefixo: bool) -> List[Tuple[str, int, float]]:
+    """
+    Tokens do vocabulário que atendem ao termo: (token, df, peso do casamento).
+    Exato tem peso 1; prefixo 0,8; parecido por trigramas até 0,6.
+    """
+    vocab = _sql_arquivo('vocabulario')
+    linhas = cur.execute(f"SELECT token, df FROM {vocab} WHERE token = ?", [termo]).fetchall()
+    achados = [(t, int(df), 1.0) for t, df in linhas]
+    if prefixo:
+        # Faixa [termo, termo + '{') cobre todos os tokens com o prefixo ('{' > 'z' e dígitos)
+        linhas = cur.execute(
+            f"SELECT token, df FROM {vocab} WHERE token > ? AND token < ? ORDER BY df DESC LIMIT ?",
+            [termo, termo + '{', MAX_EXPANSOES_PREFIXO]
+        ).fetchall()
+        achados += [(t, int(df), 0.8) for t, df in linhas]
+    if achados or len(termo) < 3:
+        return achados
+
+    grams = _trigramas(termo)
+    linhas = cur.execute(
+        f"SELECT t.token, v.df, count(*) AS comuns FROM {_sql_arquivo('trigramas')} t "
+        f"JOIN {vocab} v ON v.token = t.token "
+        f"WHERE t.trigrama IN ({', '.join('?' * len(grams))}) "
+        f"GROUP BY t.token, v.df ORDER BY comuns DESC, v.df DESC LIMIT ?",
+        grams + [MAX_EXPANSOES_TRIGRAMA]
+    ).fetchall()
+    for token, df, comuns in linhas:
+        similaridade = comuns / (len(grams) + len(_trigramas(token)) - comuns)
+        if similaridade >= 0.4:
+            achados.append((token, int(df), 0.6 * similaridade))
+    return achados
+
+
+_RE_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def _sql_documentos(cur, texto: str, campos: List[str]) -> Optional[str]:
+    """
+    SELECT dos documentos que casam com todos os termos do texto, com o
+    score por documento (d.*, score).
+
+    Tokens e pesos entram como literais (tokens só têm [a-z0-9]), para que
+    o SQL possa ser embutido em outras consultas.
+
+    Returns:
+        SQL, ou None se algum termo não casar ou não houver campo válido
+    """
+    termos = list(dict.fromkeys(tokenizar(texto)))
+    codigos = [CAMPOS[c] for c in campos if c in CAMPOS]
+    if not termos or not codigos:
+        return None
+
+    total_docs = max(1, int((_manifesto() or {}).get('documentos', 1)))
+    linhas_termos = []
+    for i, termo in enumerate(termos):
+        expansoes = [e for e in _expandir_termo(cur, termo, prefixo=(i == len(termos) - 1))
+                     if _RE_TOKEN.fullmatch(e[0])]
+        if not expansoes:
+            return None
+        for token, df, peso in expansoes:
+            linhas_termos.append((i, token, peso * math.log(1 + total_docs / max(df, 1))))
+
+    valores = ', '.join(f"({i}, '{token}', {peso!r})" for i, token, peso in linhas_termos)
+    tokens = ', '.join(f"'{t}'" for t in sorted({t for _, t, _ in linhas_termos}))
+    return f"""
+        WITH termos(termo_idx, token, peso) AS (VALUES {valores}),
+        casamentos AS (
+            SELECT p.doc_id, t.termo_idx, max(t.peso) AS peso
+            FROM {_sql_arquivo('postings')} p JOIN termos t ON t.token = p.token
+            WHERE p.token IN ({tokens})
+            GROUP BY p.doc_id, t.termo_idx
+        ),
+        docs AS (
+            SELECT doc_id, sum(peso) AS score FROM casamentos
+            GROUP BY doc_id HAVING count(*) = {len(termos)}
+        )
+        SELECT d.*, s.score / sqrt(greatest(d.n_tokens, 1)) AS score
+        FROM docs s JOIN {_sql_arquivo('documentos')} d ON d.doc_id = s.doc_id
+        WHERE d.campo IN ({', '.join(str(c) for c in codigos)})
+    """
+
+
+def buscar_nomes(texto: str, campos: List[str], uf: Optional[str] = None, municipio: Optional[str] = None,
+                 page: int = 1, page_size: int = 50) -> Optional[Tuple[pd.DataFrame, int]]:
+    """
+    Busca ranqueada no índice de nomes, agrupada por CNPJ básico.
+
+    Args:
+        texto: Texto livre (o último termo casa também como prefixo)
+        campos: Chaves de CAMPOS a considerar
+        uf, municipio: Filtros geográficos opcionais
+        page, page_size: Paginação
+
+    Returns:
+        (DataFrame da página, total de CNPJs encontrados) ou None sem índice
+    """
+    if _manifesto() is None:
+        return None
+    cur = obter_cursor()
+    documentos = _sql_documentos(cur, texto, campos)
+    if documentos is None:
+        return pd.DataFrame(), 0
+
+    filtros_doc = ['TRUE']
+    params: List = []
+    if uf:
+        filtros_doc.append("uf = ?")
+        params.append(str(uf).upper())
+    if municipio:
+        filtros_doc.append("(municipio = ? OR municipio ILIKE ?)")
+        params += [str(municipio), f"%{municipio}%"]
+
+    where_doc = ' AND '.join(filtros_doc)
+    # Total à parte: a contagem sobre a página (janela após LIMIT/OFFSET)
+    # seria 0 para páginas além do fim
+    total = cur.execute(
+        f"SELECT count(DISTINCT cnpj_basico) FROM ({documentos}) WHERE {where_doc}", params
+    ).fetchone()[0]
+    sql = f"""
+        SELECT cnpj_basico,
+               arg_max(cnpj, score) AS cnpj, arg_max(nome, score) AS nome,
+               arg_max(campo, score) AS campo, arg_max(uf, score) AS uf,
+               arg_max(municipio, score) AS municipio, max(score) AS score
+        FROM ({documentos}) WHERE {where_doc}
+        GROUP BY cnpj_basico
+        ORDER BY score DESC, cnpj_basico
+        LIMIT ? OFFSET ?
+    """
+    df = cur.execute(sql, params + [int(page_size), max(page - 1, 0) * int(page_size)]).df()
+    if df.empty:
+        return df, int(total)
+    nomes_campos = {v: k for k, v in CAMPOS.items()}
+    df['campo'] = df['campo'].map(nomes_campos)
+    df['score'] = df['score'].round(4)
+    return df, int(total)
+
+
+def sql_cnpjs_basicos(texto: str, campos: List[str]) -> Optional[str]:
+    """
+    Subconsulta com todos os CNPJs básicos que casam com o texto, para usar
+    em `cnpj_basico IN (...)` (None sem índice; '' se nada casar)
+    """
+    if _manifesto() is None:
+        return None
+    documentos = _sql_documentos(obter_cursor(), texto, campos)
+    if documentos is None:
+        return ''
+    return f"SELECT DISTINCT cnpj_basico FROM ({documentos})"
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    resultado = construir_indice_nomes()
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
@@ -1,184 +1,553 @@
 """
 Serviço de Cache e Performance B2G (Sprint 6)
 Otimizações de cache e performance
+
+Uma instância por processo (obter_cache_b2g), compartilhada entre threads:
+
+  - memória: LRU limitado por número de entradas e por bytes (tamanho do
+    JSON), protegido por lock;
+  - persistência write-behind: gravações vão para uma fila (a última
+    gravação de cada chave prevalece) descarregada em lote, em uma única
+    transação, por uma thread própria; scores de match vão para
+    match_cache (cnpj, licitacao_id) e os demais valores para cache_b2g;
+  - invalidação por prefixo e por tag via índice: cada chave é registrada
+    sob suas tags e sob os prefixos de seus segmentos ('match:', 'match:123:'),
+    e no banco as buscas usam intervalo na chave primária ou a tabela de
+    tags, sem LIKE '%x%'.
 """
 
-import logging
-from typing import Dict, List, Optional, Any
-import time
+import atexit
+import functools
 import hashlib
 import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.config import Config
 
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+PREFIXO_MATCH = 'match:'
+
+
+def _prefixos(chave: str) -> List[str]:
+    """'match:123:abc' → ['match:', 'match:123:']"""
+    partes = chave.split(':')[:-1]
+    return [':'.join(partes[:i]) + ':' for i in range(1, len(partes) + 1)]
+
+
+def _limite_superior(prefixo: str) -> str:
+    """Menor string maior que todas as iniciadas por `prefixo` (intervalo na PK)"""
+    return prefixo[:-1] + chr(ord(prefixo[-1]) + 1)
+
+
+def chave_match(cnpj: str, licitacao_id: str) -> str:
+    return f"{PREFIXO_MATCH}{cnpj}:{licitacao_id}"
+
+
+class _MemoriaLRU:
+    """LRU limitado por entradas e bytes, com índice de tags/prefixos (chamador segura o lock)"""
+
+    def __init__(self, max_entradas: int, max_bytes: int):
+        self.max_entradas = max(int(max_entradas), 1)
+        self.max_bytes = int(max_bytes)
+        self.entradas: 'OrderedDict[str, Tuple[Any, float, int, Tuple[str, ...]]]' = OrderedDict()
+        self.indice: Dict[str, Set[str]] = {}
+        self.bytes = 0
+        self.evictions = 0
+
+    def obter(self, chave: str, agora: float):
+        entrada = self.entradas.get(chave)
+        if entrada is None:
+            return None
+        if entrada[1] <= agora:
+            self.remover(chave)
+            return None
+        self.entradas.move_to_end(chave)
+        return entrada
+
+    def guardar(self, chave: str, valor: Any, expira_em: float, tamanho: int, tags: Iterable[str]):
+        self.remover(chave)
+        if tamanho > self.max_bytes:
+            return
+        marcadores = tuple(dict.fromkeys([*_prefixos(chave), *(f'#{t}' for t in tags)]))
+        self.entradas[chave] = (valor, expira_em, tamanho, marcadores)
+        self.bytes += tamanho
+        for m in marcadores:
+            self.indice.setdefault(m, set()).add(chave)
+        while len(self.entradas) > self.max_entradas or self.bytes > self.max_bytes:
+            self.remover(next(iter(self.entradas)))
+            self.evictions += 1
+
+    def remover(self, chave: str) -> bool:
+        entrada = self.entradas.pop(chave, None)
+        if entrada is None:
+            return False
+        self.bytes -= entrada[2]
+        for m in entrada[3]:
+            chaves = self.indice.get(m)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self.indice[m]
+        return True
+
+    def chaves_marcadas(self, marcador: str) -> List[str]:
+        return list(self.indice.get(marcador, ()))
+
+    def limpar(self) -> int:
+        total = len(self.entradas)
+        self.entradas.clear()
+        self.indice.clear()
+        self.bytes = 0
+        return total
+
 
 class CacheB2GService:
     """Serviço de cache para otimização"""
-    
-    def __init__(self, db_connection=None):
-        self.db = db_connection
-        self.cache_memoria = {}  # Cache em memória (simplificado)
-    
+
+    def __init__(
+        self,
+        db_path=None,
+        max_entradas: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        lote: Optional[int] = None,
+        intervalo_escrita: Optional[float] = None
+    ):
+        self.db_path = str(db_path or Config.B2G_DB_PATH)
+        self.memoria = _MemoriaLRU(
+            max_entradas or Config.CACHE_B2G_MAX_ENTRADAS,
+            max_bytes or Config.CACHE_B2G_MAX_MB * MB,
+        )
+        self.lote = max(int(lote or Config.CACHE_B2G_LOTE), 1)
+        self.intervalo_escrita = float(intervalo_escrita or Config.CACHE_B2G_INTERVALO_ESCRITA)
+        self._lock = threading.Lock()
+        # Serializa descarga e invalidação no banco: uma invalidação nunca
+        # é sobrescrita por um lote que já havia saído da fila
+        self._lock_escrita = threading.Lock()
+        self._pendentes: 'OrderedDict[str, Optional[Tuple]]' = OrderedDict()
+        self._acordar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._tabelas_ok = False
+        self.stats = {'hits_memoria': 0, 'hits_bd': 0, 'misses': 0, 'sets': 0, 'gravadas_bd': 0, 'lotes': 0}
+
+    # ---------- banco ----------
+
+    def _conexao(self) -> Optional[sqlite3.Connection]:
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao abrir banco do cache B2G: {e}")
+            return None
+        if not self._tabelas_ok:
+            self._preparar_tabelas(conn)
+        return conn
+
+    def _preparar_tabelas(self, conn: sqlite3.Connection):
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_b2g (
+                    chave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL,
+                    expira_em INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_b2g_expira ON cache_b2g(expira_em)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_b2g_tags (
+                    tag TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    PRIMARY KEY (tag, chave)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_b2g_tags_chave ON cache_b2g_tags(chave)")
+            # match_cache vem da migration 001; criada aqui se o banco ainda não a tiver
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS match_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cnpj TEXT NOT NULL,
+                    licitacao_id TEXT NOT NULL,
+                    score INTEGER NOT NULL,
+                    classificacao TEXT,
+                    explicacao TEXT,
+                    componentes TEXT,
+                    calculado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expira_em TIMESTAMP,
+                    UNIQUE(cnpj, licitacao_id)
+                )
+            """)
+        self._tabelas_ok = True
+
+    def _ler_bd(self, chave: str) -> Optional[Tuple[Any, int]]:
+        conn = self._conexao()
+        if conn is None:
+            return None
+        try:
+            agora = int(time.time())
+            if chave.startswith(PREFIXO_MATCH):
+                cnpj, licitacao_id = chave[len(PREFIXO_MATCH):].split(':', 1)
+                row = conn.execute("""
+                    SELECT score, classificacao, explicacao, componentes, expira_em FROM match_cache
+                    WHERE cnpj = ? AND licitacao_id = ? AND expira_em > ?
+                """, (cnpj, licitacao_id, agora)).fetchone()
+                if not row:
+                    return None
+                # Coluna componentes: demais campos do resultado (componentes, chance_sucesso)
+                extras = json.loads(row[3]) if row[3] else {}
+                valor = {'score': row[0], 'classificacao': row[1], 'explicacao': row[2], **extras}
+                return valor, int(row[4])
+            row = conn.execute(
+                "SELECT valor, expira_em FROM cache_b2g WHERE chave = ? AND expira_em > ?", (chave, agora)
+            ).fetchone()
+            return (json.loads(row[0]), int(row[1])) if row else None
+        finally:
+            conn.close()
+
+    def _gravar_lote(self, lote: List[Tuple[str, Optional[Tuple]]]):
+        genericos, tags, matches = [], [], []
+        for chave, registro in lote:
+            if registro is None:
+                continue
+            valor_json, expira_em, tags_chave, valor = registro
+            if chave.startswith(PREFIXO_MATCH):
+                cnpj, licitacao_id = chave[len(PREFIXO_MATCH):].split(':', 1)
+                extras = {k: v for k, v in valor.items() if k not in ('score', 'classificacao', 'explicacao')}
+                matches.append((
+                    cnpj, licitacao_id, int(valor.get('score') or 0), valor.get('classificacao'),
+                    valor.get('explicacao'), json.dumps(extras, default=str), expira_em,
+                ))
+            else:
+                genericos.append((chave, valor_json, expira_em))
+                tags.extend((t, chave) for t in tags_chave)
+        conn = self._conexao()
+        if conn is None:
+            return
+        try:
+            with conn:
+                if genericos:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO cache_b2g (chave, valor, expira_em) VALUES (?, ?, ?)", genericos
+                    )
+                    conn.executemany("DELETE FROM cache_b2g_tags WHERE chave = ?", [(g[0],) for g in genericos])
+                    conn.executemany("INSERT OR IGNORE INTO cache_b2g_tags (tag, chave) VALUES (?, ?)", tags)
+                if matches:
+                    conn.executemany("""
+                        INSERT INTO match_cache (
+                            cnpj, licitacao_id, score, classificacao, explicacao, componentes, expira_em
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(cnpj, licitacao_id) DO UPDATE SET
+                            score = excluded.score,
+                            classificacao = excluded.classificacao,
+                            explicacao = excluded.explicacao,
+                            componentes = excluded.componentes,
+                            calculado_em = CURRENT_TIMESTAMP,
+                            expira_em = excluded.expira_em
+                    """, matches)
+            self.stats['gravadas_bd'] += len(genericos) + len(matches)
+            self.stats['lotes'] += 1
+        finally:
+            conn.close()
+
+    # ---------- write-behind ----------
+
+    def _iniciar_escritor(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop_escrita, name='cache-b2g-escrita', daemon=True)
+        self._thread.start()
+
+    def _loop_escrita(self):
+        while True:
+            self._acordar.wait(self.intervalo_escrita)
+            self._acordar.clear()
+            try:
+                self.descarregar()
+            except Exception as e:
+                logger.error(f"Erro ao gravar lote do cache B2G: {e}")
+
+    def descarregar(self) -> int:
+        """Grava no banco todas as entradas pendentes, em lotes de `self.lote`"""
+        total = 0
+        with self._lock_escrita:
+            while True:
+                with self._lock:
+                    if not self._pendentes:
+                        break
+                    lote = []
+                    while self._pendentes and len(lote) < self.lote:
+                        lote.append(self._pendentes.popitem(last=False))
+                self._gravar_lote(lote)
+                total += len(lote)
+        return total
+
+    # ---------- interface ----------
+
     def get_cache(self, chave: str) -> Optional[Any]:
         """Obtém valor do cache"""
         try:
-            # Verificar cache em memória primeiro
-            if chave in self.cache_memoria:
-                entrada = self.cache_memoria[chave]
-                if entrada['expira_em'] > time.time():
-                    logger.debug(f"Cache hit (memória): {chave}")
-                    return entrada['valor']
-                else:
-                    del self.cache_memoria[chave]
-            
-            # Verificar cache no banco
-            if self.db:
-                cursor = self.db.cursor()
-                cursor.execute("""
-                    SELECT valor, expira_em FROM match_cache
-                    WHERE chave = ? AND expira_em > ?
-                """, (chave, int(time.time())))
-                
-                row = cursor.fetchone()
-                if row:
-                    logger.debug(f"Cache hit (BD): {chave}")
-                    valor = json.loads(row[0])
-                    # Copiar para memória
-                    self.cache_memoria[chave] = {
-                        'valor': valor,
-                        'expira_em': row[1]
-                    }
-                    return valor
-            
-            logger.debug(f"Cache miss: {chave}")
-            return None
-            
+            agora = time.time()
+            with self._lock:
+                entrada = self.memoria.obter(chave, agora)
+                if entrada is not None:
+                    self.stats['hits_memoria'] += 1
+                    return entrada[0]
+                pendente = self._pendentes.get(chave)
+                if pendente is not None and pendente[1] > agora:
+                    self.stats['hits_memoria'] += 1
+                    return pendente[3]
+
+            lido = self._ler_bd(chave)
+            if lido is None:
+                with self._lock:
+                    self.stats['misses'] += 1
+                logger.debug(f"Cache miss: {chave}")
+                return None
+            valor, expira_em = lido
+            with self._lock:
+                self.stats['hits_bd'] += 1
+                self.memoria.guardar(chave, valor, expira_em, len(json.dumps(valor, default=str)), ())
+            logger.debug(f"Cache hit (BD): {chave}")
+            return valor
+
         except Exception as e:
             logger.error(f"Erro ao obter cache: {e}")
             return None
-    
+
     def set_cache(
         self,
         chave: str,
         valor: Any,
-        ttl_segundos: int = 3600
+        ttl_segundos: int = 3600,
+        tags: Optional[Iterable[str]] = None,
+        persistir: bool = True
     ) -> bool:
-        """Define valor no cache"""
+        """
+        Define valor no cache
+
+        Args:
+            tags: Tags para invalidação em grupo (invalidar_cache(tag=...))
+            persistir: Se False, mantém só em memória (valores não serializáveis em JSON)
+        """
         try:
-            expira_em = int(time.time()) + ttl_segundos
-            
-            # Cache em memória
-            self.cache_memoria[chave] = {
-                'valor': valor,
-                'expira_em': expira_em
-            }
-            
-            # Cache no banco
-            if self.db:
-                cursor = self.db.cursor()
-                cursor.execute("""
-                    INSERT OR REPLACE INTO match_cache (chave, valor, expira_em)
-                    VALUES (?, ?, ?)
-                """, (chave, json.dumps(valor), expira_em))
-                
-                self.db.commit()
-            
+            expira_em = int(time.time()) + int(ttl_segundos)
+            tags = tuple(tags or ())
+            try:
+                valor_json = json.dumps(valor)
+            except (TypeError, ValueError):
+                valor_json, persistir = None, False
+            tamanho = len(valor_json) if valor_json is not None else len(repr(valor))
+
+            with self._lock:
+                self.memoria.guardar(chave, valor, expira_em, tamanho, tags)
+                self.stats['sets'] += 1
+                if persistir:
+                    self._pendentes.pop(chave, None)
+                    self._pendentes[chave] = (valor_json, expira_em, tags, valor)
+                    cheio = len(self._pendentes) >= self.lote
+            if persistir:
+                self._iniciar_escritor()
+                if cheio:
+                    self._acordar.set()
+
             logger.debug(f"Cache set: {chave} (TTL: {ttl_segundos}s)")
             return True
-            
+
         except Exception as e:
             logger.error(f"Erro ao definir cache: {e}")
             return False
-    
-    def invalidar_cache(self, padrao: str = None) -> int:
-        """Invalida cache por padrão"""
+
+    def get_match(self, cnpj: str, licitacao_id: str) -> Optional[Dict]:
+        """Score de match em cache (memória ou match_cache)"""
+        return self.get_cache(chave_match(cnpj, licitacao_id))
+
+    def set_match(self, cnpj: str, licitacao_id: str, resultado: Dict, ttl_segundos: int = 86400) -> bool:
+        """Guarda o score de match; persiste em match_cache em lote"""
+        return self.set_cache(chave_match(cnpj, licitacao_id), resultado, ttl_segundos)
+
+    def invalidar_cache(self, padrao: str = None, tag: str = None) -> int:
+        """
+        Invalida cache por prefixo de chave e/ou tag
+
+        Args:
+            padrao: Prefixo da chave ('match:12345678000190:', 'setorial:')
+            tag: Tag informada em set_cache
+
+        Sem padrão nem tag, limpa tudo.
+        """
         try:
             total = 0
-            
-            # Limpar memória
-            if padrao:
-                chaves_remover = [k for k in self.cache_memoria.keys() if padrao in k]
-                for chave in chaves_remover:
-                    del self.cache_memoria[chave]
-                    total += 1
-            else:
-                total = len(self.cache_memoria)
-                self.cache_memoria.clear()
-            
-            # Limpar banco
-            if self.db:
-                if padrao:
-                    cursor = self.db.cursor()
-                    cursor.execute("DELETE FROM match_cache WHERE chave LIKE ?", (f'%{padrao}%',))
-                else:
-                    cursor = self.db.cursor()
-                    cursor.execute("DELETE FROM match_cache")
-                
-                self.db.commit()
-                total += cursor.rowcount
-            
+            with self._lock_escrita:
+                with self._lock:
+                    if not padrao and not tag:
+                        total += self.memoria.limpar()
+                        self._pendentes.clear()
+                    else:
+                        chaves = set()
+                        if tag:
+                            chaves.update(self.memoria.chaves_marcadas(f'#{tag}'))
+                            chaves.update(k for k, r in self._pendentes.items() if r and tag in r[2])
+                        if padrao:
+                            if padrao.endswith(':'):
+                                chaves.update(self.memoria.chaves_marcadas(padrao))
+                            else:
+                                chaves.update(k for k in self.memoria.entradas if k.startswith(padrao))
+                            chaves.update(k for k in self._pendentes if k.startswith(padrao))
+                        for chave in chaves:
+                            total += int(self.memoria.remover(chave))
+                            self._pendentes.pop(chave, None)
+                total += self._invalidar_bd(padrao, tag)
+
             logger.info(f"Cache invalidado: {total} entradas")
             return total
-            
+
         except Exception as e:
             logger.error(f"Erro ao invalidar cache: {e}")
             return 0
-    
+
+    def _invalidar_bd(self, padrao: Optional[str], tag: Optional[str]) -> int:
+        conn = self._conexao()
+        if conn is None:
+            return 0
+        total = 0
+        try:
+            with conn:
+                if not padrao and not tag:
+                    total += conn.execute("DELETE FROM cache_b2g").rowcount
+                    conn.execute("DELETE FROM cache_b2g_tags")
+                    total += conn.execute("DELETE FROM match_cache").rowcount
+                    return total
+                if tag:
+                    total += conn.execute(
+                        "DELETE FROM cache_b2g WHERE chave IN (SELECT chave FROM cache_b2g_tags WHERE tag = ?)", (tag,)
+                    ).rowcount
+                    conn.execute("DELETE FROM cache_b2g_tags WHERE tag = ?", (tag,))
+                if padrao:
+                    fim = _limite_superior(padrao)
+                    total += conn.execute(
+                        "DELETE FROM cache_b2g WHERE chave >= ? AND chave < ?", (padrao, fim)
+                    ).rowcount
+                    conn.execute("DELETE FROM cache_b2g_tags WHERE chave >= ? AND chave < ?", (padrao, fim))
+                    total += self._invalidar_matches(conn, padrao)
+            return total
+        finally:
+            conn.close()
+
+    def _invalidar_matches(self, conn: sqlite3.Connection, padrao: str) -> int:
+        """Prefixo 'match:' / 'match:<cnpj>:' / 'match:<cnpj>:<licitação>' → match_cache"""
+        if PREFIXO_MATCH.startswith(padrao):
+            return conn.execute("DELETE FROM match_cache").rowcount
+        if not padrao.startswith(PREFIXO_MATCH):
+            return 0
+        resto = padrao[len(PREFIXO_MATCH):]
+        if ':' not in resto:
+            return conn.execute(
+                "DELETE FROM match_cache WHERE cnpj >= ? AND cnpj < ?", (resto, _limite_superior(resto))
+            ).rowcount if resto else 0
+        cnpj, licitacao = resto.split(':', 1)
+        if not licitacao:
+            return conn.execute("DELETE FROM match_cache WHERE cnpj = ?", (cnpj,)).rowcount
+        return conn.execute(
+            "DELETE FROM match_cache WHERE cnpj = ? AND licitacao_id >= ? AND licitacao_id < ?",
+            (cnpj, licitacao, _limite_superior(licitacao))
+        ).rowcount
+
     def gerar_chave_cache(self, *args, **kwargs) -> str:
         """Gera chave de cache baseada em argumentos"""
-        conteudo = json.dumps({'args': args, 'kwargs': kwargs}, sort_keys=True)
+        conteudo = json.dumps({'args': args, 'kwargs': kwargs}, sort_keys=True, default=str)
         return hashlib.md5(conteudo.encode()).hexdigest()
-    
+
     def limpar_cache_expirado(self) -> int:
         """Remove entradas expiradas do cache"""
         try:
             agora = int(time.time())
             total = 0
-            
+
             # Limpar memória
-            chaves_expiradas = [
-                k for k, v in self.cache_memoria.items()
-                if v['expira_em'] <= agora
-            ]
-            for chave in chaves_expiradas:
-                del self.cache_memoria[chave]
-                total += 1
-            
+            with self._lock:
+                chaves_expiradas = [k for k, e in self.memoria.entradas.items() if e[1] <= agora]
+                for chave in chaves_expiradas:
+                    total += int(self.memoria.remover(chave))
+
             # Limpar banco
-            if self.db:
-                cursor = self.db.cursor()
-                cursor.execute("DELETE FROM match_cache WHERE expira_em <= ?", (agora,))
-                self.db.commit()
-                total += cursor.rowcount
-            
+            conn = self._conexao()
+            if conn is not None:
+                try:
+                    with conn:
+                        total += conn.execute("DELETE FROM cache_b2g WHERE expira_em <= ?", (agora,)).rowcount
+                        conn.execute("DELETE FROM cache_b2g_tags WHERE chave NOT IN (SELECT chave FROM cache_b2g)")
+                        total += conn.execute("DELETE FROM match_cache WHERE expira_em <= ?", (agora,)).rowcount
+                finally:
+                    conn.close()
+
             if total > 0:
                 logger.info(f"Cache expirado limpo: {total} entradas")
-            
+
             return total
-            
+
         except Exception as e:
             logger.error(f"Erro ao limpar cache expirado: {e}")
             return 0
 
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            consultas = self.stats['hits_memoria'] + self.stats['hits_bd'] + self.stats['misses']
+            return {
+                **self.stats,
+                'evictions': self.memoria.evictions,
+                'entradas_memoria': len(self.memoria.entradas),
+                'memoria_mb': round(self.memoria.bytes / MB, 2),
+                'pendentes_bd': len(self._pendentes),
+                'taxa_acerto': round((consultas - self.stats['misses']) / consultas, 4) if consultas else 0.0,
+            }
+
+
+_instancia: Optional[CacheB2GService] = None
+_lock_instancia = threading.Lock()
+
+
+def obter_cache_b2g() -> CacheB2GService:
+    """Instância única do processo (memória e fila de gravação compartilhadas)"""
+    global _instancia
+    if _instancia is None:
+        with _lock_instancia:
+            if _instancia is None:
+                _instancia = CacheB2GService()
+                atexit.register(_instancia.descarregar)
+    return _instancia
+
 
 # Decorator para cache automático
-def cached(ttl_segundos=3600):
-    """Decorator para cachear resultados de função"""
+def cached(ttl_segundos=3600, tags: Optional[Iterable[str]] = None) -> Callable:
+    """
+    Decorator para cachear resultados de função na instância do processo.
+
+    A chave é '<módulo>.<função>:<hash dos argumentos>'; wrapper.invalidar()
+    remove todos os resultados da função.
+    """
     def decorator(func):
+        prefixo = f"{func.__module__}.{func.__qualname__}:"
+
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            cache_service = CacheB2GService()
-            chave = cache_service.gerar_chave_cache(func.__name__, *args, **kwargs)
-            
+            cache_service = obter_cache_b2g()
+            chave = prefixo + cache_service.gerar_chave_cache(*args, **kwargs)
+
             # Tentar obter do cache
             resultado = cache_service.get_cache(chave)
             if resultado is not None:
                 return resultado
-            
+
             # Executar função e cachear
             resultado = func(*args, **kwargs)
-            cache_service.set_cache(chave, resultado, ttl_segundos)
-            
+            cache_service.set_cache(chave, resultado, ttl_segundos, tags=tags)
+
             return resultado
-        
+
+        wrapper.invalidar = lambda: obter_cache_b2g().invalidar_cache(prefixo)
         return wrapper
     return decorator
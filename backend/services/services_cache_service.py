@@ -1,18 +1,464 @@
 """
 Serviço de gerenciamento de cache
+
+Cache em duas camadas:
+  - memória: LRU limitado por bytes (total e por namespace), com os objetos
+    já desserializados, para chaves quentes (tabelas de CNAE/município,
+    cartões de CNPJ, resultados setoriais);
+  - disco: diskcache, com DataFrames serializados em Arrow IPC (em vez de
+    pickle) e os demais valores em pickle.
+
+O namespace de uma chave é o prefixo antes de ':' (ou a chave inteira).
+Config.CACHE_NAMESPACES define, por namespace, TTL (que prevalece sobre o
+informado pelo chamador) e orçamento de memória. Acertos, falhas, remoções
+e latência são contados por namespace (obter_estatisticas_cache).
+
+em_voo() evita que falhas simultâneas na mesma chave repitam o cálculo.
+
+Stale-while-revalidate: namespaces com 'obsoleto' (segundos) mantêm a
+entrada por esse tempo além do TTL. Nesse intervalo get() devolve o valor
+obsoleto na hora e agenda o recálculo em segundo plano, com a mesma função
+registrada pela última chamada a em_voo() da chave. As chaves mais
+acessadas desses namespaces são recalculadas antes de vencer
+(atualizar_populares, executada pelo agendador).
 """
 
 import logging
-from pathlib import Path
-from core.config import Config
-import pandas as pd
-import diskcache as dc
+import pickle
+import threading
 import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import diskcache as dc
+import pandas as pd
+import pyarrow as pa
+
+from core.config import Config
 
 logger = logging.getLogger(__name__)
 
-# Cache em disco
-cache = dc.Cache(str(Config.CACHE_DIR))
+MB = 1024 * 1024
+
+# Valores gravados por esta camada: (MARCADOR, formato, bytes, fresco_ate)
+MARCADOR = '__cache_camadas__'
+_AUSENTE = object()
+
+
+def namespace(chave) -> str:
+    """'cnpj:123' → 'cnpj'; 'cnaes' → 'cnaes'"""
+    s = str(chave)
+    return s.split(':', 1)[0]
+
+
+def _serializar(valor, fresco_ate: Optional[float] = None) -> Tuple[Tuple, int]:
+    """Valor → (registro gravado no disco, tamanho em bytes)"""
+    if isinstance(valor, pd.DataFrame):
+        try:
+            tabela = pa.Table.from_pandas(valor, preserve_index=True)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+            dados = sink.getvalue().to_pybytes()
+            return (MARCADOR, 'arrow', dados, fresco_ate), len(dados)
+        except (pa.ArrowException, TypeError, ValueError):
+            # Colunas object com tipos mistos: mantém pickle
+            pass
+    dados = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+    return (MARCADOR, 'pickle', dados, fresco_ate), len(dados)
+
+
+def _desserializar(bruto) -> Tuple[Any, int, Optional[float]]:
+    """
+    Registro do disco → (valor, tamanho em bytes, fresco_ate); entradas
+    gravadas sem marcador passam direto
+    """
+    if isinstance(bruto, tuple) and len(bruto) in (3, 4) and bruto[0] == MARCADOR:
+        formato, dados = bruto[1], bruto[2]
+        fresco_ate = bruto[3] if len(bruto) == 4 else None
+        if formato == 'arrow':
+            return pa.ipc.open_stream(pa.py_buffer(dados)).read_all().to_pandas(), len(dados), fresco_ate
+        return pickle.loads(dados), len(dados), fresco_ate
+    return bruto, _serializar(bruto)[1], None
+
+
+def _copia(valor):
+    """Cópia rasa para que o chamador não altere o objeto guardado em memória"""
+    if isinstance(valor, pd.DataFrame):
+        return valor.copy(deep=False)
+    if isinstance(valor, (dict, list)):
+        return valor.copy()
+    return valor
+
+
+class CacheCamadas:
+    """
+    LRU em memória na frente do diskcache, com a mesma interface usada no
+    projeto (get/set/delete/clear/iterkeys/in/len).
+    """
+
+    def __init__(self, diretorio, memoria_max: int, item_max: int, disco_max: int, namespaces: Dict[str, Dict]):
+        self.disco = dc.Cache(str(diretorio), size_limit=int(disco_max))
+        self.memoria_max = int(memoria_max)
+        self.item_max = int(item_max)
+        self.namespaces = namespaces or {}
+        # chave → (valor, expira, tamanho, namespace, fresco_ate)
+        self._memoria: 'OrderedDict[Any, Tuple[Any, Optional[float], int, str, Optional[float]]]' = OrderedDict()
+        self._bytes = 0
+        self._bytes_ns: Dict[str, int] = defaultdict(int)
+        self._stats: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.RLock()
+        # Acessos por chave nos namespaces com janela de obsolescência
+        self.popularidade: Dict[Any, int] = defaultdict(int)
+        # Chamado com a chave antes de servir um valor obsoleto; False → tratar como falha
+        self.ao_servir_obsoleto: Optional[Callable[[Any], bool]] = None
+
+    # ---------- configuração por namespace ----------
+
+    def _ttl(self, ns: str, expire: Optional[float]) -> Optional[float]:
+        ttl = (self.namespaces.get(ns) or {}).get('ttl')
+        return ttl if ttl is not None else expire
+
+    def _obsoleto(self, ns: str) -> float:
+        return float((self.namespaces.get(ns) or {}).get('obsoleto') or 0)
+
+    def _orcamento(self, ns: str) -> int:
+        mb = (self.namespaces.get(ns) or {}).get('memoria_mb')
+        return int(mb * MB) if mb is not None else self.memoria_max
+
+    def _contar(self, ns: str, campo: str, latencia: float = 0.0):
+        with self._lock:
+            self._stats[ns][campo] += 1
+            if latencia:
+                self._stats[ns]['latencia_s'] += latencia
+
+    # ---------- camada de memória ----------
+
+    def _remover_memoria(self, chave) -> bool:
+        entrada = self._memoria.pop(chave, None)
+        if entrada is None:
+            return False
+        self._bytes -= entrada[2]
+        self._bytes_ns[entrada[3]] -= entrada[2]
+        return True
+
+    def _guardar_memoria(self, chave, valor, expira: Optional[float], tamanho: int, ns: str,
+                         fresco_ate: Optional[float] = None):
+        orcamento = self._orcamento(ns)
+        with self._lock:
+            self._remover_memoria(chave)
+            if tamanho > self.item_max or tamanho > orcamento:
+                return
+            self._memoria[chave] = (valor, expira, tamanho, ns, fresco_ate)
+            self._bytes += tamanho
+            self._bytes_ns[ns] += tamanho
+            # Orçamento do namespace: remove os menos recentes dele
+            if self._bytes_ns[ns] > orcamento:
+                for antiga in [k for k, e in self._memoria.items() if e[3] == ns]:
+                    if self._bytes_ns[ns] <= orcamento or antiga == chave:
+                        break
+                    self._remover_memoria(antiga)
+                    self._contar(ns, 'evictions')
+            # Orçamento total
+            while self._bytes > self.memoria_max and len(self._memoria) > 1:
+                antiga, entrada = next(iter(self._memoria.items()))
+                self._remover_memoria(antiga)
+                self._contar(entrada[3], 'evictions')
+
+    # ---------- interface ----------
+
+    def get(self, chave, default=None, obsoleto: bool = True, contar: bool = True, **kwargs):
+        """
+        Args:
+            obsoleto: Aceita valor vencido dentro da janela de obsolescência
+                do namespace (agendando o recálculo); False trata como falha
+            contar: False não registra a leitura nas estatísticas (conferência
+                interna, como a do líder em em_voo)
+        """
+        inicio = time.perf_counter()
+        ns = namespace(chave)
+        try:
+            agora = time.time()
+            if obsoleto and contar and self._obsoleto(ns):
+                with self._lock:
+                    if chave in self.popularidade or len(self.popularidade) < Config.CACHE_RECALCULO_MAX_CHAVES:
+                        self.popularidade[chave] += 1
+            with self._lock:
+                entrada = self._memoria.get(chave)
+                if entrada is not None:
+                    valor, expira, _, _, fresco_ate = entrada
+                    if expira is None or expira > agora:
+                        self._memoria.move_to_end(chave)
+                        return self._entregar(chave, ns, valor, fresco_ate, obsoleto, default, 'hits_memoria', contar)
+                    self._remover_memoria(chave)
+            try:
+                bruto, expira = self.disco.get(chave, default=_AUSENTE, expire_time=True)
+                if bruto is _AUSENTE:
+                    if contar:
+                        self._contar(ns, 'misses')
+                    return default
+                valor, tamanho, fresco_ate = _desserializar(bruto)
+            except Exception as e:
+                logger.warning(f"Erro ao ler cache '{chave}': {e}")
+                if contar:
+                    self._contar(ns, 'misses')
+                return default
+            self._guardar_memoria(chave, valor, expira, tamanho, ns, fresco_ate)
+            return self._entregar(chave, ns, valor, fresco_ate, obsoleto, default, 'hits_disco', contar)
+        finally:
+            if contar:
+                self._contar(ns, 'gets', latencia=time.perf_counter() - inicio)
+
+    def _entregar(self, chave, ns: str, valor, fresco_ate: Optional[float], obsoleto: bool, default, campo: str,
+                  contar: bool = True):
+        if fresco_ate is None or fresco_ate > time.time():
+            if contar:
+                self._contar(ns, campo)
+            return _copia(valor)
+        if not obsoleto:
+            if contar:
+                self._contar(ns, 'misses')
+            return default
+        # Sem recálculo possível (função não registrada neste processo), é falha
+        if self.ao_servir_obsoleto is None or not self.ao_servir_obsoleto(chave):
+            if contar:
+                self._contar(ns, 'misses')
+            return default
+        self._contar(ns, 'obsoletos')
+        return _copia(valor)
+
+    def frescor(self, chave) -> Optional[float]:
+        """Segundos até a entrada vencer (negativo se obsoleta); None se ausente ou sem janela"""
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is not None:
+                return None if entrada[4] is None else entrada[4] - time.time()
+        bruto = self.disco.get(chave, default=None)
+        if isinstance(bruto, tuple) and len(bruto) == 4 and bruto[0] == MARCADOR and bruto[3] is not None:
+            return bruto[3] - time.time()
+        return None
+
+    def set(self, chave, valor, expire: Optional[float] = None, **kwargs) -> bool:
+        ns = namespace(chave)
+        ttl = self._ttl(ns, expire)
+        janela = self._obsoleto(ns) if ttl else 0
+        agora = time.time()
+        fresco_ate = agora + ttl if janela else None
+        registro, tamanho = _serializar(valor, fresco_ate)
+        resultado = self.disco.set(chave, registro, expire=ttl + janela if ttl else None, **kwargs)
+        # Guarda uma cópia: o chamador pode continuar alterando o próprio objeto
+        self._guardar_memoria(chave, _copia(valor), agora + ttl + janela if ttl else None, tamanho, ns, fresco_ate)
+        self._contar(ns, 'sets')
+        return resultado
+
+    def delete(self, chave, **kwargs) -> bool:
+        with self._lock:
+            self._remover_memoria(chave)
+        return self.disco.delete(chave, **kwargs)
+
+    def clear(self, **kwargs) -> int:
+        self.limpar_memoria()
+        return self.disco.clear(**kwargs)
+
+    def limpar_memoria(self):
+        """Esvazia só a camada de memória (o disco continua valendo)"""
+        with self._lock:
+            self._memoria.clear()
+            self._bytes = 0
+            self._bytes_ns.clear()
+
+    def expire(self) -> int:
+        """Remove as entradas expiradas das duas camadas"""
+        agora = time.time()
+        with self._lock:
+            expiradas = [k for k, e in self._memoria.items() if e[1] is not None and e[1] <= agora]
+            for chave in expiradas:
+                self._remover_memoria(chave)
+        return self.disco.expire()
+
+    def iterkeys(self, reverse: bool = False) -> Iterator:
+        return self.disco.iterkeys(reverse=reverse)
+
+    def __contains__(self, chave) -> bool:
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is not None and (entrada[1] is None or entrada[1] > time.time()):
+                return True
+        return chave in self.disco
+
+    def __len__(self) -> int:
+        return len(self.disco)
+
+    def estatisticas(self) -> Dict:
+        """Contadores por namespace e ocupação da memória"""
+        with self._lock:
+            por_ns = {}
+            for ns in set(self._stats) | set(self._bytes_ns):
+                s = self._stats[ns]
+                gets = s['gets'] or 0
+                por_ns[ns] = {
+                    'hits_memoria': int(s['hits_memoria']),
+                    'hits_disco': int(s['hits_disco']),
+                    'misses': int(s['misses']),
+                    'sets': int(s['sets']),
+                    'evictions': int(s['evictions']),
+                    'coalescidas': int(s['coalescidas']),
+                    'obsoletos_servidos': int(s['obsoletos']),
+                    'recalculos': int(s['recalculos']),
+                    'latencia_media_ms': round(1000 * s['latencia_s'] / gets, 3) if gets else 0.0,
+                    'memoria_mb': round(self._bytes_ns.get(ns, 0) / MB, 2),
+                    'orcamento_mb': round(self._orcamento(ns) / MB, 2),
+                }
+            return {
+                'entradas_memoria': len(self._memoria),
+                'memoria_mb': round(self._bytes / MB, 2),
+                'memoria_max_mb': round(self.memoria_max / MB, 2),
+                'namespaces': por_ns,
+            }
+
+
+class _Voo:
+    """Cálculo em andamento para uma chave"""
+    __slots__ = ('evento', 'resultado', 'erro')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro: Optional[BaseException] = None
+
+
+_voos: Dict[Any, _Voo] = {}
+_lock_voos = threading.Lock()
+
+
+def em_voo(chave, calcular, timeout: Optional[float] = None):
+    """
+    Single-flight: chamadas simultâneas para a mesma chave de cache executam
+    `calcular` uma única vez e compartilham o resultado.
+
+    A primeira chamada (líder) confere o cache de novo (só valor fresco) e, se ainda faltar,
+    executa `calcular` (que grava o cache como de costume). As demais
+    aguardam até `timeout` segundos (Config.CACHE_ESPERA_TIMEOUT) e recebem
+    o mesmo resultado, ou a mesma exceção do líder.
+
+    Raises:
+        TimeoutError: O cálculo do líder não terminou dentro do prazo
+    """
+    _registrar_recalculo(chave, calcular)
+    with _lock_voos:
+        voo = _voos.get(chave)
+        lider = voo is None
+        if lider:
+            voo = _voos[chave] = _Voo()
+    if lider:
+        try:
+            # Conferência sem estatística: a leitura que trouxe ao líder já contou
+            voo.resultado = cache.get(chave, obsoleto=False, contar=False)
+            if voo.resultado is None:
+                voo.resultado = calcular()
+            return _copia(voo.resultado)
+        except BaseException as e:
+            voo.erro = e
+            raise
+        finally:
+            with _lock_voos:
+                _voos.pop(chave, None)
+            voo.evento.set()
+
+    cache._contar(namespace(chave), 'coalescidas')
+    if not voo.evento.wait(timeout if timeout is not None else Config.CACHE_ESPERA_TIMEOUT):
+        raise TimeoutError(f"Tempo esgotado aguardando o cálculo de '{chave}'")
+    if voo.erro is not None:
+        raise voo.erro
+    return _copia(voo.resultado)
+
+
+# ==========================================
+# RECÁLCULO EM SEGUNDO PLANO
+# ==========================================
+
+# chave → função de cálculo (última passada a em_voo), só para namespaces com janela
+_recalculos: 'OrderedDict[Any, Callable[[], Any]]' = OrderedDict()
+_recalculando: set = set()
+_lock_recalculo = threading.Lock()
+_executor_recalculo: Optional[ThreadPoolExecutor] = None
+
+
+def _registrar_recalculo(chave, calcular):
+    if not cache._obsoleto(namespace(chave)):
+        return
+    with _lock_recalculo:
+        _recalculos.pop(chave, None)
+        _recalculos[chave] = calcular
+        while len(_recalculos) > Config.CACHE_RECALCULO_MAX_CHAVES:
+            _recalculos.popitem(last=False)
+
+
+def _recalcular(chave):
+    with _lock_recalculo:
+        calcular = _recalculos.get(chave)
+    try:
+        if calcular is not None:
+            em_voo(chave, calcular)
+            cache._contar(namespace(chave), 'recalculos')
+    except Exception as e:
+        logger.warning(f"Erro ao recalcular cache '{chave}': {e}")
+    finally:
+        with _lock_recalculo:
+            _recalculando.discard(chave)
+
+
+def agendar_recalculo(chave) -> bool:
+    """Recalcula a chave em segundo plano; False se não há função registrada para ela"""
+    global _executor_recalculo
+    with _lock_recalculo:
+        if chave in _recalculando:
+            return True
+        if chave not in _recalculos:
+            return False
+        _recalculando.add(chave)
+        if _executor_recalculo is None:
+            _executor_recalculo = ThreadPoolExecutor(
+                max_workers=Config.CACHE_RECALCULO_TRABALHADORES, thread_name_prefix='cache-recalculo'
+            )
+    _executor_recalculo.submit(_recalcular, chave)
+    return True
+
+
+def atualizar_populares(limite: Optional[int] = None, antecedencia: Optional[float] = None) -> Dict:
+    """
+    Recalcula as chaves mais acessadas desde a última rodada que vencem em
+    menos de `antecedencia` segundos (ou já estão obsoletas).
+    As contagens são reduzidas à metade a cada rodada.
+    """
+    limite = limite or Config.CACHE_POPULARES_TOP
+    antecedencia = Config.CACHE_POPULARES_ANTECEDENCIA if antecedencia is None else antecedencia
+    with cache._lock:
+        ranking = sorted(cache.popularidade.items(), key=lambda kv: kv[1], reverse=True)
+        for chave, n in ranking:
+            if n // 2:
+                cache.popularidade[chave] = n // 2
+            else:
+                del cache.popularidade[chave]
+    agendadas: List[str] = []
+    for chave, _ in ranking[:limite]:
+        restante = cache.frescor(chave)
+        if restante is not None and restante < antecedencia and chave not in _recalculando \
+                and agendar_recalculo(chave):
+            agendadas.append(str(chave))
+    return {'avaliadas': min(len(ranking), limite), 'recalculadas': len(agendadas)}
+
+
+# Cache em disco com camada de memória
+cache = CacheCamadas(
+    Config.CACHE_DIR,
+    memoria_max=Config.CACHE_MEMORIA_MB * MB,
+    item_max=Config.CACHE_MEMORIA_ITEM_MB * MB,
+    disco_max=Config.CACHE_DISCO_MB * MB,
+    namespaces=Config.CACHE_NAMESPACES,
+)
+cache.ao_servir_obsoleto = agendar_recalculo
 
 def pre_carregar_dados_essenciais():
     """
@@ -43,17 +489,21 @@ def obter_estatisticas_cache():
     Obtém estatísticas do cache
     """
     try:
+        camadas = cache.estatisticas()
+        por_ns = camadas['namespaces'].values()
         stats = {
-            "tamanho_memoria_mb": 0,
-            "tamanho_disco_mb": 0,
-            "chaves": 0,
-            "hits": 0,
-            "misses": 0
+            "tamanho_memoria_mb": camadas['memoria_mb'],
+            "tamanho_disco_mb": round(cache.disco.volume() / MB, 2),
+            "chaves": len(cache),
+            "hits": sum(n['hits_memoria'] + n['hits_disco'] for n in por_ns),
+            "misses": sum(n['misses'] for n in por_ns),
+            "evictions": sum(n['evictions'] for n in por_ns),
+            "coalescidas": sum(n['coalescidas'] for n in por_ns),
+            "obsoletos_servidos": sum(n['obsoletos_servidos'] for n in por_ns),
+            "camadas": camadas,
         }
-
-        # Obtém estatísticas do cache
-        stats["chaves"] = len(cache)
-        stats["tamanho_disco_mb"] = round(sum(Path(f).stat().st_size for f in Config.CACHE_DIR.glob('*')) / (1024 * 1024), 2)
+        consultas = stats["hits"] + stats["misses"]
+        stats["taxa_acerto"] = round(stats["hits"] / consultas, 4) if consultas else 0.0
 
         return stats
 
@@ -76,4 +526,4 @@ def limpar_todo_cache():
         return True
     except Exception as e:
         logger.error(f"Erro ao limpar cache: {e}")
-        return False
\ No newline at end of file
+        return False
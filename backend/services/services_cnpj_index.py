@@ -0,0 +1,274 @@
+"""
+Índice de consulta pontual por CNPJ
+
+Etapa offline que reescreve estabelecimentos, empresas, sócios e simples em
+arquivos Parquet particionados pelos 2 primeiros dígitos do CNPJ básico e
+ordenados pela chave numérica do CNPJ, com row groups pequenos. Para cada
+partição é salvo também o vetor de chaves ordenado (.npy), de modo que a
+consulta resolve CNPJ → faixa de linhas com busca binária e lê apenas os
+row groups que contêm essas linhas, sem varrer a tabela.
+
+Uso:
+    python -m services.services_cnpj_index
+"""
+
+import json
+import logging
+import shutil
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from core.config import Config
+from utils.utils_validator import normalizar_cnpj
+
+logger = logging.getLogger(__name__)
+
+COLUNA_CHAVE = '_chave_cnpj'
+ARQUIVO_MANIFESTO = 'manifesto.json'
+
+# estabelecimentos é indexado pelo CNPJ completo (14 dígitos); as demais
+# tabelas pelo CNPJ básico (8 dígitos)
+TABELAS_INDEXADAS = {
+    'estabelecimentos': 14,
+    'empresas': 8,
+    'socios': 8,
+    'simples': 8,
+}
+
+_lock = threading.Lock()
+
+
+def _digitos_sql(coluna: str, tamanho: int) -> str:
+    return f"lpad(regexp_replace(cast({coluna} as VARCHAR), '[^0-9]', ''), {tamanho}, '0')"
+
+
+def _expressao_chave(tabela: str) -> str:
+    """Expressão SQL da chave numérica usada para ordenar e buscar"""
+    basico = _digitos_sql('cnpj_basico', 8)
+    if TABELAS_INDEXADAS[tabela] == 14:
+        ordem = _digitos_sql('cnpj_ordem', 4)
+        dv = _digitos_sql('cnpj_dv', 2)
+        return f"CAST({basico} || {ordem} || {dv} AS BIGINT)"
+    return f"CAST({basico} AS BIGINT)"
+
+
+def _diretorio_tabela(tabela: str) -> Path:
+    return Path(Config.CNPJ_INDEX_DIR) / tabela
+
+
+# ==========================================
+# CONSTRUÇÃO (OFFLINE)
+# ==========================================
+
+def _construir_tabela(con, tabela: str, origem: Path, destino: Path):
+    """Gera as partições ordenadas e os vetores de chaves de uma tabela"""
+    from services.services_duckdb_pool import expressao_parquet
+
+    temp = destino.parent / f"_{tabela}_tmp"
+    shutil.rmtree(temp, ignore_errors=True)
+    temp_sql = str(temp).replace('\\', '/')
+
+    # 1) Uma única varredura da origem, particionando pelo prefixo do CNPJ
+    con.execute(
+        f"COPY (SELECT *, {_expressao_chave(tabela)} AS {COLUNA_CHAVE}, "
+        f"substr({_digitos_sql('cnpj_basico', 8)}, 1, 2) AS prefixo "
+        f"FROM {expressao_parquet(origem)}) "
+        f"TO '{temp_sql}' (FORMAT PARQUET, PARTITION_BY (prefixo), OVERWRITE_OR_IGNORE)"
+    )
+
+    # 2) Ordena cada partição (pequena) e grava com row groups curtos
+    novo = destino.parent / f"_{tabela}_novo"
+    shutil.rmtree(novo, ignore_errors=True)
+    novo.mkdir(parents=True, exist_ok=True)
+    for part in sorted(temp.glob('prefixo=*')):
+        prefixo = part.name.split('=', 1)[1]
+        arquivo = novo / f"{prefixo}.parquet"
+        part_sql = str(part).replace('\\', '/')
+        arquivo_sql = str(arquivo).replace('\\', '/')
+        con.execute(
+            f"COPY (SELECT * FROM read_parquet('{part_sql}/*.parquet') ORDER BY {COLUNA_CHAVE}) "
+            f"TO '{arquivo_sql}' (FORMAT PARQUET, ROW_GROUP_SIZE {int(Config.CNPJ_INDEX_ROW_GROUP)})"
+        )
+        chaves = pq.read_table(str(arquivo), columns=[COLUNA_CHAVE]).column(0).to_numpy()
+        np.save(novo / f"{prefixo}.npy", chaves.astype(np.int64))
+
+    shutil.rmtree(temp, ignore_errors=True)
+    shutil.rmtree(destino, ignore_errors=True)
+    novo.rename(destino)
+
+
+def construir_indice_cnpj(tabelas: Optional[List[str]] = None) -> Dict:
+    """
+    Constrói (ou reconstrói) o índice de CNPJ a partir dos Parquet da Receita.
+
+    Args:
+        tabelas: Subconjunto de TABELAS_INDEXADAS (padrão: todas)
+
+    Returns:
+        Manifesto com as tabelas indexadas e o tempo de cada etapa
+    """
+    from services.services_duckdb_pool import obter_conexao
+
+    base = Path(Config.CNPJ_INDEX_DIR)
+    base.mkdir(parents=True, exist_ok=True)
+    manifesto = obter_manifesto() or {'tabelas': {}}
+    con = obter_conexao().cursor()
+    try:
+        for tabela in (tabelas or list(TABELAS_INDEXADAS)):
+            origem = Path(Config.ARQUIVOS_PARQUET.get(tabela, ''))
+            if not origem.exists():
+                logger.warning(f"Índice CNPJ: arquivo de {tabela} não encontrado ({origem})")
+                continue
+            inicio = time.time()
+            logger.info(f"Índice CNPJ: construindo {tabela}...")
+            _construir_tabela(con, tabela, origem, _diretorio_tabela(tabela))
+            manifesto['tabelas'][tabela] = {
+                'origem': str(origem),
+                'origem_mtime': origem.stat().st_mtime,
+                'construido_em': time.time(),
+                'segundos': round(time.time() - inicio, 1),
+            }
+            logger.info(f"✓ Índice CNPJ de {tabela} construído em {manifesto['tabelas'][tabela]['segundos']}s")
+    finally:
+        con.close()
+
+    with open(base / ARQUIVO_MANIFESTO, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    recarregar_indice()
+    return manifesto
+
+
+def obter_manifesto() -> Optional[Dict]:
+    """Lê o manifesto do índice, se existir"""
+    try:
+        caminho = Path(Config.CNPJ_INDEX_DIR) / ARQUIVO_MANIFESTO
+        if not caminho.exists():
+            return None
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Erro ao ler manifesto do índice CNPJ: {e}")
+        return None
+
+
+# ==========================================
+# CONSULTA
+# ==========================================
+
+@lru_cache(maxsize=None)
+def indice_disponivel(tabela: str) -> bool:
+    """Indica se o índice da tabela foi construído"""
+    return tabela in TABELAS_INDEXADAS and _diretorio_tabela(tabela).is_dir()
+
+
+@lru_cache(maxsize=512)
+def _chaves(tabela: str, prefixo: str) -> Optional[np.ndarray]:
+    caminho = _diretorio_tabela(tabela) / f"{prefixo}.npy"
+    if not caminho.exists():
+        return None
+    return np.load(caminho, mmap_mode='r')
+
+
+@lru_cache(maxsize=512)
+def _metadados(tabela: str, prefixo: str):
+    """Metadados do Parquet da partição e o início (linha) de cada row group"""
+    caminho = _diretorio_tabela(tabela) / f"{prefixo}.parquet"
+    metadata = pq.read_metadata(str(caminho))
+    tamanhos = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    inicios = np.concatenate([[0], np.cumsum(tamanhos)]).astype(np.int64)
+    return str(caminho), metadata, inicios
+
+
+def recarregar_indice():
+    """Descarta vetores de chaves e metadados em memória (após reconstrução)"""
+    with _lock:
+        indice_disponivel.cache_clear()
+        _chaves.cache_clear()
+        _metadados.cache_clear()
+
+
+def buscar_linhas(tabela: str, cnpj: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """
+    Retorna as linhas da tabela para o CNPJ informado usando o índice.
+
+    Args:
+        tabela: Uma de TABELAS_INDEXADAS
+        cnpj: CNPJ completo (14 dígitos) ou, para tabelas por CNPJ básico, 8 dígitos
+        columns: Colunas desejadas (padrão: todas)
+
+    Returns:
+        DataFrame (vazio se o CNPJ não existir) ou None se o índice não estiver disponível
+    """
+    if not indice_disponivel(tabela):
+        return None
+    tamanho = TABELAS_INDEXADAS[tabela]
+    num = ''.join(filter(str.isdigit, str(cnpj or '')))
+    if not num:
+        return None
+    num = normalizar_cnpj(num) if len(num) > 8 else num.zfill(8)
+    if len(num) < tamanho:
+        return None
+    try:
+        prefixo = num[:2]
+        chaves = _chaves(tabela, prefixo)
+        if chaves is None:
+            return pd.DataFrame(columns=columns or [])
+        chave = np.int64(int(num[:tamanho]))
+        ini = int(np.searchsorted(chaves, chave, side='left'))
+        fim = int(np.searchsorted(chaves, chave, side='right'))
+        if ini == fim:
+            return pd.DataFrame(columns=columns or [])
+
+        caminho, metadata, inicios = _metadados(tabela, prefixo)
+        rg_ini = int(np.searchsorted(inicios, ini, side='right')) - 1
+        rg_fim = int(np.searchsorted(inicios, fim - 1, side='right')) - 1
+        pf = pq.ParquetFile(caminho, metadata=metadata)
+        tbl = pf.read_row_groups(list(range(rg_ini, rg_fim + 1)), columns=columns)
+        tbl = tbl.slice(ini - int(inicios[rg_ini]), fim - ini)
+        df = tbl.to_pandas()
+        return df.drop(columns=[COLUNA_CHAVE], errors='ignore')
+    except Exception as e:
+        logger.warning(f"Erro na consulta indexada de {tabela} ({num}): {e}")
+        return None
+
+
+def consultar_cnpj_indexado(cnpj: str) -> Optional[pd.DataFrame]:
+    """
+    Linha única com estabelecimento + empresa do CNPJ, via índice.
+
+    Returns:
+        DataFrame de 1 linha, vazio se o CNPJ não existir, ou None sem índice
+    """
+    num = normalizar_cnpj(cnpj)
+    if not num or len(num) != 14:
+        return None
+    df_emp = buscar_linhas('empresas', num)
+    if df_emp is None:
+        return None
+    if df_emp.empty:
+        return df_emp
+    df_est = buscar_linhas('estabelecimentos', num)
+    if df_est is None:
+        return None
+    if df_est.empty:
+        # Empresa existe, mas não este estabelecimento (ordem/DV): CNPJ inexistente
+        return df_est
+    df = df_emp.head(1).reset_index(drop=True)
+    est = df_est.head(1).reset_index(drop=True)
+    extras = [c for c in est.columns if c not in df.columns]
+    df = pd.concat([df, est[extras]], axis=1)
+    df['cnpj'] = num
+    return df
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    resultado = construir_indice_cnpj()
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
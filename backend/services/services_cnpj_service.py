@@ -6,8 +6,11 @@ import pandas as pd
 from typing import Optional, Dict
 from pathlib import Path
 from core.config import Config
-from services.services_cache_service import cache
-import duckdb
+from services.services_cache_service import cache, em_voo
+from services.services_duckdb_pool import obter_cursor, tabela
+from services.services_cnpj_index import buscar_linhas, consultar_cnpj_indexado
+from services.services_busca_nomes import buscar_nomes
+from services.services_filtro_sql import esquema_parquet
 from pathlib import Path
 import pyarrow.parquet as pq
 from functools import lru_cache
@@ -47,6 +50,15 @@ def _get_field(df: Optional[pd.DataFrame], candidates: list):
     except Exception:
         return None
 
+def _cnae7(val) -> Optional[str]:
+    """CNAE com 7 dígitos, ou None para vazio/NaN"""
+    if val is None or not pd.notna(val):
+        return None
+    if isinstance(val, float) and val.is_integer():
+        val = int(val)
+    texto = str(val).strip()
+    return texto.zfill(7) if texto else None
+
 def obter_cnae_principal_por_cnpj(cnpj: str) -> Optional[str]:
     """
     Obtém o CNAE principal de um CNPJ a partir de ESTABELECIMENTOS, com fallback para EMPRESAS
@@ -54,6 +66,11 @@ def obter_cnae_principal_por_cnpj(cnpj: str) -> Optional[str]:
     num = normalizar_cnpj(cnpj)
     if not num or len(num) != 14:
         return None
+    # Consulta pelo índice de CNPJ (sem varredura), quando disponível
+    # (EMPRESAS não tem CNAE: o índice de estabelecimentos é a resposta)
+    df_est = buscar_linhas('estabelecimentos', num, columns=['cnae_fiscal_principal'])
+    if df_est is not None:
+        return _cnae7(df_est.iloc[0].get('cnae_fiscal_principal')) if not df_est.empty else None
     try:
         df_est = pd.read_parquet(
             Config.ARQUIVOS_PARQUET['estabelecimentos'],
@@ -65,9 +82,9 @@ def obter_cnae_principal_por_cnpj(cnpj: str) -> Optional[str]:
             columns=['cnae_fiscal_principal']
         )
         if df_est is not None and not df_est.empty:
-            val = df_est.iloc[0].get('cnae_fiscal_principal')
+            val = _cnae7(df_est.iloc[0].get('cnae_fiscal_principal'))
             if val:
-                return str(val).zfill(7)
+                return val
     except Exception:
         pass
     try:
@@ -77,9 +94,9 @@ def obter_cnae_principal_por_cnpj(cnpj: str) -> Optional[str]:
             columns=['cnae_fiscal']
         )
         if df_emp is not None and not df_emp.empty:
-            val = df_emp.iloc[0].get('cnae_fiscal')
+            val = _cnae7(df_emp.iloc[0].get('cnae_fiscal'))
             if val:
-                return str(val).zfill(7)
+                return val
     except Exception:
         pass
     return None
@@ -92,18 +109,27 @@ def consultar_cnpj_completo(cnpj: str) -> Optional[pd.DataFrame]:
     cached = cache.get(cache_key)
     if cached is not None:
         return cached
+    # Consultas simultâneas do mesmo CNPJ aguardam uma única varredura
+    return em_voo(cache_key, lambda: _consultar_cnpj_sem_cache(cnpj_num, cache_key))
+
+def _consultar_cnpj_sem_cache(cnpj_num: str, cache_key: str) -> Optional[pd.DataFrame]:
+    # Consulta pelo índice de CNPJ; se ele existe e não tem o CNPJ, evita as varreduras abaixo
+    df_idx = consultar_cnpj_indexado(cnpj_num)
+    if df_idx is not None:
+        if df_idx.empty:
+            return None
+        cache.set(cache_key, df_idx, expire=3600)
+        return df_idx
     # Tentativa 0: reconstruir CNPJ pelas colunas (estabelecimentos + empresas) usando DuckDB
     try:
-        pf_est = pq.ParquetFile(str(Config.ARQUIVOS_PARQUET['estabelecimentos']))
-        cols_est = [c.name for c in pf_est.schema]
+        cols_est = list(esquema_parquet(Config.ARQUIVOS_PARQUET['estabelecimentos']))
         basico = next((c for c in ['cnpj_basico','CNPJ_BASICO','cnpjBasico','cnpjbasico'] if c in cols_est), None)
         ordem = next((c for c in ['cnpj_ordem','CNPJ_ORDEM','cnpjOrdem','ordem'] if c in cols_est), None)
         dv = next((c for c in ['cnpj_dv','CNPJ_DV','cnpjDV','dv'] if c in cols_est), None)
         if not (basico and ordem and dv):
             raise ValueError('Colunas de CNPJ no ESTABELECIMENTOS não encontradas')
 
-        pf_emp = pq.ParquetFile(str(Config.ARQUIVOS_PARQUET['empresas']))
-        cols_emp = [c.name for c in pf_emp.schema]
+        cols_emp = list(esquema_parquet(Config.ARQUIVOS_PARQUET['empresas']))
         emp_basico = next((c for c in ['cnpj_basico','CNPJ_BASICO','cnpjBasico','cnpjbasico'] if c in cols_emp), None)
         razao = next((c for c in ['razao_social_nome_empresarial','razao_social','nome_empresarial'] if c in cols_emp), None) or cols_emp[0]
         nome_emp = next((c for c in ['nome_empresarial','razao_social_nome_empresarial','razao_social'] if c in cols_emp), None) or razao
@@ -114,16 +140,13 @@ def consultar_cnpj_completo(cnpj: str) -> Optional[pd.DataFrame]:
         if not emp_basico:
             raise ValueError('Coluna de cnpj_basico no EMPRESAS não encontrada')
 
-        est_path = str(Config.ARQUIVOS_PARQUET['estabelecimentos']).replace('\\', '/')
-        emp_path = str(Config.ARQUIVOS_PARQUET['empresas']).replace('\\', '/')
-
         q = f"""
         WITH est AS (
             SELECT 
                 regexp_replace(cast({basico} as VARCHAR),'[^0-9]','') AS est_basico,
                 regexp_replace(cast({ordem} as VARCHAR),'[^0-9]','') AS est_ordem,
                 regexp_replace(cast({dv} as VARCHAR),'[^0-9]','') AS est_dv
-            FROM read_parquet('{est_path}')
+            FROM {tabela('estabelecimentos')}
         ), emp AS (
             SELECT 
                 regexp_replace(cast({emp_basico} as VARCHAR),'[^0-9]','') AS emp_basico,
@@ -133,7 +156,7 @@ def consultar_cnpj_completo(cnpj: str) -> Optional[pd.DataFrame]:
                 {porte1 or 'NULL'} AS porte_da_empresa,
                 {natureza or 'NULL'} AS natureza_juridica,
                 {cnae or 'NULL'} AS cnae_fiscal
-            FROM read_parquet('{emp_path}')
+            FROM {tabela('empresas')}
         )
         SELECT 
             emp.emp_basico AS cnpj_basico,
@@ -149,7 +172,7 @@ def consultar_cnpj_completo(cnpj: str) -> Optional[pd.DataFrame]:
         WHERE (est.est_basico || est.est_ordem || est.est_dv) = '{cnpj_num}'
         LIMIT 1
         """
-        df_join = duckdb.sql(q).to_df()
+        df_join = obter_cursor().execute(q).df()
         if df_join is not None and not df_join.empty:
             cache.set(cache_key, df_join, expire=3600)
             return df_join
@@ -201,7 +224,7 @@ def consultar_cnpj_completo(cnpj: str) -> Optional[pd.DataFrame]:
         if not col:
             return None
         q = q.replace("{{'cnpj_col'}}", col)
-        df_emp = duckdb.sql(q).to_df()
+        df_emp = obter_cursor().execute(q).df()
         if df_emp is None or df_emp.empty:
             return None
         cache.set(cache_key, df_emp, expire=3600)
@@ -217,6 +240,9 @@ def verificar_divida_pgfn(cnpj: str) -> dict:
     cached = cache.get(cache_key)
     if cached is not None:
         return cached
+    return em_voo(cache_key, lambda: _verificar_divida_pgfn_sem_cache(num, cache_key))
+
+def _verificar_divida_pgfn_sem_cache(num: str, cache_key: str) -> dict:
     base = Config.PGFN_DIR
     if not base.exists():
         return {"possui_divida": False, "total_registros": 0, "arquivos": []}
@@ -232,7 +258,7 @@ def verificar_divida_pgfn(cnpj: str) -> dict:
                 continue
             f_path_safe = str(f).replace('\\', '/')
             q = f"SELECT COUNT(*) as n FROM read_parquet('{f_path_safe}') WHERE regexp_replace(cast({cand} as VARCHAR),'[^0-9]','') = '{num}'"
-            n = duckdb.sql(q).to_df()['n'].iloc[0]
+            n = obter_cursor().execute(q).df()['n'].iloc[0]
             if int(n)>0:
                 matched_files.append(f.name)
                 total += int(n)
@@ -248,37 +274,42 @@ def consultar_cnpj_simples_enriquecida(cnpj: str, light: bool = False) -> Option
         return None
     row = df_emp.iloc[0].to_dict()
     num = normalizar_cnpj(cnpj)
-    est = None
-    try:
-        est = pd.read_parquet(
-            Config.ARQUIVOS_PARQUET['estabelecimentos'],
-            filters=[
-                ('cnpj_basico','==', num[:8]),
-                ('cnpj_ordem','==', num[8:12]),
-                ('cnpj_dv','==', num[12:])
-            ]
-        )
-    except Exception:
-        est = None
+    est = buscar_linhas('estabelecimentos', num)
+    if est is None:
+        try:
+            est = pd.read_parquet(
+                Config.ARQUIVOS_PARQUET['estabelecimentos'],
+                filters=[
+                    ('cnpj_basico','==', num[:8]),
+                    ('cnpj_ordem','==', num[8:12]),
+                    ('cnpj_dv','==', num[12:])
+                ]
+            )
+        except Exception:
+            est = None
     socios = None
     simples = None
     pgfn = None
     if not light:
-        try:
-            socios = pd.read_parquet(
-                Config.ARQUIVOS_PARQUET['socios'],
-                filters=[('cnpj_basico','==', row.get('cnpj_basico'))],
-                columns=['nome_socio','qualificacao_socio','cnpj_basico']
-            )
-        except Exception:
-            socios = None
-        try:
-            simples = pd.read_parquet(
-                Config.ARQUIVOS_PARQUET['simples'],
-                filters=[('cnpj_basico','==', row.get('cnpj_basico'))]
-            )
-        except Exception:
-            simples = None
+        socios = buscar_linhas('socios', num, columns=['nome_socio','qualificacao_socio','cnpj_basico'])
+        if socios is None:
+            try:
+                socios = pd.read_parquet(
+                    Config.ARQUIVOS_PARQUET['socios'],
+                    filters=[('cnpj_basico','==', row.get('cnpj_basico'))],
+                    columns=['nome_socio','qualificacao_socio','cnpj_basico']
+                )
+            except Exception:
+                socios = None
+        simples = buscar_linhas('simples', num)
+        if simples is None:
+            try:
+                simples = pd.read_parquet(
+                    Config.ARQUIVOS_PARQUET['simples'],
+                    filters=[('cnpj_basico','==', row.get('cnpj_basico'))]
+                )
+            except Exception:
+                simples = None
         pgfn = verificar_divida_pgfn(num)
     municipio_code = _get_field(est, ['codigo_municipio','municipio_codigo','cod_municipio','cod_municipio_ibge','codigo_municipio_ibge','municipio'])
     uf_val = _get_field(est, ['uf','uf_sigla'])
@@ -516,47 +547,89 @@ def _situacao_nome(code):
         return None
 
 def buscar_por_palavra_chave(termo: str, uf: Optional[str] = None, municipio: Optional[str] = None, page: int = 1, page_size: int = 50) -> Optional[pd.DataFrame]:
-    empresas = _read_parquet(Config.ARQUIVOS_PARQUET['empresas'])
-    if empresas is None or empresas.empty:
-        return None
-    text_cols = [c for c in empresas.columns if empresas[c].dtype == object]
-    if not text_cols:
-        return None
-    mask = False
-    for c in text_cols:
-        mask = mask | empresas[c].astype(str).str.contains(termo, case=False, na=False)
-    if uf:
-        uf_cols = [c for c in empresas.columns if c.lower() == 'uf']
-        if uf_cols:
-            mask = mask & (empresas[uf_cols[0]].astype(str).str.upper() == uf.upper())
-    if municipio:
-        mun_cols = [c for c in empresas.columns if 'municipio' in c.lower()]
-        if mun_cols:
-            mask = mask & empresas[mun_cols[0]].astype(str).str.contains(municipio, case=False, na=False)
-    result = empresas[mask]
-    if result.empty:
+    """
+    Empresas cuja razão social ou nome fantasia casam com o termo, ranqueadas.
+
+    Usa o índice invertido de nomes (services_busca_nomes); sem índice, recorre
+    a um ILIKE paginado na razão social.
+    """
+    resultado = buscar_nomes(termo, ['razao_social', 'nome_fantasia'], uf=uf, municipio=municipio,
+                             page=page, page_size=page_size)
+    if resultado is not None:
+        pagina, total = resultado
+        if pagina.empty:
+            return None
+        # Mesmas colunas de antes (linhas de empresas), na ordem do ranking
+        basicos = pagina['cnpj_basico'].astype(str).tolist()
+        try:
+            df = obter_cursor().execute(
+                f"SELECT * FROM {tabela('empresas')} WHERE CAST(cnpj_basico AS VARCHAR) IN ({', '.join('?' * len(basicos))})",
+                basicos,
+            ).df()
+        except Exception as e:
+            logger.warning(f"Erro ao ler empresas da busca por palavra-chave: {e}")
+            return None
+        ordem = {b: i for i, b in enumerate(basicos)}
+        df = df.sort_values('cnpj_basico', key=lambda c: c.astype(str).map(ordem), kind='mergesort').reset_index(drop=True)
+        df.attrs['total'] = total
+        return df
+    try:
+        cols = list(esquema_parquet(Config.ARQUIVOS_PARQUET['empresas']))
+        rs_col = next((c for c in ['razao_social_nome_empresarial', 'razao_social', 'nome_empresarial'] if c in cols), None)
+        if rs_col is None:
+            return None
+        q = f"SELECT * FROM {tabela('empresas')} WHERE {rs_col} ILIKE ? LIMIT ? OFFSET ?"
+        df = obter_cursor().execute(q, [f"%{termo}%", page_size, max(page - 1, 0) * page_size]).df()
+        return df if df is not None and not df.empty else None
+    except Exception as e:
+        logger.warning(f"Erro na busca por palavra-chave: {e}")
         return None
-    start = max(page - 1, 0) * page_size
-    end = start + page_size
-    return result.iloc[start:end]
 
-def buscar_empresas_por_socio(nome_socio: str) -> Optional[pd.DataFrame]:
-    # Tenta buscar com DuckDB diretamente no parquet (mais rápido em arquivos grandes)
+def _qualificacao_socios(pagina: pd.DataFrame) -> pd.DataFrame:
+    """Página do índice → cnpj_basico, nome_socio, qualificacao_socio (colunas da busca direta)"""
+    colunas = ['cnpj_basico', 'nome_socio', 'qualificacao_socio']
+    pagina = pagina[['cnpj_basico', 'nome_socio']].astype(str)
+    try:
+        cols = list(esquema_parquet(Config.ARQUIVOS_PARQUET['socios']))
+        nome_col = next((c for c in ['nome_socio', 'socio', 'nome'] if c in cols), None)
+        qual_col = next((c for c in ['qualificacao_socio', 'qualificacao'] if c in cols), None)
+        if nome_col and qual_col:
+            basicos = pagina['cnpj_basico'].unique().tolist()
+            quals = obter_cursor().execute(
+                f"SELECT CAST(cnpj_basico AS VARCHAR) AS cnpj_basico, CAST({nome_col} AS VARCHAR) AS nome_socio, "
+                f"ANY_VALUE({qual_col}) AS qualificacao_socio FROM {tabela('socios')} "
+                f"WHERE CAST(cnpj_basico AS VARCHAR) IN ({', '.join('?' * len(basicos))}) GROUP BY ALL",
+                basicos,
+            ).df()
+            return pagina.merge(quals, on=['cnpj_basico', 'nome_socio'], how='left')[colunas]
+    except Exception as e:
+        logger.warning(f"Erro ao ler qualificação dos sócios: {e}")
+    return pagina.assign(qualificacao_socio=None)[colunas]
+
+
+def buscar_empresas_por_socio(nome_socio: str, page: int = 1, page_size: int = 500) -> Optional[pd.DataFrame]:
+    resultado = buscar_nomes(nome_socio, ['socio'], page=page, page_size=page_size)
+    if resultado is not None:
+        pagina, total = resultado
+        if pagina.empty:
+            return None
+        df = _qualificacao_socios(pagina.rename(columns={'nome': 'nome_socio'}))
+        df.attrs['total'] = total
+        return df
+    # Sem índice de nomes: tenta buscar com DuckDB diretamente no parquet (mais rápido em arquivos grandes)
     try:
-        pf = pq.ParquetFile(str(Config.ARQUIVOS_PARQUET['socios']))
-        cols = [c.name for c in pf.schema]
+        cols = list(esquema_parquet(Config.ARQUIVOS_PARQUET['socios']))
         cand = next((c for c in ['nome_socio','socio','nome'] if c in cols), None)
         qual_col = next((c for c in ['qualificacao_socio','qualificacao'] if c in cols), None)
         cnpj_col = next((c for c in ['cnpj_basico','cnpj'] if c in cols), None)
         if cand is None:
             raise ValueError('coluna de nome de sócio não encontrada')
         select_cols = ', '.join([c for c in [cnpj_col, cand + ' as nome_socio', qual_col] if c])
-        path_soc = str(Config.ARQUIVOS_PARQUET['socios']).replace('\\', '/')
         q = (
-            f"SELECT {select_cols} FROM read_parquet('{path_soc}') "
+            f"SELECT {select_cols} FROM {tabela('socios')} "
             f"WHERE lower({cand}) LIKE lower('%{nome_socio}%') LIMIT 500"
         )
-        df = duckdb.sql(q).to_df()
+        df = obter_cursor().execute(q).df()
         if df is not None and not df.empty:
             return df
     except Exception:
@@ -0,0 +1,159 @@
+"""
+Gerenciador de conexão DuckDB compartilhada
+
+Abre um único banco DuckDB por processo, registra as views sobre os arquivos
+Parquet da Receita uma única vez e entrega um cursor por thread (Waitress
+atende requisições em um pool fixo de threads).
+"""
+
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+import duckdb
+
+from core.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Tabelas da base RFB expostas como views na conexão compartilhada
+VIEWS_RFB = ('empresas', 'estabelecimentos', 'socios', 'simples', 'cnaes', 'municipios')
+
+_lock = threading.Lock()
+_local = threading.local()
+_conexao: Optional[duckdb.DuckDBPyConnection] = None
+_geracao = 0
+_views: dict = {}
+
+
+def _caminho_sql(caminho) -> str:
+    """Normaliza um caminho para uso dentro de literais SQL"""
+    return str(caminho).replace('\\', '/').replace("'", "''")
+
+
+def expressao_parquet(caminho) -> str:
+    """
+    read_parquet para um arquivo ou para um dataset (diretório), lendo as
+    partições Hive (ex.: uf=SP) como colunas.
+    """
+    if Path(str(caminho)).is_dir():
+        return f"read_parquet('{_caminho_sql(caminho)}/**/*.parquet', hive_partitioning = true)"
+    return f"read_parquet('{_caminho_sql(caminho)}')"
+
+
+def _abrir_conexao() -> duckdb.DuckDBPyConnection:
+    """Abre o banco com os limites de memória e threads definidos em Config"""
+    config_duckdb = {
+        'threads': int(Config.DUCKDB_THREADS),
+        'memory_limit': str(Config.DUCKDB_MEMORY_LIMIT),
+    }
+    con = duckdb.connect(str(Config.DUCKDB_PATH), config=config_duckdb)
+    # Mantém metadados dos Parquet em memória entre consultas
+    con.execute("SET enable_object_cache = true")
+    if Config.DUCKDB_TEMP_DIR:
+        Path(Config.DUCKDB_TEMP_DIR).mkdir(parents=True, exist_ok=True)
+        con.execute(f"SET temp_directory = '{_caminho_sql(Config.DUCKDB_TEMP_DIR)}'")
+    return con
+
+
+def registrar_view(nome: str, caminho, con: Optional[duckdb.DuckDBPyConnection] = None) -> bool:
+    """
+    Registra (ou substitui) uma view sobre um arquivo/diretório Parquet.
+
+    Returns:
+        True se a view foi criada
+    """
+    alvo = con or obter_conexao()
+    try:
+        if '*' not in str(caminho) and not Path(caminho).exists():
+            logger.warning(f"Arquivo para view '{nome}' não encontrado: {caminho}")
+            return False
+        alvo.execute(
+            f"CREATE OR REPLACE VIEW {nome} AS SELECT * FROM {expressao_parquet(caminho)}"
+        )
+        with _lock:
+            _views[nome] = str(caminho)
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao registrar view '{nome}': {e}")
+        return False
+
+
+def inicializar_duckdb() -> duckdb.DuckDBPyConnection:
+    """
+    Abre a conexão compartilhada e registra as views da base RFB.
+    Idempotente: chamadas subsequentes reaproveitam a conexão aberta.
+    """
+    global _conexao, _geracao
+    with _lock:
+        if _conexao is not None:
+            return _conexao
+        con = _abrir_conexao()
+        _conexao = con
+        _geracao += 1
+
+    for nome in VIEWS_RFB:
+        caminho = Config.ARQUIVOS_PARQUET.get(nome)
+        if caminho is not None:
+            registrar_view(nome, caminho, con)
+
+    logger.info(
+        f"✓ DuckDB inicializado ({Config.DUCKDB_PATH}, threads={Config.DUCKDB_THREADS}, "
+        f"memory_limit={Config.DUCKDB_MEMORY_LIMIT}) com views: {', '.join(sorted(_views))}"
+    )
+    return con
+
+
+def obter_conexao() -> duckdb.DuckDBPyConnection:
+    """Retorna a conexão compartilhada, inicializando-a se necessário"""
+    con = _conexao
+    if con is None:
+        con = inicializar_duckdb()
+    return con
+
+
+def obter_cursor() -> duckdb.DuckDBPyConnection:
+    """
+    Retorna o cursor DuckDB da thread atual.
+
+    Cursores compartilham o catálogo (views) da conexão principal, mas podem
+    executar consultas em paralelo com segurança.
+    """
+    con = obter_conexao()
+    cursor = getattr(_local, 'cursor', None)
+    if cursor is None or getattr(_local, 'geracao', None) != _geracao:
+        cursor = con.cursor()
+        _local.cursor = cursor
+        _local.geracao = _geracao
+    return cursor
+
+
+def tabela(nome: str) -> str:
+    """
+    Expressão SQL para a tabela informada: o nome da view registrada ou,
+    se ela não existir, um read_parquet sobre o arquivo/dataset configurado.
+    """
+    obter_conexao()
+    if nome in _views:
+        return nome
+    return expressao_parquet(Config.ARQUIVOS_PARQUET.get(nome, ''))
+
+
+def view_registrada(nome: str) -> bool:
+    """Indica se a view existe na conexão compartilhada"""
+    obter_conexao()
+    return nome in _views
+
+
+def fechar_duckdb():
+    """Fecha a conexão compartilhada (cursores das threads são descartados)"""
+    global _conexao
+    with _lock:
+        if _conexao is not None:
+            try:
+                _conexao.close()
+            except Exception as e:
+                logger.warning(f"Erro ao fechar DuckDB: {e}")
+        _conexao = None
+        _views.clear()
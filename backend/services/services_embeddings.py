@@ -0,0 +1,225 @@
+"""
+Cliente de embeddings em lote
+
+Usado pelo índice semântico (/ai/index/build, /ai/search, /ai/assist):
+
+  - várias entradas por requisição (Config.AI_EMBED_LOTE), lotes em
+    paralelo (Config.AI_EMBED_CONCORRENCIA) em uma sessão com pool de
+    conexões, repetição com backoff em 429/5xx/erros de conexão;
+  - cache em disco hash do conteúdo (modelo + texto) → vetor, separado do
+    cache principal: documentos inalterados e perguntas repetidas não são
+    enviados de novo;
+  - sem AI_API_KEY, ou se um lote falhar em todas as tentativas, usa o
+    vetor local por bytes (256 dimensões), que não vai para o cache.
+
+Servidor local de teste (vetores determinísticos, formato da API):
+    python -m services.services_embeddings --stub 8765
+    AI_API_BASE=http://127.0.0.1:8765 AI_API_KEY=teste ...
+"""
+
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import diskcache as dc
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.config import Config
+from services.compat import requests_kwargs
+
+logger = logging.getLogger(__name__)
+
+DIM_LOCAL = 256
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+
+_vetores = dc.Cache(str(Config.AI_EMBED_CACHE_DIR), size_limit=int(Config.AI_EMBED_CACHE_MB) * 1024 * 1024)
+
+_sessao: Optional[requests.Session] = None
+_lock_sessao = threading.Lock()
+
+
+def _configuracao() -> Dict[str, Optional[str]]:
+    return {
+        'api_key': os.environ.get('AI_API_KEY'),
+        'base_url': os.environ.get('AI_API_BASE', 'https://api.openai.com/v1'),
+        'modelo': os.environ.get('AI_EMBED_MODEL', 'text-embedding-3-large'),
+    }
+
+
+def obter_sessao() -> requests.Session:
+    global _sessao
+    with _lock_sessao:
+        if _sessao is None:
+            tamanho = max(int(Config.AI_EMBED_CONCORRENCIA), 1)
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=tamanho, pool_maxsize=tamanho)
+            sessao.mount('https://', adaptador)
+            sessao.mount('http://', adaptador)
+            _sessao = sessao
+        return _sessao
+
+
+def vetor_local(texto: str) -> np.ndarray:
+    """Vetor normalizado a partir dos bytes do texto (sem API)"""
+    v = np.zeros((DIM_LOCAL,), dtype=np.float32)
+    for i, ch in enumerate(texto.encode('utf-8')):
+        v[i % DIM_LOCAL] += float(ch)
+    n = np.linalg.norm(v) or 1.0
+    return (v / n).astype(np.float32)
+
+
+def _normalizar(vetor) -> np.ndarray:
+    v = np.asarray(vetor, dtype=np.float32)
+    n = np.linalg.norm(v) or 1.0
+    return (v / n).astype(np.float32)
+
+
+def chave_conteudo(modelo: str, texto: str) -> str:
+    return hashlib.sha256(f"{modelo}\0{texto}".encode('utf-8')).hexdigest()
+
+
+def _espera(tentativa: int, resposta: Optional[requests.Response] = None) -> float:
+    """Backoff exponencial com jitter; usa Retry-After (segundos) quando informado"""
+    if resposta is not None:
+        try:
+            return min(float(resposta.headers.get('Retry-After')), 30.0)
+        except (TypeError, ValueError):
+            pass
+    return float(Config.AI_EMBED_BACKOFF) * (2 ** tentativa) * (1 + random.random() / 2)
+
+
+def _requisitar_lote(textos: List[str], cfg: Dict) -> Optional[List[np.ndarray]]:
+    """Um POST /embeddings com vários textos; None se todas as tentativas falharem"""
+    url = f"{cfg['base_url'].rstrip('/')}/embeddings"
+    kw = requests_kwargs(
+        timeout=int(Config.AI_EMBED_TIMEOUT),
+        headers={"Authorization": f"Bearer {cfg['api_key']}", "Content-Type": "application/json"},
+    )
+    tentativas = max(int(Config.AI_EMBED_TENTATIVAS), 1)
+    for tentativa in range(tentativas):
+        resposta = None
+        try:
+            resposta = obter_sessao().post(url, json={"input": textos, "model": cfg['modelo']}, **kw)
+            if resposta.ok:
+                dados = sorted(resposta.json().get('data') or [], key=lambda d: d.get('index', 0))
+                if len(dados) != len(textos):
+                    logger.warning(f"Embeddings: {len(dados)} vetores para {len(textos)} textos")
+                    return None
+                return [_normalizar(d.get('embedding') or []) for d in dados]
+            if resposta.status_code not in STATUS_REPETIR:
+                logger.warning(f"Embeddings {resposta.status_code}: {resposta.text[:200]}")
+                return None
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ValueError) as e:
+            logger.warning(f"Embeddings tentativa {tentativa + 1}/{tentativas} falhou: {e}")
+        if tentativa + 1 < tentativas:
+            time.sleep(_espera(tentativa, resposta))
+    return None
+
+
+def embeddings(textos: Sequence[str]) -> List[np.ndarray]:
+    """
+    Vetores normalizados (float32) para os textos, na mesma ordem.
+
+    Textos repetidos são enviados uma vez; os já vistos saem do cache em disco.
+    """
+    textos = [str(t or '').strip() for t in textos]
+    resultado: List[Optional[np.ndarray]] = [None] * len(textos)
+    cfg = _configuracao()
+
+    faltantes: Dict[str, List[int]] = {}
+    for i, texto in enumerate(textos):
+        if not texto:
+            resultado[i] = np.zeros((DIM_LOCAL,), dtype=np.float32)
+        elif not cfg['api_key']:
+            resultado[i] = vetor_local(texto)
+        else:
+            chave = chave_conteudo(cfg['modelo'], texto)
+            guardado = _vetores.get(chave) if chave not in faltantes else None
+            if guardado is not None:
+                resultado[i] = np.frombuffer(guardado, dtype=np.float32)
+            else:
+                faltantes.setdefault(chave, []).append(i)
+
+    if faltantes:
+        chaves = list(faltantes)
+        tamanho = max(int(Config.AI_EMBED_LOTE), 1)
+        lotes = [chaves[i:i + tamanho] for i in range(0, len(chaves), tamanho)]
+
+        def _processar(lote: List[str]):
+            return lote, _requisitar_lote([textos[faltantes[c][0]] for c in lote], cfg)
+
+        concorrencia = max(min(int(Config.AI_EMBED_CONCORRENCIA), len(lotes)), 1)
+        with ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix='embeddings') as executor:
+            for lote, vetores in executor.map(_processar, lotes):
+                for j, chave in enumerate(lote):
+                    indices = faltantes[chave]
+                    if vetores is None:
+                        vetor = vetor_local(textos[indices[0]])
+                    else:
+                        vetor = vetores[j]
+                        _vetores.set(chave, vetor.tobytes())
+                    for i in indices:
+                        resultado[i] = vetor
+        logger.info(f"Embeddings: {len(textos)} textos, {len(chaves)} calculados em {len(lotes)} lote(s)")
+
+    return resultado
+
+
+def embedding(texto: str) -> np.ndarray:
+    return embeddings([texto])[0]
+
+
+def _servidor_stub(porta: int, dim: int = 64):
+    """Servidor local compatível com POST /embeddings (vetores derivados do hash do texto)"""
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            corpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            entradas = corpo.get('input') or []
+            if isinstance(entradas, str):
+                entradas = [entradas]
+            dados = []
+            for i, texto in enumerate(entradas):
+                semente = int.from_bytes(hashlib.sha256(str(texto).encode('utf-8')).digest()[:4], 'little')
+                vetor = np.random.default_rng(semente).standard_normal(dim).astype(np.float32)
+                dados.append({'object': 'embedding', 'index': i, 'embedding': vetor.tolist()})
+            saida = json.dumps({'object': 'list', 'data': dados, 'model': corpo.get('model')}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(saida)))
+            self.end_headers()
+            self.wfile.write(saida)
+
+        def log_message(self, formato, *args):
+            logger.info(formato % args)
+
+    logger.info(f"Stub de embeddings em http://127.0.0.1:{porta}/embeddings")
+    ThreadingHTTPServer(('127.0.0.1', porta), _Handler).serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Embeddings em lote')
+    parser.add_argument('--stub', type=int, metavar='PORTA', help='Sobe o servidor local de teste')
+    parser.add_argument('--dim', type=int, default=64, help='Dimensão dos vetores do stub')
+    parser.add_argument('textos', nargs='*', help='Textos para calcular (mostra dimensão e norma)')
+    args = parser.parse_args()
+
+    if args.stub:
+        _servidor_stub(args.stub, args.dim)
+    else:
+        inicio = time.perf_counter()
+        for texto, vetor in zip(args.textos, embeddings(args.textos)):
+            print(f"{texto[:40]!r}: dim={vetor.shape[0]} norma={np.linalg.norm(vetor):.3f}")
+        print(f"{(time.perf_counter() - inicio) * 1000:.0f} ms")
@@ -0,0 +1,149 @@
+"""
+Compilador de filtros para consultas DuckDB sobre os Parquet da Receita
+
+Converte as tuplas (coluna, operador, valor) usadas pelos serviços de análise
+em predicados SQL parametrizados e tipados de acordo com o esquema do arquivo.
+Comparações diretas na coluna (sem CAST) são empurradas pelo DuckDB para a
+leitura do Parquet, que descarta row groups pelas estatísticas min/max.
+"""
+
+import logging
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+OPERADORES = {
+    '==': '=',
+    '=': '=',
+    '!=': '<>',
+    '>': '>',
+    '>=': '>=',
+    '<': '<',
+    '<=': '<=',
+    'in': 'IN',
+    'not in': 'NOT IN',
+}
+
+
+@lru_cache(maxsize=32)
+def _esquema(caminho: str) -> Dict[str, pa.DataType]:
+    if Path(caminho).is_dir():
+        # Dataset particionado: colunas dos arquivos + colunas de partição Hive
+        esquema = ds.dataset(caminho, format='parquet', partitioning='hive').schema
+    else:
+        esquema = pq.read_schema(caminho)
+    return {campo.name: campo.type for campo in esquema}
+
+
+def esquema_parquet(caminho) -> Dict[str, pa.DataType]:
+    """Colunas → tipo Arrow do arquivo ou dataset Parquet (lido só dos rodapés, com cache)"""
+    try:
+        return _esquema(str(caminho))
+    except Exception as e:
+        logger.warning(f"Erro ao ler esquema de {caminho}: {e}")
+        return {}
+
+
+def identificador(coluna: str) -> str:
+    """Nome de coluna entre aspas para uso em SQL"""
+    return '"' + str(coluna).replace('"', '""') + '"'
+
+
+def expressao_numerica(coluna_sql: str, tipo: Optional[pa.DataType]) -> str:
+    """
+    Expressão numérica da coluna. Texto no formato brasileiro ('1.000,50')
+    é convertido como em _parse_float_br; colunas numéricas ficam intactas.
+    """
+    if tipo is not None and (pa.types.is_integer(tipo) or pa.types.is_floating(tipo) or pa.types.is_decimal(tipo)):
+        return coluna_sql
+    return f"TRY_CAST(replace(replace(CAST({coluna_sql} AS VARCHAR), '.', ''), ',', '.') AS DOUBLE)"
+
+
+def _data(valor) -> date:
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = ''.join(c for c in str(valor) if c.isdigit()).ljust(8, '0')
+    # Datas AAAAMMDD com mês/dia zerados (ex.: 20200000) são limites de ano
+    ano, mes, dia = int(texto[:4]), max(1, int(texto[4:6])), max(1, int(texto[6:8]))
+    return date(ano, mes, dia)
+
+
+def _converter(tipo: pa.DataType, valor: Any) -> Any:
+    """Converte o valor do filtro para o tipo físico da coluna"""
+    if pa.types.is_integer(tipo):
+        return int(float(valor))
+    if pa.types.is_floating(tipo) or pa.types.is_decimal(tipo):
+        return float(valor)
+    if pa.types.is_boolean(tipo):
+        return str(valor).lower() in ('1', 'true', 's', 'sim')
+    if pa.types.is_date(tipo):
+        return _data(valor)
+    if pa.types.is_timestamp(tipo):
+        return datetime.combine(_data(valor), datetime.min.time())
+    return str(valor)
+
+
+def compilar_predicado(coluna: str, tipo: Optional[pa.DataType], op: str, valor: Any,
+                       alias: str = '') -> Optional[Tuple[str, List[Any]]]:
+    """
+    Predicado SQL parametrizado para um filtro.
+
+    Returns:
+        (sql, parâmetros) ou None se o operador/valor não for suportado
+    """
+    op_sql = OPERADORES.get(str(op).lower())
+    if op_sql is None:
+        return None
+    col = f"{alias}.{identificador(coluna)}" if alias else identificador(coluna)
+    texto = tipo is None or pa.types.is_string(tipo) or pa.types.is_large_string(tipo)
+    try:
+        if op_sql in ('IN', 'NOT IN'):
+            valores = list(valor) if isinstance(valor, (list, tuple, set, frozenset)) else [valor]
+            if not valores:
+                return ('FALSE', []) if op_sql == 'IN' else ('TRUE', [])
+            convertidos = list(dict.fromkeys(_converter(tipo, v) for v in valores)) if tipo is not None else [str(v) for v in valores]
+            return f"{col} {op_sql} ({', '.join('?' * len(convertidos))})", convertidos
+        if texto and isinstance(valor, float):
+            # Texto com número em formato brasileiro (ex.: capital social)
+            return f"{expressao_numerica(col, tipo)} {op_sql} ?", [valor]
+        # Inteiros contra texto comparam como texto: códigos e datas AAAAMMDD
+        # têm largura fixa, então a ordem lexicográfica é a numérica
+        convertido = _converter(tipo, valor) if tipo is not None else str(valor)
+        return f"{col} {op_sql} ?", [convertido]
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Filtro ignorado ({coluna} {op} {valor!r}): {e}")
+        return None
+
+
+def compilar_filtros(filtros: List[tuple], esquema: Dict[str, pa.DataType],
+                     alias: str = '') -> Tuple[List[str], List[Any], List[tuple]]:
+    """
+    Compila os filtros cujas colunas existem no esquema.
+
+    Returns:
+        (cláusulas, parâmetros, filtros não aplicados)
+    """
+    clausulas: List[str] = []
+    parametros: List[Any] = []
+    restantes: List[tuple] = []
+    for filtro in filtros or []:
+        coluna, op, valor = filtro
+        if coluna not in esquema:
+            restantes.append(filtro)
+            continue
+        compilado = compilar_predicado(coluna, esquema[coluna], op, valor, alias)
+        if compilado is None:
+            restantes.append(filtro)
+            continue
+        clausulas.append(compilado[0])
+        parametros.extend(compilado[1])
+    return clausulas, parametros, restantes
@@ -8,9 +8,11 @@ import asyncio
 import aiohttp
 from typing import Dict, Any
 from core.config import Config
-from services.services_cache_service import cache
+from services.services_cache_service import cache, em_voo
 from services.services_cnpj_service import consultar_cnpj_completo
 from services.compat import requests_kwargs
+from services.services_pncp_coletor import coletar_por_modalidade
+from services.services_pncp_espelho import consultar_editais, consultar_periodo, espelho_disponivel
 from utils.utils_validator import normalizar_cnpj
 
 logger = logging.getLogger(__name__)
@@ -160,7 +162,7 @@ class PNCPIntegration:
     """
 
     def __init__(self):
-        self.base_url = "https://pncp.gov.br/api/consulta/v1/contratacoes/publicacao"
+        self.base_url = f"{Config.PNCP_API_URL.rstrip('/')}/v1/contratacoes/publicacao"
         self._sample_items = [
             {
                 "numeroControlePNCP": "SAMPLE-1",
@@ -209,13 +211,17 @@ class PNCPIntegration:
             cached = cache.get(cache_key)
             if cached is not None:
                 return cached
-            r = requests.get(self.base_url, params=params, **requests_kwargs(timeout=10))
-            if not r.ok:
-                return []
-            js = r.json()
-            data = js.get("data") or js.get("items") or []
-            cache.set(cache_key, data, expire=3600)
-            return data
+
+            def _baixar():
+                r = requests.get(self.base_url, params=params, **requests_kwargs(timeout=10))
+                if not r.ok:
+                    return []
+                js = r.json()
+                data = js.get("data") or js.get("items") or []
+                cache.set(cache_key, data, expire=3600)
+                return data
+
+            return em_voo(cache_key, _baixar)
         except Exception:
             return []
 
@@ -272,6 +278,14 @@ class PNCPIntegration:
             params["dataInicial"] = di
         if df:
             params["dataFinal"] = df
+        # Espelho local sincronizado cobre o período: consulta indexada, sem API remota
+        try:
+            if espelho_disponivel(data_inicial=params.get("dataInicial"), data_final=params.get("dataFinal")):
+                resultado = consultar_editais(params, pagina=params['pagina'], tamanho=params['tamanhoPagina'])
+                if resultado is not None:
+                    return resultado
+        except Exception as e:
+            logger.warning(f"Espelho PNCP indisponível, consultando API: {e}")
         cache_key = (
             f"pncp:feed:p{params['pagina']}:s{params['tamanhoPagina']}"
             f":di{params.get('dataInicial','')}:df{params.get('dataFinal','')}"
@@ -317,13 +331,20 @@ class PNCPIntegration:
             return {"pagina": params['pagina'], "tamanhoPagina": params['tamanhoPagina'], "data": self._sample_items}
 
     def listar_editais_todos(self, dias: int = 30, tamanho: int = 200, filtros: dict | None = None, max_total: int = 10000) -> dict:
-        import requests
         import logging
         logger = logging.getLogger(__name__)
         from datetime import datetime, timedelta
         filtros = filtros or {}
         dtf = datetime.utcnow()
         dti = dtf - timedelta(days=int(dias or 30))
+        # Período explícito (dataInicial/dataFinal, AAAAMMDD ou ISO) prevalece sobre `dias`
+        try:
+            if filtros.get('dataFinal'):
+                dtf = datetime.strptime(''.join(c for c in str(filtros['dataFinal']) if c.isdigit())[:8], "%Y%m%d")
+            if filtros.get('dataInicial'):
+                dti = datetime.strptime(''.join(c for c in str(filtros['dataInicial']) if c.isdigit())[:8], "%Y%m%d")
+        except ValueError:
+            logger.warning(f"Período inválido em filtros: {filtros.get('dataInicial')} a {filtros.get('dataFinal')}")
         mods = filtros.get('codigoModalidadeContratacao')
         if mods in (None, '', 'todos', 'all', 0, '0'):
             modalidade_lista = [1,2,3,4,5,6,7,8,9,10]
@@ -332,91 +353,65 @@ class PNCPIntegration:
                 modalidade_lista = [int(mods)]
             except Exception:
                 modalidade_lista = [5]
-        itens = []
-        meta = {"modalidades": [], "total": 0}
-        for mod in modalidade_lista:
-            pagina = 1
-            coletados_mod = 0
-            while True:
-                params = {
-                    "pagina": pagina,
-                    "tamanhoPagina": max(min(int(tamanho or 200), 200), 1),
-                    "dataInicial": dti.strftime("%Y%m%d"),
-                    "dataFinal": dtf.strftime("%Y%m%d"),
-                    "codigoModalidadeContratacao": mod
-                }
-                for k in [
-                    "situacao",
-                    "orgao",
-                    "unidadeGestora",
-                    "palavraChave",
-                    "municipioNome",
-                    "esferaId",
-                    "poderId",
-                    "tipoInstrumentoConvocatorioCodigo",
-                    "tipoMargemPreferencia",
-                    "conteudoNacional",
-                    "cnpj",
-                    "codigoUnidadeAdministrativa",
-                    "idUsuario",
-                    "uf",
-                    "codigoMunicipioIbge"
-                ]:
-                    v = filtros.get(k)
-                    if v:
-                        params[k] = v
-                if filtros.get("ufSigla") and not params.get("uf"):
-                    params["uf"] = filtros["ufSigla"]
-                muni = filtros.get("municipioIbge") or filtros.get("municipioCodigo")
-                if muni and not params.get("codigoMunicipioIbge"):
-                    params["codigoMunicipioIbge"] = str(muni)
-                cache_key = (
-                    f"pncp:all:mod{mod}:p{pagina}:s{params['tamanhoPagina']}:di{params['dataInicial']}:df{params['dataFinal']}:pk{params.get('palavraChave','')}"
-                    f":uf{params.get('uf','')}:mun{params.get('municipioNome','')}:munibge{params.get('codigoMunicipioIbge','')}:esf{params.get('esferaId','')}:pod{params.get('poderId','')}"
-                    f":tic{params.get('tipoInstrumentoConvocatorioCodigo','')}:tmp{params.get('tipoMargemPreferencia','')}:ecn{params.get('conteudoNacional','')}"
-                    f":cnpj{params.get('cnpj','')}:uadm{params.get('codigoUnidadeAdministrativa','')}:usr{params.get('idUsuario','')}"
-                )
-                cached = None
-                try:
-                    kw = self._kw()
-                    r = requests.get(self.base_url, params=params, **kw)
-                    if not r.ok:
-                        logger.warning(f"PNCP todos falhou mod={mod} p={pagina}: {r.status_code} {r.text[:200]}")
-                        try:
-                            kw2 = self._kw(); kw2['verify'] = False
-                            r = requests.get(self.base_url, params=params, **kw2)
-                        except Exception as e:
-                            logger.error(f"PNCP todos verify=False erro: {e}")
-                            js = {"data": self._sample_items, "totalPaginas": 1, "numeroPagina": pagina}
-                        else:
-                            if not r.ok:
-                                js = {"data": self._sample_items, "totalPaginas": 1, "numeroPagina": pagina}
-                            else:
-                                js = r.json()
-                    else:
-                        js = r.json()
-                except Exception as e:
-                    logger.error(f"PNCP todos erro: {e}")
-                    js = {"data": self._sample_items, "totalPaginas": 1, "numeroPagina": pagina}
-                arr = js if isinstance(js, list) else (js.get("data") or js.get("items") or js.get("content") or [])
-                if not arr:
-                    # Fallback offline: usa amostras
-                    arr = self._sample_items
-                for it in arr:
-                    itens.append(it)
-                    coletados_mod += 1
-                    if len(itens) >= max_total:
-                        meta["modalidades"].append({"codigo": mod, "coletados": coletados_mod})
-                        meta["total"] = len(itens)
-                        return {"data": itens, "total": len(itens), **meta}
-                total_pag = js.get("totalPaginas") if isinstance(js, dict) else None
-                num_pag = js.get("numeroPagina") if isinstance(js, dict) else None
-                if total_pag and num_pag and pagina >= int(total_pag):
-                    break
-                pagina += 1
-            meta["modalidades"].append({"codigo": mod, "coletados": coletados_mod})
-        meta["total"] = len(itens)
-        return {"data": itens, "total": len(itens), **meta}
+        params_base = {
+            "tamanhoPagina": max(min(int(tamanho or 200), 200), 1),
+            "dataInicial": dti.strftime("%Y%m%d"),
+            "dataFinal": dtf.strftime("%Y%m%d"),
+        }
+        for k in [
+            "situacao",
+            "orgao",
+            "unidadeGestora",
+            "palavraChave",
+            "municipioNome",
+            "esferaId",
+            "poderId",
+            "tipoInstrumentoConvocatorioCodigo",
+            "tipoMargemPreferencia",
+            "conteudoNacional",
+            "cnpj",
+            "codigoUnidadeAdministrativa",
+            "idUsuario",
+            "uf",
+            "codigoMunicipioIbge"
+        ]:
+            v = filtros.get(k)
+            if v:
+                params_base[k] = v
+        if filtros.get("ufSigla") and not params_base.get("uf"):
+            params_base["uf"] = filtros["ufSigla"]
+        muni = filtros.get("municipioIbge") or filtros.get("municipioCodigo")
+        if muni and not params_base.get("codigoMunicipioIbge"):
+            params_base["codigoMunicipioIbge"] = str(muni)
+        try:
+            if espelho_disponivel(data_inicial=params_base["dataInicial"], data_final=params_base.get("dataFinal")):
+                filtros_espelho = {**params_base, "codigoModalidadeContratacao": mods}
+                resultado = consultar_periodo(filtros_espelho, max_total=int(max_total or 10000))
+                if resultado is not None:
+                    return resultado
+        except Exception as e:
+            logger.warning(f"Espelho PNCP indisponível, consultando API: {e}")
+        p = params_base
+        sufixo = (
+            f":s{p['tamanhoPagina']}:di{p['dataInicial']}:df{p['dataFinal']}:pk{p.get('palavraChave','')}"
+            f":uf{p.get('uf','')}:mun{p.get('municipioNome','')}:munibge{p.get('codigoMunicipioIbge','')}:esf{p.get('esferaId','')}:pod{p.get('poderId','')}"
+            f":tic{p.get('tipoInstrumentoConvocatorioCodigo','')}:tmp{p.get('tipoMargemPreferencia','')}:ecn{p.get('conteudoNacional','')}"
+            f":cnpj{p.get('cnpj','')}:uadm{p.get('codigoUnidadeAdministrativa','')}:usr{p.get('idUsuario','')}"
+            f":sit{p.get('situacao','')}:org{p.get('orgao','')}:ug{p.get('unidadeGestora','')}"
+        )
+        # Páginas de todas as modalidades buscadas em paralelo (pool limitado,
+        # conexões reaproveitadas, backoff em 429/5xx e cache por página)
+        resultado = coletar_por_modalidade(
+            self.base_url, params_base, modalidade_lista,
+            lambda mod, pagina: f"pncp:all:mod{mod}:p{pagina}{sufixo}",
+            max_total=int(max_total or 10000),
+        )
+        itens = resultado["data"]
+        if not itens and resultado["falhas"]:
+            # Fallback offline: usa amostras
+            logger.warning(f"PNCP todos: {resultado['falhas']} páginas sem resposta, usando amostras")
+            itens = list(self._sample_items)
+        return {"data": itens, "total": len(itens), "modalidades": resultado["modalidades"]}
 
     def _listar_generico(self, url: str, pagina: int = 1, tamanho: int = 10, filtros: dict | None = None) -> dict:
         import requests
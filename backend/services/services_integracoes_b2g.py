@@ -155,26 +155,20 @@ class IntegracoesB2GService:
     
     def sincronizar_pncp_realtime(self, filtros: Optional[Dict] = None) -> Dict:
         """
-        Sincroniza dados do PNCP em tempo real
+        Sincroniza o espelho local do PNCP desde a última marca d'água
         
         Args:
-            filtros: Filtros opcionais
+            filtros: Opcional {'tipos': ['contratacoes', 'contratos']}
             
         Returns:
             Resultado da sincronização
         """
         try:
-            # Integração com API real do PNCP
-            # TODO: Implementar chamada real
+            from services.services_pncp_espelho import sincronizar
             
             logger.info("Sincronização PNCP iniciada")
-            
-            return {
-                'sucesso': True,
-                'total_novas': 0,
-                'total_atualizadas': 0,
-                'timestamp': datetime.now().isoformat()
-            }
+            tipos = (filtros or {}).get('tipos')
+            return sincronizar(tipos)
             
         except Exception as e:
             logger.error(f"Erro na sincronização PNCP: {e}")
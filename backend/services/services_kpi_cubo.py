@@ -0,0 +1,472 @@
+"""
+Cubos de agregados para os dashboards de KPIs
+
+Etapa offline que percorre estabelecimentos (+ porte de empresas) uma única
+vez e grava contagens pré-agregadas em Parquet:
+
+    fato.parquet      uf, municipio, cnae, situacao, porte, mes_inicio → n, com_contato
+    fato_uf.parquet   o mesmo sem município (consultas sem filtro/quebra por município)
+    saidas.parquet    uf, municipio, cnae, situacao, mes_inicio, mes_situacao → n (baixadas)
+    recentes.parquet  uf, municipio, cnae, situacao, data_inicio → n (últimos dias da base)
+    porte.parquet     porte → n (tabela empresas)
+
+As rotas /kpis/base e /kpis/geral respondem a partir destes cubos quando eles
+existem; o que não for coberto (cubo ausente ou janela de 30 dias fora de
+recentes) cai na consulta sobre os dados brutos.
+
+Uso:
+    python -m services.services_kpi_cubo
+"""
+
+import json
+import logging
+import shutil
+import time
+from datetime import timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from core.config import Config
+from services.services_duckdb_pool import obter_conexao, obter_cursor, registrar_view, tabela, view_registrada
+from services.services_filtro_sql import esquema_parquet
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_MANIFESTO = 'manifesto.json'
+CUBOS = ('fato', 'fato_uf', 'saidas', 'recentes', 'porte')
+JANELA_RECENTES_DIAS = 62
+
+# Códigos de situação cadastral (com e sem zero à esquerda; baixada também por extenso)
+SITUACAO_ATIVA = "('02', '2')"
+SITUACAO_BAIXADA = "('08', '8', 'BAIXADA')"
+
+# Prefixos de CNAE usados como proxy de potencial exportador
+PREFIXOS_EXPORTACAO = ('1', '2', '3', '62', '63', '01', '02', '03')
+
+_FAIXAS_IDADE = (
+    (1, '0-1 ano'),
+    (3, '1-3 anos'),
+    (5, '3-5 anos'),
+    (10, '5-10 anos'),
+    (20, '10-20 anos'),
+    (None, '20+ anos'),
+)
+
+
+def _data_sql(coluna: str) -> str:
+    return f"TRY_STRPTIME(regexp_replace(cast({coluna} as varchar), '[^0-9]', ''), '%Y%m%d')"
+
+
+def _view(cubo: str) -> str:
+    return f"kpi_{cubo}"
+
+
+# ==========================================
+# CONSTRUÇÃO (OFFLINE)
+# ==========================================
+
+def construir_cubos_kpi() -> Dict:
+    """
+    Constrói (ou reconstrói) os cubos de KPIs a partir dos Parquet da Receita.
+
+    Returns:
+        Manifesto com datas de referência, contagens e tempo de construção
+    """
+    inicio = time.time()
+    base = Path(Config.KPI_CUBO_DIR)
+    novo = base.parent / f"_{base.name}_novo"
+    shutil.rmtree(novo, ignore_errors=True)
+    novo.mkdir(parents=True, exist_ok=True)
+
+    def destino(nome):
+        return str(novo / f"{nome}.parquet").replace('\\', '/')
+
+    esq_est = esquema_parquet(Config.ARQUIVOS_PARQUET['estabelecimentos'])
+    col_dt_sit = next((c for c in ['data_da_situacao_cadastral', 'data_situacao_cadastral'] if c in esq_est), None)
+    dt_situacao = _data_sql(f"e.{col_dt_sit}") if col_dt_sit else "CAST(NULL AS TIMESTAMP)"
+    contato = ", ".join(
+        f"nullif(cast(e.{c} as varchar), '')"
+        for c in ['correio_eletronico', 'telefone_1', 'logradouro', 'cep'] if c in esq_est
+    ) or "NULL"
+    tem_empresas = Path(Config.ARQUIVOS_PARQUET['empresas']).exists()
+    porte = "CAST(m.porte_da_empresa AS VARCHAR)" if tem_empresas else "CAST(NULL AS VARCHAR)"
+    join_emp = f"LEFT JOIN {tabela('empresas')} m ON m.cnpj_basico = e.cnpj_basico" if tem_empresas else ""
+
+    con = obter_conexao().cursor()
+    try:
+        logger.info("Cubos de KPIs: preparando base de estabelecimentos...")
+        con.execute(f"""
+            CREATE TEMP TABLE _base AS SELECT
+                CAST(e.uf AS VARCHAR) AS uf,
+                CAST(e.municipio AS VARCHAR) AS municipio,
+                CAST(e.cnae_fiscal_principal AS VARCHAR) AS cnae,
+                CAST(e.situacao_cadastral AS VARCHAR) AS situacao,
+                {porte} AS porte,
+                {_data_sql('e.data_de_inicio_atividade')} AS dt_inicio,
+                {dt_situacao} AS dt_situacao,
+                coalesce({contato}) IS NOT NULL AS com_contato
+            FROM {tabela('estabelecimentos')} e {join_emp}
+        """)
+        max_dt = con.execute("SELECT max(dt_inicio) FROM _base").fetchone()[0]
+
+        logger.info("Cubos de KPIs: gravando fato...")
+        con.execute("""
+            CREATE TEMP TABLE _fato AS
+            SELECT uf, municipio, cnae, situacao, porte, strftime(dt_inicio, '%Y-%m') AS mes_inicio,
+                   count(*) AS n, count(*) FILTER (WHERE com_contato) AS com_contato
+            FROM _base GROUP BY ALL
+        """)
+        con.execute(f"COPY (SELECT * FROM _fato ORDER BY uf, municipio, cnae) TO '{destino('fato')}' (FORMAT PARQUET)")
+        con.execute(f"""
+            COPY (SELECT uf, cnae, situacao, porte, mes_inicio, sum(n) AS n, sum(com_contato) AS com_contato
+                  FROM _fato GROUP BY ALL ORDER BY uf, cnae)
+            TO '{destino('fato_uf')}' (FORMAT PARQUET)
+        """)
+        con.execute(f"""
+            COPY (SELECT uf, municipio, cnae, situacao, strftime(dt_inicio, '%Y-%m') AS mes_inicio,
+                         strftime(dt_situacao, '%Y-%m') AS mes_situacao, count(*) AS n
+                  FROM _base
+                  WHERE upper(situacao) IN {SITUACAO_BAIXADA} AND dt_situacao IS NOT NULL
+                  GROUP BY ALL ORDER BY uf, municipio, cnae)
+            TO '{destino('saidas')}' (FORMAT PARQUET)
+        """)
+        recentes_desde = None
+        if max_dt is not None:
+            recentes_desde = (pd.Timestamp(max_dt) - timedelta(days=JANELA_RECENTES_DIAS)).date()
+            con.execute(f"""
+                COPY (SELECT uf, municipio, cnae, situacao, CAST(dt_inicio AS DATE) AS data_inicio, count(*) AS n
+                      FROM _base WHERE dt_inicio >= CAST(? AS DATE)
+                      GROUP BY ALL ORDER BY data_inicio)
+                TO '{destino('recentes')}' (FORMAT PARQUET)
+            """, [recentes_desde])
+        if tem_empresas:
+            con.execute(f"""
+                COPY (SELECT CAST(porte_da_empresa AS VARCHAR) AS porte, count(*) AS n
+                      FROM {tabela('empresas')} WHERE porte_da_empresa IS NOT NULL GROUP BY 1)
+                TO '{destino('porte')}' (FORMAT PARQUET)
+            """)
+        linhas = {
+            nome: con.execute(f"SELECT count(*) FROM read_parquet('{destino(nome)}')").fetchone()[0]
+            for nome in CUBOS if (novo / f"{nome}.parquet").exists()
+        }
+        con.execute("DROP TABLE _fato")
+        con.execute("DROP TABLE _base")
+    finally:
+        con.close()
+
+    manifesto = {
+        'max_data_inicio': str(pd.Timestamp(max_dt).date()) if max_dt is not None else None,
+        'recentes_desde': str(recentes_desde) if recentes_desde else None,
+        'linhas': linhas,
+        'construido_em': time.time(),
+        'segundos': round(time.time() - inicio, 1),
+    }
+    with open(novo / ARQUIVO_MANIFESTO, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(base, ignore_errors=True)
+    novo.rename(base)
+    recarregar_cubos()
+    logger.info(f"✓ Cubos de KPIs construídos em {manifesto['segundos']}s: {linhas}")
+    return manifesto
+
+
+# ==========================================
+# CONSULTA
+# ==========================================
+
+@lru_cache(maxsize=None)
+def _manifesto() -> Optional[Dict]:
+    """Lê o manifesto e registra as views dos cubos na conexão compartilhada"""
+    try:
+        base = Path(Config.KPI_CUBO_DIR)
+        caminho = base / ARQUIVO_MANIFESTO
+        if not caminho.exists():
+            return None
+        with open(caminho, 'r', encoding='utf-8') as f:
+            manifesto = json.load(f)
+        for nome in CUBOS:
+            arquivo = base / f"{nome}.parquet"
+            if arquivo.exists():
+                registrar_view(_view(nome), arquivo)
+        return manifesto
+    except Exception as e:
+        logger.warning(f"Erro ao carregar cubos de KPIs: {e}")
+        return None
+
+
+def cubos_disponiveis() -> bool:
+    """Indica se os cubos principais foram construídos"""
+    return _manifesto() is not None and view_registrada(_view('fato')) and view_registrada(_view('fato_uf'))
+
+
+def recarregar_cubos():
+    """Descarta o manifesto em memória e re-registra as views (após reconstrução)"""
+    _manifesto.cache_clear()
+
+
+def _where(uf, municipio, cnae, ano_min, ano_max, col_ano: str = "substr(mes_inicio, 1, 4)") -> Tuple[str, List[Any]]:
+    """Filtros de /kpis/geral sobre as colunas dos cubos (mesma semântica da consulta bruta)"""
+    clausulas, params = [], []
+    if uf:
+        clausulas.append("upper(uf) = upper(?)")
+        params.append(str(uf))
+    if municipio:
+        clausulas.append("upper(municipio) = upper(?)")
+        params.append(str(municipio))
+    if cnae:
+        clausulas.append("cnae LIKE ?")
+        params.append(f"%{cnae}%")
+    if ano_min:
+        clausulas.append(f"CAST({col_ano} AS INTEGER) >= ?")
+        params.append(int(ano_min))
+    if ano_max:
+        clausulas.append(f"CAST({col_ano} AS INTEGER) <= ?")
+        params.append(int(ano_max))
+    return (" WHERE " + " AND ".join(clausulas)) if clausulas else "", params
+
+
+def _e(where_sql: str) -> str:
+    return f"{where_sql}{' AND ' if where_sql else ' WHERE '}"
+
+
+def _faixa_idade(anos: int) -> str:
+    for limite, rotulo in _FAIXAS_IDADE:
+        if limite is None or anos <= limite:
+            return rotulo
+    return _FAIXAS_IDADE[-1][1]
+
+
+def _entradas_30_dias(con, manifesto, max_mes: Optional[str], uf, municipio, cnae, ano_min, ano_max):
+    """
+    Data de referência (última abertura sob os filtros) e aberturas nos 30 dias
+    anteriores. Usa o cubo de recentes quando a janela está coberta; senão
+    consulta os dados brutos.
+    """
+    desde = manifesto.get('recentes_desde')
+    if desde and max_mes and view_registrada(_view('recentes')):
+        where_sql, params = _where(uf, municipio, cnae, ano_min, ano_max, col_ano="year(data_inicio)")
+        max_dt = con.execute(f"SELECT max(data_inicio) FROM {_view('recentes')}{where_sql}", params).fetchone()[0]
+        if max_dt is not None and pd.Timestamp(max_dt).strftime('%Y-%m') == max_mes:
+            max_dt = pd.Timestamp(max_dt)
+            if (max_dt - timedelta(days=30)).date() >= pd.Timestamp(desde).date():
+                c = con.execute(
+                    f"SELECT coalesce(sum(n), 0) FROM {_view('recentes')}{_e(where_sql)}data_inicio >= CAST(? AS DATE)",
+                    params + [(max_dt - timedelta(days=30)).date()]
+                ).fetchone()[0]
+                return max_dt, int(c)
+
+    # Fora da janela do cubo: consulta pontual nos dados brutos
+    dt_inicio = _data_sql('data_de_inicio_atividade')
+    clausulas, params = [], []
+    if uf:
+        clausulas.append("upper(cast(uf as varchar)) = upper(?)")
+        params.append(str(uf))
+    if municipio:
+        clausulas.append("upper(cast(municipio as varchar)) = upper(?)")
+        params.append(str(municipio))
+    if cnae:
+        clausulas.append("cast(cnae_fiscal_principal as varchar) LIKE ?")
+        params.append(f"%{cnae}%")
+    if ano_min:
+        clausulas.append(f"year({dt_inicio}) >= ?")
+        params.append(int(ano_min))
+    if ano_max:
+        clausulas.append(f"year({dt_inicio}) <= ?")
+        params.append(int(ano_max))
+    where_sql = (" WHERE " + " AND ".join(clausulas)) if clausulas else ""
+    fp = tabela('estabelecimentos')
+    try:
+        max_dt = con.execute(f"SELECT max({dt_inicio}) FROM {fp}{where_sql}", params).fetchone()[0]
+        max_dt = pd.Timestamp(max_dt) if max_dt is not None else pd.Timestamp.now()
+        c = con.execute(
+            f"SELECT count(*) FROM {fp}{_e(where_sql)}{dt_inicio} >= CAST(? AS DATE)",
+            params + [(max_dt - timedelta(days=30)).date()]
+        ).fetchone()[0]
+        return max_dt, int(c)
+    except Exception:
+        return pd.Timestamp.now(), None
+
+
+def kpis_geral_insumos_cubo(uf=None, municipio=None, cnae=None, ano_min=None, ano_max=None) -> Optional[Dict[str, Any]]:
+    """
+    Insumos de /kpis/geral (contagens, séries e rankings) a partir dos cubos.
+
+    Returns:
+        Mesmo dict produzido pela consulta bruta, ou None sem cubos
+    """
+    manifesto = _manifesto()
+    if manifesto is None or not cubos_disponiveis():
+        return None
+    con = obter_cursor()
+    cubo = _view('fato') if (municipio or uf) else _view('fato_uf')
+    where_sql, params = _where(uf, municipio, cnae, ano_min, ano_max)
+
+    export = " OR ".join(f"cnae LIKE '{p}%'" for p in PREFIXOS_EXPORTACAO)
+    total, ativas, com_contato, exportacao, max_mes = con.execute(
+        f"SELECT coalesce(sum(n), 0), coalesce(sum(n) FILTER (WHERE situacao IN {SITUACAO_ATIVA}), 0), "
+        f"coalesce(sum(com_contato), 0), coalesce(sum(n) FILTER (WHERE {export}), 0), max(mes_inicio) "
+        f"FROM {cubo}{where_sql}", params
+    ).fetchone()
+    total, ativas = int(total), int(ativas)
+
+    max_dt, entradas_30dias = _entradas_30_dias(con, manifesto, max_mes, uf, municipio, cnae, ano_min, ano_max)
+    ref_ano = max_dt.year
+
+    ent = con.execute(
+        f"SELECT mes_inicio AS ym, sum(n) AS c FROM {cubo}{_e(where_sql)}mes_inicio IS NOT NULL "
+        f"GROUP BY ym ORDER BY ym DESC LIMIT 12", params
+    ).df()
+    entradas = [{'label': str(r['ym']), 'count': int(r['c'])} for _, r in ent.iloc[::-1].iterrows()] if not ent.empty else []
+
+    anos = con.execute(
+        f"SELECT CAST(substr(mes_inicio, 1, 4) AS INTEGER) AS ano, sum(n) AS c FROM {cubo}"
+        f"{_e(where_sql)}mes_inicio IS NOT NULL GROUP BY ano", params
+    ).df()
+    if not anos.empty:
+        idades = ref_ano - anos['ano']
+        idade_media = float((idades * anos['c']).sum() / max(1, anos['c'].sum()))
+        faixas = anos.assign(faixa=idades.map(_faixa_idade)).groupby('faixa')['c'].sum()
+        idade_distribuicao = [
+            {'label': rotulo, 'count': int(faixas[rotulo])} for _, rotulo in _FAIXAS_IDADE if rotulo in faixas.index
+        ]
+    else:
+        idade_media, idade_distribuicao = None, []
+
+    saidas = []
+    if view_registrada(_view('saidas')):
+        where_sai, params_sai = _where(uf, municipio, cnae, ano_min, ano_max)
+        sai = con.execute(
+            f"SELECT mes_situacao AS ym, sum(n) AS c FROM {_view('saidas')}"
+            f"{_e(where_sai)}upper(situacao) IN {SITUACAO_BAIXADA} GROUP BY ym ORDER BY ym DESC LIMIT 12",
+            params_sai
+        ).df()
+        saidas = [{'label': str(r['ym']), 'count': int(r['c'])} for _, r in sai.iloc[::-1].iterrows()] if not sai.empty else []
+
+    tem_cnaes = view_registrada('cnaes')
+    top = con.execute(
+        f"SELECT cnae, sum(n) AS c FROM {cubo}{where_sql} GROUP BY cnae ORDER BY c DESC LIMIT {15 if tem_cnaes else 10}",
+        params
+    ).df()
+    descricoes = {}
+    if tem_cnaes and not top.empty:
+        try:
+            codigos = top['cnae'].astype(str).tolist()
+            df_desc = con.execute(
+                f"SELECT cast(codigo as varchar) AS cnae, descricao FROM cnaes "
+                f"WHERE cast(codigo as varchar) IN ({', '.join('?' * len(codigos))})", codigos
+            ).df()
+            descricoes = dict(zip(df_desc['cnae'], df_desc['descricao']))
+        except Exception as e:
+            logger.warning(f"Erro ao carregar descrições de CNAEs: {e}")
+    setores = [
+        {
+            'label': str(descricoes[r['cnae']])[:50] if descricoes.get(r['cnae']) else (str(r['cnae']).zfill(7) if tem_cnaes else str(r['cnae'])),
+            'cnae': str(r['cnae']).zfill(7),
+            'count': int(r['c'])
+        }
+        for _, r in top.iterrows()
+    ]
+
+    geo = 'municipio' if uf else 'uf'
+    geo_df = con.execute(
+        f"SELECT {geo} AS label, sum(n) AS c FROM {cubo}{where_sql} GROUP BY {geo} ORDER BY c DESC LIMIT 10", params
+    ).df()
+    mapa = [{'label': str(r['label']), 'count': int(r['c'])} for _, r in geo_df.iterrows()] if not geo_df.empty else []
+
+    m1 = (max_dt - pd.DateOffset(months=1)).strftime('%Y-%m')
+    m2 = (max_dt - pd.DateOffset(months=2)).strftime('%Y-%m')
+    cres = con.execute(
+        f"SELECT uf, coalesce(sum(n) FILTER (WHERE mes_inicio = ?), 0) AS c1, "
+        f"coalesce(sum(n) FILTER (WHERE mes_inicio = ?), 0) AS c2 "
+        f"FROM {cubo}{_e(where_sql)}mes_inicio IN (?, ?) GROUP BY uf",
+        [m1, m2] + params + [m1, m2]
+    ).df()
+    estados_crescimento = sorted(
+        [{'label': str(r['uf']), 'delta': int(r['c1'] - r['c2'])} for _, r in cres.iterrows()],
+        key=lambda x: x['delta'], reverse=True
+    )[:10]
+
+    return {
+        'max_dt': max_dt,
+        'total_filtrados': total,
+        'total_ativas': ativas,
+        'entradas_30dias': entradas_30dias,
+        'idade_media': idade_media,
+        'entradas': entradas,
+        'saidas': saidas,
+        'pct_validos': float(int(com_contato) / max(1, total) * 100.0),
+        'setores': setores,
+        'mapa': mapa,
+        'estados_crescimento': estados_crescimento,
+        'idade_distribuicao': idade_distribuicao,
+        'taxa_sobrevivencia': (ativas / max(1, total)) * 100.0 if total > 0 else None,
+        'exportacao': int(exportacao),
+    }
+
+
+def kpis_base_cubo() -> Optional[Dict[str, Any]]:
+    """
+    Tops e séries de /kpis/base a partir dos cubos.
+
+    Returns:
+        Dict com 'uf', 'cnae', 'situacoes', 'porte' e 'cards', ou None sem cubos
+    """
+    if _manifesto() is None or not cubos_disponiveis():
+        return None
+    con = obter_cursor()
+    cubo = _view('fato_uf')
+
+    df_uf = con.execute(
+        f"SELECT uf AS label, sum(n) AS count FROM {cubo} WHERE uf IS NOT NULL GROUP BY uf ORDER BY count DESC LIMIT 10"
+    ).df()
+    df_cnae = con.execute(
+        f"SELECT cnae, sum(n) AS count FROM {cubo} WHERE cnae IS NOT NULL GROUP BY cnae ORDER BY count DESC LIMIT 15"
+    ).df()
+    descricoes = {}
+    if view_registrada('cnaes') and not df_cnae.empty:
+        try:
+            codigos = df_cnae['cnae'].astype(str).tolist()
+            df_desc = con.execute(
+                f"SELECT cast(codigo as varchar) AS cnae, descricao FROM cnaes "
+                f"WHERE cast(codigo as varchar) IN ({', '.join('?' * len(codigos))})", codigos
+            ).df()
+            descricoes = dict(zip(df_desc['cnae'], df_desc['descricao']))
+        except Exception as e:
+            logger.warning(f"Erro ao buscar CNAEs: {e}")
+    df_sit = con.execute(
+        f"SELECT situacao AS sit, sum(n) AS count FROM {cubo} GROUP BY situacao ORDER BY count DESC"
+    ).df()
+    df_porte = con.execute(
+        f"SELECT porte, n AS count FROM {_view('porte')} ORDER BY count DESC"
+    ).df() if view_registrada(_view('porte')) else pd.DataFrame(columns=['porte', 'count'])
+
+    df_ent = con.execute(
+        f"SELECT replace(mes_inicio, '-', '') AS mes, sum(n) AS count FROM {cubo} "
+        f"WHERE mes_inicio >= '2023-01' GROUP BY 1 ORDER BY 1"
+    ).df()
+    df_sai = con.execute(
+        f"SELECT replace(mes_situacao, '-', '') AS mes, sum(n) AS count FROM {_view('saidas')} "
+        f"WHERE upper(situacao) IN {SITUACAO_BAIXADA} AND mes_situacao >= '2023-01' GROUP BY 1 ORDER BY 1"
+    ).df() if view_registrada(_view('saidas')) else pd.DataFrame(columns=['mes', 'count'])
+    total_ativas = con.execute(
+        f"SELECT coalesce(sum(n), 0) FROM {cubo} WHERE situacao IN {SITUACAO_ATIVA}"
+    ).fetchone()[0]
+
+    return {
+        'uf': df_uf,
+        'cnae': df_cnae.assign(descricao=df_cnae['cnae'].map(descricoes)) if descricoes else df_cnae,
+        'situacoes': df_sit,
+        'porte': df_porte,
+        'entradas': df_ent,
+        'saidas': df_sai,
+        'total_ativas': int(total_ativas),
+    }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    resultado = construir_cubos_kpi()
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
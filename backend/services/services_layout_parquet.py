@@ -0,0 +1,191 @@
+"""
+Layout otimizado dos Parquet da Receita
+
+Etapa offline que reescreve estabelecimentos, empresas, sócios e simples em
+datasets (diretórios) dentro de Config.DATASETS_DIR:
+
+  - estabelecimentos particionado no estilo Hive por UF (uf=SP/...), de modo
+    que filtros por UF leem só a partição correspondente;
+  - todas as tabelas ordenadas por cnpj_basico, o que deixa as estatísticas
+    min/max dos row groups estreitas e permite ao DuckDB/pyarrow descartar
+    row groups em filtros e junções por CNPJ;
+  - row groups de tamanho fixo (Config.LAYOUT_ROW_GROUP) e compressão zstd;
+    colunas de texto com poucos valores distintos (situação, porte, CNAE,
+    município) são gravadas com dicionário pelo writer Parquet do DuckDB.
+
+Depois de gerados, Config.ARQUIVOS_PARQUET passa a apontar para os
+diretórios (ver Config.USAR_DATASETS) e as views DuckDB os leem com
+hive_partitioning. Quando chega um dump mais novo que o usado na geração
+(origem/origem_mtime do manifesto), o arquivo monolítico volta a ser usado
+até o layout ser gerado de novo.
+
+Uso:
+    python -m services.services_layout_parquet [tabela ...]
+"""
+
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pyarrow.parquet as pq
+
+from core.config import Config
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_MANIFESTO = 'manifesto.json'
+
+# Tabela → coluna de partição Hive (ou None) e colunas de ordenação
+LAYOUTS = {
+    'estabelecimentos': {'particao': 'uf', 'ordem': ('cnpj_basico', 'cnpj_ordem', 'cnpj_dv')},
+    'empresas': {'particao': None, 'ordem': ('cnpj_basico',)},
+    'socios': {'particao': None, 'ordem': ('cnpj_basico',)},
+    'simples': {'particao': None, 'ordem': ('cnpj_basico',)},
+}
+
+
+def _caminho_sql(caminho) -> str:
+    return str(caminho).replace('\\', '/').replace("'", "''")
+
+
+def _origem(tabela: str) -> Path:
+    """Arquivo monolítico original (ignora o dataset já gerado)"""
+    return Config._find_file(Config.DATA_DIR, Config.PADROES_PARQUET[tabela])
+
+
+def _opcoes_copy() -> str:
+    return f"FORMAT PARQUET, COMPRESSION zstd, ROW_GROUP_SIZE {int(Config.LAYOUT_ROW_GROUP)}"
+
+
+def _ordem_sql(colunas: List[str], ordem) -> str:
+    presentes = [f'"{c}"' for c in ordem if c in colunas]
+    return f" ORDER BY {', '.join(presentes)}" if presentes else ''
+
+
+# ==========================================
+# CONSTRUÇÃO (OFFLINE)
+# ==========================================
+
+def _construir_tabela(con, tabela: str, origem: Path, destino: Path) -> Dict:
+    """Gera o dataset da tabela em um diretório temporário e o troca pelo atual"""
+    layout = LAYOUTS[tabela]
+    colunas = [c.name for c in pq.read_schema(str(origem))]
+    particao = layout['particao'] if layout['particao'] in colunas else None
+    ordem = _ordem_sql(colunas, layout['ordem'])
+    origem_sql = _caminho_sql(origem)
+
+    novo = destino.parent / f"_{tabela}_novo"
+    shutil.rmtree(novo, ignore_errors=True)
+    novo.mkdir(parents=True, exist_ok=True)
+
+    if particao:
+        # 1) Uma varredura da origem, separando pela coluna de partição
+        temp = destino.parent / f"_{tabela}_tmp"
+        shutil.rmtree(temp, ignore_errors=True)
+        con.execute(
+            f"COPY (SELECT * FROM read_parquet('{origem_sql}')) TO '{_caminho_sql(temp)}' "
+            f"(FORMAT PARQUET, PARTITION_BY (\"{particao}\"), OVERWRITE_OR_IGNORE)"
+        )
+        # 2) Ordena cada partição e grava com o row group configurado. A coluna
+        #    de partição fica só no nome do diretório (restaurada na leitura)
+        for part in sorted(temp.glob(f'{particao}=*')):
+            saida = novo / part.name
+            saida.mkdir(parents=True, exist_ok=True)
+            selecao = ', '.join(f'"{c}"' for c in colunas if c != particao)
+            con.execute(
+                f"COPY (SELECT {selecao} FROM read_parquet('{_caminho_sql(part)}/*.parquet'){ordem}) "
+                f"TO '{_caminho_sql(saida / 'parte_0.parquet')}' ({_opcoes_copy()})"
+            )
+        shutil.rmtree(temp, ignore_errors=True)
+    else:
+        con.execute(
+            f"COPY (SELECT * FROM read_parquet('{origem_sql}'){ordem}) "
+            f"TO '{_caminho_sql(novo / 'parte_0.parquet')}' ({_opcoes_copy()})"
+        )
+
+    # Troca o dataset anterior pelo novo
+    antigo = destino.parent / f"_{tabela}_antigo"
+    shutil.rmtree(antigo, ignore_errors=True)
+    if destino.exists():
+        destino.rename(antigo)
+    novo.rename(destino)
+    shutil.rmtree(antigo, ignore_errors=True)
+
+    arquivos = sorted(destino.rglob('*.parquet'))
+    return {
+        'particao': particao,
+        'ordem': [c for c in layout['ordem'] if c in colunas],
+        'arquivos': len(arquivos),
+        'linhas': sum(pq.read_metadata(str(a)).num_rows for a in arquivos),
+    }
+
+
+def gerar_layout(tabelas: Optional[List[str]] = None) -> Dict:
+    """
+    Reescreve as tabelas da Receita no layout particionado e ordenado.
+
+    Args:
+        tabelas: Subconjunto de LAYOUTS (padrão: todas)
+
+    Returns:
+        Manifesto com as tabelas geradas e o tempo de cada uma
+    """
+    from services.services_duckdb_pool import obter_conexao
+
+    base = Path(Config.DATASETS_DIR)
+    base.mkdir(parents=True, exist_ok=True)
+    manifesto = obter_manifesto() or {'tabelas': {}}
+    con = obter_conexao().cursor()
+    try:
+        for tabela in (tabelas or list(LAYOUTS)):
+            if tabela not in LAYOUTS:
+                logger.warning(f"Layout: tabela desconhecida {tabela}")
+                continue
+            origem = _origem(tabela)
+            if not origem.is_file():
+                logger.warning(f"Layout: arquivo de {tabela} não encontrado ({origem})")
+                continue
+            inicio = time.time()
+            logger.info(f"Layout: reescrevendo {tabela}...")
+            info = _construir_tabela(con, tabela, origem, base / tabela)
+            info.update({
+                'origem': str(origem),
+                'origem_mtime': origem.stat().st_mtime,
+                'row_group': int(Config.LAYOUT_ROW_GROUP),
+                'construido_em': time.time(),
+                'segundos': round(time.time() - inicio, 1),
+            })
+            manifesto['tabelas'][tabela] = info
+            logger.info(f"✓ Layout de {tabela}: {info['linhas']} linhas em {info['arquivos']} arquivos ({info['segundos']}s)")
+    finally:
+        con.close()
+
+    with open(base / ARQUIVO_MANIFESTO, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    # Os caminhos resolvidos passam a apontar para os diretórios gerados;
+    # views e artefatos derivados são atualizados por services_versao_dados
+    Config.recarregar_arquivos_parquet()
+    return manifesto
+
+
+def obter_manifesto() -> Optional[Dict]:
+    """Lê o manifesto dos datasets gerados, se existir"""
+    try:
+        caminho = Path(Config.DATASETS_DIR) / ARQUIVO_MANIFESTO
+        if not caminho.exists():
+            return None
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Erro ao ler manifesto dos datasets: {e}")
+        return None
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    resultado = gerar_layout([a for a in sys.argv[1:] if not a.startswith('-')] or None)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
@@ -5,8 +5,10 @@ Calcula compatibilidade entre empresa e licitação baseado em múltiplos fatore
 
 import logging
 from typing import Dict, List, Optional, Tuple
-import re
 from datetime import datetime, timedelta
+from core.config import Config
+from core.tabelas_referencia import UF_REGIAO_SLUG, normalizar_texto, parse_data
+from services.services_cache_performance import obter_cache_b2g
 
 logger = logging.getLogger(__name__)
 
@@ -20,15 +22,6 @@ class MatchB2GCalculator:
     PESO_GEOGRAFIA = 0.20  # 20% - Proximidade geográfica
     PESO_HISTORICO = 0.10  # 10% - Histórico da empresa
     
-    # Mapeamento de UFs para regiões
-    REGIOES = {
-        'norte': ['AC', 'AP', 'AM', 'PA', 'RO', 'RR', 'TO'],
-        'nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
-        'centro_oeste': ['DF', 'GO', 'MT', 'MS'],
-        'sudeste': ['ES', 'MG', 'RJ', 'SP'],
-        'sul': ['PR', 'RS', 'SC']
-    }
-    
     # Faixas de valor por porte (em R$)
     FAIXAS_PORTE = {
         '01': {'nome': 'MEI', 'min': 0, 'max': 81000},
@@ -266,8 +259,9 @@ class MatchB2GCalculator:
             if data_abertura:
                 try:
                     # Formato: YYYYMMDD
-                    data_str = str(data_abertura)
-                    data = datetime.strptime(data_str, '%Y%m%d')
+                    data = parse_data(str(data_abertura), ('%Y%m%d',))
+                    if data is None:
+                        raise ValueError(f"data inválida: {data_abertura}")
                     anos_atividade = (datetime.now() - data).days / 365.25
                     
                     if anos_atividade >= 5:
@@ -295,19 +289,13 @@ class MatchB2GCalculator:
     def _normalizar_texto(self, texto: str) -> str:
         """Normaliza texto removendo caracteres especiais"""
         try:
-            texto = str(texto).lower()
-            texto = re.sub(r'[^a-z0-9\s]', ' ', texto)
-            texto = re.sub(r'\s+', ' ', texto).strip()
-            return texto
+            return normalizar_texto(str(texto))
         except:
             return ''
     
     def _get_regiao(self, uf: str) -> str:
         """Retorna região do UF"""
-        for regiao, ufs in self.REGIOES.items():
-            if uf in ufs:
-                return regiao
-        return 'desconhecida'
+        return UF_REGIAO_SLUG.get(uf, 'desconhecida')
     
     def _classificar_match(self, score: int) -> str:
         """Classifica match em categorias"""
@@ -360,7 +348,7 @@ class MatchB2GCalculator:
 # Função auxiliar para facilitar uso
 def calcular_match_licitacao(empresa_data: Dict, licitacao_data: Dict) -> Dict:
     """
-    Wrapper function para calcular match
+    Wrapper function para calcular match (em cache por CNPJ e licitação)
     
     Args:
         empresa_data: Dict com dados da empresa
@@ -369,5 +357,16 @@ def calcular_match_licitacao(empresa_data: Dict, licitacao_data: Dict) -> Dict:
     Returns:
         Dict com resultado do match
     """
+    cnpj = str(empresa_data.get('cnpj') or '')
+    licitacao_id = str(licitacao_data.get('id') or licitacao_data.get('numeroControlePNCP') or '')
+    cache_service = obter_cache_b2g() if cnpj and licitacao_id else None
+    if cache_service is not None:
+        resultado = cache_service.get_match(cnpj, licitacao_id)
+        if resultado is not None:
+            return resultado
+
     calculator = MatchB2GCalculator()
-    return calculator.calcular_match(empresa_data, licitacao_data)
+    resultado = calculator.calcular_match(empresa_data, licitacao_data)
+    if cache_service is not None and resultado.get('componentes'):
+        cache_service.set_match(cnpj, licitacao_id, resultado, Config.MATCH_CACHE_TTL)
+    return resultado
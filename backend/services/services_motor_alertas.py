@@ -0,0 +1,245 @@
+"""
+Motor de casamento de alertas de licitações
+
+Compila os critérios de todos os alertas ativos em índices compartilhados e
+casa cada lote de licitações contra todos os alertas de uma vez, em vez de
+avaliar alerta por alerta:
+
+  - cada alerta ocupa um bit; conjuntos de alertas são inteiros (bitsets);
+  - palavras-chave e órgãos: listas invertidas termo → frases; uma frase
+    casa quando todos os seus termos aparecem no texto (sem acentos, sem
+    diferenciar maiúsculas);
+  - UFs e modalidades: bitset por valor;
+  - faixas de valor e de prazo (dias até o encerramento): limites
+    ordenados com OR acumulado, de modo que os alertas que aceitam um
+    valor saem de uma busca binária por limite.
+
+Um alerta sem determinado critério aceita qualquer licitação nesse
+critério. CNAEs não constam nas publicações do PNCP e não restringem.
+"""
+
+import logging
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def termos(texto: Any) -> List[str]:
+    """Texto → termos minúsculos, sem acentos"""
+    if texto is None:
+        return []
+    s = unicodedata.normalize('NFKD', str(texto))
+    s = ''.join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    return re.findall(r'[a-z0-9]+', s)
+
+
+def _frases(valor) -> List[Tuple[str, ...]]:
+    """'a b, c' ou ['a b', 'c'] → [('a', 'b'), ('c',)]"""
+    if valor in (None, '', [], ()):
+        return []
+    partes = valor if isinstance(valor, (list, tuple, set)) else str(valor).replace(';', ',').split(',')
+    frases = []
+    for parte in partes:
+        t = tuple(dict.fromkeys(termos(parte)))
+        if t:
+            frases.append(t)
+    return frases
+
+
+def _lista(valor) -> List[str]:
+    if valor in (None, '', [], ()):
+        return []
+    if not isinstance(valor, (list, tuple, set)):
+        valor = str(valor).replace(';', ',').split(',')
+    return [str(v).strip() for v in valor if str(v).strip()]
+
+
+def _bits(mascara: int) -> Iterable[int]:
+    while mascara:
+        menor = mascara & -mascara
+        yield menor.bit_length() - 1
+        mascara ^= menor
+
+
+class _IndiceFrases:
+    """Frases por termo; devolve o bitset dos alertas com alguma frase presente no texto"""
+
+    def __init__(self):
+        self.frases: List[Tuple[Tuple[str, ...], int]] = []
+        self.postings: Dict[str, List[int]] = {}
+        self.sem_criterio = 0
+
+    def adicionar(self, bit: int, frases: List[Tuple[str, ...]]):
+        if not frases:
+            self.sem_criterio |= 1 << bit
+            return
+        for frase in frases:
+            self.postings.setdefault(frase[0], []).append(len(self.frases))
+            self.frases.append((frase, 1 << bit))
+
+    def mascara(self, termos_texto: Set[str]) -> int:
+        resultado = self.sem_criterio
+        for termo in termos_texto:
+            for i in self.postings.get(termo, ()):
+                frase, bits = self.frases[i]
+                if len(frase) == 1 or termos_texto.issuperset(frase):
+                    resultado |= bits
+        return resultado
+
+
+class _IndiceValores:
+    """Bitset por valor discreto (UF, modalidade)"""
+
+    def __init__(self):
+        self.por_valor: Dict[str, int] = {}
+        self.sem_criterio = 0
+
+    def adicionar(self, bit: int, valores: List[str]):
+        if not valores:
+            self.sem_criterio |= 1 << bit
+            return
+        for v in valores:
+            self.por_valor[v] = self.por_valor.get(v, 0) | (1 << bit)
+
+    def mascara(self, valor: Optional[str]) -> int:
+        return self.sem_criterio | self.por_valor.get(valor, 0)
+
+
+class _IndiceFaixas:
+    """
+    Faixas [mínimo, máximo] por alerta. Mínimos e máximos ficam ordenados
+    com o OR acumulado dos bits (prefixo para mínimos, sufixo para máximos),
+    e a consulta de um valor faz uma busca binária em cada lista.
+    """
+
+    def __init__(self):
+        self._minimos: List[Tuple[float, int]] = []
+        self._maximos: List[Tuple[float, int]] = []
+        self.sem_minimo = 0
+        self.sem_maximo = 0
+
+    def adicionar(self, bit: int, minimo: Optional[float], maximo: Optional[float]):
+        if minimo is None:
+            self.sem_minimo |= 1 << bit
+        else:
+            self._minimos.append((float(minimo), 1 << bit))
+        if maximo is None:
+            self.sem_maximo |= 1 << bit
+        else:
+            self._maximos.append((float(maximo), 1 << bit))
+
+    def compilar(self):
+        self._minimos.sort()
+        self._maximos.sort()
+        self.chaves_min = [m for m, _ in self._minimos]
+        self.prefixo_min = []
+        acc = 0
+        for _, bits in self._minimos:
+            acc |= bits
+            self.prefixo_min.append(acc)
+        self.chaves_max = [m for m, _ in self._maximos]
+        self.sufixo_max = [0] * len(self._maximos)
+        acc = 0
+        for i in range(len(self._maximos) - 1, -1, -1):
+            acc |= self._maximos[i][1]
+            self.sufixo_max[i] = acc
+
+    def mascara(self, valor: Optional[float]) -> int:
+        if valor is None:
+            return self.sem_minimo & self.sem_maximo
+        i = bisect_right(self.chaves_min, valor)
+        aceitam_min = self.sem_minimo | (self.prefixo_min[i - 1] if i else 0)
+        j = bisect_left(self.chaves_max, valor)
+        aceitam_max = self.sem_maximo | (self.sufixo_max[j] if j < len(self.sufixo_max) else 0)
+        return aceitam_min & aceitam_max
+
+
+def _numero(valor) -> Optional[float]:
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return None
+    return None if numero != numero else numero
+
+
+class MotorAlertas:
+    """
+    Alertas compilados para casamento em lote.
+
+    Uso:
+        motor = MotorAlertas(alertas)   # [{'id': ..., 'criterios': {...}}]
+        motor.casar_lote(licitacoes)    # {alerta_id: [índices das licitações]}
+    """
+
+    def __init__(self, alertas: List[Dict]):
+        self.ids: List[Any] = []
+        self.palavras = _IndiceFrases()
+        self.orgaos = _IndiceFrases()
+        self.ufs = _IndiceValores()
+        self.modalidades = _IndiceValores()
+        self.valores = _IndiceFaixas()
+        self.prazos = _IndiceFaixas()
+        for bit, alerta in enumerate(alertas):
+            c = alerta.get('criterios') or {}
+            self.ids.append(alerta['id'])
+            self.palavras.adicionar(bit, _frases(c.get('palavras_chave')))
+            self.orgaos.adicionar(bit, _frases(c.get('orgaos')))
+            self.ufs.adicionar(bit, [u.upper() for u in _lista(c.get('ufs'))])
+            self.modalidades.adicionar(bit, [str(int(m)) for m in _lista(c.get('modalidades')) if m.isdigit()])
+            self.valores.adicionar(bit, _numero(c.get('valor_minimo')), _numero(c.get('valor_maximo')))
+            self.prazos.adicionar(bit, _numero(c.get('prazo_minimo_dias')), _numero(c.get('prazo_maximo_dias')))
+        self.valores.compilar()
+        self.prazos.compilar()
+        self.todos = (1 << len(self.ids)) - 1
+
+    def mascara(self, licitacao: Dict, hoje: Optional[date] = None) -> int:
+        """
+        Bitset dos alertas que aceitam a licitação.
+
+        Args:
+            licitacao: Campos normalizados do espelho (objeto, orgao, uf,
+                modalidade, valor, data_encerramento)
+        """
+        m = self.todos
+        m &= self.ufs.mascara(str(licitacao.get('uf') or '').upper())
+        if not m:
+            return 0
+        modalidade = _numero(licitacao.get('modalidade'))
+        m &= self.modalidades.mascara(str(int(modalidade)) if modalidade is not None else None)
+        if not m:
+            return 0
+        m &= self.valores.mascara(_numero(licitacao.get('valor')))
+        if not m:
+            return 0
+        encerramento = licitacao.get('data_encerramento')
+        prazo = None
+        if encerramento is not None and encerramento == encerramento:  # NaT/NaN
+            fim = encerramento.date() if hasattr(encerramento, 'date') else encerramento
+            prazo = float((fim - (hoje or date.today())).days)
+        m &= self.prazos.mascara(prazo)
+        if not m:
+            return 0
+        m &= self.palavras.mascara(set(termos(licitacao.get('objeto'))))
+        if not m:
+            return 0
+        return m & self.orgaos.mascara(set(termos(licitacao.get('orgao'))))
+
+    def casar_lote(self, licitacoes: List[Dict]) -> Dict[Any, List[int]]:
+        """
+        Casa o lote inteiro contra todos os alertas.
+
+        Returns:
+            {alerta_id: [índices das licitações que o alerta aceita]}
+        """
+        hoje = date.today()
+        resultado: Dict[Any, List[int]] = {}
+        if not self.ids:
+            return resultado
+        for i, licitacao in enumerate(licitacoes):
+            for bit in _bits(self.mascara(licitacao, hoje)):
+                resultado.setdefault(self.ids[bit], []).append(i)
+        return resultado
@@ -0,0 +1,194 @@
+"""
+Coletor concorrente da API de consulta do PNCP
+
+Busca páginas em paralelo num pool limitado de threads, reaproveitando
+conexões HTTP de uma única requests.Session (pool do urllib3 do tamanho da
+concorrência). Respostas 429/5xx e falhas de rede são repetidas com backoff
+exponencial (respeitando Retry-After), e cada página bem-sucedida fica no
+diskcache por Config.PNCP_PAGINA_TTL.
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.config import Config
+from services.compat import requests_kwargs
+from services.services_cache_service import cache, em_voo
+
+logger = logging.getLogger(__name__)
+
+STATUS_REPETIR = (429, 500, 502, 503, 504)
+
+_lock = threading.Lock()
+_sessao: Optional[requests.Session] = None
+
+
+def obter_sessao() -> requests.Session:
+    """Sessão HTTP compartilhada com pool de conexões do tamanho da concorrência"""
+    global _sessao
+    with _lock:
+        if _sessao is None:
+            sessao = requests.Session()
+            tamanho = max(int(Config.PNCP_CONCORRENCIA), 1)
+            adaptador = HTTPAdapter(pool_connections=tamanho, pool_maxsize=tamanho, max_retries=0)
+            sessao.mount('https://', adaptador)
+            sessao.mount('http://', adaptador)
+            _sessao = sessao
+        return _sessao
+
+
+def _espera(tentativa: int, resposta: Optional[requests.Response] = None) -> float:
+    """Backoff exponencial com jitter; usa Retry-After (segundos) quando informado"""
+    if resposta is not None:
+        try:
+            return min(float(resposta.headers.get('Retry-After')), 30.0)
+        except (TypeError, ValueError):
+            pass
+    return float(Config.PNCP_BACKOFF) * (2 ** tentativa) * (1 + random.random() / 2)
+
+
+def obter_json(url: str, params: Dict[str, Any], cache_key: Optional[str] = None,
+               timeout: Optional[int] = None) -> Optional[Any]:
+    """
+    GET com repetição e cache por página.
+
+    Returns:
+        JSON decodificado, ou None se todas as tentativas falharem
+    """
+    if cache_key:
+        try:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+        except Exception:
+            pass
+        # Mesma página pedida ao mesmo tempo: uma requisição só
+        return em_voo(cache_key, lambda: _baixar_json(url, params, cache_key, timeout))
+    return _baixar_json(url, params, None, timeout)
+
+
+def _baixar_json(url: str, params: Dict[str, Any], cache_key: Optional[str], timeout: Optional[int]) -> Optional[Any]:
+    sessao = obter_sessao()
+    kw = requests_kwargs(timeout=timeout or int(Config.PNCP_TIMEOUT), headers={"User-Agent": "Mozilla/5.0"})
+    tentativas = max(int(Config.PNCP_TENTATIVAS), 1)
+    for tentativa in range(tentativas):
+        resposta = None
+        try:
+            resposta = sessao.get(url, params=params, **kw)
+            if resposta.status_code == 204:
+                return {}
+            if resposta.ok:
+                js = resposta.json()
+                if cache_key:
+                    try:
+                        cache.set(cache_key, js, expire=int(Config.PNCP_PAGINA_TTL))
+                    except Exception:
+                        pass
+                return js
+            if resposta.status_code not in STATUS_REPETIR:
+                logger.warning(f"PNCP {resposta.status_code} em {url} {params}: {resposta.text[:200]}")
+                return None
+        except requests.exceptions.SSLError as e:
+            # Proxies corporativos com certificado próprio
+            if kw.get('verify', True):
+                logger.warning(f"PNCP SSL, repetindo sem verificação: {e}")
+                kw['verify'] = False
+                continue
+            logger.error(f"PNCP SSL erro: {e}")
+            return None
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ValueError) as e:
+            logger.warning(f"PNCP tentativa {tentativa + 1}/{tentativas} falhou ({url}): {e}")
+        if tentativa + 1 < tentativas:
+            time.sleep(_espera(tentativa, resposta))
+    logger.error(f"PNCP sem resposta após {tentativas} tentativas: {url} {params}")
+    return None
+
+
+def itens_resposta(js: Any) -> List[Dict]:
+    """Lista de registros de uma resposta da API (lista pura ou envelope paginado)"""
+    if isinstance(js, list):
+        return js
+    if isinstance(js, dict):
+        return js.get("data") or js.get("items") or js.get("content") or []
+    return []
+
+
+def coletar_paginas(url: str, pedidos: Iterable[Tuple[Dict[str, Any], Optional[str]]],
+                    concorrencia: Optional[int] = None) -> List[Optional[Any]]:
+    """
+    Busca várias páginas em paralelo.
+
+    Args:
+        pedidos: (params, cache_key) de cada página
+
+    Returns:
+        Respostas na mesma ordem dos pedidos (None para as que falharam)
+    """
+    pedidos = list(pedidos)
+    if not pedidos:
+        return []
+    trabalhadores = max(1, min(int(concorrencia or Config.PNCP_CONCORRENCIA), len(pedidos)))
+    with ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='pncp') as pool:
+        return list(pool.map(lambda p: obter_json(url, p[0], p[1]), pedidos))
+
+
+def coletar_por_modalidade(url: str, params_base: Dict[str, Any], modalidades: List[int],
+                           chave_pagina, max_total: int = 10000) -> Dict[str, Any]:
+    """
+    Todas as páginas de cada modalidade, com no máximo `max_total` registros.
+
+    A primeira página de todas as modalidades é buscada em paralelo para
+    descobrir o total de páginas; as demais são então buscadas em paralelo,
+    só até cobrir `max_total`. A ordem do resultado é modalidade → página.
+
+    Args:
+        chave_pagina: função (modalidade, pagina) → chave de cache da página
+
+    Returns:
+        {'data': [...], 'modalidades': [{'codigo', 'coletados'}], 'falhas': n}
+    """
+    def pedido(mod, pagina):
+        return ({**params_base, "codigoModalidadeContratacao": mod, "pagina": pagina}, chave_pagina(mod, pagina))
+
+    primeiras = coletar_paginas(url, [pedido(mod, 1) for mod in modalidades])
+    paginas: Dict[Tuple[int, int], Any] = {}
+    extras = []
+    previstos = 0
+    tamanho = int(params_base.get("tamanhoPagina") or 1)
+    for mod, js in zip(modalidades, primeiras):
+        paginas[(mod, 1)] = js
+        previstos += len(itens_resposta(js))
+        total_pag = js.get("totalPaginas") if isinstance(js, dict) else None
+        try:
+            total_pag = int(total_pag or 1)
+        except (TypeError, ValueError):
+            total_pag = 1
+        for pagina in range(2, total_pag + 1):
+            if previstos >= max_total:
+                break
+            extras.append((mod, pagina))
+            previstos += tamanho
+
+    for (mod, pagina), js in zip(extras, coletar_paginas(url, [pedido(m, p) for m, p in extras])):
+        paginas[(mod, pagina)] = js
+
+    itens: List[Dict] = []
+    por_modalidade = []
+    falhas = sum(1 for js in paginas.values() if js is None)
+    for mod in modalidades:
+        coletados = 0
+        for (m, pagina) in sorted(k for k in paginas if k[0] == mod):
+            for item in itens_resposta(paginas[(m, pagina)]):
+                if len(itens) >= max_total:
+                    break
+                itens.append(item)
+                coletados += 1
+        por_modalidade.append({"codigo": mod, "coletados": coletados})
+    return {"data": itens, "modalidades": por_modalidade, "falhas": falhas}
@@ -0,0 +1,659 @@
+"""
+Espelho local do PNCP
+
+Sincroniza incrementalmente contratações e contratos publicados no PNCP
+para um banco DuckDB em disco (Config.PNCP_ESPELHO_PATH), anexado à
+conexão compartilhada como o catálogo `pncp`. Cada tipo tem uma tabela com
+chave primária (numeroControlePNCP), de modo que republicações e
+atualizações substituem o registro anterior.
+
+A sincronização guarda, por tipo, a marca d'água (última data de publicação
+coletada) e volta Config.PNCP_ESPELHO_SOBREPOSICAO_DIAS a cada rodada para
+capturar publicações tardias. As páginas são baixadas pelo coletor
+concorrente (services_pncp_coletor).
+
+O agregado diário (data × modalidade × UF × esfera → quantidade, valor) é
+mantido junto com as contratações, recalculando só as datas de cada lote.
+
+Listagens de editais, série temporal, alertas e favoritos consultam o
+espelho quando ele cobre o período pedido e foi sincronizado há pouco
+(espelho_disponivel); filtros que o espelho não guarda continuam indo à API
+remota.
+
+Uso:
+    python -m services.services_pncp_espelho [contratacoes contratos]
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from core.config import Config
+from services.services_duckdb_pool import obter_conexao, obter_cursor
+from services.services_pncp_coletor import coletar_por_modalidade
+
+logger = logging.getLogger(__name__)
+
+CATALOGO = 'pncp'
+# Contratações por data × modalidade × UF × esfera (quantidade, soma do valor)
+AGREGADO = 'agregado_diario'
+MODALIDADES = list(range(1, 11))
+
+# Tipo → endpoint da API de consulta e se a coleta exige modalidade
+TIPOS = {
+    'contratacoes': {'caminho': '/v1/contratacoes/publicacao', 'por_modalidade': True},
+    'contratos': {'caminho': '/v1/contratos', 'por_modalidade': False},
+}
+
+# Coluna → caminhos no JSON da API (o primeiro preenchido vence)
+CAMPOS = {
+    'numero_controle': ('numeroControlePNCP',),
+    'data_publicacao': ('dataPublicacaoPncp', 'dataPublicacao', 'dataAssinatura'),
+    'modalidade': ('codigoModalidadeContratacao', 'modalidadeId'),
+    'situacao': ('situacaoCompraId', 'situacao'),
+    'uf': ('unidadeOrgao.ufSigla', 'ufSigla', 'uf'),
+    'municipio': ('unidadeOrgao.municipioNome', 'municipioNome'),
+    'municipio_ibge': ('unidadeOrgao.codigoIbge', 'codigoMunicipioIbge'),
+    'esfera': ('orgaoEntidade.esferaId', 'esferaId'),
+    'poder': ('orgaoEntidade.poderId', 'poderId'),
+    'orgao_cnpj': ('orgaoEntidade.cnpj', 'cnpj'),
+    'orgao': ('orgaoEntidade.razaoSocial', 'orgao'),
+    'unidade': ('unidadeOrgao.nomeUnidade', 'unidadeGestora'),
+    'objeto': ('objetoCompra', 'objeto', 'objetoContrato', 'descricao'),
+    'valor': ('valorTotalEstimado', 'valorTotal', 'valorGlobal', 'valorInicial'),
+    'data_abertura': ('dataAberturaProposta', 'dataVigenciaInicio'),
+    'data_encerramento': ('dataEncerramentoProposta', 'dataVigenciaFim'),
+    'atualizado': ('dataAtualizacao', 'dataAtualizacaoGlobal'),
+}
+
+COLUNAS_SQL = """
+    chave VARCHAR PRIMARY KEY,
+    numero_controle VARCHAR,
+    data_publicacao DATE,
+    modalidade INTEGER,
+    situacao VARCHAR,
+    uf VARCHAR,
+    municipio VARCHAR,
+    municipio_ibge VARCHAR,
+    esfera VARCHAR,
+    poder VARCHAR,
+    orgao_cnpj VARCHAR,
+    orgao VARCHAR,
+    unidade VARCHAR,
+    objeto VARCHAR,
+    valor DOUBLE,
+    data_abertura DATE,
+    data_encerramento DATE,
+    atualizado VARCHAR,
+    registro VARCHAR,
+    sincronizado_em TIMESTAMP
+"""
+# sincronizado_em é a primeira vez que a chave entrou no espelho: atualizações
+# e a sobreposição de datas não a alteram (marca d'água dos alertas)
+COLUNAS = [linha.split()[0] for linha in COLUNAS_SQL.strip().splitlines()]
+
+# Filtros da API que o espelho não guarda: a consulta vai para a API remota
+FILTROS_REMOTOS = (
+    'tipoInstrumentoConvocatorioCodigo', 'tipoMargemPreferencia', 'conteudoNacional',
+    'codigoUnidadeAdministrativa', 'idUsuario',
+)
+
+_lock_anexo = threading.Lock()
+_lock_sync = threading.Lock()
+_thread_sync: Optional[threading.Thread] = None
+
+
+def _caminho_sql(caminho) -> str:
+    return str(caminho).replace('\\', '/').replace("'", "''")
+
+
+def url_tipo(tipo: str) -> str:
+    return Config.PNCP_API_URL.rstrip('/') + TIPOS[tipo]['caminho']
+
+
+# ==========================================
+# BANCO DO ESPELHO
+# ==========================================
+
+def _anexar():
+    """Anexa o banco do espelho à conexão compartilhada (e cria as tabelas)"""
+    con = obter_conexao()
+    with _lock_anexo:
+        anexado = con.execute(
+            "SELECT count(*) FROM duckdb_databases() WHERE database_name = ?", [CATALOGO]
+        ).fetchone()[0]
+        if anexado:
+            return
+        Config.PNCP_ESPELHO_PATH.parent.mkdir(parents=True, exist_ok=True)
+        con.execute(f"ATTACH '{_caminho_sql(Config.PNCP_ESPELHO_PATH)}' AS {CATALOGO}")
+        for tipo in TIPOS:
+            con.execute(f"CREATE TABLE IF NOT EXISTS {CATALOGO}.{tipo} ({COLUNAS_SQL})")
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {CATALOGO}.sincronizacao (
+                tipo VARCHAR PRIMARY KEY,
+                inicio DATE,
+                marca_dagua DATE,
+                sincronizado_em TIMESTAMP,
+                total BIGINT,
+                erro VARCHAR
+            )
+        """)
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {CATALOGO}.{AGREGADO} (
+                data DATE,
+                modalidade INTEGER,
+                uf VARCHAR,
+                esfera VARCHAR,
+                quantidade BIGINT,
+                valor DOUBLE
+            )
+        """)
+        vazio = con.execute(f"SELECT count(*) = 0 FROM {CATALOGO}.{AGREGADO}").fetchone()[0]
+        if vazio:
+            # Espelho sincronizado antes do agregado existir
+            _recalcular_agregado(con)
+
+
+def cursor_espelho():
+    """Cursor da thread atual com o catálogo do espelho anexado"""
+    _anexar()
+    return obter_cursor()
+
+
+def estado(tipo: str) -> Optional[Dict]:
+    """Cobertura sincronizada do tipo: inicio, marca_dagua, sincronizado_em, total, erro"""
+    try:
+        cur = cursor_espelho()
+        linha = cur.execute(
+            f"SELECT inicio, marca_dagua, sincronizado_em, total, erro FROM {CATALOGO}.sincronizacao WHERE tipo = ?",
+            [tipo],
+        ).fetchone()
+    except Exception as e:
+        logger.warning(f"Erro ao ler estado do espelho PNCP: {e}")
+        return None
+    if not linha:
+        return None
+    return dict(zip(('inicio', 'marca_dagua', 'sincronizado_em', 'total', 'erro'), linha))
+
+
+def espelho_disponivel(tipo: str = 'contratacoes', data_inicial: Optional[str] = None,
+                       data_final: Optional[str] = None) -> bool:
+    """
+    Indica se o espelho está ativo e cobre o período de `data_inicial` a
+    `data_final` (AAAAMMDD; padrão hoje) com dados recentes:
+
+      - a cobertura começa em ou antes de `data_inicial`;
+      - a marca d'água alcança min(data_final, hoje - PNCP_ESPELHO_TOLERANCIA_DIAS);
+      - a última sincronização tem no máximo PNCP_ESPELHO_IDADE_MAX segundos.
+
+    Fora disso as consultas vão à API remota.
+    """
+    if not Config.PNCP_ESPELHO_ATIVO:
+        return False
+    info = estado(tipo)
+    if not info or not info.get('inicio') or not info.get('marca_dagua'):
+        return False
+    inicio = _data(data_inicial)
+    if inicio is not None and inicio < info['inicio']:
+        return False
+    hoje = date.today()
+    exigida = hoje - timedelta(days=int(Config.PNCP_ESPELHO_TOLERANCIA_DIAS))
+    fim = _data(data_final)
+    if fim is not None:
+        exigida = min(fim, exigida)
+    if info['marca_dagua'] < exigida:
+        logger.info(f"Espelho PNCP {tipo} defasado (marca d'água {info['marca_dagua']}), consultando API")
+        return False
+    idade_max = int(Config.PNCP_ESPELHO_IDADE_MAX)
+    sincronizado = info.get('sincronizado_em')
+    if idade_max > 0 and (sincronizado is None or (datetime.now() - sincronizado).total_seconds() > idade_max):
+        logger.info(f"Espelho PNCP {tipo} sem sincronizar desde {sincronizado}, consultando API")
+        return False
+    return True
+
+
+def fonte_espelho(tipo: str = 'contratacoes') -> Dict:
+    """Campo `fonte` das respostas servidas pelo espelho, com a cobertura usada"""
+    info = estado(tipo) or {}
+
+    def iso(v):
+        return v.isoformat() if v is not None else None
+
+    return {
+        'tipo': 'espelho',
+        'inicio': iso(info.get('inicio')),
+        'marca_dagua': iso(info.get('marca_dagua')),
+        'sincronizado_em': iso(info.get('sincronizado_em')),
+    }
+
+
+# ==========================================
+# NORMALIZAÇÃO
+# ==========================================
+
+def _valor(registro: Dict, caminho: str) -> Any:
+    atual: Any = registro
+    for parte in caminho.split('.'):
+        if not isinstance(atual, dict):
+            return None
+        atual = atual.get(parte)
+    return atual
+
+
+def _campo(registro: Dict, caminhos: Tuple[str, ...]) -> Any:
+    for caminho in caminhos:
+        v = _valor(registro, caminho)
+        if v not in (None, ''):
+            return v
+    return None
+
+
+def _data(valor) -> Optional[date]:
+    """AAAAMMDD, AAAA-MM-DD ou ISO com hora → date"""
+    d = ''.join(ch for ch in str(valor or '')[:10] if ch.isdigit())
+    if len(d) < 8:
+        return None
+    try:
+        return datetime.strptime(d[:8], '%Y%m%d').date()
+    except ValueError:
+        return None
+
+
+def _chave(tipo: str, registro: Dict) -> Optional[str]:
+    numero = registro.get('numeroControlePNCP')
+    if not numero:
+        return None
+    return str(numero)
+
+
+def normalizar(tipo: str, registros: Iterable[Dict]) -> pd.DataFrame:
+    """Registros da API → linhas da tabela do espelho (sem chave são descartados)"""
+    agora = datetime.now()
+    linhas = []
+    for reg in registros:
+        chave = _chave(tipo, reg)
+        if not chave:
+            continue
+        linha = {'chave': chave}
+        for coluna, caminhos in CAMPOS.items():
+            linha[coluna] = _campo(reg, caminhos)
+        linha['registro'] = json.dumps(reg, ensure_ascii=False, default=str)
+        linha['sincronizado_em'] = agora
+        linhas.append(linha)
+    df = pd.DataFrame(linhas, columns=COLUNAS)
+    if df.empty:
+        return df
+    for coluna in ('data_publicacao', 'data_abertura', 'data_encerramento'):
+        df[coluna] = df[coluna].map(_data)
+    df['modalidade'] = pd.to_numeric(df['modalidade'], errors='coerce').astype('Int64')
+    df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
+    for coluna in ('situacao', 'uf', 'municipio', 'municipio_ibge', 'esfera', 'poder',
+                   'orgao_cnpj', 'orgao', 'unidade', 'objeto', 'atualizado', 'numero_controle'):
+        df[coluna] = df[coluna].map(lambda v: None if v is None else str(v))
+    df['uf'] = df['uf'].str.upper()
+    # Uma linha por chave (a última publicada na rodada vence)
+    return df.drop_duplicates('chave', keep='last')
+
+
+# ==========================================
+# SINCRONIZAÇÃO
+# ==========================================
+
+def _recalcular_agregado(cur, datas: Optional[List[date]] = None):
+    """
+    Recalcula o agregado diário das datas informadas (todas, se None) a
+    partir das contratações do espelho.
+    """
+    if datas is None:
+        cur.execute(f"DELETE FROM {CATALOGO}.{AGREGADO}")
+        filtro, params = 'TRUE', []
+    elif datas:
+        marcadores = ', '.join('?' * len(datas))
+        cur.execute(f"DELETE FROM {CATALOGO}.{AGREGADO} WHERE data IN ({marcadores})", list(datas))
+        filtro, params = f"data_publicacao IN ({marcadores})", list(datas)
+    else:
+        return
+    cur.execute(f"""
+        INSERT INTO {CATALOGO}.{AGREGADO}
+        SELECT data_publicacao, modalidade, uf, esfera, count(*), coalesce(sum(valor), 0)
+        FROM {CATALOGO}.contratacoes
+        WHERE data_publicacao IS NOT NULL AND {filtro}
+        GROUP BY ALL
+    """, params)
+
+
+def gravar(tipo: str, df: pd.DataFrame) -> Tuple[int, int]:
+    """
+    Insere ou substitui as linhas no espelho. Para contratações, o agregado
+    diário das datas afetadas (novas e as das versões substituídas) é
+    recalculado na mesma rodada.
+
+    Returns:
+        (novas, atualizadas)
+    """
+    if df.empty:
+        return 0, 0
+    cur = cursor_espelho()
+    nome = f"_pncp_lote_{threading.get_ident()}"
+    cur.register(nome, df)
+    try:
+        existentes = cur.execute(
+            f"SELECT count(*) FROM {CATALOGO}.{tipo} WHERE chave IN (SELECT chave FROM {nome})"
+        ).fetchone()[0]
+        datas = None
+        if tipo == 'contratacoes':
+            datas = [d for (d,) in cur.execute(f"""
+                SELECT data_publicacao FROM {nome}
+                UNION
+                SELECT data_publicacao FROM {CATALOGO}.{tipo} WHERE chave IN (SELECT chave FROM {nome})
+            """).fetchall() if d is not None]
+        cur.execute("BEGIN TRANSACTION")
+        try:
+            selecao = ', '.join(
+                'coalesce(t.sincronizado_em, n.sincronizado_em)' if c == 'sincronizado_em' else f'n.{c}'
+                for c in COLUNAS
+            )
+            cur.execute(f"""
+                INSERT OR REPLACE INTO {CATALOGO}.{tipo}
+                SELECT {selecao} FROM {nome} n LEFT JOIN {CATALOGO}.{tipo} t ON t.chave = n.chave
+            """)
+            if datas is not None:
+                _recalcular_agregado(cur, datas)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    finally:
+        cur.unregister(nome)
+    return len(df) - int(existentes), int(existentes)
+
+
+def _salvar_estado(tipo: str, inicio: date, marca: date, erro: Optional[str] = None):
+    cur = cursor_espelho()
+    total = cur.execute(f"SELECT count(*) FROM {CATALOGO}.{tipo}").fetchone()[0]
+    cur.execute(
+        f"INSERT OR REPLACE INTO {CATALOGO}.sincronizacao VALUES (?, ?, ?, ?, ?, ?)",
+        [tipo, inicio, marca, datetime.now(), int(total), erro],
+    )
+
+
+def _janelas(inicio: date, fim: date, dias: int) -> List[Tuple[date, date]]:
+    janelas = []
+    atual = inicio
+    while atual <= fim:
+        ultimo = min(atual + timedelta(days=max(dias, 1) - 1), fim)
+        janelas.append((atual, ultimo))
+        atual = ultimo + timedelta(days=1)
+    return janelas
+
+
+def sincronizar_tipo(tipo: str, ate: Optional[date] = None) -> Dict:
+    """
+    Baixa as publicações do tipo desde a marca d'água e grava no espelho.
+    A marca só avança por janelas baixadas sem falhas.
+    """
+    hoje = ate or date.today()
+    info = estado(tipo)
+    if info and info.get('marca_dagua'):
+        inicio_cobertura = info['inicio']
+        desde = info['marca_dagua'] - timedelta(days=int(Config.PNCP_ESPELHO_SOBREPOSICAO_DIAS))
+    else:
+        inicio_cobertura = hoje - timedelta(days=int(Config.PNCP_ESPELHO_DIAS_INICIAIS))
+        desde = inicio_cobertura
+
+    resumo = {'tipo': tipo, 'desde': desde.isoformat(), 'novas': 0, 'atualizadas': 0, 'erro': None}
+    marca = info.get('marca_dagua') if info else None
+    modalidades = MODALIDADES if TIPOS[tipo]['por_modalidade'] else [None]
+    for ini, fim in _janelas(desde, hoje, int(Config.PNCP_ESPELHO_JANELA_DIAS)):
+        params = {
+            'dataInicial': ini.strftime('%Y%m%d'),
+            'dataFinal': fim.strftime('%Y%m%d'),
+            'tamanhoPagina': 50 if tipo == 'contratacoes' else 500,
+        }
+        # Sem cache por página: o espelho precisa do estado atual da API
+        resultado = coletar_por_modalidade(url_tipo(tipo), params, modalidades, lambda m, p: None, max_total=10 ** 9)
+        novas, atualizadas = gravar(tipo, normalizar(tipo, resultado['data']))
+        resumo['novas'] += novas
+        resumo['atualizadas'] += atualizadas
+        if resultado['falhas']:
+            resumo['erro'] = f"{resultado['falhas']} páginas sem resposta em {ini}..{fim}"
+            break
+        marca = fim
+    if marca is not None:
+        _salvar_estado(tipo, inicio_cobertura, marca, resumo['erro'])
+    resumo['marca_dagua'] = marca.isoformat() if marca else None
+    logger.info(f"Espelho PNCP {tipo}: {resumo['novas']} novas, {resumo['atualizadas']} atualizadas (até {resumo['marca_dagua']})")
+    return resumo
+
+
+def sincronizar(tipos: Optional[List[str]] = None) -> Dict:
+    """
+    Sincroniza os tipos configurados (Config.PNCP_ESPELHO_TIPOS).
+    Só uma sincronização roda por vez no processo.
+    """
+    if not _lock_sync.acquire(blocking=False):
+        return {'sucesso': False, 'erro': 'Sincronização já em andamento'}
+    inicio = time.time()
+    try:
+        resumos = {}
+        for tipo in (tipos or Config.PNCP_ESPELHO_TIPOS):
+            if tipo not in TIPOS:
+                logger.warning(f"Espelho PNCP: tipo desconhecido {tipo}")
+                continue
+            try:
+                resumos[tipo] = sincronizar_tipo(tipo)
+            except Exception as e:
+                logger.error(f"Erro ao sincronizar {tipo} do PNCP: {e}", exc_info=True)
+                resumos[tipo] = {'tipo': tipo, 'novas': 0, 'atualizadas': 0, 'erro': str(e)}
+        return {
+            'sucesso': all(not r.get('erro') for r in resumos.values()),
+            'total_novas': sum(r['novas'] for r in resumos.values()),
+            'total_atualizadas': sum(r['atualizadas'] for r in resumos.values()),
+            'tipos': resumos,
+            'segundos': round(time.time() - inicio, 1),
+            'timestamp': datetime.now().isoformat(),
+        }
+    finally:
+        _lock_sync.release()
+
+
+def iniciar_sincronizacao_periodica() -> bool:
+    """
+    Thread própria que sincroniza a cada Config.PNCP_ESPELHO_INTERVALO segundos
+    (no servidor a sincronização roda pelo services.services_agendador)
+    """
+    global _thread_sync
+    intervalo = int(Config.PNCP_ESPELHO_INTERVALO)
+    if not Config.PNCP_ESPELHO_ATIVO or intervalo <= 0:
+        return False
+    if _thread_sync is not None and _thread_sync.is_alive():
+        return True
+
+    def _loop():
+        while True:
+            try:
+                sincronizar()
+            except Exception as e:
+                logger.error(f"Erro na sincronização periódica do PNCP: {e}")
+            time.sleep(intervalo)
+
+    _thread_sync = threading.Thread(target=_loop, name='pncp-espelho', daemon=True)
+    _thread_sync.start()
+    logger.info(f"✓ Sincronização do espelho PNCP a cada {intervalo}s")
+    return True
+
+
+# ==========================================
+# CONSULTA
+# ==========================================
+
+def where_filtros(filtros: Dict, coluna_data: str = 'data_publicacao') -> Optional[Tuple[str, List]]:
+    """
+    WHERE equivalente aos filtros da API de consulta.
+
+    Args:
+        coluna_data: Coluna da data de publicação ('data' no agregado diário)
+
+    Returns:
+        (sql, params), ou None se houver filtro que o espelho não atende
+    """
+    filtros = {k: v for k, v in (filtros or {}).items() if v not in (None, '')}
+    if any(k in filtros for k in FILTROS_REMOTOS):
+        return None
+    condicoes, params = [], []
+    di, df = _data(filtros.get('dataInicial')), _data(filtros.get('dataFinal'))
+    if di:
+        condicoes.append(f"{coluna_data} >= ?")
+        params.append(di)
+    if df:
+        condicoes.append(f"{coluna_data} <= ?")
+        params.append(df)
+    mod = filtros.get('codigoModalidadeContratacao') or filtros.get('modalidade')
+    if mod not in (None, '', 'todos', 'all', 0, '0'):
+        try:
+            condicoes.append("modalidade = ?")
+            params.append(int(mod))
+        except (TypeError, ValueError):
+            return None
+    uf = filtros.get('uf') or filtros.get('ufSigla')
+    if uf:
+        condicoes.append("uf = ?")
+        params.append(str(uf).upper())
+    if filtros.get('municipioNome'):
+        condicoes.append("upper(municipio) = upper(?)")
+        params.append(str(filtros['municipioNome']))
+    ibge = filtros.get('codigoMunicipioIbge') or filtros.get('municipioIbge') or filtros.get('municipioCodigo')
+    if ibge:
+        condicoes.append("municipio_ibge = ?")
+        params.append(str(ibge))
+    for chave, coluna in (('esferaId', 'esfera'), ('poderId', 'poder'), ('situacao', 'situacao')):
+        if filtros.get(chave):
+            condicoes.append(f"{coluna} = ?")
+            params.append(str(filtros[chave]))
+    if filtros.get('cnpj'):
+        condicoes.append("orgao_cnpj = ?")
+        params.append(''.join(ch for ch in str(filtros['cnpj']) if ch.isdigit()))
+    for chave, coluna in (('orgao', 'orgao'), ('unidadeGestora', 'unidade'), ('palavraChave', 'objeto')):
+        if filtros.get(chave):
+            condicoes.append(f"{coluna} ILIKE ?")
+            params.append(f"%{filtros[chave]}%")
+    return (' AND '.join(condicoes) or 'TRUE'), params
+
+
+def _registros(linhas) -> List[Dict]:
+    return [json.loads(r[0]) for r in linhas]
+
+
+def consultar_editais(filtros: Dict, pagina: int = 1, tamanho: int = 10, tipo: str = 'contratacoes') -> Optional[Dict]:
+    """
+    Uma página de editais do espelho, no formato de PNCPIntegration.listar_editais.
+
+    Returns:
+        Dict com data/totalRegistros/totalPaginas, ou None se o espelho não atende os filtros
+    """
+    where = where_filtros(filtros)
+    if where is None:
+        return None
+    where_sql, params = where
+    cur = cursor_espelho()
+    total = cur.execute(f"SELECT count(*) FROM {CATALOGO}.{tipo} WHERE {where_sql}", params).fetchone()[0]
+    linhas = cur.execute(
+        f"SELECT registro FROM {CATALOGO}.{tipo} WHERE {where_sql} "
+        f"ORDER BY data_publicacao DESC, chave LIMIT ? OFFSET ?",
+        params + [int(tamanho), (int(pagina) - 1) * int(tamanho)],
+    ).fetchall()
+    return {
+        'pagina': int(pagina),
+        'tamanhoPagina': int(tamanho),
+        'data': _registros(linhas),
+        'totalRegistros': int(total),
+        'totalPaginas': (int(total) + int(tamanho) - 1) // int(tamanho),
+        'numeroPagina': int(pagina),
+        'fonte': fonte_espelho(tipo),
+    }
+
+
+def consultar_periodo(filtros: Dict, max_total: int = 10000) -> Optional[Dict]:
+    """
+    Editais do período (dataInicial/dataFinal nos filtros), no formato de
+    PNCPIntegration.listar_editais_todos.
+    """
+    where = where_filtros(filtros)
+    if where is None:
+        return None
+    where_sql, params = where
+    linhas = cursor_espelho().execute(
+        f"SELECT modalidade, registro FROM {CATALOGO}.contratacoes WHERE {where_sql} "
+        f"ORDER BY modalidade, data_publicacao DESC, chave LIMIT ?",
+        params + [int(max_total)],
+    ).fetchall()
+    itens = [json.loads(r[1]) for r in linhas]
+    por_modalidade: Dict[Any, int] = {}
+    for mod, _ in linhas:
+        por_modalidade[mod] = por_modalidade.get(mod, 0) + 1
+    return {
+        'data': itens,
+        'total': len(itens),
+        'modalidades': [{'codigo': m, 'coletados': n} for m, n in por_modalidade.items()],
+        'fonte': fonte_espelho(),
+    }
+
+
+def contratacoes_desde(desde: Optional[str] = None, limite: int = 50000,
+                       sincronizado_apos: Optional[datetime] = None,
+                       sincronizado_ate: Optional[datetime] = None,
+                       apos: Optional[Tuple[datetime, str]] = None) -> List[Dict]:
+    """
+    Contratações publicadas a partir de `desde` (ISO ou AAAAMMDD), com os
+    campos normalizados e o JSON original em 'registro' (texto), na ordem
+    de entrada no espelho (sincronizado_em, chave).
+
+    Args:
+        sincronizado_apos, sincronizado_ate: Só as que entraram no espelho
+            depois do primeiro instante e até o segundo
+        apos: (sincronizado_em, chave) do último registro da página anterior
+    """
+    condicoes = [
+        "data_publicacao >= coalesce(?, DATE '1900-01-01')",
+        "sincronizado_em > coalesce(?, TIMESTAMP '1900-01-01')",
+        "sincronizado_em <= coalesce(?, TIMESTAMP '9999-12-31')",
+    ]
+    params: List[Any] = [_data(desde), sincronizado_apos, sincronizado_ate]
+    if apos is not None:
+        condicoes.append("(sincronizado_em > ? OR (sincronizado_em = ? AND chave > ?))")
+        params += [apos[0], apos[0], apos[1]]
+    linhas = cursor_espelho().execute(
+        f"SELECT chave, numero_controle, data_publicacao, modalidade, uf, orgao, objeto, valor, "
+        f"data_encerramento, registro, sincronizado_em FROM {CATALOGO}.contratacoes "
+        f"WHERE {' AND '.join(condicoes)} "
+        f"ORDER BY sincronizado_em, chave LIMIT ?",
+        params + [int(limite)],
+    ).fetchall()
+    campos = ('chave', 'numero_controle', 'data_publicacao', 'modalidade', 'uf', 'orgao', 'objeto', 'valor',
+              'data_encerramento', 'registro', 'sincronizado_em')
+    return [dict(zip(campos, linha)) for linha in linhas]
+
+
+def registros_por_numero(numeros: List[str], tipo: str = 'contratacoes') -> Dict[str, Dict]:
+    """Registro atual de cada numeroControlePNCP encontrado no espelho"""
+    numeros = list(dict.fromkeys(str(n) for n in numeros if n))
+    if not numeros:
+        return {}
+    linhas = cursor_espelho().execute(
+        f"SELECT numero_controle, registro FROM {CATALOGO}.{tipo} "
+        f"WHERE numero_controle IN ({', '.join('?' * len(numeros))})",
+        numeros,
+    ).fetchall()
+    return {n: json.loads(r) for n, r in linhas}
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    resultado = sincronizar([a for a in sys.argv[1:] if not a.startswith('-')] or None)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2, default=str))
@@ -0,0 +1,176 @@
+"""
+Série temporal de publicações do PNCP
+
+Monta a série diária (quantidade, valor e média móvel) e os rankings de
+modalidade e UF para qualquer período e largura de média móvel:
+
+  - com o espelho sincronizado, lê o agregado diário (data × modalidade ×
+    UF × esfera) quando os filtros se limitam a essas dimensões, ou agrega
+    as contratações do espelho em SQL para os demais filtros;
+  - sem espelho, agrega os editais baixados da API.
+
+Em todos os casos o cálculo é feito sobre um quadro (data, modalidade, uf,
+quantidade, valor) com groupby/rolling do pandas.
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from services.services_pncp_espelho import (
+    AGREGADO, CATALOGO, cursor_espelho, espelho_disponivel, fonte_espelho, where_filtros,
+)
+
+logger = logging.getLogger(__name__)
+
+COLUNAS_QUADRO = ['data', 'modalidade', 'uf', 'quantidade', 'valor']
+
+# Filtros atendidos pelo agregado diário (os demais exigem as contratações)
+FILTROS_AGREGADO = ('dataInicial', 'dataFinal', 'codigoModalidadeContratacao', 'uf', 'ufSigla', 'esferaId')
+
+
+def _ativos(filtros: Dict) -> Dict:
+    return {k: v for k, v in (filtros or {}).items() if v not in (None, '')}
+
+
+def _quadro_espelho(filtros: Dict) -> Optional[pd.DataFrame]:
+    """Quadro agregado a partir do espelho, ou None se ele não atende os filtros"""
+    ativos = _ativos(filtros)
+    if set(ativos) <= set(FILTROS_AGREGADO):
+        condicoes, params = where_filtros(ativos, coluna_data='data')
+        sql = f"""
+            SELECT data, modalidade, uf, sum(quantidade) AS quantidade, sum(valor) AS valor
+            FROM {CATALOGO}.{AGREGADO}
+            WHERE {condicoes}
+            GROUP BY ALL
+        """
+    else:
+        where = where_filtros(ativos)
+        if where is None:
+            return None
+        condicoes, params = where
+        sql = f"""
+            SELECT data_publicacao AS data, modalidade, uf,
+                   count(*) AS quantidade, coalesce(sum(valor), 0) AS valor
+            FROM {CATALOGO}.contratacoes
+            WHERE data_publicacao IS NOT NULL AND {condicoes}
+            GROUP BY ALL
+        """
+    return cursor_espelho().execute(sql, params).df()
+
+
+def quadro_vazio() -> pd.DataFrame:
+    """Quadro sem linhas, com os tipos das colunas (groupby/nlargest exigem numéricos)"""
+    return pd.DataFrame({
+        'data': pd.Series(dtype='datetime64[ns]'),
+        'modalidade': pd.Series(dtype=float),
+        'uf': pd.Series(dtype=object),
+        'quantidade': pd.Series(dtype='int64'),
+        'valor': pd.Series(dtype=float),
+    })
+
+
+def quadro_itens(itens: List[Dict]) -> pd.DataFrame:
+    """Editais da API → quadro (data, modalidade, uf, quantidade, valor)"""
+    if not itens:
+        return quadro_vazio()
+    df = pd.DataFrame(itens)
+
+    def coluna(*nomes):
+        serie = pd.Series(None, index=df.index, dtype=object)
+        for nome in nomes:
+            if nome in df.columns:
+                serie = serie.where(serie.notna() & (serie != ''), df[nome])
+        return serie
+
+    digitos = coluna('dataPublicacaoPncp', 'dataPublicacao').astype(str).str.replace(r'\D', '', regex=True).str[:8]
+    valor = pd.to_numeric(coluna('valorTotalEstimado', 'valorTotal'), errors='coerce').fillna(0.0)
+    return pd.DataFrame({
+        'data': pd.to_datetime(digitos, format='%Y%m%d', errors='coerce'),
+        'modalidade': pd.to_numeric(coluna('codigoModalidadeContratacao', 'modalidade'), errors='coerce'),
+        'uf': coluna('uf', 'ufSigla'),
+        'quantidade': 1,
+        'valor': valor,
+    }).dropna(subset=['data'])
+
+
+def _top(quadro: pd.DataFrame, coluna: str, n: int = 10) -> List[Dict]:
+    quadro = quadro.dropna(subset=[coluna])
+    if quadro.empty:
+        return []
+    contagem = pd.to_numeric(quadro.groupby(coluna)['quantidade'].sum()).nlargest(n)
+    if coluna == 'modalidade':
+        contagem.index = contagem.index.astype(int)
+    return [{'label': str(k), 'count': int(v)} for k, v in contagem.items() if str(k)]
+
+
+def _dia(valor) -> pd.Timestamp:
+    """AAAAMMDD ou ISO → Timestamp (NaT se inválido)"""
+    digitos = ''.join(c for c in str(valor) if c.isdigit())[:8]
+    return pd.to_datetime(digitos, format='%Y%m%d', errors='coerce')
+
+
+def calcular_serie(quadro: pd.DataFrame, media: int = 7, inicio: Optional[str] = None,
+                   fim: Optional[str] = None) -> Dict:
+    """
+    Série diária, médias móveis e rankings a partir do quadro agregado.
+
+    Args:
+        media: Largura (em dias corridos) da média móvel
+        inicio, fim: Período (AAAAMMDD); dias sem publicação entram com zero
+    """
+    media = max(int(media or 7), 1)
+    if quadro is None or quadro.empty:
+        quadro = quadro_vazio()
+    por_dia = quadro.groupby('data', sort=True)[['quantidade', 'valor']].sum()
+    por_dia.index = pd.to_datetime(por_dia.index)
+    # Um ponto por dia do calendário, para que a média móvel seja em dias corridos
+    primeiro = _dia(inicio) if inicio else (por_dia.index.min() if len(por_dia) else pd.NaT)
+    ultimo = _dia(fim) if fim else (por_dia.index.max() if len(por_dia) else pd.NaT)
+    if pd.notna(primeiro) and pd.notna(ultimo) and primeiro <= ultimo:
+        por_dia = por_dia.reindex(pd.date_range(primeiro, ultimo, freq='D'), fill_value=0)
+    contagem = por_dia['quantidade'].astype(int)
+    series = pd.DataFrame({
+        'date': pd.to_datetime(por_dia.index).strftime('%Y%m%d'),
+        'count': contagem.values,
+        'valor': por_dia['valor'].astype(float).values,
+    })
+    return {
+        'total': int(contagem.sum()),
+        'totalValor': float(por_dia['valor'].sum()),
+        'series': series.to_dict(orient='records'),
+        'mediaMovel': contagem.rolling(media, min_periods=1).mean().tolist(),
+        'mediaMovelJanela': media,
+        'mediaMovel7': contagem.rolling(7, min_periods=1).mean().tolist(),
+        'topModalidades': _top(quadro, 'modalidade'),
+        'topUFs': _top(quadro, 'uf'),
+    }
+
+
+def serie_pncp(filtros: Dict, dias: Optional[int] = None, media: int = 7, tamanho: int = 200) -> Dict:
+    """
+    Série de publicações do período (últimos `dias`, ou dataInicial/dataFinal
+    dos filtros; padrão 30 dias).
+    """
+    filtros = dict(_ativos(filtros))
+    if dias or not filtros.get('dataInicial'):
+        hoje = date.today()
+        filtros['dataInicial'] = (hoje - timedelta(days=int(dias or 30))).strftime('%Y%m%d')
+        filtros.setdefault('dataFinal', hoje.strftime('%Y%m%d'))
+
+    quadro = None
+    try:
+        if espelho_disponivel(data_inicial=filtros['dataInicial'], data_final=filtros.get('dataFinal')):
+            quadro = _quadro_espelho(filtros)
+            fonte = fonte_espelho()
+    except Exception as e:
+        logger.warning(f"Série PNCP pelo espelho falhou, consultando API: {e}")
+        quadro = None
+    if quadro is None:
+        from services.services_integracao_service import PNCPIntegration
+        fonte = {'tipo': 'api'}
+        base = PNCPIntegration().listar_editais_todos(dias=int(dias or 30), tamanho=tamanho, filtros=filtros)
+        quadro = quadro_itens(base.get('data') or [])
+    return {**calcular_serie(quadro, media, filtros['dataInicial'], filtros.get('dataFinal')), 'fonte': fonte}
@@ -0,0 +1,166 @@
+"""
+Tabela de responsável por CNPJ básico
+
+Etapa offline que percorre sócios uma única vez e grava, para cada
+cnpj_basico, o sócio escolhido como responsável: administradores (sócio-
+administrador, diretor, presidente, gerente) primeiro, depois o primeiro
+nome em ordem alfabética. O arquivo é ordenado por cnpj_basico e exposto
+como a view `responsavel`, usada nas listas de leads no lugar da junção com
+a tabela de sócios inteira.
+
+    responsavel_por_cnpj_basico.parquet
+        cnpj_basico, responsavel, responsavel_documento, responsavel_qualificacao
+
+Uso:
+    python -m services.services_responsavel
+"""
+
+import json
+import logging
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from core.config import Config
+from services.services_duckdb_pool import obter_conexao, obter_cursor, registrar_view, tabela, view_registrada
+from services.services_filtro_sql import esquema_parquet
+
+logger = logging.getLogger(__name__)
+
+VIEW = 'responsavel'
+ARQUIVO = 'responsavel_por_cnpj_basico.parquet'
+ARQUIVO_MANIFESTO = 'manifesto.json'
+
+# Qualificações de administrador na tabela de sócios da Receita
+# (05 administrador, 10 diretor, 16 presidente, 49 sócio-administrador)
+CODIGOS_ADMINISTRADOR = ('05', '10', '16', '49')
+TERMOS_ADMINISTRADOR = 'ADMIN|DIRETOR|PRESIDENTE|GERENTE'
+
+
+def _arquivo() -> Path:
+    return Path(Config.RESPONSAVEL_DIR) / ARQUIVO
+
+
+# ==========================================
+# CONSTRUÇÃO (OFFLINE)
+# ==========================================
+
+def construir_tabela_responsavel() -> Dict:
+    """
+    Constrói (ou reconstrói) a tabela de responsável a partir de sócios.
+
+    Returns:
+        Manifesto com número de CNPJs básicos e tempo de construção
+    """
+    inicio = time.time()
+    base = Path(Config.RESPONSAVEL_DIR)
+    base.mkdir(parents=True, exist_ok=True)
+    esquema = esquema_parquet(Config.ARQUIVOS_PARQUET['socios'])
+    if 'cnpj_basico' not in esquema or 'nome_socio' not in esquema:
+        raise ValueError('Colunas cnpj_basico/nome_socio não encontradas em sócios')
+
+    qual = "CAST(qualificacao_socio AS VARCHAR)" if 'qualificacao_socio' in esquema else "CAST(NULL AS VARCHAR)"
+    documento = (
+        "regexp_replace(CAST(cpf_cnpj_do_socio AS VARCHAR), '[^0-9]', '', 'g')"
+        if 'cpf_cnpj_do_socio' in esquema else "CAST(NULL AS VARCHAR)"
+    )
+    codigos = ', '.join(f"'{c}'" for c in CODIGOS_ADMINISTRADOR)
+    administrador = (
+        f"(regexp_matches(upper({qual}), '{TERMOS_ADMINISTRADOR}') OR lpad({qual}, 2, '0') IN ({codigos}))"
+    )
+
+    temp = base / f"_{ARQUIVO}.tmp"
+    temp_sql = str(temp).replace('\\', '/')
+    con = obter_conexao().cursor()
+    try:
+        logger.info("Responsável: escolhendo um sócio por CNPJ básico...")
+        con.execute(f"""
+            COPY (
+                SELECT cnpj_basico,
+                       nome_socio AS responsavel,
+                       {documento} AS responsavel_documento,
+                       {qual} AS responsavel_qualificacao
+                FROM {tabela('socios')}
+                WHERE nome_socio IS NOT NULL
+                QUALIFY row_number() OVER (
+                    PARTITION BY cnpj_basico
+                    ORDER BY coalesce({administrador}, false) DESC, nome_socio
+                ) = 1
+                ORDER BY cnpj_basico
+            ) TO '{temp_sql}' (FORMAT PARQUET, COMPRESSION zstd, ROW_GROUP_SIZE {int(Config.RESPONSAVEL_ROW_GROUP)})
+        """)
+        total = con.execute(f"SELECT count(*) FROM read_parquet('{temp_sql}')").fetchone()[0]
+    finally:
+        con.close()
+
+    temp.replace(_arquivo())
+    manifesto = {
+        'origem': str(Config.ARQUIVOS_PARQUET['socios']),
+        'cnpjs_basicos': int(total),
+        'construido_em': time.time(),
+        'segundos': round(time.time() - inicio, 1),
+    }
+    with open(base / ARQUIVO_MANIFESTO, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    recarregar_responsavel()
+    logger.info(f"✓ Tabela de responsável: {total} CNPJs básicos em {manifesto['segundos']}s")
+    return manifesto
+
+
+# ==========================================
+# CONSULTA
+# ==========================================
+
+@lru_cache(maxsize=None)
+def _manifesto() -> Optional[Dict]:
+    try:
+        caminho = Path(Config.RESPONSAVEL_DIR) / ARQUIVO_MANIFESTO
+        if not caminho.exists() or not _arquivo().exists():
+            return None
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Erro ao ler manifesto da tabela de responsável: {e}")
+        return None
+
+
+def responsavel_disponivel() -> bool:
+    """Indica se a tabela foi construída, registrando a view se necessário"""
+    if _manifesto() is None:
+        return False
+    if not view_registrada(VIEW):
+        return registrar_view(VIEW, _arquivo())
+    return True
+
+
+def recarregar_responsavel():
+    """Descarta o manifesto em memória e re-registra a view (após reconstrução)"""
+    _manifesto.cache_clear()
+    if _manifesto() is not None:
+        registrar_view(VIEW, _arquivo())
+
+
+def responsaveis_por_cnpj_basico(cnpjs_basicos: List[str]) -> Optional[pd.DataFrame]:
+    """
+    Responsável de cada CNPJ básico informado.
+
+    Returns:
+        DataFrame (cnpj_basico, responsavel, responsavel_documento,
+        responsavel_qualificacao) ou None se a tabela não foi construída
+    """
+    if not responsavel_disponivel():
+        return None
+    basicos = list(dict.fromkeys(str(b) for b in cnpjs_basicos))
+    if not basicos:
+        return pd.DataFrame(columns=['cnpj_basico', 'responsavel', 'responsavel_documento', 'responsavel_qualificacao'])
+    q = f"SELECT * FROM {VIEW} WHERE cnpj_basico IN ({', '.join('?' * len(basicos))})"
+    return obter_cursor().execute(q, basicos).df()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    resultado = construir_tabela_responsavel()
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
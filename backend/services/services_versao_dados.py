@@ -0,0 +1,349 @@
+"""
+Versão dos dados da Receita e atualização incremental dos artefatos derivados
+
+Mantém um manifesto (Config.VERSAO_DADOS_ARQUIVO) com a impressão digital de
+cada arquivo/partição Parquet configurado: tamanho, mtime, número de linhas e
+hash do rodapé Parquet (metadados + estatísticas dos row groups, que mudam
+sempre que o conteúdo muda, sem precisar ler o arquivo inteiro).
+
+Quando um dump mensal novo é carregado, `atualizar_artefatos` compara com o
+manifesto anterior e, só para as tabelas alteradas:
+  - reabre as views DuckDB;
+  - reconstrói os artefatos que dependem delas (índice de CNPJ por tabela,
+    índice de nomes, cubos de KPIs, tabela de responsável) se já tiverem
+    sido construídos;
+  - remove do diskcache as chaves derivadas dessas tabelas.
+
+A reconstrução é por tabela inteira: cada artefato agrega a tabela toda
+(índices ordenados por CNPJ, cubos somados sobre todas as UFs), então uma
+partição alterada refaz o artefato completo. As partições alteradas só
+aparecem no resumo ('tabelas_alteradas'), para diagnóstico.
+
+Uso:
+    python -m services.services_versao_dados [--forcar]
+"""
+
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pyarrow.parquet as pq
+
+from core.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Artefato → tabelas de origem (qualquer alteração nelas exige reconstrução)
+DEPENDENCIAS_ARTEFATOS = {
+    'indice_cnpj': ('estabelecimentos', 'empresas', 'socios', 'simples'),
+    'indice_nomes': ('empresas', 'estabelecimentos', 'socios'),
+    'cubos_kpi': ('estabelecimentos', 'empresas'),
+    'responsavel': ('socios',),
+}
+
+# Prefixos de chaves do diskcache derivadas de cada tabela
+PREFIXOS_CACHE = {
+    'empresas': ('cnpj:', 'setorial:', 'players_total:'),
+    'estabelecimentos': ('cnpj:', 'setorial:', 'players_total:'),
+    'socios': ('cnpj:', 'setorial:'),
+    'simples': ('cnpj:',),
+    'cnaes': ('cnaes', 'setorial:'),
+    'municipios': ('municipios', 'cnpj:'),
+    'pgfn': ('pgfn:',),
+}
+
+
+# ==========================================
+# IMPRESSÃO DIGITAL
+# ==========================================
+
+def _hash_rodape(caminho: Path) -> str:
+    """sha1 do rodapé Parquet (ou do arquivo inteiro, se não for Parquet válido)"""
+    h = hashlib.sha1()
+    tamanho = caminho.stat().st_size
+    with open(caminho, 'rb') as f:
+        if tamanho >= 12:
+            f.seek(-8, 2)
+            fim = f.read(8)
+            if fim[4:] == b'PAR1':
+                n = int.from_bytes(fim[:4], 'little')
+                f.seek(-(8 + n), 2)
+                h.update(f.read(n))
+                h.update(str(tamanho).encode())
+                return h.hexdigest()
+            f.seek(0)
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _impressao_arquivo(caminho: Path) -> Dict:
+    stat = caminho.stat()
+    try:
+        linhas = int(pq.read_metadata(str(caminho)).num_rows)
+    except Exception:
+        linhas = None
+    return {
+        'tamanho': stat.st_size,
+        'mtime': stat.st_mtime,
+        'linhas': linhas,
+        'hash': _hash_rodape(caminho),
+    }
+
+
+def impressao_tabela(caminho) -> Optional[Dict]:
+    """
+    Impressão digital de um arquivo Parquet ou de um diretório particionado.
+
+    Returns:
+        Dict com hash agregado, linhas e partes (uma por arquivo), ou None se não existir
+    """
+    caminho = Path(caminho)
+    if caminho.is_dir():
+        arquivos = sorted(caminho.rglob('*.parquet'))
+    elif caminho.exists():
+        arquivos = [caminho]
+    else:
+        return None
+    partes = {}
+    for arq in arquivos:
+        chave = str(arq.relative_to(caminho)) if caminho.is_dir() else arq.name
+        partes[chave] = _impressao_arquivo(arq)
+    agregado = hashlib.sha1(
+        ''.join(f"{k}:{v['hash']};" for k, v in sorted(partes.items())).encode()
+    ).hexdigest()
+    linhas = [p['linhas'] for p in partes.values()]
+    return {
+        'caminho': str(caminho),
+        'hash': agregado,
+        'linhas': sum(linhas) if None not in linhas else None,
+        'partes': partes,
+    }
+
+
+def calcular_manifesto() -> Dict:
+    """Manifesto dos arquivos configurados em Config.ARQUIVOS_PARQUET"""
+    tabelas = {}
+    for nome, caminho in Config.ARQUIVOS_PARQUET.items():
+        try:
+            impressao = impressao_tabela(caminho)
+        except Exception as e:
+            logger.warning(f"Erro ao calcular impressão digital de {nome}: {e}")
+            impressao = None
+        if impressao is not None:
+            tabelas[nome] = impressao
+    versao = hashlib.sha1(
+        ''.join(f"{k}:{v['hash']};" for k, v in sorted(tabelas.items())).encode()
+    ).hexdigest()[:12]
+    return {'versao': versao, 'calculado_em': time.time(), 'tabelas': tabelas}
+
+
+def ler_manifesto() -> Optional[Dict]:
+    """Manifesto salvo da última versão processada, se existir"""
+    try:
+        caminho = Path(Config.VERSAO_DADOS_ARQUIVO)
+        if not caminho.exists():
+            return None
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Erro ao ler manifesto de versão dos dados: {e}")
+        return None
+
+
+def _salvar_manifesto(manifesto: Dict):
+    caminho = Path(Config.VERSAO_DADOS_ARQUIVO)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temp = caminho.with_suffix('.tmp')
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    temp.replace(caminho)
+
+
+def versao_dados() -> Optional[str]:
+    """Identificador curto da versão dos dados processada por último"""
+    manifesto = ler_manifesto()
+    return manifesto.get('versao') if manifesto else None
+
+
+def tabelas_alteradas(anterior: Optional[Dict], atual: Dict) -> Dict[str, List[str]]:
+    """
+    Tabelas (e partições) que mudaram entre dois manifestos.
+
+    Returns:
+        {tabela: [partes alteradas]}; sem manifesto anterior, todas as tabelas
+    """
+    antigas = (anterior or {}).get('tabelas', {})
+    novas = atual.get('tabelas', {})
+    alteradas = {}
+    for nome in set(antigas) | set(novas):
+        a, n = antigas.get(nome), novas.get(nome)
+        if a is None or n is None:
+            alteradas[nome] = sorted(set((a or n or {}).get('partes', {})))
+        elif a['hash'] != n['hash']:
+            partes_a, partes_n = a.get('partes', {}), n.get('partes', {})
+            alteradas[nome] = sorted(
+                k for k in set(partes_a) | set(partes_n)
+                if (partes_a.get(k) or {}).get('hash') != (partes_n.get(k) or {}).get('hash')
+            )
+    return alteradas
+
+
+# ==========================================
+# INVALIDAÇÃO E RECONSTRUÇÃO
+# ==========================================
+
+def invalidar_cache_tabelas(tabelas: List[str]) -> int:
+    """
+    Remove do diskcache e dos caches em memória o que deriva das tabelas.
+
+    Returns:
+        Número de chaves removidas do diskcache
+    """
+    from services.services_cache_service import cache
+
+    prefixos = tuple(sorted({p for t in tabelas for p in PREFIXOS_CACHE.get(t, ())}))
+    removidas = 0
+    if prefixos:
+        for chave in list(cache.iterkeys()):
+            if isinstance(chave, str) and chave.startswith(prefixos):
+                if cache.delete(chave):
+                    removidas += 1
+
+    # Caches em processo que guardam dados lidos dos Parquet
+    try:
+        from services.services_filtro_sql import _esquema
+        _esquema.cache_clear()
+        from services import services_analise_service
+        with services_analise_service._ranking_lock:
+            services_analise_service._ranking_conjuntos.clear()
+    except Exception as e:
+        logger.warning(f"Erro ao limpar caches em memória: {e}")
+
+    logger.info(f"Cache invalidado para {', '.join(sorted(tabelas))}: {removidas} chaves removidas")
+    return removidas
+
+
+def recarregar_processo():
+    """
+    Faz este processo enxergar os arquivos atuais: caminhos, views DuckDB
+    (com os cubos e a tabela de responsável registrados nelas), índices e
+    tabelas pequenas lidas uma vez em memória
+    """
+    Config.recarregar_arquivos_parquet()
+    # Views e metadados em cache do DuckDB apontam para os arquivos antigos
+    from services.services_duckdb_pool import fechar_duckdb, inicializar_duckdb
+    fechar_duckdb()
+    inicializar_duckdb()
+    # Views dos cubos são registradas na conexão; força novo registro
+    from services.services_kpi_cubo import recarregar_cubos
+    recarregar_cubos()
+    from services.services_responsavel import recarregar_responsavel
+    recarregar_responsavel()
+    try:
+        from services.services_cnpj_index import recarregar_indice
+        recarregar_indice()
+        from services.services_busca_nomes import recarregar_indice_nomes
+        recarregar_indice_nomes()
+        from services.services_cnpj_service import _cnaes_df, _municipios_df
+        _cnaes_df.cache_clear()
+        _municipios_df.cache_clear()
+    except Exception as e:
+        logger.warning(f"Erro ao recarregar índices em memória: {e}")
+
+
+def _artefato_construido(artefato: str) -> bool:
+    if artefato == 'indice_cnpj':
+        from services.services_cnpj_index import obter_manifesto
+        return obter_manifesto() is not None
+    if artefato == 'indice_nomes':
+        from services.services_busca_nomes import indice_nomes_disponivel
+        return indice_nomes_disponivel()
+    if artefato == 'cubos_kpi':
+        return (Path(Config.KPI_CUBO_DIR) / 'manifesto.json').exists()
+    if artefato == 'responsavel':
+        return (Path(Config.RESPONSAVEL_DIR) / 'manifesto.json').exists()
+    return False
+
+
+def _reconstruir(artefato: str, tabelas: List[str]):
+    if artefato == 'indice_cnpj':
+        from services.services_cnpj_index import TABELAS_INDEXADAS, construir_indice_cnpj
+        construir_indice_cnpj([t for t in tabelas if t in TABELAS_INDEXADAS])
+    elif artefato == 'indice_nomes':
+        from services.services_busca_nomes import construir_indice_nomes
+        construir_indice_nomes()
+    elif artefato == 'cubos_kpi':
+        from services.services_kpi_cubo import construir_cubos_kpi
+        construir_cubos_kpi()
+    elif artefato == 'responsavel':
+        from services.services_responsavel import construir_tabela_responsavel
+        construir_tabela_responsavel()
+
+
+def atualizar_artefatos(forcar: bool = False, reconstruir: bool = True) -> Dict:
+    """
+    Detecta uma nova versão dos dados e atualiza só o que dela depende.
+
+    Args:
+        forcar: Trata todas as tabelas como alteradas
+        reconstruir: Se False, apenas invalida caches (reconstrução fica para depois)
+
+    Returns:
+        Resumo com versões, tabelas alteradas e artefatos reconstruídos
+    """
+    Config.recarregar_arquivos_parquet()
+    anterior = ler_manifesto()
+    atual = calcular_manifesto()
+    alteradas = tabelas_alteradas(None if forcar else anterior, atual)
+    # Reconstruções adiadas (reconstruir=False) ou que falharam da última vez
+    pendentes_anteriores = (anterior or {}).get('pendentes', {})
+    resumo = {
+        'versao_anterior': (anterior or {}).get('versao'),
+        'versao': atual['versao'],
+        'tabelas_alteradas': alteradas,
+        'reconstruidos': [],
+        'pendentes': {},
+        'chaves_removidas': 0,
+    }
+    if not alteradas and not (reconstruir and pendentes_anteriores):
+        logger.info(f"Dados sem alteração (versão {atual['versao']})")
+        # Reconstruções adiadas continuam pendentes (o manifesto não muda)
+        resumo['pendentes'] = dict(pendentes_anteriores)
+        return resumo
+
+    if alteradas:
+        logger.info(f"Nova versão dos dados {resumo['versao_anterior']} → {atual['versao']}: {', '.join(sorted(alteradas))}")
+        recarregar_processo()
+
+    for artefato, dependencias in DEPENDENCIAS_ARTEFATOS.items():
+        afetadas = sorted(set(t for t in dependencias if t in alteradas) | set(pendentes_anteriores.get(artefato, [])))
+        if not afetadas or not _artefato_construido(artefato):
+            continue
+        if not reconstruir:
+            resumo['pendentes'][artefato] = afetadas
+            continue
+        try:
+            _reconstruir(artefato, afetadas)
+            resumo['reconstruidos'].append(artefato)
+        except Exception as e:
+            logger.error(f"Erro ao reconstruir {artefato}: {e}")
+            resumo['pendentes'][artefato] = afetadas
+
+    if alteradas:
+        resumo['chaves_removidas'] = invalidar_cache_tabelas(list(alteradas))
+
+    atual['pendentes'] = resumo['pendentes']
+    atual['atualizado_em'] = time.time()
+    _salvar_manifesto(atual)
+    return resumo
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    resultado = atualizar_artefatos(forcar='--forcar' in sys.argv)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
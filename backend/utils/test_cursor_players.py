@@ -0,0 +1,47 @@
+import sys
+import os
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.routes_analises import _criar_cursor_players, _ler_cursor_players, _ordem_players
+
+
+def test_ordenacao_padrao_e_escolhida():
+    assert _ordem_players('')[0] == 'capital_desc'
+    assert _ordem_players(None)[0] == 'capital_desc'
+    assert _ordem_players('score')[0] == 'capital_desc'
+    for nome, direcao in [('capital_asc', 'ASC'), ('idade_desc', 'ASC'), ('idade_asc', 'DESC')]:
+        ordem = _ordem_players(nome)
+        assert ordem[0] == nome and ordem[2] == direcao
+        assert ordem[1].startswith('coalesce(')
+
+
+def test_cursor_ida_e_volta():
+    casos = [
+        ('capital_desc', 1500.5, '12345678000199'),
+        ('capital_asc', 0, '00000000000191'),
+        ('capital_desc', float('-inf'), '11111111000111'),  # capital nulo (coalesce)
+        ('idade_desc', '20010315', '22222222000122'),
+        ('idade_asc', '', '33333333000133'),
+    ]
+    for nome, chave, cnpj in casos:
+        cursor = _criar_cursor_players(nome, chave, cnpj)
+        assert '=' not in cursor
+        lido = _ler_cursor_players(cursor, nome)
+        esperado = float(chave) if nome.startswith('capital') else str(chave)
+        assert lido == (esperado, cnpj)
+
+
+def test_cursor_de_outra_ordenacao_ou_invalido():
+    cursor = _criar_cursor_players('capital_desc', 10.0, '12345678000199')
+    assert _ler_cursor_players(cursor, 'capital_asc') is None
+    assert _ler_cursor_players(cursor, 'idade_desc') is None
+    assert _ler_cursor_players('nao-e-cursor', 'capital_desc') is None
+    assert _ler_cursor_players('', 'capital_desc') is None
+
+
+if __name__ == "__main__":
+    test_ordenacao_padrao_e_escolhida()
+    test_cursor_ida_e_volta()
+    test_cursor_de_outra_ordenacao_ou_invalido()
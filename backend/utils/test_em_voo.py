@@ -0,0 +1,90 @@
+import sys
+import os
+import threading
+import time
+import uuid
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.services_cache_service import cache, em_voo
+
+
+def _chave(nome):
+    return f"testevoo:{nome}:{uuid.uuid4().hex}"
+
+
+def _lider(chave, calcular, saida):
+    def rodar():
+        try:
+            saida['valor'] = em_voo(chave, calcular)
+        except BaseException as e:
+            saida['erro'] = e
+    t = threading.Thread(target=rodar)
+    t.start()
+    return t
+
+
+def test_timeout_do_seguidor():
+    chave = _chave('timeout')
+    iniciou, liberar = threading.Event(), threading.Event()
+
+    def calcular():
+        iniciou.set()
+        liberar.wait(5)
+        return 42
+
+    saida = {}
+    lider = _lider(chave, calcular, saida)
+    assert iniciou.wait(5)
+    try:
+        em_voo(chave, lambda: 0, timeout=0.05)
+        assert False, "esperava TimeoutError"
+    except TimeoutError:
+        pass
+    finally:
+        liberar.set()
+        lider.join(5)
+    assert saida == {'valor': 42}
+
+
+def test_erro_do_lider_propaga():
+    chave = _chave('erro')
+    iniciou, liberar = threading.Event(), threading.Event()
+
+    def calcular():
+        iniciou.set()
+        liberar.wait(5)
+        raise ValueError('falhou')
+
+    saida = {}
+    lider = _lider(chave, calcular, saida)
+    assert iniciou.wait(5)
+    coalescidas = cache._stats['testevoo']['coalescidas']
+    resultado = {}
+    seguidor = _lider(chave, lambda: 0, resultado)
+    # O seguidor precisa estar aguardando o voo antes de o líder terminar
+    for _ in range(100):
+        if cache._stats['testevoo']['coalescidas'] > coalescidas:
+            break
+        time.sleep(0.01)
+    liberar.set()
+    lider.join(5)
+    seguidor.join(5)
+    assert isinstance(saida.get('erro'), ValueError)
+    assert resultado.get('erro') is saida['erro']
+
+
+def test_lider_nao_conta_conferencia():
+    chave = _chave('contagem')
+    antes = dict(cache._stats['testevoo'])
+    assert em_voo(chave, lambda: 7) == 7
+    depois = cache._stats['testevoo']
+    assert depois['gets'] == antes.get('gets', 0)
+    assert depois['misses'] == antes.get('misses', 0)
+
+
+if __name__ == "__main__":
+    test_timeout_do_seguidor()
+    test_erro_do_lider_propaga()
+    test_lider_nao_conta_conferencia()
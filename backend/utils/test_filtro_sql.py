@@ -0,0 +1,72 @@
+import sys
+import os
+from datetime import date, datetime
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from services.services_filtro_sql import (
+    compilar_filtros, compilar_predicado, esquema_parquet, expressao_numerica,
+)
+
+
+def test_valores_convertidos_para_o_tipo_da_coluna():
+    assert compilar_predicado('porte', pa.int32(), '==', '3') == ('"porte" = ?', [3])
+    assert compilar_predicado('capital', pa.float64(), '>=', '1000') == ('"capital" >= ?', [1000.0])
+    assert compilar_predicado('abertura', pa.date32(), '>=', '20200000') == ('"abertura" >= ?', [date(2020, 1, 1)])
+    assert compilar_predicado('abertura', pa.timestamp('us'), '<', '2021-03-15') == (
+        '"abertura" < ?', [datetime(2021, 3, 15)])
+    assert compilar_predicado('uf', pa.string(), '!=', 'SP') == ('"uf" <> ?', ['SP'])
+    # Inteiros contra texto comparam como texto (códigos de largura fixa)
+    assert compilar_predicado('data_inicio', pa.string(), '>=', 20200101) == ('"data_inicio" >= ?', ['20200101'])
+
+
+def test_texto_com_numero_brasileiro():
+    sql, params = compilar_predicado('capital_social', pa.string(), '>', 1500.0)
+    assert sql == expressao_numerica('"capital_social"', pa.string()) + ' > ?'
+    assert sql.startswith('TRY_CAST(') and params == [1500.0]
+    assert expressao_numerica('"x"', pa.int64()) == '"x"'
+
+
+def test_in_e_not_in():
+    assert compilar_predicado('uf', pa.string(), 'in', ['SP', 'RJ', 'SP']) == ('"uf" IN (?, ?)', ['SP', 'RJ'])
+    assert compilar_predicado('porte', pa.int8(), 'not in', ('1', '2')) == ('"porte" NOT IN (?, ?)', [1, 2])
+    assert compilar_predicado('uf', pa.string(), 'in', []) == ('FALSE', [])
+    assert compilar_predicado('uf', pa.string(), 'not in', []) == ('TRUE', [])
+
+
+def test_alias_e_identificador():
+    assert compilar_predicado('nome "x"', None, '=', 1, alias='e') == ('e."nome ""x""" = ?', ['1'])
+
+
+def test_filtros_nao_suportados_ficam_de_fora():
+    assert compilar_predicado('uf', pa.string(), 'like', 'S%') is None
+    assert compilar_predicado('porte', pa.int32(), '==', 'abc') is None
+    esquema = {'uf': pa.string(), 'porte': pa.int32()}
+    filtros = [('uf', '==', 'SP'), ('porte', '>=', 2), ('municipio', '==', '7107'), ('porte', '==', 'abc')]
+    clausulas, params, restantes = compilar_filtros(filtros, esquema, alias='t')
+    assert clausulas == ['t."uf" = ?', 't."porte" >= ?']
+    assert params == ['SP', 2]
+    assert restantes == [('municipio', '==', '7107'), ('porte', '==', 'abc')]
+
+
+def test_esquema_parquet(tmp_path):
+    caminho = tmp_path / 'amostra.parquet'
+    pq.write_table(pa.table({'uf': ['SP'], 'porte': pa.array([3], pa.int8())}), caminho)
+    assert esquema_parquet(caminho) == {'uf': pa.string(), 'porte': pa.int8()}
+    assert esquema_parquet(tmp_path / 'inexistente.parquet') == {}
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_valores_convertidos_para_o_tipo_da_coluna()
+    test_texto_com_numero_brasileiro()
+    test_in_e_not_in()
+    test_alias_e_identificador()
+    test_filtros_nao_suportados_ficam_de_fora()
+    with tempfile.TemporaryDirectory() as d:
+        test_esquema_parquet(Path(d))
@@ -0,0 +1,113 @@
+import sys
+import os
+import random
+from datetime import date, timedelta
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.services_motor_alertas import MotorAlertas, termos
+
+
+def _aceita(criterios, licitacao, hoje):
+    """Casamento alerta a alerta, usado como referência para o motor"""
+    ufs = [u.upper() for u in criterios.get('ufs') or []]
+    if ufs and str(licitacao.get('uf') or '').upper() not in ufs:
+        return False
+    modalidades = [str(int(m)) for m in criterios.get('modalidades') or []]
+    modalidade = licitacao.get('modalidade')
+    if modalidades and (modalidade is None or str(int(modalidade)) not in modalidades):
+        return False
+
+    def na_faixa(valor, minimo, maximo):
+        if minimo is None and maximo is None:
+            return True
+        if valor is None:
+            return False
+        return (minimo is None or valor >= minimo) and (maximo is None or valor <= maximo)
+
+    if not na_faixa(licitacao.get('valor'), criterios.get('valor_minimo'), criterios.get('valor_maximo')):
+        return False
+    encerramento = licitacao.get('data_encerramento')
+    prazo = (encerramento - hoje).days if encerramento else None
+    if not na_faixa(prazo, criterios.get('prazo_minimo_dias'), criterios.get('prazo_maximo_dias')):
+        return False
+    for campo, texto in (('palavras_chave', 'objeto'), ('orgaos', 'orgao')):
+        frases = [termos(f) for f in criterios.get(campo) or [] if termos(f)]
+        presentes = set(termos(licitacao.get(texto)))
+        if frases and not any(presentes.issuperset(f) for f in frases):
+            return False
+    return True
+
+
+def test_casos_basicos():
+    hoje = date.today()
+    alertas = [
+        {'id': 1, 'criterios': {'palavras_chave': 'software, licença de uso'}},
+        {'id': 2, 'criterios': {'ufs': ['sp', 'RJ'], 'valor_minimo': 1000, 'valor_maximo': 5000}},
+        {'id': 3, 'criterios': {'modalidades': ['6'], 'prazo_minimo_dias': 5}},
+        {'id': 4, 'criterios': {'orgaos': ['Prefeitura Municipal']}},
+        {'id': 5, 'criterios': {}},
+    ]
+    licitacoes = [
+        {'objeto': 'Aquisição de LICENÇA de uso de Software', 'uf': 'SP', 'valor': 1000.0,
+         'modalidade': 6, 'orgao': 'Prefeitura Municipal de Campinas', 'data_encerramento': hoje + timedelta(days=10)},
+        {'objeto': 'Licença para eventos', 'uf': 'MG', 'valor': 9000.0,
+         'modalidade': 8, 'orgao': 'Câmara Municipal', 'data_encerramento': hoje + timedelta(days=2)},
+        {'objeto': 'Obras', 'uf': 'RJ', 'valor': None, 'modalidade': None, 'orgao': None, 'data_encerramento': None},
+    ]
+    assert MotorAlertas(alertas).casar_lote(licitacoes) == {1: [0], 2: [0], 3: [0], 4: [0], 5: [0, 1, 2]}
+
+
+def test_sem_alertas_ou_sem_licitacoes():
+    assert MotorAlertas([]).casar_lote([{'objeto': 'x'}]) == {}
+    assert MotorAlertas([{'id': 1, 'criterios': {}}]).casar_lote([]) == {}
+
+
+def test_igual_ao_casamento_alerta_a_alerta():
+    rnd = random.Random(0)
+    hoje = date.today()
+    palavras = ['software', 'licenca de uso', 'obra', 'merenda escolar', 'veiculo', 'consultoria']
+    orgaos = ['prefeitura', 'secretaria de saude', 'camara municipal', 'tribunal']
+    objetos = ['Aquisição de software e licença de uso', 'Obra de pavimentação', 'Merenda escolar',
+               'Locação de veículo', 'Consultoria em software', 'Serviços gerais', None]
+    nomes_orgaos = ['Prefeitura de Campinas', 'Secretaria de Saúde do Estado', 'Câmara Municipal', 'Tribunal de Justiça', None]
+
+    def faixa(minimo, maximo):
+        a = rnd.choice([None, rnd.uniform(minimo, maximo)])
+        b = rnd.choice([None, rnd.uniform(minimo, maximo)])
+        if a is not None and b is not None and a > b:
+            a, b = b, a
+        return a, b
+
+    alertas = []
+    for i in range(80):
+        vmin, vmax = faixa(0, 1e6)
+        pmin, pmax = faixa(-5, 30)
+        alertas.append({'id': i, 'criterios': {
+            'palavras_chave': rnd.sample(palavras, rnd.randint(0, 2)),
+            'orgaos': rnd.sample(orgaos, rnd.choice([0, 0, 1])),
+            'ufs': rnd.sample(['SP', 'RJ', 'MG', 'BA'], rnd.randint(0, 2)),
+            'modalidades': rnd.sample(['1', '6', '8', '12'], rnd.randint(0, 2)),
+            'valor_minimo': vmin, 'valor_maximo': vmax,
+            'prazo_minimo_dias': pmin, 'prazo_maximo_dias': pmax,
+        }})
+    licitacoes = [{
+        'objeto': rnd.choice(objetos),
+        'orgao': rnd.choice(nomes_orgaos),
+        'uf': rnd.choice(['SP', 'rj', 'MG', 'BA', 'AM', None]),
+        'modalidade': rnd.choice([1, 6, 8, 12, None]),
+        'valor': rnd.choice([None, rnd.uniform(0, 1e6)]),
+        'data_encerramento': rnd.choice([None, hoje + timedelta(days=rnd.randint(-10, 40))]),
+    } for _ in range(400)]
+
+    casados = MotorAlertas(alertas).casar_lote(licitacoes)
+    for alerta in alertas:
+        esperado = [i for i, lic in enumerate(licitacoes) if _aceita(alerta['criterios'], lic, hoje)]
+        assert casados.get(alerta['id'], []) == esperado, alerta['id']
+
+
+if __name__ == "__main__":
+    test_casos_basicos()
+    test_sem_alertas_ou_sem_licitacoes()
+    test_igual_ao_casamento_alerta_a_alerta()
@@ -0,0 +1,38 @@
+import sys
+import os
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from services.services_pncp_serie import COLUNAS_QUADRO, calcular_serie, quadro_itens
+
+
+def test_janela_vazia():
+    for quadro in (quadro_itens([]), pd.DataFrame(columns=COLUNAS_QUADRO)):
+        res = calcular_serie(quadro, 7, '20240101', '20240103')
+        assert res['total'] == 0
+        assert res['totalValor'] == 0.0
+        assert [p['date'] for p in res['series']] == ['20240101', '20240102', '20240103']
+        assert all(p['count'] == 0 for p in res['series'])
+        assert res['mediaMovel'] == [0.0, 0.0, 0.0]
+        assert res['topModalidades'] == []
+        assert res['topUFs'] == []
+
+
+def test_serie_com_itens():
+    itens = [
+        {'dataPublicacaoPncp': '2024-01-01T10:00:00', 'codigoModalidadeContratacao': 6, 'uf': 'SP', 'valorTotalEstimado': 100},
+        {'dataPublicacaoPncp': '2024-01-03T09:00:00', 'codigoModalidadeContratacao': 6, 'uf': 'RJ', 'valorTotalEstimado': 50},
+    ]
+    res = calcular_serie(quadro_itens(itens), 2, '20240101', '20240103')
+    assert res['total'] == 2
+    assert [p['count'] for p in res['series']] == [1, 0, 1]
+    assert res['mediaMovel'] == [1.0, 0.5, 0.5]
+    assert res['topModalidades'] == [{'label': '6', 'count': 2}]
+
+
+if __name__ == "__main__":
+    test_janela_vazia()
+    test_serie_com_itens()
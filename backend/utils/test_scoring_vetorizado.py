@@ -0,0 +1,82 @@
+import sys
+import os
+import random
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from core.scoring_engine import PERFIS_PESOS, ScoringEngine
+
+CRITERIOS = ['cnae', 'localizacao', 'porte', 'capital_social', 'experiencia', 'certidoes']
+UFS = ['SP', 'RJ', 'MG', 'PR', 'BA', 'AM', 'sp', '']
+MUNICIPIOS = ['Campinas', 'CAMPINAS', 'Curitiba', 'Salvador', '']
+PORTES = ['MEI', 'MICRO', 'EPP', 'Pequena', 'MEDIO', 'GRANDE', 'DEMAIS', '']
+SITUACOES = ['ATIVA', 'ativa', 'BAIXADA', 'SUSPENSA', 'INAPTA', 'NULA', 'XYZ', '']
+
+
+def _cnae(rnd):
+    if rnd.random() < 0.1:
+        return ''
+    codigo = ''.join(rnd.choice('0123456789') for _ in range(7))
+    return codigo if rnd.random() < 0.5 else f"{codigo[:4]}-{codigo[4]}/{codigo[5:]}"
+
+
+def _data(rnd):
+    if rnd.random() < 0.1:
+        return rnd.choice(['', 'invalida'])
+    return f"{rnd.randint(1980, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}"
+
+
+def _pares(n, semente=0):
+    rnd = random.Random(semente)
+    empresas, editais = [], []
+    for _ in range(n):
+        empresas.append({
+            'cnae_fiscal': _cnae(rnd),
+            'uf': rnd.choice(UFS),
+            'municipio': rnd.choice(MUNICIPIOS),
+            'porte': rnd.choice(PORTES),
+            'capital_social': rnd.choice([0, 10_000, 150_000, 750_000, 2_000_000, 8_000_000, rnd.uniform(1, 1e7)]),
+            'data_abertura': _data(rnd),
+            'situacao_cadastral': rnd.choice(SITUACOES),
+        })
+        editais.append({
+            'cnae_relacionado': _cnae(rnd),
+            'uf': rnd.choice(UFS),
+            'municipio': rnd.choice(MUNICIPIOS),
+            'porte_preferencial': rnd.sample(PORTES, rnd.randint(0, 2)),
+            'valorEstimado': rnd.choice([0, 50_000, 1_000_000, rnd.uniform(1, 5e7)]),
+            'exige_experiencia': rnd.random() < 0.5,
+            'exige_certidoes': rnd.random() < 0.5,
+        })
+    return empresas, editais
+
+
+def test_vetorizado_igual_ao_escalar():
+    empresas, editais = _pares(500)
+    for perfil in PERFIS_PESOS:
+        motor = ScoringEngine(perfil)
+        vetorizado = motor.calcular_scores_vetorizado(pd.DataFrame(empresas), pd.DataFrame(editais))
+        for i, (empresa, edital) in enumerate(zip(empresas, editais)):
+            escalar = motor.calcular_score(empresa, edital)
+            linha = vetorizado.iloc[i]
+            for nome in CRITERIOS:
+                assert np.isclose(linha[f'score_{nome}'], escalar.detalhes[nome]['score']), (perfil, i, nome)
+            assert np.isclose(linha['score_total'], escalar.score_total), (perfil, i)
+            assert linha['classificacao'] == escalar.classificacao, (perfil, i)
+
+
+def test_edital_unico_replicado():
+    empresas, editais = _pares(50, semente=1)
+    motor = ScoringEngine()
+    vetorizado = motor.calcular_scores_vetorizado(pd.DataFrame(empresas), editais[0])
+    for i, empresa in enumerate(empresas):
+        assert np.isclose(vetorizado['score_total'].iloc[i], motor.calcular_score(empresa, editais[0]).score_total)
+
+
+if __name__ == "__main__":
+    test_vetorizado_igual_ao_escalar()
+    test_edital_unico_replicado()
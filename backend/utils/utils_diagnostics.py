@@ -4,6 +4,7 @@ Funções de diagnóstico do sistema
 
 import pandas as pd
 import pyarrow.parquet as pq
+import pyarrow.dataset as ds
 import time
 import psutil
 import os
@@ -123,7 +124,11 @@ def diagnosticar_colunas():
             continue
 
         try:
-            schema = pq.read_schema(caminho)
+            if caminho.is_dir():
+                # Dataset particionado gerado por services_layout_parquet
+                schema = ds.dataset(str(caminho), format='parquet', partitioning='hive').schema
+            else:
+                schema = pq.read_schema(caminho)
             lista = ''.join(f"<li>{field.name}</li>" for field in schema)
             sections.append(f"<h2>{nome} ({len(schema)} colunas)</h2><ul>{lista}</ul>")
         except Exception as e:
@@ -0,0 +1,160 @@
+"""
+Formatação vetorizada de registros de empresas para listas de leads
+
+Operações sobre colunas inteiras (sem apply/iterrows), aplicadas depois do
+corte top-N: máscara de CNPJ, CEP, telefone, endereço, rótulo de porte e
+idade, e conversão para registros JSON.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# Textos que representam ausência de valor depois de astype(str)
+VAZIOS = ('', 'nan', 'none', 'nat', '<na>', 'null')
+
+PORTE_ROTULOS = {
+    '01': 'Microempresa', '1': 'Microempresa',
+    '03': 'Pequeno Porte', '3': 'Pequeno Porte',
+    '05': 'Demais', '5': 'Demais',
+}
+
+
+def texto(serie: pd.Series) -> pd.Series:
+    """Texto sem espaços nas pontas; nulos e marcadores ('nan', 'None') viram ''"""
+    s = pd.Series(serie).astype('string').str.strip().fillna('')
+    return s.mask(s.str.lower().isin(VAZIOS), '').astype(object)
+
+
+def digitos(serie: pd.Series) -> pd.Series:
+    """Somente os dígitos (números lidos como float perdem o '.0')"""
+    return texto(serie).str.replace(r'\.0+$', '', regex=True).str.replace(r'\D', '', regex=True)
+
+
+def _coluna(df: pd.DataFrame, nome: str) -> pd.Series:
+    if nome in df.columns:
+        return texto(df[nome])
+    return pd.Series('', index=df.index, dtype=object)
+
+
+def juntar(partes: List[pd.Series], separador: str = ' - ') -> pd.Series:
+    """Concatena, linha a linha, as partes não vazias com o separador"""
+    resultado = partes[0]
+    for parte in partes[1:]:
+        ambos = (resultado != '') & (parte != '')
+        resultado = (resultado + separador).where(ambos, resultado) + parte
+    return resultado
+
+
+def _nulo_se_vazio(serie: pd.Series) -> pd.Series:
+    return serie.where(serie != '', None)
+
+
+def cnpj_completo(df: pd.DataFrame) -> pd.Series:
+    """CNPJ de 14 dígitos a partir de cnpj_basico/cnpj_ordem/cnpj_dv"""
+    return (
+        digitos(df['cnpj_basico']).str.zfill(8)
+        + digitos(df['cnpj_ordem']).str.zfill(4)
+        + digitos(df['cnpj_dv']).str.zfill(2)
+    )
+
+
+def mascarar_cnpj(serie: pd.Series) -> pd.Series:
+    """00.000.000/0000-00 para CNPJs com 14 dígitos; demais ficam como estão"""
+    d = digitos(serie)
+    mascara = d.str[:2] + '.' + d.str[2:5] + '.' + d.str[5:8] + '/' + d.str[8:12] + '-' + d.str[12:]
+    return mascara.where(d.str.len() == 14, texto(serie))
+
+
+def formatar_cep(serie: pd.Series) -> pd.Series:
+    """00000-000, ou None se não tiver 8 dígitos"""
+    d = digitos(serie)
+    return (d.str[:5] + '-' + d.str[5:8]).where(d.str.len() == 8, None)
+
+
+def formatar_telefone(ddd: pd.Series, telefone: pd.Series) -> pd.Series:
+    """(DD) NNNNNNNN, ou None se faltar DDD ou número"""
+    d, t = digitos(ddd), digitos(telefone)
+    return ('(' + d + ') ' + t).where((d != '') & (t != ''), None)
+
+
+def telefone_principal(df: pd.DataFrame) -> pd.Series:
+    """Telefone 1 formatado; na falta dele, o telefone 2"""
+    t1 = formatar_telefone(_coluna(df, 'ddd_1'), _coluna(df, 'telefone_1'))
+    t2 = formatar_telefone(_coluna(df, 'ddd_2'), _coluna(df, 'telefone_2'))
+    return t1.where(t1.notna(), t2)
+
+
+def formatar_endereco(df: pd.DataFrame) -> pd.Series:
+    """'TIPO LOGRADOURO - Nº 10 - COMPLEMENTO - BAIRRO - 00000-000', sem partes vazias"""
+    logradouro = juntar([_coluna(df, 'tipo_de_logradouro'), _coluna(df, 'logradouro')], ' ')
+    numero = _coluna(df, 'numero')
+    numero = ('Nº ' + numero).where(numero != '', '')
+    cep = formatar_cep(_coluna(df, 'cep')).fillna('')
+    endereco = juntar([logradouro, numero, _coluna(df, 'complemento'), _coluna(df, 'bairro'), cep])
+    return _nulo_se_vazio(endereco)
+
+
+def rotulo_porte(serie: pd.Series) -> pd.Series:
+    """Código de porte da Receita → rótulo exibido ('Demais' quando desconhecido)"""
+    return texto(serie).map(PORTE_ROTULOS).fillna('Demais')
+
+
+def idade_anos(serie: pd.Series, ano_atual: Optional[int] = None) -> pd.Series:
+    """Anos desde o início de atividade (AAAAMMDD); 0 quando a data é inválida"""
+    ano_atual = ano_atual or datetime.now().year
+    anos = pd.to_numeric(digitos(serie).str[:4], errors='coerce')
+    return (ano_atual - anos).fillna(0).astype(int)
+
+
+def numero_br(serie: pd.Series) -> pd.Series:
+    """Números lidos como texto no formato brasileiro ('1.000,50') → float (NaN se inválido)"""
+    if pd.api.types.is_numeric_dtype(serie):
+        return pd.to_numeric(serie, errors='coerce')
+    t = texto(serie)
+    com_virgula = t.str.contains(',', regex=False)
+    t = t.where(~com_virgula, t.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    return pd.to_numeric(t, errors='coerce')
+
+
+def email(serie: pd.Series) -> pd.Series:
+    """E-mail em minúsculas, ou None"""
+    return _nulo_se_vazio(texto(serie).str.lower())
+
+
+def formatar_leads(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Acrescenta as colunas formatadas de uma lista de leads: cnpj (14 dígitos),
+    cnpj_formatado, endereco, telefone, email, porte_rotulo e idade.
+    Colunas de origem ausentes resultam em valores vazios.
+    """
+    df = df.copy()
+    if 'cnpj' not in df.columns and {'cnpj_basico', 'cnpj_ordem', 'cnpj_dv'} <= set(df.columns):
+        df['cnpj'] = cnpj_completo(df)
+    if 'cnpj' in df.columns:
+        df['cnpj_formatado'] = mascarar_cnpj(df['cnpj'])
+    df['endereco'] = formatar_endereco(df)
+    df['telefone'] = telefone_principal(df)
+    df['email'] = email(df['correio_eletronico']) if 'correio_eletronico' in df.columns else None
+    if 'porte_da_empresa' in df.columns:
+        df['porte_rotulo'] = rotulo_porte(df['porte_da_empresa'])
+    if 'data_de_inicio_atividade' in df.columns:
+        df['idade'] = idade_anos(df['data_de_inicio_atividade'])
+    return df
+
+
+def registros_json(df: pd.DataFrame, campos: Dict[str, str], padrao: Optional[Dict[str, object]] = None) -> List[Dict]:
+    """
+    Lista de dicts prontos para jsonify.
+
+    Args:
+        campos: coluna do DataFrame → chave do registro
+        padrao: valor usado para nulos, por chave do registro
+    """
+    saida = df.reindex(columns=list(campos)).rename(columns=campos)
+    saida = saida.astype(object).where(saida.notna(), None)
+    for chave, valor in (padrao or {}).items():
+        if chave in saida.columns:
+            saida[chave] = saida[chave].where(saida[chave].notna(), valor)
+    return saida.to_dict(orient='records')